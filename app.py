@@ -1,24 +1,64 @@
 from __future__ import annotations
 
+import os
+
+from modules.startup_profile import PROFILE_ENV_VAR, active_profiler, enable_import_profiling
+
+if os.environ.get(PROFILE_ENV_VAR):
+    # Installed before the imports below so their cost is part of the report.
+    enable_import_profiling()
+
+import functools
 import hashlib
 import json
+import sys
+import time
 import urllib.parse
-from datetime import datetime, timezone
+import uuid
+from collections.abc import Callable
 
 import streamlit as st
-from azure.identity import InteractiveBrowserCredential
 
+from modules.client_registry import default_client_registry
 from modules.community_search import (
     DEFAULT_OWNER,
     DEFAULT_REF,
     DEFAULT_REPO,
-    build_project_catalog,
-    fetch_text_file,
-    fetch_repo_tree,
+    load_project_catalog,
+    load_text_file,
     search_projects,
 )
+from modules.deadline import Deadline
+from modules.deployment_pool import DeploymentPool, build_deployment_pool
+from modules.graph_auth import (
+    DEFAULT_AUTH_RECORD_PATH,
+    GraphAuth,
+    GraphTokenProvider,
+    forget_auth_record,
+    interactive_token_provider,
+)
+from modules.graph_inventory import GraphInventory
+from modules.hedging import RequestHedger
+from modules.history import DEFAULT_HISTORY_PATH, DEFAULT_HISTORY_PAGE_SIZE, HistoryItem, HistoryStore
+from modules.jobs import DEFAULT_JOB_WORKERS, Job, JobContext, JobQueue
+from modules.prompt_cache import default_prompt_cache_stats
 from modules.prompts import SCENARIO_TEMPLATES
-from modules.utility import Utility, ValidationReport
+from modules.run_states import DEFAULT_RUN_STATE_PATH, RunStateStore, RunStateSync
+from modules.telemetry import default_telemetry
+from modules.validation_rules import ValidationSession
+from modules.session_blobs import DEFAULT_SESSION_LIMIT_BYTES, BlobStore, SessionBlobs
+from modules.shared_cache import DEFAULT_CACHE_BACKEND, CacheBackend, create_cache
+from modules.semantic_cache import DEFAULT_CACHE_PATH, DEFAULT_SIMILARITY_THRESHOLD, SemanticCache
+from modules.utility import (
+    DEFAULT_GENERATION_DEADLINE_SECONDS,
+    DEFAULT_RESPONSE_CACHE_TTL_SECONDS,
+    GRAPH_BASE_URL,
+    MAX_CANDIDATES,
+    ScriptArtifact,
+    Utility,
+    ValidationReport,
+    build_upload_payload,
+)
 
 MODEL_PRESETS: dict[str, str] = {
     "GPT-5.3-Codex (latest coding, 2026-02-05)": "gpt-5.3-codex",
@@ -111,6 +151,9 @@ def _default_state() -> dict[str, object]:
         "extra_requirements": "",
         "temperature": 0.2,
         "max_tokens": 1600,
+        "candidates": 1,
+        "use_semantic_cache": True,
+        "semantic_cache_hit": None,
         "llm_provider": "Azure OpenAI",
         "model_preset": "Custom",
         "model_name": "",
@@ -120,15 +163,32 @@ def _default_state() -> dict[str, object]:
         "detection_script": "",
         "remediation_script": "",
         "generated": False,
-        "history": [],
+        "alternates": [],
+        "history_version": 0,
+        "history_query": "",
+        "history_page": 0,
         "graph_auth_header": {},
+        "graph_token_provider": None,
+        "graph_provider_key": None,
         "graph_scope": _secret("GRAPH_SCOPE", "https://graph.microsoft.com/.default"),
+        "graph_inventory": None,
+        "run_state_script_id": "",
+        "upsert_by_name": True,
         "last_validation": None,
+        "validation_session": None,
         "github_token": "",
         "community_query": "",
         "community_results": [],
         "community_error": "",
         "selected_community_project": None,
+        "payload_preview": None,
+        "notices": {},
+        "active_fragment": "",
+        "app_run_active": False,
+        "render_ms": {},
+        "job_owner": uuid.uuid4().hex,
+        "session_blobs": None,
+        "pending_jobs": [],
     }
 
 
@@ -145,10 +205,40 @@ def _reset_scripts() -> None:
     st.session_state.detection_script = ""
     st.session_state.remediation_script = ""
     st.session_state.generated = False
+    st.session_state.alternates = []
     st.session_state.last_validation = None
 
 
-def _create_utility() -> tuple[Utility | None, list[str]]:
+@st.cache_resource(show_spinner=False)
+def _load_deployment_pool(configs_json: str) -> DeploymentPool:
+    return build_deployment_pool(json.loads(configs_json))
+
+
+def _deployment_pool() -> DeploymentPool | None:
+    if "AZURE_OPENAI_DEPLOYMENTS" not in st.secrets:
+        return None
+    configs = [dict(item) for item in st.secrets["AZURE_OPENAI_DEPLOYMENTS"]]
+    # One shared pool per config so usage and health tracking survive reruns and sessions.
+    return _load_deployment_pool(json.dumps(configs, sort_keys=True))
+
+
+@st.cache_resource(show_spinner=False)
+def _load_request_hedger(percentile: float) -> RequestHedger:
+    return RequestHedger(percentile=percentile)
+
+
+def _request_hedger() -> RequestHedger | None:
+    if str(_secret("LLM_HEDGING", "false")).lower() not in {"1", "true", "yes"}:
+        return None
+    return _load_request_hedger(float(_secret("LLM_HEDGE_PERCENTILE", "95")))
+
+
+def _utility_settings() -> tuple[dict[str, object] | None, list[str]]:
+    """Keyword arguments for `Utility`, or the missing settings; builds no client."""
+    pool = _deployment_pool()
+    if pool is not None:
+        return {"model_name": st.session_state.model_name.strip(), "deployment_pool": pool}, []
+
     provider = st.session_state.llm_provider
     model_name = st.session_state.model_name.strip()
     if not model_name:
@@ -167,59 +257,79 @@ def _create_utility() -> tuple[Utility | None, list[str]]:
         missing = [key for key in required if key not in st.secrets]
         if missing:
             return None, missing
-
-        utility = Utility(
-            provider="azure",
-            model_name=model_name,
-            api_key=st.secrets["AZURE_OPENAI_KEY"],
-            azure_openai_endpoint=st.secrets["AZURE_OPENAI_ENDPOINT"],
-            azure_openai_api_version=_secret("AZURE_OPENAI_API_VERSION", "2025-04-01-preview"),
-            graph_auth_header=st.session_state.graph_auth_header,
-        )
-        return utility, []
+        return {
+            "provider": "azure",
+            "model_name": model_name,
+            "api_key": st.secrets["AZURE_OPENAI_KEY"],
+            "azure_openai_endpoint": st.secrets["AZURE_OPENAI_ENDPOINT"],
+            "azure_openai_api_version": _secret("AZURE_OPENAI_API_VERSION", "2025-04-01-preview"),
+        }, []
 
     openai_key = st.session_state.openai_api_key.strip() or _secret("OPENAI_API_KEY", "")
     if not openai_key:
         return None, ["OPENAI_API_KEY"]
+    return {"provider": "openai", "model_name": model_name, "api_key": openai_key}, []
 
+
+def _create_utility() -> tuple[Utility | None, list[str]]:
+    settings, missing = _utility_settings()
+    if settings is None:
+        return None, missing
     utility = Utility(
-        provider="openai",
-        model_name=model_name,
-        api_key=openai_key,
+        **settings,
+        hedger=_request_hedger(),
         graph_auth_header=st.session_state.graph_auth_header,
+        graph_token_provider=st.session_state.graph_token_provider,
+        cache=_shared_cache(),
+        response_cache_ttl=float(_secret("LLM_RESPONSE_CACHE_TTL_SECONDS", str(DEFAULT_RESPONSE_CACHE_TTL_SECONDS))),
     )
     return utility, []
 
 
-def _history_label(item: dict[str, str]) -> str:
-    return f"{item['created_at']} | {item['mode']} | {item['fingerprint']}"
+@st.cache_resource(show_spinner=False)
+def _history_store() -> HistoryStore:
+    return HistoryStore(_secret("HISTORY_PATH", DEFAULT_HISTORY_PATH))
+
+
+def _history_owner() -> str:
+    """Whose snapshots this session sees: the signed-in user, else this browser session.
+
+    `HISTORY_SHARED=true` restores one history for everyone using the same `HISTORY_PATH`.
+    """
+    if str(_secret("HISTORY_SHARED", "false")).lower() in {"1", "true", "yes"}:
+        return ""
+    try:
+        if st.user.is_logged_in:
+            return f"user:{st.user.get('email') or st.user.get('sub')}"
+    except Exception:
+        pass
+    return f"session:{st.session_state.job_owner}"
+
+
+def _history_label(item: HistoryItem) -> str:
+    return f"{item.created_at} | {item.mode} | {item.fingerprint} | {item.description[:40]}"
 
 
 def _save_history(mode: str) -> None:
     if not st.session_state.detection_script.strip():
         return
+    _history_store().save(
+        description=st.session_state.description,
+        detection_script=st.session_state.detection_script,
+        remediation_script=st.session_state.remediation_script,
+        mode=mode,
+        owner=_history_owner(),
+    )
+    st.session_state.history_page = 0
+    st.session_state.history_version += 1
 
-    now = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%SZ")
-    key = hashlib.sha256(
-        (st.session_state.detection_script + "\n--\n" + st.session_state.remediation_script).encode(
-            "utf-8"
-        )
-    ).hexdigest()
-
-    entry = {
-        "id": key,
-        "created_at": now,
-        "mode": mode,
-        "description": st.session_state.description.strip(),
-        "detection_script": st.session_state.detection_script,
-        "remediation_script": st.session_state.remediation_script,
-        "fingerprint": key[:8],
-    }
 
-    st.session_state.history = [entry] + [
-        item for item in st.session_state.history if item["id"] != entry["id"]
-    ]
-    st.session_state.history = st.session_state.history[:12]
+def _shift_history_page(step: int) -> None:
+    st.session_state.history_page = max(0, st.session_state.history_page + step)
+
+
+def _reset_history_page() -> None:
+    st.session_state.history_page = 0
 
 
 def _render_validation(report: ValidationReport | None) -> None:
@@ -245,20 +355,51 @@ def _render_validation(report: ValidationReport | None) -> None:
         st.info(info)
 
 
-def _build_graph_header(token: str) -> dict[str, str]:
-    return {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {token}",
-    }
+def _graph_connected() -> bool:
+    provider: GraphTokenProvider | None = st.session_state.graph_token_provider
+    return provider is not None or "Authorization" in st.session_state.graph_auth_header
+
+
+def _graph_auth() -> GraphAuth:
+    return st.session_state.graph_token_provider or st.session_state.graph_auth_header
+
+
+def _graph_remembers_sign_in() -> bool:
+    return str(_secret("GRAPH_REMEMBER_SIGN_IN", "false")).lower() in {"1", "true", "yes"}
+
+
+def _graph_token_provider(app_registration_id: str) -> GraphTokenProvider:
+    """This session's provider; a new one (and a browser sign-in) when the registration, tenant or scope changes."""
+    tenant_id = _secret("GRAPH_TENANT_ID", "") or None
+    key = (app_registration_id, tenant_id or "", st.session_state.graph_scope)
+    provider: GraphTokenProvider | None = st.session_state.graph_token_provider
+    if provider is not None and st.session_state.graph_provider_key == key:
+        return provider
+    provider = interactive_token_provider(
+        app_registration_id,
+        st.session_state.graph_scope,
+        tenant_id=tenant_id,
+        record_path=DEFAULT_AUTH_RECORD_PATH if _graph_remembers_sign_in() else None,
+        allow_unencrypted_storage=str(_secret("GRAPH_TOKEN_CACHE_UNENCRYPTED", "false")).lower() in {"1", "true", "yes"},
+    )
+    st.session_state.graph_provider_key = key
+    return provider
+
+
+@st.cache_resource(show_spinner=False)
+def _shared_cache() -> CacheBackend:
+    """Cache for catalog, file contents, LLM responses and validation; disk or SQLite share it across replicas."""
+    return create_cache(
+        _secret("CACHE_BACKEND", DEFAULT_CACHE_BACKEND),
+        _secret("CACHE_PATH", ""),
+        memory_bytes=int(_secret("CACHE_MEMORY_MB", "64")) * 1024 * 1024,
+    )
 
 
-@st.cache_data(ttl=1800, show_spinner=False)
 def _load_community_catalog(owner: str, repo: str, ref: str, github_token: str) -> list:
-    tree = fetch_repo_tree(owner=owner, repo=repo, ref=ref, github_token=github_token)
-    return build_project_catalog(tree)
+    return load_project_catalog(_shared_cache(), owner=owner, repo=repo, ref=ref, github_token=github_token)
 
 
-@st.cache_data(ttl=1800, show_spinner=False)
 def _load_community_project_preview(
     project_name: str,
     project_folder: str,
@@ -266,6 +407,7 @@ def _load_community_project_preview(
     remediation_file: str,
     readme_file: str,
     github_token: str,
+    deadline: Deadline | None = None,
 ) -> dict[str, str]:
     detection_script = ""
     remediation_script = ""
@@ -273,36 +415,42 @@ def _load_community_project_preview(
 
     try:
         if detection_file:
-            detection_script = fetch_text_file(
+            detection_script = load_text_file(
+                _shared_cache(),
                 path=detection_file,
                 owner=DEFAULT_OWNER,
                 repo=DEFAULT_REPO,
                 ref=DEFAULT_REF,
                 github_token=github_token,
+                deadline=deadline,
             )
     except Exception:
         detection_script = ""
 
     try:
         if remediation_file:
-            remediation_script = fetch_text_file(
+            remediation_script = load_text_file(
+                _shared_cache(),
                 path=remediation_file,
                 owner=DEFAULT_OWNER,
                 repo=DEFAULT_REPO,
                 ref=DEFAULT_REF,
                 github_token=github_token,
+                deadline=deadline,
             )
     except Exception:
         remediation_script = ""
 
     try:
         if readme_file:
-            readme_content = fetch_text_file(
+            readme_content = load_text_file(
+                _shared_cache(),
                 path=readme_file,
                 owner=DEFAULT_OWNER,
                 repo=DEFAULT_REPO,
                 ref=DEFAULT_REF,
                 github_token=github_token,
+                deadline=deadline,
             )
     except Exception:
         readme_content = ""
@@ -320,6 +468,205 @@ def _load_community_project_preview(
     }
 
 
+@st.cache_resource(show_spinner=False)
+def _semantic_cache() -> SemanticCache:
+    return SemanticCache(
+        path=_secret("SEMANTIC_CACHE_PATH", DEFAULT_CACHE_PATH),
+        threshold=float(_secret("SEMANTIC_CACHE_THRESHOLD", str(DEFAULT_SIMILARITY_THRESHOLD))),
+    )
+
+
+@st.cache_resource(show_spinner=False)
+def _blob_store() -> BlobStore:
+    return BlobStore(memory_limit_bytes=int(_secret("SESSION_BLOB_MEMORY_MB", "64")) * 1024 * 1024)
+
+
+def _blobs() -> SessionBlobs:
+    """This session's handle on the shared store for large text kept in session state."""
+    if st.session_state.session_blobs is None:
+        limit = int(_secret("SESSION_BLOB_LIMIT_KB", str(DEFAULT_SESSION_LIMIT_BYTES // 1024))) * 1024
+        st.session_state.session_blobs = SessionBlobs(_blob_store(), limit)
+    return st.session_state.session_blobs
+
+
+def _apply_artifact(artifact: ScriptArtifact, utility: Utility | None) -> None:
+    st.session_state.detection_script = artifact.detection_script
+    st.session_state.remediation_script = artifact.remediation_script
+    st.session_state.alternates = [
+        {
+            "score": item.score,
+            "fingerprint": item.fingerprint,
+            "detection_key": _blobs().put(item.detection_script),
+            "remediation_key": _blobs().put(item.remediation_script),
+        }
+        for item in artifact.alternates
+    ]
+    st.session_state.generated = True
+    _save_history(artifact.mode)
+    if utility is not None:
+        _validate_current_scripts(utility)
+
+
+def _validate_current_scripts(utility: Utility) -> None:
+    """Validate the editor contents, re-scanning only lines edited since the last run."""
+    session = st.session_state.validation_session
+    if session is None or session.registry is not utility.validation_rules:
+        session = ValidationSession(utility.validation_rules)
+        st.session_state.validation_session = session
+    st.session_state.last_validation = utility.validate_scripts(
+        detection_script=st.session_state.detection_script,
+        remediation_script=st.session_state.remediation_script,
+        session=session,
+    )
+
+
+def _deadline_seconds(name: str, default: float) -> float:
+    try:
+        return float(_secret(name, str(default)))
+    except ValueError:
+        return default
+
+
+@st.cache_resource(show_spinner=False)
+def _job_queue() -> JobQueue:
+    return JobQueue(max_workers=int(_secret("JOB_WORKERS", str(DEFAULT_JOB_WORKERS))))
+
+
+def _submit_job(function: Callable[[JobContext], object], kind: str, label: str, deadline: Deadline) -> None:
+    """Run `function` in the background; its result is applied by `_collect_finished_jobs`."""
+    job_id = _job_queue().submit(function, kind, label=label, owner=st.session_state.job_owner, deadline=deadline)
+    st.session_state.pending_jobs = st.session_state.pending_jobs + [job_id]
+
+
+def _start_generation(utility: Utility) -> None:
+    # Worker threads have no Streamlit context, so everything is read from the session here.
+    description = st.session_state.description
+    extra_requirements = st.session_state.extra_requirements
+    candidates = int(st.session_state.candidates)
+    request = {
+        "description": description,
+        "include_remediation": st.session_state.mode == "Detection and Remediation",
+        "temperature": float(st.session_state.temperature),
+        "max_tokens": int(st.session_state.max_tokens),
+        "extra_requirements": extra_requirements,
+        "candidates": candidates,
+    }
+    cache = _semantic_cache() if st.session_state.use_semantic_cache else None
+
+    def generate(context: JobContext) -> ScriptArtifact:
+        context.progress(0.1, f"Generating {candidates} candidate(s)...")
+        artifact = utility.generate(**request, deadline=context.deadline)
+        if cache is not None:
+            try:
+                cache.store(artifact, extra_requirements=extra_requirements)
+            except Exception:
+                pass
+        if candidates > 1:
+            context.progress(1.0, f"Best of {candidates} candidates selected (score {artifact.score:.0f}).")
+        else:
+            context.progress(1.0, "Scripts generated and validated.")
+        return artifact
+
+    deadline = Deadline.after(_deadline_seconds("GENERATION_DEADLINE_SECONDS", DEFAULT_GENERATION_DEADLINE_SECONDS))
+    _submit_job(generate, "generate", description.strip().splitlines()[0][:60], deadline)
+    _notice("info", "Generation started. Progress is shown under Jobs.")
+
+
+def _collect_finished_jobs() -> None:
+    """Apply the results of this session's finished jobs on the script thread."""
+    pending = st.session_state.pending_jobs
+    if not pending:
+        return
+    queue = _job_queue()
+    still_running = []
+    for job_id in pending:
+        job = queue.get(job_id)
+        if job is None:
+            continue
+        if not job.finished:
+            still_running.append(job_id)
+            continue
+        if job.state != "succeeded":
+            continue
+        if job.kind == "generate":
+            utility, _ = _create_utility()
+            _apply_artifact(job.result, utility)
+        elif job.kind == "publish" and job.result:
+            st.session_state.run_state_script_id = str(job.result.get("id", ""))
+    st.session_state.pending_jobs = still_running
+
+
+def _render_metrics_panel() -> None:
+    totals = default_telemetry.totals()
+    cache_report = default_prompt_cache_stats.report()
+    st.markdown(
+        f"""
+        <div class="stat-card">
+          LLM calls: <strong>{totals['calls']}</strong> (errors: {totals['errors']}, fallbacks: {totals['fallback_attempts']})<br>
+          Avg latency: <strong>{totals['avg_latency_ms']:.0f} ms</strong><br>
+          Tokens in/out: <strong>{totals['input_tokens']} / {totals['output_tokens']}</strong><br>
+          Prompt budget: <strong>{totals['prompt_tokens_saved']}</strong> tokens saved ({totals['prompts_compacted']} prompts compacted)<br>
+          Prefix-cache hit rate: <strong>{cache_report['hit_rate']:.0%}</strong>
+          ({cache_report['cached_tokens']} cached tokens, ~{cache_report['estimated_latency_saved_ms']:.0f} ms saved)
+        </div>
+        """,
+        unsafe_allow_html=True,
+    )
+
+    rows = default_telemetry.summary()
+    if rows:
+        st.dataframe(rows, use_container_width=True, hide_index=True)
+
+    hedger = _request_hedger()
+    if hedger is not None:
+        st.caption("Request hedging")
+        st.json(hedger.stats(), expanded=False)
+
+    profiler = active_profiler()
+    if profiler is not None:
+        # Plain text: st.dataframe would load pandas and pyarrow and distort the profile.
+        st.caption(f"Import profile ({PROFILE_ENV_VAR})")
+        st.code(profiler.format_report(), language=None)
+
+    st.caption("Background jobs")
+    st.json(_job_queue().stats(), expanded=False)
+
+    st.caption("Session text store")
+    st.json({**_blob_store().stats(), "this_session_bytes": _blobs().memory_bytes}, expanded=False)
+
+    st.caption("Shared LLM clients")
+    st.json(default_client_registry.stats(), expanded=False)
+
+    cache = _shared_cache()
+    st.caption(f"Shared cache ({cache.name})")
+    st.json(cache.stats(), expanded=False)
+
+    if st.session_state.render_ms:
+        st.caption("Last render time per section (ms)")
+        st.json(st.session_state.render_ms, expanded=False)
+
+    pool = _deployment_pool()
+    if pool is not None:
+        st.caption("Deployment pool")
+        st.dataframe(pool.snapshot(), use_container_width=True, hide_index=True)
+
+    c_json, c_prom = st.columns(2)
+    c_json.download_button(
+        label="metrics.json",
+        data=default_telemetry.to_json(),
+        file_name="metrics.json",
+        mime="application/json",
+        use_container_width=True,
+    )
+    c_prom.download_button(
+        label="metrics.prom",
+        data=default_telemetry.to_prometheus(),
+        file_name="metrics.prom",
+        mime="text/plain",
+        use_container_width=True,
+    )
+
+
 def _render_model_controls() -> None:
     st.subheader("Model")
     st.session_state.llm_provider = st.selectbox(
@@ -379,6 +726,85 @@ def _render_generation_controls() -> None:
         int(st.session_state.max_tokens),
         100,
     )
+    st.session_state.candidates = st.slider(
+        "Candidates (best of N)",
+        1,
+        MAX_CANDIDATES,
+        int(st.session_state.candidates),
+        1,
+        help="Generate several candidates in parallel and keep the one with the best validation score.",
+    )
+    st.session_state.use_semantic_cache = st.toggle(
+        "Offer cached scripts for similar requests",
+        value=bool(st.session_state.use_semantic_cache),
+        help="Looks up earlier generations with a similar description before calling the model.",
+    )
+
+
+_UPSERT_MESSAGES = {
+    "created": "Upload successful.",
+    "updated": "Existing script updated.",
+    "unchanged": "An identical script is already published; nothing was uploaded.",
+}
+
+
+def _start_publish(utility: Utility, payload: dict) -> None:
+    inventory = None
+    if st.session_state.upsert_by_name:
+        if st.session_state.graph_inventory is None:
+            st.session_state.graph_inventory = GraphInventory(GRAPH_BASE_URL)
+        inventory = st.session_state.graph_inventory
+
+    def publish(context: JobContext) -> dict:
+        context.progress(0.1, "Uploading to Graph...")
+        if inventory is None:
+            body = utility.upload_payload(payload, deadline=context.deadline)
+            context.progress(1.0, "Upload successful.")
+            return body
+        result = utility.upsert_payloads([payload], inventory=inventory, deadline=context.deadline)[0]
+        if not result.ok:
+            raise RuntimeError(result.error)
+        context.progress(1.0, _UPSERT_MESSAGES[result.action])
+        return result.body or {}
+
+    deadline = Deadline.after(_deadline_seconds("UPLOAD_DEADLINE_SECONDS", 60))
+    _submit_job(publish, "publish", str(payload.get("displayName", "")), deadline)
+    _notice("info", "Upload started. Progress is shown under Jobs.")
+
+
+@st.cache_resource(show_spinner=False)
+def _run_state_store() -> RunStateStore:
+    return RunStateStore(_secret("RUN_STATE_PATH", DEFAULT_RUN_STATE_PATH))
+
+
+def _render_run_state_panel() -> None:
+    with st.expander("Deployment status"):
+        script_id = st.text_input("Script ID", key="run_state_script_id").strip()
+        c1, c2 = st.columns(2)
+        if c1.button("Sync run states", use_container_width=True, disabled=not script_id):
+            if not _graph_connected():
+                st.error("Connect to Graph first.")
+            else:
+                # Only Graph is needed here, so this works without LLM settings.
+                sync = RunStateSync(_graph_auth(), _run_state_store(), GRAPH_BASE_URL)
+                deadline = Deadline.after(_deadline_seconds("UPLOAD_DEADLINE_SECONDS", 60) * 5)
+                with st.spinner("Syncing device run states..."):
+                    result = sync.sync([script_id], deadline=deadline)[0]
+                if result.ok:
+                    kind = "incremental" if result.incremental else "full"
+                    st.success(f"{result.rows} device states synced ({kind}, {result.seconds}s).")
+                else:
+                    st.error(f"Run state sync failed: {result.error}")
+        if c2.button("Forget stored states", use_container_width=True, disabled=not script_id):
+            _run_state_store().clear(script_id)
+        if script_id:
+            summary = _run_state_store().summary(script_id)
+            if summary["devices"]:
+                cols = st.columns(3)
+                cols[0].metric("Devices", summary["devices"])
+                cols[1].metric("Issue detected", summary["detection_states"].get("fail", 0))
+                cols[2].metric("Remediated", summary["remediation_states"].get("success", 0))
+                st.dataframe(_run_state_store().states(script_id, limit=50), use_container_width=True)
 
 
 def _render_graph_login_controls() -> None:
@@ -392,362 +818,541 @@ def _render_graph_login_controls() -> None:
             st.error("APP_REGISTRATION_ID is missing in secrets.")
         else:
             try:
-                credential = InteractiveBrowserCredential(client_id=app_registration_id)
-                token = credential.get_token(st.session_state.graph_scope).token
-                st.session_state.graph_auth_header = _build_graph_header(token)
+                provider = _graph_token_provider(app_registration_id)
+                # Signs in interactively only when no cached token can be refreshed silently.
+                provider.token()
+                st.session_state.graph_token_provider = provider
+                # The remote index belongs to the tenant of the previous token.
+                st.session_state.graph_inventory = None
                 st.success("Graph token acquired.")
             except Exception as exc:
                 st.error(f"Graph authentication failed: {exc}")
 
     if c2.button("Disconnect", use_container_width=True, key="publish_graph_disconnect"):
+        if st.session_state.graph_token_provider is not None:
+            st.session_state.graph_token_provider.invalidate()
+        if _graph_remembers_sign_in():
+            forget_auth_record(DEFAULT_AUTH_RECORD_PATH)
+        st.session_state.graph_token_provider = None
+        st.session_state.graph_provider_key = None
         st.session_state.graph_auth_header = {}
+        st.session_state.graph_inventory = None
         st.info("Graph token removed.")
 
-    if "Authorization" in st.session_state.graph_auth_header:
+    if _graph_connected():
         st.caption("Graph status: Connected")
     else:
         st.caption("Graph status: Not connected")
 
 
-_init_state()
-_inject_styles()
+# Session state read by more than one fragment. A fragment run that changes any of these
+# reruns the whole app, so the other tabs never show stale values.
+_SHARED_STATE_KEYS = (
+    "description",
+    "detection_script",
+    "remediation_script",
+    "mode",
+    "scope",
+    "generated",
+    "alternates",
+    "history_version",
+    "last_validation",
+    "selected_community_project",
+    "pending_jobs",
+    "run_state_script_id",
+)
 
-st.markdown(
+
+def _shared_state() -> tuple[object, ...]:
+    return tuple(st.session_state.get(key) for key in _SHARED_STATE_KEYS)
+
+
+def _notice(kind: str, message: str) -> None:
+    """Show a status message that is shown again if the fragment triggers an app rerun."""
+    getattr(st, kind)(message)
+    notices = st.session_state.notices.setdefault(st.session_state.active_fragment, [])
+    notices.append((kind, message))
+
+
+def _isolated(render: Callable[[], None], run_every: float | None = None) -> Callable[[], None]:
+    """Turn a tab or panel into a fragment that reruns on its own when its widgets change.
+
+    With `run_every` the fragment also reruns on that interval. Render times are
+    recorded per fragment and shown in the Metrics panel.
     """
-    <div class="hero">
-      <h2 style="margin:0;">Remediation Creator Next</h2>
-      <p>Generate, review, validate and publish Intune detection/remediation scripts with Azure OpenAI or OpenAI.</p>
-    </div>
-    """,
-    unsafe_allow_html=True,
-)
 
-col_a, col_b = st.columns([0.65, 0.35])
+    @functools.wraps(render)
+    def run() -> None:
+        name = render.__name__
+        for kind, message in st.session_state.notices.pop(name, []):
+            getattr(st, kind)(message)
+        st.session_state.active_fragment = name
+        before = _shared_state()
+        started = time.perf_counter()
+        render()
+        st.session_state.render_ms[name] = round((time.perf_counter() - started) * 1000, 1)
+        if not st.session_state.app_run_active and _shared_state() != before:
+            st.rerun()
+        st.session_state.notices.pop(name, None)
+        st.session_state.active_fragment = ""
 
-with col_a:
-    tab_community, tab_generate, tab_review, tab_publish = st.tabs(
-        ["Find Scripts", "Generate", "Review", "Publish"]
-    )
+    return st.fragment(run, run_every=run_every)
 
-    with tab_generate:
-        with st.expander("Model & Generation Settings", expanded=False):
-            _render_model_controls()
-            _render_generation_controls()
-        st.divider()
 
-        st.subheader("Describe your remediation scenario")
+def _payload_preview() -> tuple[str, str]:
+    """Upload payload JSON and any error; rebuilt only when one of its inputs changes.
 
-        template_names = [item["name"] for item in SCENARIO_TEMPLATES]
-        selected_template_name = st.selectbox("Template starter", options=["Custom"] + template_names)
+    Session state keeps a digest of the inputs and the blob key of the JSON, not the text.
+    """
+    inputs = (
+        st.session_state.script_name,
+        st.session_state.description,
+        st.session_state.scope,
+        st.session_state.detection_script,
+        st.session_state.remediation_script,
+        bool(st.session_state.run_as_32_bit),
+        bool(st.session_state.enforce_signature_check),
+        st.session_state.publisher.strip() or "Remediation Creator Next",
+    )
+    digest = hashlib.sha256("\0".join(str(value) for value in inputs).encode("utf-8")).hexdigest()
+    cached = st.session_state.payload_preview
+    if cached is not None and cached[0] == digest:
+        return _blobs().get(cached[1]), cached[2]
+    try:
+        payload_json, error = Utility.pretty_json(build_upload_payload(*inputs)), ""
+    except ValueError as exc:
+        payload_json, error = "", str(exc)
+    st.session_state.payload_preview = (digest, _blobs().put(payload_json) if payload_json else "", error)
+    return payload_json, error
+
+
+@_isolated
+def _render_generate_tab() -> None:
+    with st.expander("Model & Generation Settings", expanded=False):
+        _render_model_controls()
+        _render_generation_controls()
+    st.divider()
+
+    st.subheader("Describe your remediation scenario")
+
+    template_names = [item["name"] for item in SCENARIO_TEMPLATES]
+    selected_template_name = st.selectbox("Template starter", options=["Custom"] + template_names)
+
+    if st.button("Insert template into description"):
+        if selected_template_name != "Custom":
+            selected_template = next(item for item in SCENARIO_TEMPLATES if item["name"] == selected_template_name)
+            if st.session_state.description.strip():
+                st.session_state.description += "\n\n" + selected_template["description"]
+            else:
+                st.session_state.description = selected_template["description"]
 
-        if st.button("Insert template into description"):
-            if selected_template_name != "Custom":
-                selected_template = next(item for item in SCENARIO_TEMPLATES if item["name"] == selected_template_name)
-                if st.session_state.description.strip():
-                    st.session_state.description += "\n\n" + selected_template["description"]
-                else:
-                    st.session_state.description = selected_template["description"]
+    st.session_state.description = st.text_area(
+        "Description",
+        value=st.session_state.description,
+        height=220,
+        placeholder="Explain what should be detected and how it should be remediated...",
+    )
 
-        st.session_state.description = st.text_area(
-            "Description",
-            value=st.session_state.description,
-            height=220,
-            placeholder="Explain what should be detected and how it should be remediated...",
-        )
+    st.session_state.extra_requirements = st.text_area(
+        "Additional requirements (optional)",
+        value=st.session_state.extra_requirements,
+        height=120,
+        placeholder="e.g. keep all actions idempotent, include event log output",
+    )
 
-        st.session_state.extra_requirements = st.text_area(
-            "Additional requirements (optional)",
-            value=st.session_state.extra_requirements,
-            height=120,
-            placeholder="e.g. keep all actions idempotent, include event log output",
-        )
+    c_generate, c_clear = st.columns([0.25, 0.2])
 
-        c_generate, c_clear = st.columns([0.25, 0.2])
+    if c_generate.button("Generate scripts", use_container_width=True, type="primary"):
+        st.session_state.semantic_cache_hit = None
+        utility, missing_config = _create_utility()
+        if utility is None:
+            _notice("error", "LLM configuration missing: " + ", ".join(missing_config) + ". Configure it in Generate.")
+        elif not st.session_state.description.strip():
+            _notice("error", "Please enter a description first.")
+        else:
+            cache_hit = None
+            if st.session_state.use_semantic_cache:
+                try:
+                    cache_hit = _semantic_cache().lookup(
+                        description=st.session_state.description,
+                        extra_requirements=st.session_state.extra_requirements,
+                        mode=st.session_state.mode,
+                    )
+                except Exception:
+                    cache_hit = None
+            if cache_hit is not None:
+                st.session_state.semantic_cache_hit = cache_hit
+            else:
+                _start_generation(utility)
 
-        if c_generate.button("Generate scripts", use_container_width=True, type="primary"):
+    cache_hit = st.session_state.semantic_cache_hit
+    if cache_hit is not None:
+        if cache_hit.exact:
+            st.info(f"This request was generated before: \"{cache_hit.artifact.description[:160]}\"")
+        else:
+            st.warning(
+                f"Near-duplicate, not an exact match ({cache_hit.similarity:.0%} similar). The cached scripts "
+                f"were generated for: \"{cache_hit.artifact.description[:160]}\". Check that they do what "
+                "your description asks before using them."
+            )
+        c_use_cached, c_regenerate = st.columns(2)
+        if c_use_cached.button("Use cached scripts", use_container_width=True):
+            utility, _ = _create_utility()
+            _apply_artifact(cache_hit.artifact, utility)
+            st.session_state.semantic_cache_hit = None
+            if cache_hit.exact:
+                _notice("success", "Cached scripts loaded into the Review editor.")
+            else:
+                _notice(
+                    "warning",
+                    "Near-duplicate scripts loaded into the Review editor. They were generated for "
+                    f"\"{cache_hit.artifact.description[:160]}\"; review them before publishing.",
+                )
+        if c_regenerate.button("Regenerate anyway", use_container_width=True):
+            st.session_state.semantic_cache_hit = None
             utility, missing_config = _create_utility()
             if utility is None:
-                st.error("LLM configuration missing: " + ", ".join(missing_config) + ". Configure it in Generate.")
-            elif not st.session_state.description.strip():
-                st.error("Please enter a description first.")
+                _notice("error", "LLM configuration missing: " + ", ".join(missing_config) + ". Configure it in Generate.")
             else:
-                with st.spinner("Generating scripts..."):
-                    try:
-                        artifact = utility.generate(
-                            description=st.session_state.description,
-                            include_remediation=st.session_state.mode == "Detection and Remediation",
-                            temperature=float(st.session_state.temperature),
-                            max_tokens=int(st.session_state.max_tokens),
-                            extra_requirements=st.session_state.extra_requirements,
-                        )
-                        st.session_state.detection_script = artifact.detection_script
-                        st.session_state.remediation_script = artifact.remediation_script
-                        st.session_state.generated = True
-                        _save_history(artifact.mode)
-                        st.session_state.last_validation = utility.validate_scripts(
-                            detection_script=st.session_state.detection_script,
-                            remediation_script=st.session_state.remediation_script,
-                        )
-                        st.success("Scripts generated and validated.")
-                    except Exception as exc:
-                        st.error(f"Generation failed: {exc}")
-
-        if c_clear.button("Clear", use_container_width=True):
-            _reset_scripts()
+                # New scripts were asked for, so cached LLM responses are skipped as well.
+                utility.response_cache_ttl = 0
+                _start_generation(utility)
 
-    with tab_community:
-        st.subheader("Find matching scripts from community repository")
-        st.caption("Searches JayRHa/EndpointAnalyticsRemediationScripts via GitHub API.")
+    if c_clear.button("Clear", use_container_width=True):
+        _reset_scripts()
 
-        selected_project = st.session_state.selected_community_project
-        if isinstance(selected_project, dict) and selected_project.get("name"):
-            st.info(f"Selected: {selected_project['name']} (shown in Review tab)")
 
-        st.session_state.github_token = st.text_input(
-            "GitHub token (optional)",
-            value=st.session_state.github_token,
-            type="password",
-            help="Optional: increases API rate limits for search.",
-        )
-        st.session_state.community_query = st.text_input(
-            "Search query",
-            value=st.session_state.community_query,
-            placeholder="e.g. bitlocker, teams, dns, browser cache",
-        )
+@_isolated
+def _render_community_tab() -> None:
+    st.subheader("Find matching scripts from community repository")
+    st.caption("Searches JayRHa/EndpointAnalyticsRemediationScripts via GitHub API.")
 
-        c_search, c_reset = st.columns([0.35, 0.2])
-        if c_search.button("Search community projects", use_container_width=True):
-            try:
-                catalog = _load_community_catalog(
-                    owner=DEFAULT_OWNER,
-                    repo=DEFAULT_REPO,
-                    ref=DEFAULT_REF,
-                    github_token=st.session_state.github_token,
-                )
-                st.session_state.community_results = search_projects(
-                    query=st.session_state.community_query,
-                    catalog=catalog,
-                    limit=8,
-                )
-                st.session_state.community_error = ""
-            except Exception as exc:
-                st.session_state.community_results = []
-                st.session_state.community_error = str(exc)
+    selected_project = st.session_state.selected_community_project
+    if isinstance(selected_project, dict) and selected_project.get("name"):
+        st.info(f"Selected: {selected_project['name']} (shown in Review tab)")
 
-        if c_reset.button("Clear results", use_container_width=True):
-            st.session_state.community_results = []
-            st.session_state.community_error = ""
-            st.session_state.community_query = ""
-
-        if st.session_state.community_error:
-            st.error(f"Community search failed: {st.session_state.community_error}")
-
-        if st.session_state.community_results:
-            for item in st.session_state.community_results:
-                project = item.project
-                st.markdown(f"**{project.name}**  \nScore: `{item.score}`")
-                st.markdown(
-                    f"[Open project]({project.folder_url()})  "
-                    f"| Detection scripts: `{len(project.detection_files)}`  "
-                    f"| Remediation scripts: `{len(project.remediation_files)}`"
-                )
-                if item.reasons:
-                    st.caption("Reasons: " + ", ".join(item.reasons))
-                select_key = hashlib.sha256(project.name.encode("utf-8")).hexdigest()[:8]
-                if st.button(f"Select: {project.name}", key=f"community_select_{select_key}", use_container_width=True):
-                    detection_file = project.detection_files[0] if project.detection_files else ""
-                    remediation_file = project.remediation_files[0] if project.remediation_files else ""
-                    st.session_state.selected_community_project = _load_community_project_preview(
-                        project_name=project.name,
-                        project_folder=project.folder,
-                        detection_file=detection_file,
-                        remediation_file=remediation_file,
-                        readme_file=project.readme_file,
-                        github_token=st.session_state.github_token,
-                    )
-                    st.success(f"Selected '{project.name}'. Open Review tab.")
-        elif st.session_state.community_query.strip():
-            st.info("No matching community projects found for the current query.")
+    st.session_state.github_token = st.text_input(
+        "GitHub token (optional)",
+        value=st.session_state.github_token,
+        type="password",
+        help="Optional: increases API rate limits for search.",
+    )
+    st.session_state.community_query = st.text_input(
+        "Search query",
+        value=st.session_state.community_query,
+        placeholder="e.g. bitlocker, teams, dns, browser cache",
+    )
 
-    with tab_review:
-        st.subheader("Review and validate")
-
-        selected_project = st.session_state.selected_community_project
-        if isinstance(selected_project, dict) and selected_project.get("name"):
-            st.markdown(f"**Selected Community Project:** {selected_project['name']}")
-            st.markdown(f"[Open project]({selected_project.get('folder_url', '')})")
-
-            preview_col1, preview_col2 = st.columns(2)
-            preview_col1.caption("Community Detection")
-            preview_col1.text_area(
-                "Community detection preview",
-                value=selected_project.get("detection_script", ""),
-                height=180,
-                key="community_detection_preview",
-                disabled=True,
+    c_search, c_reset = st.columns([0.35, 0.2])
+    if c_search.button("Search community projects", use_container_width=True):
+        try:
+            catalog = _load_community_catalog(
+                owner=DEFAULT_OWNER,
+                repo=DEFAULT_REPO,
+                ref=DEFAULT_REF,
+                github_token=st.session_state.github_token,
             )
-            preview_col2.caption("Community Remediation")
-            preview_col2.text_area(
-                "Community remediation preview",
-                value=selected_project.get("remediation_script", ""),
-                height=180,
-                key="community_remediation_preview",
-                disabled=True,
+            st.session_state.community_results = search_projects(
+                query=st.session_state.community_query,
+                catalog=catalog,
+                limit=8,
             )
-
-            c_apply, c_reference = st.columns(2)
-            if c_apply.button("Use selected scripts in editor", use_container_width=True):
-                if selected_project.get("detection_script", "").strip():
-                    st.session_state.detection_script = selected_project["detection_script"]
-                if selected_project.get("remediation_script", "").strip():
-                    st.session_state.remediation_script = selected_project["remediation_script"]
-                st.success("Community scripts copied into Review editor.")
-
-            if c_reference.button("Add selected project to description", use_container_width=True):
-                ref_line = "Reference from community repo: " + selected_project["name"]
-                if ref_line not in st.session_state.description:
-                    if st.session_state.description.strip():
-                        st.session_state.description += "\n\n" + ref_line
-                    else:
-                        st.session_state.description = ref_line
-                st.success("Reference added to description.")
-
-            st.divider()
-
-        st.session_state.detection_script = st.text_area(
-            "Detection script",
-            value=st.session_state.detection_script,
-            height=280,
-            placeholder="Detection script appears here...",
+            st.session_state.community_error = ""
+        except Exception as exc:
+            st.session_state.community_results = []
+            st.session_state.community_error = str(exc)
+
+    if c_reset.button("Clear results", use_container_width=True):
+        st.session_state.community_results = []
+        st.session_state.community_error = ""
+        st.session_state.community_query = ""
+
+    if st.session_state.community_error:
+        st.error(f"Community search failed: {st.session_state.community_error}")
+
+    if st.session_state.community_results:
+        for item in st.session_state.community_results:
+            project = item.project
+            st.markdown(f"**{project.name}**  \nScore: `{item.score}`")
+            st.markdown(
+                f"[Open project]({project.folder_url()})  "
+                f"| Detection scripts: `{len(project.detection_files)}`  "
+                f"| Remediation scripts: `{len(project.remediation_files)}`"
+            )
+            if item.reasons:
+                st.caption("Reasons: " + ", ".join(item.reasons))
+            select_key = hashlib.sha256(project.name.encode("utf-8")).hexdigest()[:8]
+            if st.button(f"Select: {project.name}", key=f"community_select_{select_key}", use_container_width=True):
+                detection_file = project.detection_files[0] if project.detection_files else ""
+                remediation_file = project.remediation_files[0] if project.remediation_files else ""
+                preview = _load_community_project_preview(
+                    project_name=project.name,
+                    project_folder=project.folder,
+                    detection_file=detection_file,
+                    remediation_file=remediation_file,
+                    readme_file=project.readme_file,
+                    deadline=Deadline.after(_deadline_seconds("COMMUNITY_DEADLINE_SECONDS", 45)),
+                    github_token=st.session_state.github_token,
+                )
+                # Many users open the same projects; their texts are stored once, compressed.
+                for text_field, key_field in (
+                    ("detection_script", "detection_key"),
+                    ("remediation_script", "remediation_key"),
+                    ("readme_content", "readme_key"),
+                ):
+                    preview[key_field] = _blobs().put(preview.pop(text_field))
+                st.session_state.selected_community_project = preview
+                _notice("success", f"Selected '{project.name}'. Open Review tab.")
+    elif st.session_state.community_query.strip():
+        st.info("No matching community projects found for the current query.")
+
+
+@_isolated
+def _render_review_tab() -> None:
+    st.subheader("Review and validate")
+
+    selected_project = st.session_state.selected_community_project
+    if isinstance(selected_project, dict) and selected_project.get("name"):
+        st.markdown(f"**Selected Community Project:** {selected_project['name']}")
+        st.markdown(f"[Open project]({selected_project.get('folder_url', '')})")
+
+        preview_col1, preview_col2 = st.columns(2)
+        community_detection = _blobs().get(selected_project.get("detection_key", ""))
+        community_remediation = _blobs().get(selected_project.get("remediation_key", ""))
+        preview_col1.caption("Community Detection")
+        preview_col1.text_area(
+            "Community detection preview",
+            value=community_detection,
+            height=180,
+            key="community_detection_preview",
+            disabled=True,
         )
-
-        st.session_state.remediation_script = st.text_area(
-            "Remediation script",
-            value=st.session_state.remediation_script,
-            height=280,
-            placeholder="Remediation script appears here...",
+        preview_col2.caption("Community Remediation")
+        preview_col2.text_area(
+            "Community remediation preview",
+            value=community_remediation,
+            height=180,
+            key="community_remediation_preview",
+            disabled=True,
         )
 
-        c_validate, c_save = st.columns(2)
-        if c_validate.button("Run validation", use_container_width=True):
-            utility, missing_config = _create_utility()
-            if utility is None:
-                st.error("LLM configuration missing: " + ", ".join(missing_config) + ". Configure it in Generate.")
-            else:
-                st.session_state.last_validation = utility.validate_scripts(
-                    detection_script=st.session_state.detection_script,
-                    remediation_script=st.session_state.remediation_script,
-                )
-
-        if c_save.button("Save snapshot", use_container_width=True):
-            _save_history(st.session_state.mode)
-            st.success("Snapshot saved to history.")
+        c_apply, c_reference = st.columns(2)
+        if c_apply.button("Use selected scripts in editor", use_container_width=True):
+            if community_detection.strip():
+                st.session_state.detection_script = community_detection
+            if community_remediation.strip():
+                st.session_state.remediation_script = community_remediation
+            _notice("success", "Community scripts copied into Review editor.")
+
+        if c_reference.button("Add selected project to description", use_container_width=True):
+            ref_line = "Reference from community repo: " + selected_project["name"]
+            if ref_line not in st.session_state.description:
+                if st.session_state.description.strip():
+                    st.session_state.description += "\n\n" + ref_line
+                else:
+                    st.session_state.description = ref_line
+            _notice("success", "Reference added to description.")
 
-        _render_validation(st.session_state.last_validation)
+        st.divider()
 
-        d_col, r_col = st.columns(2)
-        d_col.download_button(
-            label="Download detection.ps1",
-            data=st.session_state.detection_script,
-            file_name="detection.ps1",
-            mime="text/plain",
-            disabled=not bool(st.session_state.detection_script.strip()),
-            use_container_width=True,
-        )
-        r_col.download_button(
-            label="Download remediation.ps1",
-            data=st.session_state.remediation_script,
-            file_name="remediation.ps1",
-            mime="text/plain",
-            disabled=not bool(st.session_state.remediation_script.strip()),
-            use_container_width=True,
-        )
+    st.session_state.detection_script = st.text_area(
+        "Detection script",
+        value=st.session_state.detection_script,
+        height=280,
+        placeholder="Detection script appears here...",
+    )
 
-    with tab_publish:
-        st.subheader("Publish to Intune")
+    st.session_state.remediation_script = st.text_area(
+        "Remediation script",
+        value=st.session_state.remediation_script,
+        height=280,
+        placeholder="Remediation script appears here...",
+    )
 
+    if st.session_state.alternates:
+        with st.expander(f"Alternate candidates ({len(st.session_state.alternates)})", expanded=False):
+            for index, alternate in enumerate(st.session_state.alternates):
+                st.caption(f"Candidate {alternate['fingerprint']} | score {alternate['score']:.0f}")
+                st.code(_blobs().get(alternate["detection_key"]), language="powershell")
+                if st.button("Use this candidate", key=f"use_alternate_{index}", use_container_width=True):
+                    st.session_state.detection_script = _blobs().get(alternate["detection_key"])
+                    st.session_state.remediation_script = _blobs().get(alternate["remediation_key"])
+                    _notice("success", "Alternate candidate copied into Review editor.")
+
+    c_validate, c_save = st.columns(2)
+    if c_validate.button("Run validation", use_container_width=True):
         utility, missing_config = _create_utility()
         if utility is None:
-            st.warning("LLM configuration missing: " + ", ".join(missing_config) + ". Configure it in Generate.")
+            _notice("error", "LLM configuration missing: " + ", ".join(missing_config) + ". Configure it in Generate.")
+        else:
+            _validate_current_scripts(utility)
+
+    if c_save.button("Save snapshot", use_container_width=True):
+        _save_history(st.session_state.mode)
+        _notice("success", "Snapshot saved to history.")
+
+    _render_validation(st.session_state.last_validation)
+
+    d_col, r_col = st.columns(2)
+    d_col.download_button(
+        label="Download detection.ps1",
+        data=st.session_state.detection_script,
+        file_name="detection.ps1",
+        mime="text/plain",
+        disabled=not bool(st.session_state.detection_script.strip()),
+        use_container_width=True,
+    )
+    r_col.download_button(
+        label="Download remediation.ps1",
+        data=st.session_state.remediation_script,
+        file_name="remediation.ps1",
+        mime="text/plain",
+        disabled=not bool(st.session_state.remediation_script.strip()),
+        use_container_width=True,
+    )
 
-        st.divider()
-        st.subheader("Execution")
-        st.session_state.scope = st.selectbox(
-            "Run as",
-            options=["System", "User"],
-            index=0 if st.session_state.scope == "System" else 1,
-        )
-        st.session_state.run_as_32_bit = st.toggle(
-            "Run as 32-bit",
-            value=bool(st.session_state.run_as_32_bit),
+
+@_isolated
+def _render_publish_tab() -> None:
+    st.subheader("Publish to Intune")
+
+    # Only check the settings here; the client is built when an action needs it.
+    _, missing_config = _utility_settings()
+    if missing_config:
+        st.warning("LLM configuration missing: " + ", ".join(missing_config) + ". Configure it in Generate.")
+
+    st.divider()
+    st.subheader("Execution")
+    st.session_state.scope = st.selectbox(
+        "Run as",
+        options=["System", "User"],
+        index=0 if st.session_state.scope == "System" else 1,
+    )
+    st.session_state.run_as_32_bit = st.toggle(
+        "Run as 32-bit",
+        value=bool(st.session_state.run_as_32_bit),
+    )
+    st.session_state.enforce_signature_check = st.toggle(
+        "Enforce signature check",
+        value=bool(st.session_state.enforce_signature_check),
+    )
+
+    _render_graph_login_controls()
+
+    st.divider()
+
+    st.session_state.script_name = st.text_input("Script name", value=st.session_state.script_name)
+    st.session_state.publisher = st.text_input("Publisher", value=st.session_state.publisher)
+
+    payload_json, payload_error = _payload_preview()
+    if payload_error and not missing_config:
+        st.warning(f"Payload preview unavailable: {payload_error}")
+
+    if payload_json and not missing_config:
+        st.code(payload_json, language="json")
+        st.download_button(
+            label="Download payload.json",
+            data=payload_json,
+            file_name="intune_device_health_script_payload.json",
+            mime="application/json",
+            use_container_width=True,
         )
-        st.session_state.enforce_signature_check = st.toggle(
-            "Enforce signature check",
-            value=bool(st.session_state.enforce_signature_check),
+
+        st.session_state.upsert_by_name = st.toggle(
+            "Update existing script with the same name",
+            value=bool(st.session_state.upsert_by_name),
+            help="Skips the upload when the tenant already has an identical script and updates it when it differs.",
         )
+        if st.button("Upload to Graph", type="primary", use_container_width=True):
+            utility, missing_config = _create_utility()
+            if utility is None:
+                st.error("LLM configuration missing: " + ", ".join(missing_config))
+            elif not _graph_connected():
+                st.error("Authenticate to Graph in the Publish tab first.")
+            else:
+                _start_publish(utility, json.loads(payload_json))
 
-        _render_graph_login_controls()
+    _render_run_state_panel()
 
-        st.divider()
 
-        st.session_state.script_name = st.text_input("Script name", value=st.session_state.script_name)
-        st.session_state.publisher = st.text_input("Publisher", value=st.session_state.publisher)
+def _render_job(job: Job) -> None:
+    with st.container(border=True):
+        st.markdown(f"**{job.kind.title()}** · {job.label or job.id[:8]}")
+        if job.state == "failed":
+            st.error(f"{job.kind.title()} failed: {job.error}")
+        elif job.state == "cancelled":
+            st.caption(job.message or "Cancelled.")
+        else:
+            st.progress(job.progress, text=f"{job.message or job.state.title()} ({job.seconds}s)")
+        if job.state == "succeeded" and job.kind == "publish" and job.result:
+            st.json(job.result, expanded=False)
+        if job.finished:
+            if st.button("Dismiss", key=f"job_dismiss_{job.id}", use_container_width=True):
+                _job_queue().forget(job.id)
+                st.rerun(scope="fragment")
+        elif st.button("Cancel", key=f"job_cancel_{job.id}", use_container_width=True):
+            _job_queue().cancel(job.id)
+
+
+def _render_jobs() -> None:
+    _collect_finished_jobs()
+    jobs = _job_queue().jobs(owner=st.session_state.job_owner)[:JOBS_SHOWN]
+    if not jobs:
+        return
+    st.subheader("Jobs")
+    for job in jobs:
+        _render_job(job)
 
-        payload = None
-        if utility is not None:
-            try:
-                payload = utility.build_upload_payload(
-                    script_name=st.session_state.script_name,
-                    description=st.session_state.description,
-                    scope=st.session_state.scope,
-                    detection_script=st.session_state.detection_script,
-                    remediation_script=st.session_state.remediation_script,
-                    run_as_32_bit=bool(st.session_state.run_as_32_bit),
-                    enforce_signature_check=bool(st.session_state.enforce_signature_check),
-                    publisher=st.session_state.publisher.strip() or "Remediation Creator Next",
-                )
-            except Exception as exc:
-                st.warning(f"Payload preview unavailable: {exc}")
-
-        if payload:
-            st.code(utility.pretty_json(payload), language="json")
-            st.download_button(
-                label="Download payload.json",
-                data=json.dumps(payload, indent=2),
-                file_name="intune_device_health_script_payload.json",
-                mime="application/json",
-                use_container_width=True,
-            )
 
-            if st.button("Upload to Graph", type="primary", use_container_width=True):
-                if utility is None:
-                    st.error("LLM configuration missing: " + ", ".join(missing_config))
-                elif "Authorization" not in st.session_state.graph_auth_header:
-                    st.error("Authenticate to Graph in the Publish tab first.")
-                else:
-                    try:
-                        result = utility.upload_payload(payload)
-                        st.success("Upload successful.")
-                        st.json(result)
-                    except Exception as exc:
-                        st.error(f"Upload failed: {exc}")
+JOB_POLL_SECONDS = 1.0
+JOBS_SHOWN = 6
+_render_jobs_panel = _isolated(_render_jobs)
+# Polls only while this session has unfinished jobs; the last one finishing reruns the app.
+_render_jobs_panel_live = _isolated(_render_jobs, run_every=JOB_POLL_SECONDS)
 
-with col_b:
+
+@_isolated
+def _render_history_panel() -> None:
     st.subheader("History")
-    if st.session_state.history:
-        labels = [_history_label(item) for item in st.session_state.history]
-        selected = st.selectbox("Saved snapshots", options=labels)
-        selected_item = st.session_state.history[labels.index(selected)]
+    store = _history_store()
+    owner = _history_owner()
+    query = st.text_input(
+        "Search snapshots",
+        key="history_query",
+        placeholder="Words from the description or the scripts",
+        on_change=_reset_history_page,
+    )
+    total = store.count(query, owner=owner)
+    if total:
+        pages = -(-total // DEFAULT_HISTORY_PAGE_SIZE)
+        page = min(st.session_state.history_page, pages - 1)
+        # Only the labels of one page are loaded; script bodies are read on restore.
+        items = {item.id: item for item in store.page(query, page * DEFAULT_HISTORY_PAGE_SIZE, owner=owner)}
+        selected_id = st.selectbox(
+            "Saved snapshots", options=list(items), format_func=lambda item_id: _history_label(items[item_id])
+        )
+        c_newer, c_page, c_older = st.columns([0.3, 0.4, 0.3])
+        c_newer.button("Newer", disabled=page == 0, on_click=_shift_history_page, args=(-1,), use_container_width=True)
+        c_page.caption(f"Page {page + 1} of {pages} ({total} snapshots)")
+        c_older.button(
+            "Older", disabled=page >= pages - 1, on_click=_shift_history_page, args=(1,), use_container_width=True
+        )
 
         if st.button("Restore snapshot", use_container_width=True):
-            st.session_state.description = selected_item["description"]
-            st.session_state.detection_script = selected_item["detection_script"]
-            st.session_state.remediation_script = selected_item["remediation_script"]
-            st.session_state.generated = True
-            st.success("Snapshot restored.")
+            entry = store.get(selected_id, owner=owner)
+            if entry is None:
+                _notice("error", "This snapshot no longer exists.")
+            else:
+                st.session_state.description = entry.description
+                st.session_state.detection_script = entry.detection_script
+                st.session_state.remediation_script = entry.remediation_script
+                st.session_state.generated = True
+                _notice("success", "Snapshot restored.")
 
         st.caption("Snapshot description")
-        st.write(selected_item["description"] or "(empty)")
+        st.write(items[selected_id].description or "(empty)")
+    elif query:
+        st.info("No snapshots match this search.")
     else:
         st.info("No history yet. Generate a script to create snapshots.")
 
@@ -763,3 +1368,53 @@ with col_b:
         """,
         unsafe_allow_html=True,
     )
+
+    with st.expander("Metrics", expanded=False):
+        _render_metrics_panel()
+
+
+_app_started = time.perf_counter()
+_init_state()
+st.session_state.app_run_active = True
+_collect_finished_jobs()
+_inject_styles()
+
+st.markdown(
+    """
+    <div class="hero">
+      <h2 style="margin:0;">Remediation Creator Next</h2>
+      <p>Generate, review, validate and publish Intune detection/remediation scripts with Azure OpenAI or OpenAI.</p>
+    </div>
+    """,
+    unsafe_allow_html=True,
+)
+
+col_a, col_b = st.columns([0.65, 0.35])
+
+with col_a:
+    tab_community, tab_generate, tab_review, tab_publish = st.tabs(
+        ["Find Scripts", "Generate", "Review", "Publish"]
+    )
+    with tab_generate:
+        _render_generate_tab()
+    with tab_community:
+        _render_community_tab()
+    with tab_review:
+        _render_review_tab()
+    with tab_publish:
+        _render_publish_tab()
+
+with col_b:
+    if st.session_state.pending_jobs:
+        _render_jobs_panel_live()
+    else:
+        _render_jobs_panel()
+    _render_history_panel()
+
+st.session_state.app_run_active = False
+st.session_state.render_ms["app"] = round((time.perf_counter() - _app_started) * 1000, 1)
+
+_profiler = active_profiler()
+if _profiler is not None and _profiler.phase == "startup":
+    _profiler.mark_first_paint()
+    print(_profiler.format_report(), file=sys.stderr)
@@ -0,0 +1,688 @@
+"""Headless JSON HTTP API for search, generation, validation and publishing.
+
+Usage:
+    python -m modules.api_server [--host HOST] [--port PORT] [--workers N] [--max-queue N]
+
+LLM, GitHub and Graph settings are read from the environment; see `utility_from_env`
+and `ServerConfig.from_env`.
+"""
+
+from __future__ import annotations
+
+import argparse
+import hmac
+import json
+import os
+import socket
+import sys
+import threading
+import time
+from collections.abc import Callable, Mapping
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from typing import Any
+from urllib.parse import parse_qs, urlsplit
+
+from modules.client_registry import default_client_registry
+from modules.community_search import (
+    CATALOG_TTL_SECONDS,
+    DEFAULT_OWNER,
+    DEFAULT_REF,
+    DEFAULT_REPO,
+    GITHUB_API_BASE,
+    load_project_catalog,
+    search_projects,
+)
+from modules.deadline import Deadline, DeadlineExceeded
+from modules.graph_batch import DEFAULT_BATCH_CONCURRENCY, GraphBatchPublisher
+from modules.graph_inventory import GraphInventory, upsert
+from modules.shared_cache import DEFAULT_CACHE_BACKEND, CacheBackend, create_cache
+from modules.telemetry import default_telemetry
+from modules.utility import (
+    DEFAULT_GENERATION_DEADLINE_SECONDS,
+    DEFAULT_RESPONSE_CACHE_TTL_SECONDS,
+    GRAPH_BASE_URL,
+    MAX_CANDIDATES,
+    Utility,
+    build_upload_payload,
+)
+from modules.validation import validate_scripts
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8080
+DEFAULT_API_WORKERS = 8
+DEFAULT_MAX_QUEUE = 32
+DEFAULT_QUEUE_TIMEOUT_SECONDS = 10.0
+DEFAULT_PUBLISH_DEADLINE_SECONDS = 120.0
+DEFAULT_MAX_BODY_BYTES = 4 * 1024 * 1024
+DEFAULT_CLIENT_TIMEOUT_SECONDS = 30.0
+DEFAULT_REJECT_LINGER_SECONDS = 1.0
+# Refusals queued for the reject threads; further over-limit connections are closed unanswered.
+MAX_PENDING_REJECTIONS = 64
+_METRIC_PREFIX = "remediation_api"
+
+
+class _HttpError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+@dataclass(slots=True)
+class ServerConfig:
+    host: str = DEFAULT_HOST
+    port: int = DEFAULT_PORT
+    workers: int = DEFAULT_API_WORKERS
+    max_queue: int = DEFAULT_MAX_QUEUE
+    queue_timeout_seconds: float = DEFAULT_QUEUE_TIMEOUT_SECONDS
+    max_body_bytes: int = DEFAULT_MAX_BODY_BYTES
+    generation_deadline_seconds: float = DEFAULT_GENERATION_DEADLINE_SECONDS
+    publish_deadline_seconds: float = DEFAULT_PUBLISH_DEADLINE_SECONDS
+    catalog_ttl_seconds: float = CATALOG_TTL_SECONDS
+    cache_backend: str = DEFAULT_CACHE_BACKEND
+    cache_path: str = ""
+    graph_base_url: str = GRAPH_BASE_URL
+    github_api_base: str = GITHUB_API_BASE
+    github_token: str = ""
+    api_token: str = ""
+
+    @classmethod
+    def from_env(cls, env: Mapping[str, str] = os.environ) -> ServerConfig:
+        """Read `API_*`, `CACHE_*`, `GRAPH_BASE_URL`, `GITHUB_API_BASE` and `GITHUB_TOKEN`."""
+        return cls(
+            host=env.get("API_HOST", DEFAULT_HOST),
+            port=int(env.get("API_PORT", DEFAULT_PORT)),
+            workers=int(env.get("API_WORKERS", DEFAULT_API_WORKERS)),
+            max_queue=int(env.get("API_MAX_QUEUE", DEFAULT_MAX_QUEUE)),
+            queue_timeout_seconds=float(env.get("API_QUEUE_TIMEOUT_SECONDS", DEFAULT_QUEUE_TIMEOUT_SECONDS)),
+            generation_deadline_seconds=float(
+                env.get("GENERATION_DEADLINE_SECONDS", DEFAULT_GENERATION_DEADLINE_SECONDS)
+            ),
+            publish_deadline_seconds=float(env.get("UPLOAD_DEADLINE_SECONDS", DEFAULT_PUBLISH_DEADLINE_SECONDS)),
+            cache_backend=env.get("CACHE_BACKEND", DEFAULT_CACHE_BACKEND),
+            cache_path=env.get("CACHE_PATH", ""),
+            graph_base_url=env.get("GRAPH_BASE_URL", GRAPH_BASE_URL),
+            github_api_base=env.get("GITHUB_API_BASE", GITHUB_API_BASE),
+            github_token=env.get("GITHUB_TOKEN", ""),
+            api_token=env.get("API_TOKEN", ""),
+        )
+
+
+def utility_from_env(env: Mapping[str, str] = os.environ, cache: CacheBackend | None = None) -> Utility | None:
+    """Build a `Utility` from the same names the app reads from secrets; None without an LLM.
+
+    `AZURE_OPENAI_DEPLOYMENTS` (a JSON list) selects a deployment pool. Otherwise
+    `AZURE_OPENAI_KEY`/`AZURE_OPENAI_ENDPOINT` with `AZURE_OPENAI_CHATGPT_DEPLOYMENT`, or
+    `OPENAI_API_KEY` with `OPENAI_MODEL`; `LLM_PROVIDER` picks one when both are set.
+    The OpenAI SDK also honours `OPENAI_BASE_URL`, e.g. for a local stand-in.
+    """
+    shared = {
+        "cache": cache,
+        "response_cache_ttl": float(env.get("LLM_RESPONSE_CACHE_TTL_SECONDS", DEFAULT_RESPONSE_CACHE_TTL_SECONDS)),
+    }
+    hedger = None
+    if env.get("LLM_HEDGING", "false").lower() in {"1", "true", "yes"}:
+        from modules.hedging import RequestHedger
+
+        hedger = RequestHedger(percentile=float(env.get("LLM_HEDGE_PERCENTILE", "95")))
+
+    if env.get("AZURE_OPENAI_DEPLOYMENTS"):
+        from modules.deployment_pool import build_deployment_pool
+
+        pool = build_deployment_pool(json.loads(env["AZURE_OPENAI_DEPLOYMENTS"]))
+        return Utility(model_name="", deployment_pool=pool, hedger=hedger, **shared)
+
+    provider = env.get("LLM_PROVIDER", "azure" if env.get("AZURE_OPENAI_KEY") else "openai").lower()
+    if provider == "azure" and env.get("AZURE_OPENAI_KEY"):
+        return Utility(
+            model_name=env.get("AZURE_OPENAI_CHATGPT_DEPLOYMENT", ""),
+            provider="azure",
+            api_key=env["AZURE_OPENAI_KEY"],
+            azure_openai_endpoint=env.get("AZURE_OPENAI_ENDPOINT", ""),
+            azure_openai_api_version=env.get("AZURE_OPENAI_API_VERSION", "2025-04-01-preview"),
+            hedger=hedger,
+            **shared,
+        )
+    if provider == "openai" and env.get("OPENAI_API_KEY"):
+        return Utility(
+            model_name=env.get("OPENAI_MODEL", ""),
+            provider="openai",
+            api_key=env["OPENAI_API_KEY"],
+            hedger=hedger,
+            **shared,
+        )
+    return None
+
+
+@dataclass(slots=True)
+class _RouteStats:
+    requests: int = 0
+    errors: int = 0
+    latency_total: float = 0.0
+    latency_max: float = 0.0
+    statuses: dict[int, int] = field(default_factory=dict)
+
+
+class ApiService:
+    """Endpoint logic, independent of HTTP; bodies in and out are plain dicts.
+
+    The community catalog and validation reports go through `cache`. With a disk or
+    SQLite backend, replicas share them; concurrent searches while the catalog is
+    being fetched wait for that fetch instead of each calling GitHub.
+    """
+
+    def __init__(self, config: ServerConfig, utility: Utility | None = None, cache: CacheBackend | None = None):
+        self.config = config
+        self.utility = utility
+        self.cache = cache or create_cache(config.cache_backend, config.cache_path)
+        self.started_at = time.time()
+        self._lock = threading.Lock()
+        self._routes: dict[str, _RouteStats] = {}
+
+    def search(self, body: dict[str, Any]) -> dict[str, Any]:
+        query = _text(body, "query")
+        if not query.strip():
+            raise ValueError("'query' is required.")
+        owner = _text(body, "owner", DEFAULT_OWNER)
+        repo = _text(body, "repo", DEFAULT_REPO)
+        ref = _text(body, "ref", DEFAULT_REF)
+        catalog = load_project_catalog(
+            self.cache,
+            owner,
+            repo,
+            ref,
+            github_token=self.config.github_token,
+            api_base=self.config.github_api_base,
+            ttl_seconds=self.config.catalog_ttl_seconds,
+        )
+        matches = search_projects(query, catalog, limit=_int(body, "limit", 8, minimum=1, maximum=100))
+        return {
+            "catalog_size": len(catalog),
+            "matches": [
+                {
+                    "name": match.project.name,
+                    "folder": match.project.folder,
+                    "folder_url": match.project.folder_url(owner, repo, ref),
+                    "score": match.score,
+                    "reasons": match.reasons,
+                    "detection_files": match.project.detection_files,
+                    "remediation_files": match.project.remediation_files,
+                    "readme_file": match.project.readme_file,
+                }
+                for match in matches
+            ],
+        }
+
+    def generate(
+        self,
+        body: dict[str, Any],
+        deadline: Deadline | None = None,
+        on_stage: Callable[[str, str], None] | None = None,
+    ) -> dict[str, Any]:
+        if self.utility is None:
+            raise _HttpError(503, "No LLM is configured for this server.")
+        artifact = self.utility.generate(
+            description=_text(body, "description"),
+            include_remediation=_bool(body, "include_remediation", True),
+            temperature=_float(body, "temperature", 0.2),
+            max_tokens=_int(body, "max_tokens", 1600, minimum=1),
+            extra_requirements=_text(body, "extra_requirements"),
+            candidates=_int(body, "candidates", 1, minimum=1, maximum=MAX_CANDIDATES),
+            deadline=deadline or self.generation_deadline(),
+            on_stage=on_stage,
+        )
+        return {"artifact": asdict(artifact)}
+
+    def generation_deadline(self) -> Deadline:
+        return Deadline.after(self.config.generation_deadline_seconds)
+
+    def validate(self, body: dict[str, Any]) -> dict[str, Any]:
+        report = validate_scripts(
+            _text(body, "detection_script"), _text(body, "remediation_script"), cache=self.cache
+        )
+        return {
+            "valid": report.is_valid,
+            "errors": report.errors,
+            "warnings": report.warnings,
+            "infos": report.infos,
+            "findings": [asdict(finding) for finding in report.findings],
+        }
+
+    def payload(self, body: dict[str, Any]) -> dict[str, Any]:
+        payload = build_upload_payload(
+            script_name=_text(body, "script_name"),
+            description=_text(body, "description"),
+            scope=_text(body, "scope", "system"),
+            detection_script=_text(body, "detection_script"),
+            remediation_script=_text(body, "remediation_script"),
+            run_as_32_bit=_bool(body, "run_as_32_bit", True),
+            enforce_signature_check=_bool(body, "enforce_signature_check", False),
+        )
+        return {"payload": payload}
+
+    def publish(self, body: dict[str, Any], authorization: str) -> dict[str, Any]:
+        """Upload `payloads` with the caller's Graph token; per-item failures do not fail the call."""
+        if not authorization.startswith("Bearer "):
+            raise _HttpError(401, "Send the Graph access token as 'Authorization: Bearer <token>'.")
+        payloads = body.get("payloads")
+        if not isinstance(payloads, list) or not payloads or not all(isinstance(item, dict) for item in payloads):
+            raise ValueError("'payloads' must be a non-empty list of payload objects.")
+        auth = {"Authorization": authorization}
+        concurrency = _int(body, "concurrency", DEFAULT_BATCH_CONCURRENCY, minimum=1, maximum=16)
+        deadline = Deadline.after(self.config.publish_deadline_seconds)
+        if _bool(body, "upsert", False):
+            # One inventory per call: callers may hold tokens for different tenants.
+            inventory = GraphInventory(self.config.graph_base_url)
+            publisher = GraphBatchPublisher(
+                auth, inventory.base_url, inventory.endpoint, concurrency=concurrency, session=inventory.session
+            )
+            results = upsert(payloads, inventory, publisher, auth, deadline)
+        else:
+            publisher = GraphBatchPublisher(auth, self.config.graph_base_url, concurrency=concurrency)
+            results = publisher.publish(payloads, deadline)
+        succeeded = sum(result.ok for result in results)
+        return {
+            "succeeded": succeeded,
+            "failed": len(results) - succeeded,
+            "results": [asdict(result) for result in results],
+        }
+
+    def health(self) -> dict[str, Any]:
+        return {
+            "status": "ok",
+            "uptime_seconds": round(time.time() - self.started_at, 1),
+            "llm_configured": self.utility is not None,
+        }
+
+    def metrics(self, pool: dict[str, Any]) -> dict[str, Any]:
+        with self._lock:
+            routes = {
+                route: {
+                    "requests": stats.requests,
+                    "errors": stats.errors,
+                    "statuses": {str(status): count for status, count in sorted(stats.statuses.items())},
+                    "avg_latency_ms": round(stats.latency_total / stats.requests * 1000, 1),
+                    "max_latency_ms": round(stats.latency_max * 1000, 1),
+                }
+                for route, stats in sorted(self._routes.items())
+            }
+        return {
+            "pool": pool,
+            "routes": routes,
+            "cache": {"backend": self.cache.name, **self.cache.stats()},
+            "llm": default_telemetry.totals(),
+            "clients": default_client_registry.stats(),
+        }
+
+    def metrics_prometheus(self, pool: dict[str, Any]) -> str:
+        """Server metrics followed by the LLM telemetry, in the Prometheus text format."""
+        lines = []
+        for name, value in pool.items():
+            if isinstance(value, (int, float)):
+                lines.append(f"{_METRIC_PREFIX}_pool_{name} {value}")
+        for name, value in self.cache.stats().items():
+            lines.append(f'{_METRIC_PREFIX}_cache_{name}{{backend="{self.cache.name}"}} {value}')
+        with self._lock:
+            lines += [
+                f"# TYPE {_METRIC_PREFIX}_requests_total counter",
+                *(
+                    f'{_METRIC_PREFIX}_requests_total{{route="{route}",status="{status}"}} {count}'
+                    for route, stats in sorted(self._routes.items())
+                    for status, count in sorted(stats.statuses.items())
+                ),
+                f"# TYPE {_METRIC_PREFIX}_request_seconds_sum counter",
+                *(
+                    f'{_METRIC_PREFIX}_request_seconds_sum{{route="{route}"}} {stats.latency_total:.6f}'
+                    for route, stats in sorted(self._routes.items())
+                ),
+            ]
+        return "\n".join(lines) + "\n" + default_telemetry.to_prometheus()
+
+    def record(self, route: str, status: int, seconds: float) -> None:
+        with self._lock:
+            stats = self._routes.setdefault(route, _RouteStats())
+            stats.requests += 1
+            stats.errors += status >= 400
+            stats.latency_total += seconds
+            stats.latency_max = max(stats.latency_max, seconds)
+            stats.statuses[status] = stats.statuses.get(status, 0) + 1
+
+
+class ApiServer(HTTPServer):
+    """HTTP server that hands connections to a fixed pool of `workers` threads.
+
+    At most `max_queue` connections wait for a worker; beyond that new ones are answered
+    at once with 503 and `Retry-After`, and a connection that waited longer than
+    `queue_timeout_seconds` gets the same answer instead of being served late. Each
+    connection carries one request, so idle keep-alive clients never hold a worker.
+    When more than `MAX_PENDING_REJECTIONS` refusals are already waiting, further
+    connections are closed without an answer (counted as `dropped`).
+    """
+
+    request_queue_size = 128
+
+    def __init__(
+        self,
+        service: ApiService,
+        host: str = DEFAULT_HOST,
+        port: int = DEFAULT_PORT,
+        workers: int = DEFAULT_API_WORKERS,
+        max_queue: int = DEFAULT_MAX_QUEUE,
+        queue_timeout_seconds: float = DEFAULT_QUEUE_TIMEOUT_SECONDS,
+    ):
+        if workers < 1:
+            raise ValueError("The API needs at least one worker.")
+        if max_queue < 0:
+            raise ValueError("max_queue cannot be negative.")
+        super().__init__((host, port), _ApiHandler)
+        self.service = service
+        self.workers = workers
+        self.max_queue = max_queue
+        self.queue_timeout_seconds = queue_timeout_seconds
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="api")
+        # Refusals linger until the client has sent its request, so they get their own threads.
+        self._rejector = ThreadPoolExecutor(max_workers=2, thread_name_prefix="api-reject")
+        self._lock = threading.Lock()
+        self._waiting = 0
+        self._active = 0
+        self._rejecting = 0
+        self._counters = {"accepted": 0, "rejected": 0, "expired": 0, "dropped": 0}
+        self._queue_wait_total = 0.0
+        self._queue_wait_max = 0.0
+
+    def process_request(self, request: Any, client_address: Any) -> None:
+        with self._lock:
+            full = self._waiting + self._active >= self.workers + self.max_queue
+            dropped = full and self._rejecting >= MAX_PENDING_REJECTIONS
+            if dropped:
+                self._counters["dropped"] += 1
+            elif full:
+                self._counters["rejected"] += 1
+                self._rejecting += 1
+            else:
+                self._counters["accepted"] += 1
+                self._waiting += 1
+        if dropped:
+            self.shutdown_request(request)
+        elif full:
+            self._rejector.submit(self._refuse, request)
+        else:
+            self._executor.submit(self._work, request, client_address, time.perf_counter())
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            served = self._counters["accepted"] - self._waiting
+            return {
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "active": self._active,
+                "waiting": self._waiting,
+                **self._counters,
+                "avg_queue_wait_ms": round(self._queue_wait_total / served * 1000, 1) if served else 0.0,
+                "max_queue_wait_ms": round(self._queue_wait_max * 1000, 1),
+            }
+
+    def server_close(self) -> None:
+        super().server_close()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._rejector.shutdown(wait=False, cancel_futures=True)
+
+    def _work(self, request: Any, client_address: Any, queued_at: float) -> None:
+        waited = time.perf_counter() - queued_at
+        with self._lock:
+            self._waiting -= 1
+            self._active += 1
+            self._queue_wait_total += waited
+            self._queue_wait_max = max(self._queue_wait_max, waited)
+            expired = waited > self.queue_timeout_seconds
+            if expired:
+                self._counters["expired"] += 1
+        try:
+            if expired:
+                self._reject(request, "Request waited too long for a worker; retry shortly.")
+                return
+            self.finish_request(request, client_address)
+            self.shutdown_request(request)
+        except Exception:
+            self.handle_error(request, client_address)
+            self.shutdown_request(request)
+        finally:
+            with self._lock:
+                self._active -= 1
+
+    def _refuse(self, request: socket.socket) -> None:
+        try:
+            self._reject(request, "Server is busy; retry shortly.")
+        finally:
+            with self._lock:
+                self._rejecting -= 1
+
+    def _reject(self, request: socket.socket, message: str) -> None:
+        """Answer 503 without parsing the request, so a saturated server stays cheap to refuse."""
+        body = json.dumps({"error": message}).encode("utf-8")
+        head = (
+            "HTTP/1.0 503 Service Unavailable\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "Retry-After: 1\r\n"
+            "Connection: close\r\n\r\n"
+        )
+        try:
+            request.settimeout(DEFAULT_REJECT_LINGER_SECONDS)
+            request.sendall(head.encode("ascii") + body)
+            request.shutdown(socket.SHUT_WR)
+            # Closing with the request still unread would reset the connection before the
+            # client reads the 503, so read until it hangs up or the linger time is over.
+            while request.recv(65536):
+                pass
+        except OSError:
+            pass
+        self.close_request(request)
+
+
+class _ApiHandler(BaseHTTPRequestHandler):
+    server: ApiServer
+    server_version = "RemediationCreatorAPI/1.0"
+    timeout = DEFAULT_CLIENT_TIMEOUT_SECONDS
+
+    _ROUTES = {
+        "/healthz": "GET",
+        "/metrics": "GET",
+        "/v1/search": "POST",
+        "/v1/generate": "POST",
+        "/v1/validate": "POST",
+        "/v1/payload": "POST",
+        "/v1/publish": "POST",
+    }
+
+    def do_GET(self) -> None:
+        self._dispatch("GET")
+
+    def do_POST(self) -> None:
+        self._dispatch("POST")
+
+    def log_message(self, format: str, *args: Any) -> None:
+        # Request counts and latency are on /metrics; per-request lines would slow load tests.
+        return
+
+    def _dispatch(self, method: str) -> None:
+        started = time.perf_counter()
+        url = urlsplit(self.path)
+        route = url.path if url.path in self._ROUTES else "other"
+        service = self.server.service
+        try:
+            status = self._handle(method, url.path, parse_qs(url.query))
+        except Exception as exc:
+            status = _error_status(exc)
+            self._send_json(status, {"error": str(exc) or type(exc).__name__})
+        service.record(route, status, time.perf_counter() - started)
+
+    def _handle(self, method: str, path: str, query: dict[str, list[str]]) -> int:
+        expected = self._ROUTES.get(path)
+        if expected is None:
+            raise _HttpError(404, f"No such endpoint: {path}")
+        if method != expected:
+            raise _HttpError(405, f"{path} only accepts {expected}.")
+        service = self.server.service
+        if path == "/healthz":
+            return self._send_json(200, {**service.health(), "pool": self.server.stats()})
+        if path == "/metrics":
+            if query.get("format") == ["prometheus"]:
+                return self._send_text(200, service.metrics_prometheus(self.server.stats()))
+            return self._send_json(200, service.metrics(self.server.stats()))
+
+        self._authorize()
+        body = self._read_json()
+        if path == "/v1/search":
+            return self._send_json(200, service.search(body))
+        if path == "/v1/generate":
+            if _bool(body, "stream", False):
+                return self._stream_generation(body)
+            return self._send_json(200, service.generate(body))
+        if path == "/v1/validate":
+            return self._send_json(200, service.validate(body))
+        if path == "/v1/payload":
+            return self._send_json(200, service.payload(body))
+        return self._send_json(200, service.publish(body, self.headers.get("Authorization", "")))
+
+    def _authorize(self) -> None:
+        token = self.server.service.config.api_token
+        if token and not hmac.compare_digest(self.headers.get("X-Api-Token", ""), token):
+            raise _HttpError(401, "Missing or wrong X-Api-Token header.")
+
+    def _read_json(self) -> dict[str, Any]:
+        try:
+            length = int(self.headers.get("Content-Length", "0"))
+        except ValueError:
+            raise _HttpError(400, "Invalid Content-Length header.") from None
+        if length > self.server.service.config.max_body_bytes:
+            raise _HttpError(413, "Request body is too large.")
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except (UnicodeDecodeError, json.JSONDecodeError) as exc:
+            raise _HttpError(400, f"Request body is not valid JSON: {exc}") from None
+        if not isinstance(body, dict):
+            raise _HttpError(400, "Request body must be a JSON object.")
+        return body
+
+    def _stream_generation(self, body: dict[str, Any]) -> int:
+        """Send newline-delimited JSON events: `started`, each finished script, then `result` or `error`."""
+        service = self.server.service
+        if service.utility is None:
+            raise _HttpError(503, "No LLM is configured for this server.")
+        deadline = service.generation_deadline()
+        lock = threading.Lock()
+
+        def emit(event: dict[str, Any]) -> None:
+            with lock:
+                if deadline.cancelled:
+                    return
+                try:
+                    self.wfile.write(json.dumps(event).encode("utf-8") + b"\n")
+                except OSError:
+                    # The client went away; stop the LLM calls still running for it.
+                    deadline.cancel()
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        emit({"event": "started"})
+        try:
+            result = service.generate(
+                body, deadline, on_stage=lambda stage, script: emit({"event": stage, "script": script})
+            )
+        except Exception as exc:
+            status = _error_status(exc)
+            emit({"event": "error", "status": status, "error": str(exc) or type(exc).__name__})
+            return status
+        emit({"event": "result", **result})
+        return 200
+
+    def _send_json(self, status: int, body: dict[str, Any]) -> int:
+        return self._send(status, json.dumps(body).encode("utf-8"), "application/json")
+
+    def _send_text(self, status: int, text: str) -> int:
+        return self._send(status, text.encode("utf-8"), "text/plain; version=0.0.4")
+
+    def _send(self, status: int, data: bytes, content_type: str) -> int:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        if status == 503:
+            self.send_header("Retry-After", "1")
+        self.end_headers()
+        self.wfile.write(data)
+        return status
+
+
+def _error_status(exc: Exception) -> int:
+    """400 for bad input, 504 when the deadline ran out, 502 for upstream (GitHub, Graph, LLM) failures."""
+    if isinstance(exc, _HttpError):
+        return exc.status
+    if isinstance(exc, DeadlineExceeded):
+        return 504
+    if isinstance(exc, ValueError):
+        return 400
+    return 502
+
+
+def _text(body: dict[str, Any], name: str, default: str = "") -> str:
+    value = body.get(name, default)
+    if not isinstance(value, str):
+        raise ValueError(f"'{name}' must be a string.")
+    return value
+
+
+def _bool(body: dict[str, Any], name: str, default: bool) -> bool:
+    value = body.get(name, default)
+    if not isinstance(value, bool):
+        raise ValueError(f"'{name}' must be true or false.")
+    return value
+
+
+def _int(body: dict[str, Any], name: str, default: int, minimum: int | None = None, maximum: int | None = None) -> int:
+    value = body.get(name, default)
+    if not isinstance(value, int) or isinstance(value, bool):
+        raise ValueError(f"'{name}' must be an integer.")
+    if (minimum is not None and value < minimum) or (maximum is not None and value > maximum):
+        raise ValueError(f"'{name}' must be between {minimum} and {maximum}.")
+    return value
+
+
+def _float(body: dict[str, Any], name: str, default: float) -> float:
+    value = body.get(name, default)
+    if not isinstance(value, (int, float)) or isinstance(value, bool):
+        raise ValueError(f"'{name}' must be a number.")
+    return float(value)
+
+
+def main(argv: list[str] | None = None) -> int:
+    config = ServerConfig.from_env()
+    parser = argparse.ArgumentParser(prog="python -m modules.api_server", description="Serve the headless JSON API.")
+    parser.add_argument("--host", default=config.host)
+    parser.add_argument("--port", type=int, default=config.port)
+    parser.add_argument("--workers", type=int, default=config.workers, help="Requests served at once.")
+    parser.add_argument("--max-queue", type=int, default=config.max_queue, help="Requests waiting before 503s.")
+    parser.add_argument("--queue-timeout", type=float, default=config.queue_timeout_seconds)
+    args = parser.parse_args(argv)
+    config.host, config.port, config.workers = args.host, args.port, args.workers
+    config.max_queue, config.queue_timeout_seconds = args.max_queue, args.queue_timeout
+
+    cache = create_cache(config.cache_backend, config.cache_path)
+    service = ApiService(config, utility_from_env(cache=cache), cache)
+    server = ApiServer(service, config.host, config.port, config.workers, config.max_queue, config.queue_timeout_seconds)
+    host, port = server.server_address[:2]
+    print(f"Serving on http://{host}:{port} with {config.workers} workers", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,349 @@
+"""Asyncio service facade for high-concurrency generation and Graph upload."""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import TYPE_CHECKING, Any
+
+from modules.prompts import DETECTION_SCRIPT_PROMPT, REMEDIATION_SCRIPT_PROMPT
+from modules.deadline import Deadline, DeadlineExceeded, request_timeout
+from modules.deployment_pool import Deployment
+from modules.graph_auth import auth_headers
+from modules.graph_batch import DEFAULT_BATCH_CONCURRENCY, GraphBatchPublisher, PublishResult
+from modules.utility import (
+    DEFAULT_GENERATION_DEADLINE_SECONDS,
+    DEFAULT_TIMEOUT_SECONDS,
+    GRAPH_BASE_URL,
+    BaseUtility,
+    CallUsage,
+    ScriptArtifact,
+)
+
+if TYPE_CHECKING:
+    import httpx
+
+
+class AsyncUtility(BaseUtility):
+    """Async counterpart of `Utility` built on the async OpenAI clients and httpx.
+
+    One instance can serve many concurrent `generate`/`upload_payload` calls from a
+    single event loop. Close it with `aclose()` or use it as an async context manager.
+    """
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self._http: httpx.AsyncClient | None = None
+
+    def _create_client(self, api_key: str, azure_openai_endpoint: str, azure_openai_api_version: str) -> Any:
+        from openai import AsyncAzureOpenAI, AsyncOpenAI
+
+        if self.provider == "openai":
+            return AsyncOpenAI(api_key=api_key)
+        return AsyncAzureOpenAI(
+            api_key=api_key,
+            api_version=azure_openai_api_version,
+            azure_endpoint=azure_openai_endpoint,
+        )
+
+    async def __aenter__(self) -> AsyncUtility:
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        """Release the Graph connection pool and the LLM clients created for this instance.
+
+        With a deployment pool, that is the async clients the pool built for itself
+        (`DeploymentPool.aclose`); clients from the shared registry stay open.
+        """
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+        if self.deployment_pool is not None:
+            await self.deployment_pool.aclose()
+        elif self._client is not None:
+            await self._client.close()
+            self._client = None
+
+    async def generate(
+        self,
+        description: str,
+        include_remediation: bool,
+        temperature: float = 0.2,
+        max_tokens: int = 1600,
+        extra_requirements: str = "",
+        candidates: int = 1,
+        deadline: Deadline | None = None,
+    ) -> ScriptArtifact:
+        """Generate detection and optionally remediation scripts (best of `candidates`).
+
+        In-flight requests are cancelled and `DeadlineExceeded` raised when `deadline` runs out.
+        """
+        if not description.strip():
+            raise ValueError("Description cannot be empty.")
+        if deadline is None:
+            deadline = Deadline.after(DEFAULT_GENERATION_DEADLINE_SECONDS)
+
+        count = self._candidate_count(candidates)
+        if count == 1:
+            work = self._generate_candidate(
+                description, include_remediation, temperature, max_tokens, extra_requirements, deadline
+            )
+        else:
+            work = self._generate_best(
+                count, description, include_remediation, temperature, max_tokens, extra_requirements, deadline
+            )
+        try:
+            return await asyncio.wait_for(work, timeout=deadline.timeout(action="generation"))
+        except asyncio.TimeoutError as exc:
+            if isinstance(exc, DeadlineExceeded):
+                raise
+            raise DeadlineExceeded("Deadline exceeded while generating.") from exc
+
+    async def _generate_best(
+        self,
+        count: int,
+        description: str,
+        include_remediation: bool,
+        temperature: float,
+        max_tokens: int,
+        extra_requirements: str,
+        deadline: Deadline,
+    ) -> ScriptArtifact:
+        outcomes = await asyncio.gather(
+            *(
+                self._generate_candidate(
+                    description, include_remediation, temperature, max_tokens, extra_requirements, deadline, variant
+                )
+                for variant in range(count)
+            ),
+            return_exceptions=True,
+        )
+        return self._select_best(list(outcomes))
+
+    async def _generate_candidate(
+        self,
+        description: str,
+        include_remediation: bool,
+        temperature: float,
+        max_tokens: int,
+        extra_requirements: str,
+        deadline: Deadline | None = None,
+        variant: int = 0,
+    ) -> ScriptArtifact:
+        detection_budget = self._fit_detection_prompt(description, extra_requirements, max_tokens)
+        detection_script = await self._invoke_gpt_call(
+            user=detection_budget.prompt,
+            system=DETECTION_SCRIPT_PROMPT,
+            temperature=temperature,
+            max_tokens=detection_budget.max_tokens,
+            deadline=deadline,
+            variant=variant,
+        )
+
+        remediation_script = ""
+        if include_remediation:
+            remediation_budget = self._fit_remediation_prompt(
+                description, detection_script, extra_requirements, max_tokens
+            )
+            remediation_script = await self._invoke_gpt_call(
+                user=remediation_budget.prompt,
+                system=REMEDIATION_SCRIPT_PROMPT,
+                temperature=temperature,
+                max_tokens=remediation_budget.max_tokens,
+                deadline=deadline,
+                variant=variant,
+            )
+
+        return self._build_artifact(description, detection_script, remediation_script, include_remediation)
+
+    async def upload_payload(
+        self,
+        payload: dict[str, Any],
+        endpoint: str = "deviceManagement/deviceHealthScripts",
+        deadline: Deadline | None = None,
+    ) -> dict[str, Any]:
+        """Upload a prepared payload to Microsoft Graph."""
+        self._require_graph_auth()
+
+        # A token refresh can block on the credential, so it runs off the event loop.
+        headers = await asyncio.to_thread(auth_headers, self.graph_auth)
+        response = await self._graph_client().post(
+            GRAPH_BASE_URL + endpoint,
+            headers=headers,
+            json=payload,
+            timeout=request_timeout(deadline, DEFAULT_TIMEOUT_SECONDS, "Graph upload"),
+        )
+        return self._graph_result(response)
+
+    async def publish_payloads(
+        self,
+        payloads: list[dict[str, Any]],
+        endpoint: str = "deviceManagement/deviceHealthScripts",
+        concurrency: int = DEFAULT_BATCH_CONCURRENCY,
+        deadline: Deadline | None = None,
+        base_url: str = GRAPH_BASE_URL,
+    ) -> list[PublishResult]:
+        """Upload many payloads through Graph `$batch` without blocking the event loop."""
+        self._require_graph_auth()
+        publisher = GraphBatchPublisher(self.graph_auth, base_url, endpoint, concurrency=concurrency)
+        return await asyncio.to_thread(publisher.publish, payloads, deadline)
+
+    def _graph_client(self) -> httpx.AsyncClient:
+        if self._http is None:
+            import httpx
+
+            self._http = httpx.AsyncClient(timeout=DEFAULT_TIMEOUT_SECONDS)
+        return self._http
+
+    async def _invoke_gpt_call(
+        self,
+        user: str,
+        system: str,
+        temperature: float,
+        max_tokens: int,
+        deadline: Deadline | None = None,
+        variant: int = 0,
+    ) -> str:
+        """One LLM call, answered from the shared cache like `Utility._invoke_gpt_call`.
+
+        Cache reads and writes run off the event loop. Unlike the sync path there is no
+        fill lock, so concurrent identical calls may each reach the model once.
+        """
+        if not self.caches_responses:
+            return await self._invoke_uncached(user, system, temperature, max_tokens, deadline)
+        key = self._response_cache_key(user, system, temperature, max_tokens, variant)
+        cached = await asyncio.to_thread(self.cache.get_json, key)
+        if cached is not None:
+            return cached
+        text = await self._invoke_uncached(user, system, temperature, max_tokens, deadline)
+        await asyncio.to_thread(self.cache.set_json, key, text, self.response_cache_ttl)
+        return text
+
+    async def _invoke_uncached(
+        self,
+        user: str,
+        system: str,
+        temperature: float,
+        max_tokens: int,
+        deadline: Deadline | None,
+    ) -> str:
+        messages = self._build_messages(user, system)
+        used: set[str] = set()
+
+        if self.hedger is not None:
+            return await self.hedger.acall(
+                primary=lambda: self._invoke_routed(messages, temperature, max_tokens, used, deadline),
+                hedge=lambda: self._invoke_routed(
+                    messages, temperature, max_tokens, used, deadline, exclude=self._hedge_exclusions(used)
+                ),
+                deadline=deadline,
+            )
+        return await self._invoke_routed(messages, temperature, max_tokens, used, deadline)
+
+    async def _invoke_routed(
+        self,
+        messages: list[dict[str, str]],
+        temperature: float,
+        max_tokens: int,
+        used: set[str],
+        deadline: Deadline | None,
+        exclude: frozenset[str] = frozenset(),
+    ) -> str:
+        if self.deployment_pool is None:
+            text, _usage = await self._invoke_model(
+                client=self.client,
+                model_name=self.model_name,
+                provider=self.provider,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                deadline=deadline,
+            )
+            return text
+
+        async def run(deployment: Deployment) -> tuple[str, CallUsage]:
+            used.add(deployment.name)
+            return await self._invoke_model(
+                client=deployment.client,
+                model_name=deployment.model_name,
+                provider=deployment.provider,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                deadline=deadline,
+            )
+
+        text, _usage = await self.deployment_pool.acall(
+            run,
+            estimated_tokens=self._estimate_call_tokens(messages, max_tokens),
+            exclude=exclude,
+            deadline=deadline,
+            tokens_used=lambda result: result[1].total_tokens,
+        )
+        return text
+
+    async def _invoke_model(
+        self,
+        client: Any,
+        model_name: str,
+        provider: str,
+        messages: list[dict[str, str]],
+        temperature: float,
+        max_tokens: int,
+        deadline: Deadline | None = None,
+    ) -> tuple[str, CallUsage]:
+        fallback_attempts = 0
+        # GPT-5 style chat models are often exposed through the Responses API.
+        if self._prefer_responses_api(model_name):
+            try:
+                return await self._invoke_api(
+                    "responses", client, model_name, provider, messages, temperature, max_tokens, 0, deadline
+                )
+            except DeadlineExceeded:
+                raise
+            except Exception:
+                # Fall back to chat completions for compatibility with classic deployments.
+                # The failed attempt is already recorded in telemetry.
+                fallback_attempts = 1
+
+        return await self._invoke_api(
+            "chat.completions",
+            client,
+            model_name,
+            provider,
+            messages,
+            temperature,
+            max_tokens,
+            fallback_attempts,
+            deadline,
+        )
+
+    async def _invoke_api(
+        self,
+        api_path: str,
+        client: Any,
+        model_name: str,
+        provider: str,
+        messages: list[dict[str, str]],
+        temperature: float,
+        max_tokens: int,
+        fallback_attempts: int = 0,
+        deadline: Deadline | None = None,
+    ) -> tuple[str, CallUsage]:
+        params = self._request_params(api_path, temperature, max_tokens)
+        started = time.perf_counter()
+        while True:
+            try:
+                response = await self._send_request(client, api_path, model_name, messages, params, deadline)
+                break
+            except DeadlineExceeded:
+                raise
+            except Exception as exc:
+                params = self._retry_params(
+                    exc, params, started, provider, model_name, api_path, fallback_attempts, deadline
+                )
+                fallback_attempts += 1
+        return self._finish_call(response, started, provider, model_name, api_path, fallback_attempts)
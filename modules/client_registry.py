@@ -0,0 +1,106 @@
+"""Process-wide registry of long-lived LLM clients with keep-alive connection pools."""
+
+from __future__ import annotations
+
+import hashlib
+import threading
+from dataclasses import dataclass
+from typing import Any
+
+DEFAULT_MAX_CONNECTIONS = 64
+DEFAULT_MAX_KEEPALIVE_CONNECTIONS = 32
+DEFAULT_KEEPALIVE_EXPIRY_SECONDS = 120.0
+
+
+@dataclass(frozen=True, slots=True)
+class ClientKey:
+    """Identifies a client; the API key is only kept as a hash."""
+
+    provider: str
+    endpoint: str
+    api_version: str
+    key_hash: str
+    max_retries: int | None = None
+
+
+class ClientRegistry:
+    """Hand out one shared sync OpenAI/Azure OpenAI client per provider, endpoint, version and key.
+
+    Clients are created on first use and kept for the life of the process, so every
+    `Utility`, Streamlit rerun and session reuses warm HTTP connections instead of
+    paying for DNS, TCP and TLS setup again. The clients carry no per-user state:
+    Graph headers and deadlines are applied per request.
+    """
+
+    def __init__(
+        self,
+        max_connections: int = DEFAULT_MAX_CONNECTIONS,
+        max_keepalive_connections: int = DEFAULT_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry: float = DEFAULT_KEEPALIVE_EXPIRY_SECONDS,
+    ):
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.keepalive_expiry = keepalive_expiry
+        self._lock = threading.Lock()
+        self._clients: dict[ClientKey, Any] = {}
+        self._counters = {"created": 0, "reused": 0}
+
+    def get(
+        self,
+        provider: str,
+        api_key: str,
+        endpoint: str = "",
+        api_version: str = "",
+        max_retries: int | None = None,
+    ) -> Any:
+        """Return the shared client for these settings, creating it on first use."""
+        key = ClientKey(
+            provider=provider,
+            endpoint=endpoint.rstrip("/"),
+            api_version=api_version,
+            key_hash=hashlib.sha256(api_key.encode("utf-8")).hexdigest(),
+            max_retries=max_retries,
+        )
+        with self._lock:
+            client = self._clients.get(key)
+            if client is not None:
+                self._counters["reused"] += 1
+                return client
+            client = self._create(key, api_key)
+            self._clients[key] = client
+            self._counters["created"] += 1
+            return client
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {**self._counters, "clients": len(self._clients)}
+
+    def clear(self) -> None:
+        """Close every cached client, e.g. after rotating API keys."""
+        with self._lock:
+            clients = list(self._clients.values())
+            self._clients.clear()
+        for client in clients:
+            client.close()
+
+    def _create(self, key: ClientKey, api_key: str) -> Any:
+        # Imported here so the SDK and httpx load with the first client, not at app start.
+        import httpx
+        from openai import AzureOpenAI, DefaultHttpxClient, OpenAI
+
+        limits = httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive_connections,
+            keepalive_expiry=self.keepalive_expiry,
+        )
+        options: dict[str, Any] = {"api_key": api_key, "http_client": DefaultHttpxClient(limits=limits)}
+        if key.max_retries is not None:
+            options["max_retries"] = key.max_retries
+        if key.provider == "openai":
+            return OpenAI(**options)
+        if key.provider == "azure":
+            return AzureOpenAI(api_version=key.api_version, azure_endpoint=key.endpoint, **options)
+        raise ValueError("Unsupported provider. Use 'azure' or 'openai'.")
+
+
+default_client_registry = ClientRegistry()
@@ -2,17 +2,20 @@
 
 from __future__ import annotations
 
+import hashlib
 import re
 import urllib.parse
-from dataclasses import dataclass, field
+from dataclasses import asdict, dataclass, field
 
-import requests
+from modules.deadline import Deadline, request_timeout
+from modules.shared_cache import CacheBackend, cache_key
 
 GITHUB_API_BASE = "https://api.github.com"
 DEFAULT_OWNER = "JayRHa"
 DEFAULT_REPO = "EndpointAnalyticsRemediationScripts"
 DEFAULT_REF = "main"
 REQUEST_TIMEOUT = 30
+CATALOG_TTL_SECONDS = 1800
 
 
 @dataclass(slots=True)
@@ -45,9 +48,11 @@ def fetch_repo_tree(
     repo: str = DEFAULT_REPO,
     ref: str = DEFAULT_REF,
     github_token: str = "",
+    deadline: Deadline | None = None,
+    api_base: str = GITHUB_API_BASE,
 ) -> list[dict]:
-    """Fetch recursive tree metadata from GitHub."""
-    url = f"{GITHUB_API_BASE}/repos/{owner}/{repo}/git/trees/{ref}?recursive=1"
+    """Fetch recursive tree metadata from GitHub; `api_base` can point at a mirror or stand-in."""
+    url = f"{api_base.rstrip('/')}/repos/{owner}/{repo}/git/trees/{ref}?recursive=1"
     headers = {
         "Accept": "application/vnd.github+json",
         "User-Agent": "remediation-creator-next",
@@ -55,7 +60,9 @@ def fetch_repo_tree(
     if github_token.strip():
         headers["Authorization"] = f"Bearer {github_token.strip()}"
 
-    response = requests.get(url, headers=headers, timeout=REQUEST_TIMEOUT)
+    import requests
+
+    response = requests.get(url, headers=headers, timeout=request_timeout(deadline, REQUEST_TIMEOUT, "GitHub tree fetch"))
     if response.status_code >= 400:
         raise RuntimeError(f"GitHub API error ({response.status_code}): {response.text[:300]}")
 
@@ -196,11 +203,13 @@ def fetch_text_file(
     repo: str = DEFAULT_REPO,
     ref: str = DEFAULT_REF,
     github_token: str = "",
+    deadline: Deadline | None = None,
+    api_base: str = GITHUB_API_BASE,
 ) -> str:
     """Fetch text content from a file path in a GitHub repository."""
     encoded_path = urllib.parse.quote(path, safe="/")
     encoded_ref = urllib.parse.quote(ref, safe="")
-    url = f"{GITHUB_API_BASE}/repos/{owner}/{repo}/contents/{encoded_path}?ref={encoded_ref}"
+    url = f"{api_base.rstrip('/')}/repos/{owner}/{repo}/contents/{encoded_path}?ref={encoded_ref}"
     headers = {
         "Accept": "application/vnd.github.raw",
         "User-Agent": "remediation-creator-next",
@@ -208,7 +217,59 @@ def fetch_text_file(
     if github_token.strip():
         headers["Authorization"] = f"Bearer {github_token.strip()}"
 
-    response = requests.get(url, headers=headers, timeout=REQUEST_TIMEOUT)
+    import requests
+
+    response = requests.get(url, headers=headers, timeout=request_timeout(deadline, REQUEST_TIMEOUT, "GitHub file fetch"))
     if response.status_code >= 400:
         raise RuntimeError(f"GitHub file fetch error ({response.status_code}): {response.text[:300]}")
     return response.text
+
+
+def load_project_catalog(
+    cache: CacheBackend | None,
+    owner: str = DEFAULT_OWNER,
+    repo: str = DEFAULT_REPO,
+    ref: str = DEFAULT_REF,
+    github_token: str = "",
+    deadline: Deadline | None = None,
+    api_base: str = GITHUB_API_BASE,
+    ttl_seconds: float = CATALOG_TTL_SECONDS,
+) -> list[CommunityProject]:
+    """Project catalog fetched at most once per `ttl_seconds` by everyone sharing `cache`."""
+
+    def fetch() -> list[dict]:
+        tree = fetch_repo_tree(owner, repo, ref, github_token, deadline, api_base)
+        return [asdict(project) for project in build_project_catalog(tree)]
+
+    if cache is None:
+        items = fetch()
+    else:
+        key = cache_key("github-catalog", api_base, owner, repo, ref, _token_scope(github_token))
+        items = cache.get_or_fill(key, fetch, ttl_seconds)
+    return [CommunityProject(**item) for item in items]
+
+
+def load_text_file(
+    cache: CacheBackend | None,
+    path: str,
+    owner: str = DEFAULT_OWNER,
+    repo: str = DEFAULT_REPO,
+    ref: str = DEFAULT_REF,
+    github_token: str = "",
+    deadline: Deadline | None = None,
+    api_base: str = GITHUB_API_BASE,
+    ttl_seconds: float = CATALOG_TTL_SECONDS,
+) -> str:
+    """`fetch_text_file` through `cache`; failed fetches are not cached."""
+    if cache is None:
+        return fetch_text_file(path, owner, repo, ref, github_token, deadline, api_base)
+    key = cache_key("github-file", api_base, owner, repo, ref, path, _token_scope(github_token))
+    return cache.get_or_fill(
+        key, lambda: fetch_text_file(path, owner, repo, ref, github_token, deadline, api_base), ttl_seconds
+    )
+
+
+def _token_scope(github_token: str) -> str:
+    """Part of cache keys, so content fetched with one token is never served to callers without it."""
+    token = github_token.strip()
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()[:16] if token else ""
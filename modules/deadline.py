@@ -0,0 +1,77 @@
+"""End-to-end deadlines shared by LLM, GitHub and Graph calls."""
+
+from __future__ import annotations
+
+import threading
+import time
+from collections.abc import Callable
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when the time budget for an operation has run out or it was cancelled."""
+
+
+class Deadline:
+    """Absolute time budget passed through a whole operation.
+
+    Every retry, fallback or follow-up request asks the deadline for the remaining budget
+    instead of using its own fixed timeout. `cancel()` expires the deadline immediately so
+    cooperative code stops at its next check.
+    """
+
+    def __init__(self, seconds: float | None, clock: Callable[[], float] = time.monotonic):
+        self._clock = clock
+        self._expires_at = None if seconds is None else clock() + max(0.0, seconds)
+        self._cancelled = threading.Event()
+
+    @classmethod
+    def after(cls, seconds: float) -> Deadline:
+        return cls(seconds)
+
+    @classmethod
+    def never(cls) -> Deadline:
+        return cls(None)
+
+    def cancel(self) -> None:
+        self._cancelled.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def remaining(self) -> float | None:
+        """Seconds left, 0.0 once expired or cancelled, or None for no deadline."""
+        if self._cancelled.is_set():
+            return 0.0
+        if self._expires_at is None:
+            return None
+        return max(0.0, self._expires_at - self._clock())
+
+    @property
+    def expired(self) -> bool:
+        remaining = self.remaining()
+        return remaining is not None and remaining <= 0
+
+    def check(self, action: str = "operation") -> None:
+        if self.cancelled:
+            raise DeadlineExceeded(f"{action} was cancelled.")
+        if self.expired:
+            raise DeadlineExceeded(f"Deadline exceeded before {action}.")
+
+    def timeout(self, cap: float | None = None, action: str = "operation") -> float | None:
+        """Timeout for the next blocking call: the remaining budget, optionally capped."""
+        self.check(action)
+        remaining = self.remaining()
+        if remaining is None:
+            return cap
+        if cap is None:
+            return remaining
+        return min(remaining, cap)
+
+
+def request_timeout(deadline: Deadline | None, default: float, action: str = "request") -> float:
+    """Timeout for one HTTP request: the default, shortened to what the deadline allows."""
+    if deadline is None:
+        return default
+    timeout = deadline.timeout(default, action)
+    return default if timeout is None else timeout
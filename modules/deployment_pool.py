@@ -0,0 +1,417 @@
+"""Load balancing and failover across several LLM deployments."""
+
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from collections import deque
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
+from typing import Any, TypeVar
+
+from modules.deadline import Deadline, DeadlineExceeded
+
+T = TypeVar("T")
+
+DEFAULT_WINDOW_SECONDS = 60.0
+DEFAULT_FAILURE_COOLDOWN_SECONDS = 30.0
+DEFAULT_MAX_WAIT_SECONDS = 60.0
+_LATENCY_SMOOTHING = 0.3
+# Status codes where another deployment may succeed; other 4xx errors are raised as-is.
+_FAILOVER_STATUS_CODES = {404, 408, 409, 429}
+
+
+@dataclass(slots=True)
+class Deployment:
+    """One LLM endpoint the pool can route calls to."""
+
+    name: str
+    client: Any
+    model_name: str
+    provider: str = "azure"
+    tpm_limit: int = 0
+    rpm_limit: int = 0
+    priority: int = 0
+    # True when the client was created for this deployment alone and is closed with the pool.
+    owns_client: bool = False
+
+
+@dataclass(slots=True)
+class DeploymentStats:
+    """Rolling usage and health state for one deployment."""
+
+    requests: deque[float] = field(default_factory=deque)
+    tokens: deque[tuple[float, int]] = field(default_factory=deque)
+    token_total: int = 0
+    in_flight: int = 0
+    latency_ewma: float = 0.0
+    cooldown_until: float = 0.0
+    consecutive_failures: int = 0
+    successes: int = 0
+    failures: int = 0
+    last_error: str = ""
+
+
+class DeploymentUnavailableError(RuntimeError):
+    """Raised when no deployment in the pool could serve a call."""
+
+
+class DeploymentPool:
+    """Route calls to the least-loaded healthy deployment with failover.
+
+    Deployments with a lower `priority` value are preferred; higher tiers (for example a
+    secondary region or the OpenAI provider) are only used when every deployment in the
+    preferred tier is cooling down or has already failed for the current call.
+    """
+
+    def __init__(
+        self,
+        deployments: list[Deployment],
+        window_seconds: float = DEFAULT_WINDOW_SECONDS,
+        failure_cooldown_seconds: float = DEFAULT_FAILURE_COOLDOWN_SECONDS,
+        max_wait_seconds: float = DEFAULT_MAX_WAIT_SECONDS,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        if not deployments:
+            raise ValueError("Deployment pool needs at least one deployment.")
+        names = [item.name for item in deployments]
+        if len(set(names)) != len(names):
+            raise ValueError("Deployment names must be unique.")
+
+        self.deployments = list(deployments)
+        self.window_seconds = window_seconds
+        self.failure_cooldown_seconds = failure_cooldown_seconds
+        self.max_wait_seconds = max_wait_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._stats = {item.name: DeploymentStats() for item in deployments}
+
+    def select(self, estimated_tokens: int = 0, exclude: set[str] | frozenset[str] = frozenset()) -> Deployment | None:
+        """Return the least-loaded healthy deployment, or None if all are unavailable."""
+        with self._lock:
+            now = self._clock()
+            candidates = []
+            for deployment in self.deployments:
+                if deployment.name in exclude:
+                    continue
+                stats = self._stats[deployment.name]
+                self._prune(stats, now)
+                if stats.cooldown_until > now:
+                    continue
+                load = self._load(deployment, stats, estimated_tokens)
+                if load >= 1.0:
+                    continue
+                candidates.append((deployment.priority, load, stats.latency_ewma, deployment))
+            if not candidates:
+                return None
+            candidates.sort(key=lambda item: item[:3])
+            chosen = candidates[0][3]
+            self._stats[chosen.name].in_flight += 1
+            return chosen
+
+    def record_success(self, deployment: Deployment, latency_seconds: float, tokens: int) -> None:
+        with self._lock:
+            now = self._clock()
+            stats = self._stats[deployment.name]
+            stats.in_flight = max(0, stats.in_flight - 1)
+            stats.requests.append(now)
+            stats.tokens.append((now, tokens))
+            stats.token_total += tokens
+            stats.latency_ewma = (
+                latency_seconds
+                if stats.successes == 0
+                else (1 - _LATENCY_SMOOTHING) * stats.latency_ewma + _LATENCY_SMOOTHING * latency_seconds
+            )
+            stats.successes += 1
+            stats.consecutive_failures = 0
+
+    def record_failure(self, deployment: Deployment, exc: BaseException) -> None:
+        with self._lock:
+            now = self._clock()
+            stats = self._stats[deployment.name]
+            stats.in_flight = max(0, stats.in_flight - 1)
+            stats.requests.append(now)
+            stats.failures += 1
+            stats.consecutive_failures += 1
+            stats.last_error = str(exc)[:300]
+
+            retry_after = retry_after_seconds(exc)
+            if retry_after is not None:
+                cooldown = retry_after
+            else:
+                # Back off harder on deployments that keep failing.
+                cooldown = self.failure_cooldown_seconds * min(2 ** (stats.consecutive_failures - 1), 8)
+            stats.cooldown_until = max(stats.cooldown_until, now + cooldown)
+
+    def release(self, deployment: Deployment) -> None:
+        """Drop an in-flight reservation without recording an outcome."""
+        with self._lock:
+            stats = self._stats[deployment.name]
+            stats.in_flight = max(0, stats.in_flight - 1)
+
+    async def aclose(self) -> None:
+        """Close the async clients created for this pool; shared registry clients stay open."""
+        for deployment in self.deployments:
+            if deployment.owns_client:
+                await deployment.client.close()
+
+    def seconds_until_available(self) -> float:
+        with self._lock:
+            now = self._clock()
+            return max(0.0, min(stats.cooldown_until for stats in self._stats.values()) - now)
+
+    def snapshot(self) -> list[dict[str, Any]]:
+        """Return per-deployment usage and health for display or metrics."""
+        with self._lock:
+            now = self._clock()
+            rows = []
+            for deployment in self.deployments:
+                stats = self._stats[deployment.name]
+                self._prune(stats, now)
+                rows.append(
+                    {
+                        "name": deployment.name,
+                        "provider": deployment.provider,
+                        "model": deployment.model_name,
+                        "priority": deployment.priority,
+                        "rpm": len(stats.requests),
+                        "tpm": stats.token_total,
+                        "in_flight": stats.in_flight,
+                        "latency_ewma_ms": round(stats.latency_ewma * 1000, 1),
+                        "healthy": stats.cooldown_until <= now,
+                        "cooldown_remaining_s": round(max(0.0, stats.cooldown_until - now), 1),
+                        "successes": stats.successes,
+                        "failures": stats.failures,
+                        "last_error": stats.last_error,
+                    }
+                )
+            return rows
+
+    def call(
+        self,
+        invoke: Callable[[Deployment], T],
+        estimated_tokens: int = 0,
+        exclude: frozenset[str] = frozenset(),
+        deadline: Deadline | None = None,
+        tokens_used: Callable[[T], int] | None = None,
+    ) -> T:
+        """Run `invoke` on the best deployment, failing over on retryable errors.
+
+        Cooldown waits and failovers stop with `DeadlineExceeded` once `deadline` runs out.
+        `tokens_used` reads the tokens a result actually consumed for the TPM window; when
+        it is missing or returns 0, `estimated_tokens` is recorded instead.
+        """
+        tried: set[str] = set(exclude)
+        last_error: BaseException | None = None
+        waited = 0.0
+
+        while True:
+            if deadline is not None:
+                deadline.check("LLM call")
+            deployment = self.select(estimated_tokens, exclude=tried)
+            if deployment is None:
+                delay = self._wait_delay(tried, waited, deadline)
+                if delay is None:
+                    raise DeploymentUnavailableError(self._unavailable_message(last_error)) from last_error
+                time.sleep(delay)
+                waited += delay
+                continue
+
+            started = time.perf_counter()
+            try:
+                result = invoke(deployment)
+            except DeadlineExceeded:
+                self.release(deployment)
+                raise
+            except Exception as exc:
+                if not is_failover_error(exc):
+                    self.release(deployment)
+                    raise
+                self.record_failure(deployment, exc)
+                tried.add(deployment.name)
+                last_error = exc
+                continue
+
+            tokens = tokens_used(result) if tokens_used is not None else 0
+            self.record_success(deployment, time.perf_counter() - started, tokens or estimated_tokens)
+            return result
+
+    async def acall(
+        self,
+        invoke: Callable[[Deployment], Awaitable[T]],
+        estimated_tokens: int = 0,
+        exclude: frozenset[str] = frozenset(),
+        deadline: Deadline | None = None,
+        tokens_used: Callable[[T], int] | None = None,
+    ) -> T:
+        """Async variant of `call` for pools built from async clients."""
+        tried: set[str] = set(exclude)
+        last_error: BaseException | None = None
+        waited = 0.0
+
+        while True:
+            if deadline is not None:
+                deadline.check("LLM call")
+            deployment = self.select(estimated_tokens, exclude=tried)
+            if deployment is None:
+                delay = self._wait_delay(tried, waited, deadline)
+                if delay is None:
+                    raise DeploymentUnavailableError(self._unavailable_message(last_error)) from last_error
+                await asyncio.sleep(delay)
+                waited += delay
+                continue
+
+            started = time.perf_counter()
+            try:
+                result = await invoke(deployment)
+            except asyncio.CancelledError:
+                self.release(deployment)
+                raise
+            except DeadlineExceeded:
+                self.release(deployment)
+                raise
+            except Exception as exc:
+                if not is_failover_error(exc):
+                    self.release(deployment)
+                    raise
+                self.record_failure(deployment, exc)
+                tried.add(deployment.name)
+                last_error = exc
+                continue
+
+            tokens = tokens_used(result) if tokens_used is not None else 0
+            self.record_success(deployment, time.perf_counter() - started, tokens or estimated_tokens)
+            return result
+
+    def _wait_delay(self, tried: set[str], waited: float, deadline: Deadline | None = None) -> float | None:
+        """How long to wait for a cooldown to end, or None when the call should give up."""
+        if len(tried) >= len(self.deployments):
+            return None
+        delay = self.seconds_until_available()
+        if delay <= 0:
+            # Every untried deployment is at its RPM/TPM limit; wait for the window to slide.
+            delay = 1.0
+        if waited + delay > self.max_wait_seconds:
+            return None
+        remaining = None if deadline is None else deadline.remaining()
+        if remaining is not None and delay >= remaining:
+            raise DeadlineExceeded("Deadline exceeded while waiting for a deployment cooldown.")
+        return delay
+
+    def _load(self, deployment: Deployment, stats: DeploymentStats, estimated_tokens: int) -> float:
+        ratios = [0.0]
+        if deployment.rpm_limit > 0:
+            ratios.append((len(stats.requests) + stats.in_flight) / deployment.rpm_limit)
+        if deployment.tpm_limit > 0:
+            ratios.append((stats.token_total + estimated_tokens) / deployment.tpm_limit)
+        return max(ratios)
+
+    def _prune(self, stats: DeploymentStats, now: float) -> None:
+        horizon = now - self.window_seconds
+        while stats.requests and stats.requests[0] < horizon:
+            stats.requests.popleft()
+        while stats.tokens and stats.tokens[0][0] < horizon:
+            stats.token_total -= stats.tokens.popleft()[1]
+
+    @staticmethod
+    def _unavailable_message(last_error: BaseException | None) -> str:
+        if last_error is None:
+            return "All deployments are rate limited or cooling down."
+        return f"All deployments failed. Last error: {last_error}"
+
+
+def is_failover_error(exc: BaseException) -> bool:
+    """Return True for throttling, timeout, connection and server errors."""
+    if isinstance(exc, DeadlineExceeded):
+        # The caller's own budget ran out; another deployment would not help.
+        return False
+    status_code = getattr(exc, "status_code", None)
+    if status_code is None:
+        response = getattr(exc, "response", None)
+        status_code = getattr(response, "status_code", None)
+    if status_code is None:
+        # Timeouts and connection errors carry no HTTP status.
+        return isinstance(exc, (TimeoutError, ConnectionError)) or type(exc).__name__ in {
+            "APITimeoutError",
+            "APIConnectionError",
+        }
+    return status_code in _FAILOVER_STATUS_CODES or status_code >= 500
+
+
+def retry_after_seconds(exc: BaseException) -> float | None:
+    """Read a Retry-After hint from an HTTP error, if present."""
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return max(0.0, float(retry_after_ms) / 1000.0)
+        except ValueError:
+            pass
+
+    retry_after = headers.get("retry-after")
+    if retry_after:
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            return None
+    return None
+
+
+def build_deployment_pool(configs: list[dict[str, Any]], async_clients: bool = False) -> DeploymentPool:
+    """Create a pool from config dicts (for example `[[AZURE_OPENAI_DEPLOYMENTS]]` in secrets).
+
+    Supported keys: `name`, `provider` (`azure` or `openai`), `endpoint`, `api_key`,
+    `api_version`, `deployment` (model/deployment name), `tpm`, `rpm`, `priority`.
+    """
+    from modules.client_registry import default_client_registry
+
+    if async_clients:
+        from openai import AsyncAzureOpenAI, AsyncOpenAI
+
+    deployments: list[Deployment] = []
+    for index, config in enumerate(configs):
+        provider = str(config.get("provider", "azure")).lower().strip()
+        model_name = str(config.get("deployment", "")).strip()
+        api_key = str(config.get("api_key", "")).strip()
+        if not model_name or not api_key:
+            raise ValueError(f"Deployment config #{index + 1} needs 'deployment' and 'api_key'.")
+
+        # The pool handles retries and Retry-After itself; SDK retries would hide throttling.
+        # Sync clients come from the shared registry; async ones are bound to their event loop.
+        if provider == "openai":
+            if async_clients:
+                client = AsyncOpenAI(api_key=api_key, max_retries=0)
+            else:
+                client = default_client_registry.get("openai", api_key, max_retries=0)
+        elif provider == "azure":
+            endpoint = str(config.get("endpoint", "")).strip()
+            if not endpoint:
+                raise ValueError(f"Deployment config #{index + 1} needs 'endpoint' for Azure.")
+            api_version = str(config.get("api_version", "2025-04-01-preview"))
+            if async_clients:
+                client = AsyncAzureOpenAI(
+                    api_key=api_key, api_version=api_version, azure_endpoint=endpoint, max_retries=0
+                )
+            else:
+                client = default_client_registry.get("azure", api_key, endpoint, api_version, max_retries=0)
+        else:
+            raise ValueError("Unsupported provider. Use 'azure' or 'openai'.")
+
+        deployments.append(
+            Deployment(
+                name=str(config.get("name", "")).strip() or f"{provider}-{index + 1}",
+                client=client,
+                model_name=model_name,
+                provider=provider,
+                tpm_limit=int(config.get("tpm", 0)),
+                rpm_limit=int(config.get("rpm", 0)),
+                priority=int(config.get("priority", 0)),
+                owns_client=async_clients,
+            )
+        )
+    return DeploymentPool(deployments)
@@ -0,0 +1,175 @@
+"""Cached Microsoft Graph tokens with silent refresh before expiry."""
+
+from __future__ import annotations
+
+import threading
+import time
+from collections.abc import Callable
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Union
+
+if TYPE_CHECKING:
+    import requests
+
+DEFAULT_REFRESH_MARGIN_SECONDS = 300.0
+DEFAULT_TOKEN_CACHE_NAME = "remediation-creator-next"
+DEFAULT_AUTH_RECORD_PATH = ".cache/graph_auth_record.json"
+
+
+class GraphTokenProvider:
+    """Thread-safe bearer tokens for Graph from one long-lived credential.
+
+    The current token is reused until `refresh_margin_seconds` before `expires_on`. Inside
+    that margin, callers keep getting the still-valid token while one background thread
+    fetches the next one, so bulk uploads never wait for auth. Only an expired or
+    invalidated token makes callers block, and then a single refresh is shared by all of
+    them. Refreshes go through the credential's own token cache, so they are silent once
+    the user has signed in.
+    """
+
+    def __init__(
+        self,
+        credential: Any,
+        scope: str,
+        refresh_margin_seconds: float = DEFAULT_REFRESH_MARGIN_SECONDS,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.credential = credential
+        self.scope = scope
+        self.refresh_margin_seconds = refresh_margin_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._refreshing = threading.Lock()
+        self._token = ""
+        self._expires_on = 0.0
+        self._background: threading.Thread | None = None
+        self.last_error = ""
+
+    @property
+    def expires_on(self) -> float:
+        return self._expires_on
+
+    @property
+    def connected(self) -> bool:
+        return bool(self._token) and self._clock() < self._expires_on
+
+    def token(self) -> str:
+        """Return a valid access token, refreshing it when needed."""
+        with self._lock:
+            token, expires_on = self._token, self._expires_on
+        now = self._clock()
+        if token and now < expires_on - self.refresh_margin_seconds:
+            return token
+        if token and now < expires_on:
+            self._refresh_in_background()
+            return token
+        return self._refresh(expired_token=token)
+
+    def auth_header(self) -> dict[str, str]:
+        return {"Authorization": f"Bearer {self.token()}", "Content-Type": "application/json"}
+
+    def invalidate(self, token: str | None = None) -> None:
+        """Drop the cached token, e.g. after a 401; pass the rejected token to ignore stale reports."""
+        with self._lock:
+            if token is None or token == self._token:
+                self._token = ""
+                self._expires_on = 0.0
+
+    def _refresh(self, expired_token: str = "") -> str:
+        with self._refreshing:
+            with self._lock:
+                if self._token and self._token != expired_token and self._clock() < self._expires_on:
+                    # Another thread refreshed while this one waited.
+                    return self._token
+            access = self.credential.get_token(self.scope)
+            with self._lock:
+                self._token = access.token
+                self._expires_on = float(access.expires_on)
+                self.last_error = ""
+                return self._token
+
+    def _refresh_in_background(self) -> None:
+        with self._lock:
+            if self._background is not None and self._background.is_alive():
+                return
+            current = self._token
+            self._background = threading.Thread(
+                target=self._background_refresh, args=(current,), name="graph-token-refresh", daemon=True
+            )
+            self._background.start()
+
+    def _background_refresh(self, current: str) -> None:
+        try:
+            self._refresh(expired_token=current)
+        except Exception as exc:
+            # The current token is still valid; the next call past expiry retries in the foreground.
+            self.last_error = str(exc)
+
+
+GraphAuth = Union[dict[str, str], GraphTokenProvider]
+
+
+def graph_session() -> requests.Session:
+    """New HTTP session for Graph calls; `requests` is only imported once one is needed."""
+    import requests
+
+    return requests.Session()
+
+
+def auth_headers(auth: GraphAuth) -> dict[str, str]:
+    """Headers for one Graph request from a static header dict or a token provider."""
+    if isinstance(auth, GraphTokenProvider):
+        return auth.auth_header()
+    return auth
+
+
+def interactive_token_provider(
+    client_id: str,
+    scope: str,
+    tenant_id: str | None = None,
+    cache_name: str = DEFAULT_TOKEN_CACHE_NAME,
+    record_path: str | Path | None = DEFAULT_AUTH_RECORD_PATH,
+    allow_unencrypted_storage: bool = False,
+) -> GraphTokenProvider:
+    """Browser sign-in with a persistent token cache.
+
+    With a `record_path`, the authentication record (account and tenant, no secrets) is
+    kept there and later sign-ins, including after a restart, refresh silently from the
+    OS-protected MSAL cache named `cache_name`. Anyone who can reach the process then
+    acts as that account, so pass None wherever several people share one instance; each
+    provider then signs in through the browser once and holds only its own token.
+    """
+    from azure.identity import AuthenticationRecord, InteractiveBrowserCredential, TokenCachePersistenceOptions
+
+    record = None
+    path = Path(record_path) if record_path is not None else None
+    if path is not None and path.exists():
+        try:
+            record = AuthenticationRecord.deserialize(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError, KeyError):
+            record = None
+
+    kwargs: dict[str, Any] = {
+        "client_id": client_id,
+        "cache_persistence_options": TokenCachePersistenceOptions(
+            name=cache_name, allow_unencrypted_storage=allow_unencrypted_storage
+        ),
+    }
+    if tenant_id:
+        kwargs["tenant_id"] = tenant_id
+    if record is not None:
+        kwargs["authentication_record"] = record
+    credential = InteractiveBrowserCredential(**kwargs)
+
+    if record is None:
+        record = credential.authenticate(scopes=[scope])
+        if path is not None:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(record.serialize(), encoding="utf-8")
+    return GraphTokenProvider(credential, scope)
+
+
+def forget_auth_record(record_path: str | Path | None = DEFAULT_AUTH_RECORD_PATH) -> None:
+    """Delete the stored account record so the next sign-in opens the browser again."""
+    if record_path is not None:
+        Path(record_path).unlink(missing_ok=True)
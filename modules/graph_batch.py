@@ -0,0 +1,242 @@
+"""Bulk Graph publishing through JSON `$batch` requests."""
+
+from __future__ import annotations
+
+import time
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any
+
+from modules.deadline import Deadline, DeadlineExceeded, request_timeout
+from modules.graph_auth import GraphAuth, GraphTokenProvider, auth_headers, graph_session
+
+if TYPE_CHECKING:
+    import requests
+
+GRAPH_BATCH_LIMIT = 20
+DEFAULT_BATCH_CONCURRENCY = 4
+DEFAULT_MAX_ATTEMPTS = 4
+DEFAULT_BACKOFF_SECONDS = 2.0
+MAX_BACKOFF_SECONDS = 60.0
+DEFAULT_BATCH_TIMEOUT_SECONDS = 120
+# Item statuses worth sending again; anything else is reported as a final failure.
+RETRYABLE_STATUS_CODES = frozenset({408, 429, 500, 502, 503, 504})
+
+
+@dataclass(slots=True)
+class PublishResult:
+    """Outcome for one payload; `index` is its position in the published list."""
+
+    index: int
+    display_name: str
+    status_code: int = 0
+    body: Any = None
+    error: str = ""
+    attempts: int = 0
+    action: str = ""
+
+    @property
+    def ok(self) -> bool:
+        return 200 <= self.status_code < 300
+
+
+@dataclass(slots=True)
+class BatchOperation:
+    """One request inside a `$batch`; `url` is relative to the Graph version root."""
+
+    method: str
+    url: str
+    body: dict[str, Any] | None = None
+    display_name: str = ""
+    action: str = ""
+
+
+class GraphBatchPublisher:
+    """Publish many payloads with Graph `$batch`, 20 per request, several batches at once.
+
+    Each item in a batch carries its own status. Successful and permanently failed items
+    are final; throttled (429) and transient 5xx items, plus every item of a batch whose
+    HTTP request failed outright, are regrouped and sent again after the largest
+    `Retry-After` seen, or an exponential backoff, up to `max_attempts` per item.
+    """
+
+    def __init__(
+        self,
+        auth: GraphAuth,
+        base_url: str,
+        endpoint: str = "deviceManagement/deviceHealthScripts",
+        concurrency: int = DEFAULT_BATCH_CONCURRENCY,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+        backoff_seconds: float = DEFAULT_BACKOFF_SECONDS,
+        session: requests.Session | None = None,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        if concurrency < 1:
+            raise ValueError("Batch concurrency must be at least 1.")
+        if max_attempts < 1:
+            raise ValueError("max_attempts must be at least 1.")
+        self.auth = auth
+        self.batch_url = base_url.rstrip("/") + "/$batch"
+        self.endpoint = "/" + endpoint.lstrip("/")
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self.session = session or graph_session()
+        self._sleep = sleep
+
+    def publish(self, payloads: list[dict[str, Any]], deadline: Deadline | None = None) -> list[PublishResult]:
+        """POST every payload and return one result per payload, in input order."""
+        operations = [
+            BatchOperation("POST", self.endpoint, payload, str(payload.get("displayName", "")), "created")
+            for payload in payloads
+        ]
+        return self.execute(operations, deadline)
+
+    def execute(self, operations: list[BatchOperation], deadline: Deadline | None = None) -> list[PublishResult]:
+        """Run arbitrary operations through `$batch`; one result per operation, in order."""
+        results = [
+            PublishResult(index, operation.display_name, action=operation.action)
+            for index, operation in enumerate(operations)
+        ]
+        pending = list(range(len(operations)))
+        round_number = 0
+
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="graph-batch") as executor:
+            while pending:
+                if deadline is not None and deadline.expired:
+                    self._give_up(results, pending, "Deadline exceeded before the item was published.")
+                    break
+                batches = [pending[start : start + GRAPH_BATCH_LIMIT] for start in range(0, len(pending), GRAPH_BATCH_LIMIT)]
+                outcomes = list(executor.map(lambda batch: self._send(batch, operations, results, deadline), batches))
+                pending = [index for retry, _ in outcomes for index in retry]
+                pending = [index for index in pending if results[index].attempts < self.max_attempts]
+                if not pending:
+                    break
+                round_number += 1
+                hinted = max((hint for _, hint in outcomes if hint is not None), default=None)
+                delay = hinted if hinted is not None else self.backoff_seconds * 2 ** (round_number - 1)
+                delay = min(delay, MAX_BACKOFF_SECONDS)
+                remaining = None if deadline is None else deadline.remaining()
+                if remaining is not None and delay >= remaining:
+                    self._give_up(results, pending, "Deadline exceeded while waiting to retry.")
+                    break
+                self._sleep(delay)
+        return results
+
+    def _send(
+        self,
+        batch: list[int],
+        operations: list[BatchOperation],
+        results: list[PublishResult],
+        deadline: Deadline | None,
+    ) -> tuple[list[int], float | None]:
+        """Send one `$batch` request; return the items to retry and the Retry-After hint."""
+        import requests
+
+        body = {"requests": [_batch_request(index, operations[index]) for index in batch]}
+        for index in batch:
+            results[index].attempts += 1
+
+        try:
+            headers = auth_headers(self.auth)
+            response = self.session.post(
+                self.batch_url,
+                headers=headers,
+                json=body,
+                timeout=request_timeout(deadline, DEFAULT_BATCH_TIMEOUT_SECONDS, "Graph batch upload"),
+            )
+        except (requests.RequestException, DeadlineExceeded) as exc:
+            self._fail(results, batch, 0, str(exc))
+            return batch, None
+
+        if response.status_code == 401 and isinstance(self.auth, GraphTokenProvider):
+            # The token was revoked or expired early; the next attempt fetches a new one.
+            self.auth.invalidate(headers["Authorization"].removeprefix("Bearer "))
+            self._fail(results, batch, 401, f"Graph batch failed (401): {response.text[:500]}")
+            return batch, 0.0
+
+        if response.status_code >= 400:
+            error = f"Graph batch failed ({response.status_code}): {response.text[:500]}"
+            self._fail(results, batch, response.status_code, error)
+            if response.status_code in RETRYABLE_STATUS_CODES:
+                return batch, _retry_after(response.headers)
+            return [], None
+
+        try:
+            responses = response.json().get("responses", [])
+        except ValueError:
+            self._fail(results, batch, response.status_code, "Graph batch returned a non-JSON body.")
+            return batch, None
+
+        retry: list[int] = []
+        hint: float | None = None
+        answered: set[int] = set()
+        for item in responses:
+            try:
+                index = int(item.get("id", ""))
+            except ValueError:
+                continue
+            if index not in batch:
+                continue
+            answered.add(index)
+            status = int(item.get("status", 0))
+            result = results[index]
+            result.status_code = status
+            result.body = item.get("body")
+            if 200 <= status < 300:
+                result.error = ""
+                continue
+            result.error = _item_error(status, result.body)
+            if status in RETRYABLE_STATUS_CODES:
+                retry.append(index)
+                item_hint = _retry_after(item.get("headers") or {})
+                if item_hint is not None:
+                    hint = item_hint if hint is None else max(hint, item_hint)
+
+        missing = [index for index in batch if index not in answered]
+        self._fail(results, missing, 0, "Graph batch response did not include this item.")
+        return retry + missing, hint
+
+    @staticmethod
+    def _fail(results: list[PublishResult], indexes: list[int], status: int, error: str) -> None:
+        # Each index belongs to exactly one in-flight batch, so no locking is needed.
+        for index in indexes:
+            results[index].status_code = status
+            results[index].error = error
+
+    @staticmethod
+    def _give_up(results: list[PublishResult], indexes: list[int], error: str) -> None:
+        for index in indexes:
+            last = results[index].error
+            results[index].error = f"{error} Last error: {last}" if last else error
+
+
+def _batch_request(index: int, operation: BatchOperation) -> dict[str, Any]:
+    request: dict[str, Any] = {"id": str(index), "method": operation.method, "url": operation.url}
+    if operation.body is not None:
+        request["headers"] = {"Content-Type": "application/json"}
+        request["body"] = operation.body
+    return request
+
+
+def _retry_after(headers: Any) -> float | None:
+    """Read `Retry-After` (seconds) from response or batch item headers."""
+    for name, value in dict(headers).items():
+        if name.lower() == "retry-after":
+            try:
+                return max(0.0, float(value))
+            except (TypeError, ValueError):
+                return None
+    return None
+
+
+def _item_error(status: int, body: Any) -> str:
+    message = ""
+    if isinstance(body, dict):
+        error = body.get("error")
+        if isinstance(error, dict):
+            message = str(error.get("message", ""))
+        elif error:
+            message = str(error)
+    return f"Graph request failed ({status}): {message[:500]}" if message else f"Graph request failed ({status})."
@@ -0,0 +1,267 @@
+"""Remote index of published device health scripts for idempotent upserts."""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import threading
+import time
+from collections.abc import Callable
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+from modules.deadline import Deadline, request_timeout
+from modules.graph_auth import GraphAuth, auth_headers, graph_session
+from modules.graph_batch import BatchOperation, GraphBatchPublisher, PublishResult
+
+if TYPE_CHECKING:
+    import requests
+
+DEFAULT_INVENTORY_MAX_AGE_SECONDS = 300.0
+DEFAULT_LIST_TIMEOUT_SECONDS = 45
+# Payload fields that decide whether a published script is up to date.
+FINGERPRINT_FIELDS = (
+    "description",
+    "publisher",
+    "runAs32Bit",
+    "runAsAccount",
+    "enforceSignatureCheck",
+    "detectionScriptContent",
+    "remediationScriptContent",
+)
+_LIST_SELECT = "id,displayName,lastModifiedDateTime"
+
+
+@dataclass(slots=True)
+class RemoteScript:
+    """One script in the tenant; `fingerprint` is empty until its content has been read."""
+
+    id: str
+    display_name: str
+    last_modified: str = ""
+    fingerprint: str = ""
+
+
+def payload_fingerprint(payload: dict[str, Any]) -> str:
+    """Hash of the fields we publish; Graph objects and upload payloads hash alike."""
+    canonical = {name: payload.get(name) or "" for name in FINGERPRINT_FIELDS}
+    for name in ("runAs32Bit", "enforceSignatureCheck"):
+        canonical[name] = bool(payload.get(name))
+    encoded = json.dumps(canonical, sort_keys=True, ensure_ascii=True).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+
+class GraphInventory:
+    """Cached index of remote scripts by display name and content fingerprint.
+
+    `refresh()` pages through the collection with a light `$select`, following
+    `@odata.nextLink`. Entries whose `lastModifiedDateTime` is unchanged keep their
+    fingerprint, so after the first upsert only new or edited scripts are read again.
+    Writes made through `upsert` are recorded directly, without another listing; when
+    Graph returns no `lastModifiedDateTime` (PATCH answers 204), the next listing's
+    timestamp is adopted instead of reading the content again.
+    Pass `path` to keep the index across restarts.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        endpoint: str = "deviceManagement/deviceHealthScripts",
+        max_age_seconds: float = DEFAULT_INVENTORY_MAX_AGE_SECONDS,
+        path: str | Path | None = None,
+        session: requests.Session | None = None,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.base_url = base_url.rstrip("/") + "/"
+        self.endpoint = endpoint.strip("/")
+        self.max_age_seconds = max_age_seconds
+        self.path = Path(path) if path is not None else None
+        self.session = session or graph_session()
+        self._clock = clock
+        self._lock = threading.RLock()
+        self._entries: dict[str, RemoteScript] = {}
+        self._refreshed_at = 0.0
+        self._load()
+
+    @property
+    def entries(self) -> list[RemoteScript]:
+        with self._lock:
+            return list(self._entries.values())
+
+    @property
+    def stale(self) -> bool:
+        return self._clock() - self._refreshed_at >= self.max_age_seconds
+
+    def invalidate(self) -> None:
+        """Force the next `refresh()` to list the collection again."""
+        with self._lock:
+            self._refreshed_at = 0.0
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._refreshed_at = 0.0
+            self.save()
+
+    def find(self, display_name: str) -> list[RemoteScript]:
+        """Scripts with this display name, most recently modified first."""
+        key = display_name.strip().lower()
+        with self._lock:
+            matches = [entry for entry in self._entries.values() if entry.display_name.strip().lower() == key]
+        return sorted(matches, key=lambda entry: entry.last_modified, reverse=True)
+
+    def refresh(self, auth: GraphAuth, deadline: Deadline | None = None, force: bool = False) -> None:
+        """Re-list the collection when the index is older than `max_age_seconds`."""
+        if not force and not self.stale:
+            return
+        listed: dict[str, RemoteScript] = {}
+        url: str | None = f"{self.base_url}{self.endpoint}?$select={_LIST_SELECT}"
+        while url:
+            response = self.session.get(
+                url,
+                headers=auth_headers(auth),
+                timeout=request_timeout(deadline, DEFAULT_LIST_TIMEOUT_SECONDS, "Graph inventory listing"),
+            )
+            if response.status_code >= 400:
+                raise RuntimeError(f"Graph listing failed ({response.status_code}): {response.text[:500]}")
+            page = response.json()
+            for item in page.get("value", []):
+                entry = RemoteScript(
+                    id=str(item["id"]),
+                    display_name=str(item.get("displayName") or ""),
+                    last_modified=str(item.get("lastModifiedDateTime") or ""),
+                )
+                listed[entry.id] = entry
+            url = page.get("@odata.nextLink")
+
+        with self._lock:
+            for entry in listed.values():
+                known = self._entries.get(entry.id)
+                if known is not None and known.last_modified in {"", entry.last_modified}:
+                    entry.fingerprint = known.fingerprint
+            self._entries = listed
+            self._refreshed_at = self._clock()
+            self.save()
+
+    def record(self, script_id: str, payload: dict[str, Any], last_modified: str = "") -> None:
+        """Store the state of a script we just created or updated; call `save()` afterwards."""
+        with self._lock:
+            self._entries[script_id] = RemoteScript(
+                id=script_id,
+                display_name=str(payload.get("displayName", "")),
+                last_modified=last_modified,
+                fingerprint=payload_fingerprint(payload),
+            )
+
+    def fill_fingerprints(
+        self,
+        entries: list[RemoteScript],
+        publisher: GraphBatchPublisher,
+        deadline: Deadline | None = None,
+    ) -> None:
+        """Read the content of entries without a fingerprint, 20 per `$batch` request."""
+        missing = [entry for entry in entries if not entry.fingerprint]
+        if not missing:
+            return
+        operations = [
+            BatchOperation("GET", f"/{self.endpoint}/{entry.id}", display_name=entry.display_name, action="read")
+            for entry in missing
+        ]
+        results = publisher.execute(operations, deadline)
+        with self._lock:
+            for entry, result in zip(missing, results):
+                if result.ok and isinstance(result.body, dict):
+                    entry.fingerprint = payload_fingerprint(result.body)
+                    entry.last_modified = str(result.body.get("lastModifiedDateTime") or entry.last_modified)
+            self.save()
+
+    def _load(self) -> None:
+        if self.path is None or not self.path.exists():
+            return
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+            entries = [RemoteScript(**item) for item in data.get("entries", [])]
+        except (OSError, ValueError, TypeError):
+            return
+        self._entries = {entry.id: entry for entry in entries}
+        # A loaded index still needs one listing to catch remote changes and deletions.
+        self._refreshed_at = 0.0
+
+    def save(self) -> None:
+        if self.path is None:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            data = {"endpoint": self.endpoint, "entries": [asdict(entry) for entry in self._entries.values()]}
+        temporary = self.path.with_suffix(".tmp")
+        temporary.write_text(json.dumps(data), encoding="utf-8")
+        temporary.replace(self.path)
+
+
+def upsert(
+    payloads: list[dict[str, Any]],
+    inventory: GraphInventory,
+    publisher: GraphBatchPublisher,
+    auth: GraphAuth,
+    deadline: Deadline | None = None,
+) -> list[PublishResult]:
+    """POST new scripts, PATCH changed ones and skip unchanged ones, matched by display name.
+
+    When several payloads share a display name, only the last one is published; the
+    earlier ones are reported as failed `duplicate` results instead of creating copies.
+    """
+    results: list[PublishResult | None] = [None] * len(payloads)
+    latest: dict[str, int] = {}
+    for index, payload in enumerate(payloads):
+        latest[str(payload.get("displayName", "")).strip().lower()] = index
+    for index, payload in enumerate(payloads):
+        if latest[str(payload.get("displayName", "")).strip().lower()] != index:
+            results[index] = PublishResult(
+                index,
+                str(payload.get("displayName", "")),
+                error="Skipped: a later payload in this upload has the same display name.",
+                action="duplicate",
+            )
+
+    inventory.refresh(auth, deadline)
+    pending = [index for index, result in enumerate(results) if result is None]
+    candidates = {index: inventory.find(str(payloads[index].get("displayName", ""))) for index in pending}
+    inventory.fill_fingerprints([entry for matches in candidates.values() for entry in matches], publisher, deadline)
+
+    operations: list[BatchOperation] = []
+    positions: list[int] = []
+    targets: list[str] = []
+    for index in pending:
+        payload = payloads[index]
+        name = str(payload.get("displayName", ""))
+        matches = candidates[index]
+        fingerprint = payload_fingerprint(payload)
+        unchanged = next((entry for entry in matches if entry.fingerprint == fingerprint), None)
+        if unchanged is not None:
+            results[index] = PublishResult(index, name, status_code=200, body={"id": unchanged.id}, action="unchanged")
+            continue
+        if matches:
+            target = matches[0].id
+            operations.append(BatchOperation("PATCH", f"/{inventory.endpoint}/{target}", payload, name, "updated"))
+        else:
+            target = ""
+            operations.append(BatchOperation("POST", f"/{inventory.endpoint}", payload, name, "created"))
+        positions.append(index)
+        targets.append(target)
+
+    for index, target, result in zip(positions, targets, publisher.execute(operations, deadline)):
+        result.index = index
+        results[index] = result
+        if not result.ok:
+            continue
+        body = result.body if isinstance(result.body, dict) else {}
+        script_id = str(body.get("id") or target)
+        if script_id:
+            inventory.record(script_id, payloads[index], str(body.get("lastModifiedDateTime") or ""))
+            # PATCH answers 204 without a body; report the ID that was updated.
+            result.body = body or {"id": script_id}
+        else:
+            inventory.invalidate()
+    inventory.save()
+    return [result for result in results if result is not None]
@@ -0,0 +1,195 @@
+"""Hedged LLM requests to cut tail latency."""
+
+from __future__ import annotations
+
+import asyncio
+import math
+import threading
+import time
+from collections import deque
+from collections.abc import Awaitable, Callable
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, TypeVar
+
+from modules.deadline import Deadline, DeadlineExceeded
+
+T = TypeVar("T")
+
+DEFAULT_PERCENTILE = 95.0
+DEFAULT_INITIAL_DELAY_SECONDS = 8.0
+DEFAULT_MIN_DELAY_SECONDS = 1.0
+DEFAULT_MAX_DELAY_SECONDS = 60.0
+DEFAULT_MIN_SAMPLES = 20
+DEFAULT_SAMPLE_WINDOW = 500
+
+
+class RequestHedger:
+    """Fire a duplicate request when the first one is slower than a latency percentile.
+
+    The hedge delay is the configured percentile of recently observed call latencies,
+    clamped to `[min_delay_seconds, max_delay_seconds]`; until `min_samples` calls have
+    completed, `initial_delay_seconds` is used. One instance is meant to be shared by
+    every `Utility` that talks to the same deployments.
+
+    Sync calls cannot interrupt an in-flight HTTP request, so a losing sync attempt is
+    abandoned and its result discarded; async losers are cancelled. Each sync primary
+    runs on its own thread, so callers are never queued behind other calls and the hedge
+    delay starts when the request does; only hedges share the `max_workers` pool.
+    """
+
+    def __init__(
+        self,
+        percentile: float = DEFAULT_PERCENTILE,
+        initial_delay_seconds: float = DEFAULT_INITIAL_DELAY_SECONDS,
+        min_delay_seconds: float = DEFAULT_MIN_DELAY_SECONDS,
+        max_delay_seconds: float = DEFAULT_MAX_DELAY_SECONDS,
+        min_samples: int = DEFAULT_MIN_SAMPLES,
+        max_workers: int = 32,
+    ):
+        if not 0 < percentile < 100:
+            raise ValueError("Hedge percentile must be between 0 and 100.")
+        self.percentile = percentile
+        self.initial_delay_seconds = initial_delay_seconds
+        self.min_delay_seconds = min_delay_seconds
+        self.max_delay_seconds = max_delay_seconds
+        self.min_samples = min_samples
+        self._samples: deque[float] = deque(maxlen=DEFAULT_SAMPLE_WINDOW)
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm-hedge")
+        self._counters = {"calls": 0, "hedges_fired": 0, "hedge_wins": 0, "primary_wins_after_hedge": 0}
+
+    def delay(self) -> float:
+        """Current hedge delay in seconds."""
+        with self._lock:
+            samples = sorted(self._samples)
+        if len(samples) < self.min_samples:
+            value = self.initial_delay_seconds
+        else:
+            rank = max(0, math.ceil(self.percentile / 100.0 * len(samples)) - 1)
+            value = samples[rank]
+        return min(max(value, self.min_delay_seconds), self.max_delay_seconds)
+
+    def stats(self) -> dict[str, Any]:
+        """Return hedge counters and the current delay."""
+        with self._lock:
+            counters = dict(self._counters)
+            samples = len(self._samples)
+        fired = counters["hedges_fired"]
+        counters["hedge_fire_rate"] = round(fired / counters["calls"], 4) if counters["calls"] else 0.0
+        counters["hedge_win_rate"] = round(counters["hedge_wins"] / fired, 4) if fired else 0.0
+        counters["latency_samples"] = samples
+        counters["current_delay_s"] = round(self.delay(), 3)
+        return counters
+
+    def call(self, primary: Callable[[], T], hedge: Callable[[], T], deadline: Deadline | None = None) -> T:
+        """Run `primary`, racing it against `hedge` if it exceeds the hedge delay."""
+        self._count("calls")
+        first = self._start(primary)
+        done, _ = wait([first], timeout=self._first_wait(deadline))
+        if done:
+            return self._finish(first.result())
+        if deadline is not None and deadline.expired:
+            first.cancel()
+            raise DeadlineExceeded("Deadline exceeded before the LLM call completed.")
+
+        self._count("hedges_fired")
+        second = self._executor.submit(self._timed, hedge)
+        pending: set[Future] = {first, second}
+        errors: list[BaseException] = []
+        while pending:
+            timeout = None if deadline is None else deadline.remaining()
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                for loser in pending:
+                    loser.cancel()
+                raise DeadlineExceeded("Deadline exceeded before the LLM call completed.")
+            for future in done:
+                error = future.exception()
+                if error is not None:
+                    errors.append(error)
+                    continue
+                for loser in pending:
+                    loser.cancel()
+                self._count("hedge_wins" if future is second else "primary_wins_after_hedge")
+                return self._finish(future.result())
+        raise errors[0]
+
+    async def acall(
+        self,
+        primary: Callable[[], Awaitable[T]],
+        hedge: Callable[[], Awaitable[T]],
+        deadline: Deadline | None = None,
+    ) -> T:
+        """Async variant of `call`; the losing attempt is cancelled."""
+        self._count("calls")
+        first = asyncio.ensure_future(self._atimed(primary))
+        done, _ = await asyncio.wait({first}, timeout=self._first_wait(deadline))
+        if done:
+            return self._finish(first.result())
+        if deadline is not None and deadline.expired:
+            first.cancel()
+            raise DeadlineExceeded("Deadline exceeded before the LLM call completed.")
+
+        self._count("hedges_fired")
+        second = asyncio.ensure_future(self._atimed(hedge))
+        pending: set[asyncio.Future] = {first, second}
+        errors: list[BaseException] = []
+        try:
+            while pending:
+                timeout = None if deadline is None else deadline.remaining()
+                done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    raise DeadlineExceeded("Deadline exceeded before the LLM call completed.")
+                for task in done:
+                    error = task.exception()
+                    if error is not None:
+                        errors.append(error)
+                        continue
+                    self._count("hedge_wins" if task is second else "primary_wins_after_hedge")
+                    return self._finish(task.result())
+        finally:
+            for task in pending:
+                task.cancel()
+        raise errors[0]
+
+    def _start(self, fn: Callable[[], T]) -> Future:
+        """Run `fn` on a thread of its own; the future resolves to `(elapsed, result)`."""
+        future: Future = Future()
+        future.set_running_or_notify_cancel()
+
+        def run() -> None:
+            try:
+                future.set_result(self._timed(fn))
+            except BaseException as exc:
+                future.set_exception(exc)
+
+        threading.Thread(target=run, name="llm-primary", daemon=True).start()
+        return future
+
+    def _first_wait(self, deadline: Deadline | None) -> float:
+        """Hedge delay, shortened so the first wait never outlives the deadline."""
+        delay = self.delay()
+        remaining = None if deadline is None else deadline.remaining()
+        return delay if remaining is None else min(delay, remaining)
+
+    def _finish(self, timed_result: tuple[float, T]) -> T:
+        elapsed, result = timed_result
+        with self._lock:
+            self._samples.append(elapsed)
+        return result
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counters[name] += 1
+
+    @staticmethod
+    def _timed(fn: Callable[[], T]) -> tuple[float, T]:
+        started = time.perf_counter()
+        result = fn()
+        return time.perf_counter() - started, result
+
+    @staticmethod
+    async def _atimed(fn: Callable[[], Awaitable[T]]) -> tuple[float, T]:
+        started = time.perf_counter()
+        result = await fn()
+        return time.perf_counter() - started, result
@@ -0,0 +1,221 @@
+"""Persistent snapshot history with full-text search."""
+
+from __future__ import annotations
+
+import hashlib
+import re
+import sqlite3
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+
+DEFAULT_HISTORY_PATH = ".cache/history.sqlite"
+DEFAULT_HISTORY_PAGE_SIZE = 10
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+
+@dataclass(slots=True)
+class HistoryItem:
+    """One row of a history page; the script bodies are loaded with `HistoryStore.get`."""
+
+    id: str
+    created_at: str
+    mode: str
+    description: str
+
+    @property
+    def fingerprint(self) -> str:
+        return self.id[:8]
+
+
+@dataclass(slots=True)
+class HistoryEntry:
+    id: str
+    created_at: str
+    mode: str
+    description: str
+    detection_script: str
+    remediation_script: str
+
+    @property
+    def fingerprint(self) -> str:
+        return self.id[:8]
+
+
+def artifact_key(detection_script: str, remediation_script: str, owner: str = "") -> str:
+    """SHA-256 of the script pair (and owner); saving the same scripts again updates one entry."""
+    scope = f"{owner}\n--\n" if owner else ""
+    return hashlib.sha256((scope + detection_script + "\n--\n" + remediation_script).encode("utf-8")).hexdigest()
+
+
+def fts_query(text: str) -> str:
+    """Turn free text into an FTS5 query: every word must match, as a prefix."""
+    return " ".join(f'"{word}"*' for word in _WORD.findall(text.lower()))
+
+
+class HistoryStore:
+    """Saved snapshots in SQLite, deduplicated by `artifact_key` and indexed with FTS5.
+
+    Descriptions and script bodies are searchable; `page()` returns only the light
+    columns, so listing stays fast however large the scripts are. Every method takes an
+    `owner` and only sees that owner's snapshots; the empty owner is the shared history.
+    """
+
+    def __init__(self, path: str | Path = DEFAULT_HISTORY_PATH):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS history (
+                    rowid INTEGER PRIMARY KEY,
+                    id TEXT NOT NULL UNIQUE,
+                    created_at TEXT NOT NULL,
+                    mode TEXT NOT NULL,
+                    description TEXT NOT NULL,
+                    detection_script TEXT NOT NULL,
+                    remediation_script TEXT NOT NULL,
+                    saved REAL NOT NULL,
+                    owner TEXT NOT NULL DEFAULT ''
+                );
+                CREATE VIRTUAL TABLE IF NOT EXISTS history_fts USING fts5(
+                    description, detection_script, remediation_script,
+                    content='history', content_rowid='rowid'
+                );
+                CREATE TRIGGER IF NOT EXISTS history_ai AFTER INSERT ON history BEGIN
+                    INSERT INTO history_fts (rowid, description, detection_script, remediation_script)
+                    VALUES (new.rowid, new.description, new.detection_script, new.remediation_script);
+                END;
+                CREATE TRIGGER IF NOT EXISTS history_ad AFTER DELETE ON history BEGIN
+                    INSERT INTO history_fts (history_fts, rowid, description, detection_script, remediation_script)
+                    VALUES ('delete', old.rowid, old.description, old.detection_script, old.remediation_script);
+                END;
+                -- Recreated on open: earlier versions only re-indexed on description changes.
+                DROP TRIGGER IF EXISTS history_au;
+                CREATE TRIGGER history_au
+                AFTER UPDATE OF description, detection_script, remediation_script ON history BEGIN
+                    INSERT INTO history_fts (history_fts, rowid, description, detection_script, remediation_script)
+                    VALUES ('delete', old.rowid, old.description, old.detection_script, old.remediation_script);
+                    INSERT INTO history_fts (rowid, description, detection_script, remediation_script)
+                    VALUES (new.rowid, new.description, new.detection_script, new.remediation_script);
+                END;
+                """
+            )
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(history)")}
+            if "owner" not in columns:
+                # Earlier versions kept one history for everyone; those rows stay in the shared scope.
+                conn.execute("ALTER TABLE history ADD COLUMN owner TEXT NOT NULL DEFAULT ''")
+            conn.execute("DROP INDEX IF EXISTS history_saved")
+            conn.execute("CREATE INDEX IF NOT EXISTS history_owner_saved ON history (owner, saved DESC)")
+            # Matches in the description outrank matches somewhere in a script body.
+            conn.execute("INSERT INTO history_fts (history_fts, rank) VALUES ('rank', 'bm25(4.0, 1.0, 1.0)')")
+
+    def save(
+        self, description: str, detection_script: str, remediation_script: str, mode: str, owner: str = ""
+    ) -> HistoryItem:
+        """Store a snapshot, or move an identical earlier one of the same owner to the top."""
+        item = HistoryItem(
+            id=artifact_key(detection_script, remediation_script, owner),
+            created_at=datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%SZ"),
+            mode=mode,
+            description=description.strip(),
+        )
+        with self._connect() as conn:
+            conn.execute(
+                """
+                INSERT INTO history (
+                    id, created_at, mode, description, detection_script, remediation_script, saved, owner
+                )
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (id) DO UPDATE SET
+                    created_at = excluded.created_at,
+                    mode = excluded.mode,
+                    description = excluded.description,
+                    saved = excluded.saved
+                """,
+                (
+                    item.id,
+                    item.created_at,
+                    mode,
+                    item.description,
+                    detection_script,
+                    remediation_script,
+                    time.time(),
+                    owner,
+                ),
+            )
+        return item
+
+    def page(
+        self, query: str = "", offset: int = 0, limit: int = DEFAULT_HISTORY_PAGE_SIZE, owner: str = ""
+    ) -> list[HistoryItem]:
+        """Newest snapshots of `owner` first, or their best matches for `query`."""
+        match = fts_query(query)
+        with self._connect() as conn:
+            if match:
+                # Rank inside FTS5 and read only the light columns of one page.
+                rows = conn.execute(
+                    """
+                    SELECT h.id, h.created_at, h.mode, h.description
+                    FROM history_fts JOIN history AS h ON h.rowid = history_fts.rowid
+                    WHERE history_fts MATCH ? AND h.owner = ?
+                    ORDER BY history_fts.rank LIMIT ? OFFSET ?
+                    """,
+                    (match, owner, limit, offset),
+                ).fetchall()
+            else:
+                rows = conn.execute(
+                    """
+                    SELECT id, created_at, mode, description FROM history
+                    WHERE owner = ? ORDER BY saved DESC LIMIT ? OFFSET ?
+                    """,
+                    (owner, limit, offset),
+                ).fetchall()
+        return [HistoryItem(*row) for row in rows]
+
+    def count(self, query: str = "", owner: str = "") -> int:
+        match = fts_query(query)
+        with self._connect() as conn:
+            if match:
+                row = conn.execute(
+                    """
+                    SELECT count(*) FROM history_fts JOIN history AS h ON h.rowid = history_fts.rowid
+                    WHERE history_fts MATCH ? AND h.owner = ?
+                    """,
+                    (match, owner),
+                ).fetchone()
+            else:
+                row = conn.execute("SELECT count(*) FROM history WHERE owner = ?", (owner,)).fetchone()
+        return int(row[0])
+
+    def get(self, entry_id: str, owner: str = "") -> HistoryEntry | None:
+        with self._connect() as conn:
+            row = conn.execute(
+                """
+                SELECT id, created_at, mode, description, detection_script, remediation_script
+                FROM history WHERE id = ? AND owner = ?
+                """,
+                (entry_id, owner),
+            ).fetchone()
+        return HistoryEntry(*row) if row else None
+
+    def delete(self, entry_id: str, owner: str = "") -> None:
+        with self._connect() as conn:
+            conn.execute("DELETE FROM history WHERE id = ? AND owner = ?", (entry_id, owner))
+
+    def clear(self, owner: str = "") -> None:
+        with self._connect() as conn:
+            conn.execute("DELETE FROM history WHERE owner = ?", (owner,))
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
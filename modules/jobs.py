@@ -0,0 +1,208 @@
+"""Background job queue for long-running generation and publishing work."""
+
+from __future__ import annotations
+
+import threading
+import time
+import uuid
+from collections.abc import Callable
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor
+from dataclasses import dataclass, field, replace
+from typing import Any
+
+from modules.deadline import Deadline, DeadlineExceeded
+
+DEFAULT_JOB_WORKERS = 8
+DEFAULT_FINISHED_JOBS_KEPT = 200
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED_STATES = frozenset({SUCCEEDED, FAILED, CANCELLED})
+
+
+@dataclass(slots=True)
+class Job:
+    """Status of one submitted job; `get()` and `jobs()` return copies."""
+
+    id: str
+    kind: str
+    label: str = ""
+    owner: str = ""
+    state: str = QUEUED
+    progress: float = 0.0
+    message: str = ""
+    result: Any = None
+    error: str = ""
+    created_at: float = field(default_factory=time.time)
+    started_at: float = 0.0
+    finished_at: float = 0.0
+
+    @property
+    def finished(self) -> bool:
+        return self.state in FINISHED_STATES
+
+    @property
+    def seconds(self) -> float:
+        if not self.started_at:
+            return 0.0
+        return round((self.finished_at or time.time()) - self.started_at, 1)
+
+
+class JobContext:
+    """Handed to a running job to report progress and notice cancellation.
+
+    `deadline` is cancelled together with the job, so passing it on to `Utility`
+    calls stops them at their next deadline check.
+    """
+
+    def __init__(self, queue: JobQueue, job_id: str, deadline: Deadline):
+        self._queue = queue
+        self.job_id = job_id
+        self.deadline = deadline
+
+    @property
+    def cancelled(self) -> bool:
+        return self.deadline.cancelled
+
+    def progress(self, fraction: float, message: str = "") -> None:
+        self._queue._update(self.job_id, progress=min(1.0, max(0.0, fraction)), message=message)
+
+    def check(self, action: str = "job") -> None:
+        self.deadline.check(action)
+
+
+class JobQueue:
+    """Run blocking work on a thread pool and track it by job ID.
+
+    `submit()` returns immediately; callers poll `get()` or `jobs(owner)` for state,
+    progress and the result, and `cancel()` stops a queued job or signals a running
+    one through its deadline. Finished jobs are kept until `forget()` or until more
+    than `max_finished` have piled up, oldest first.
+    """
+
+    def __init__(self, max_workers: int = DEFAULT_JOB_WORKERS, max_finished: int = DEFAULT_FINISHED_JOBS_KEPT):
+        self.max_finished = max_finished
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._lock = threading.Lock()
+        self._jobs: dict[str, Job] = {}
+        self._futures: dict[str, Future] = {}
+        self._deadlines: dict[str, Deadline] = {}
+
+    def submit(
+        self,
+        function: Callable[[JobContext], Any],
+        kind: str,
+        label: str = "",
+        owner: str = "",
+        deadline: Deadline | None = None,
+    ) -> str:
+        """Queue `function(context)` and return the new job ID."""
+        job = Job(id=uuid.uuid4().hex, kind=kind, label=label, owner=owner)
+        deadline = deadline or Deadline.never()
+        with self._lock:
+            self._jobs[job.id] = job
+            self._deadlines[job.id] = deadline
+            self._futures[job.id] = self._executor.submit(self._run, job.id, function, JobContext(self, job.id, deadline))
+            self._prune()
+        return job.id
+
+    def get(self, job_id: str) -> Job | None:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return replace(job) if job is not None else None
+
+    def jobs(self, owner: str | None = None) -> list[Job]:
+        """Jobs of one owner (all jobs when `owner` is None), newest first."""
+        with self._lock:
+            selected = [replace(job) for job in self._jobs.values() if owner is None or job.owner == owner]
+        return sorted(selected, key=lambda job: job.created_at, reverse=True)
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancel a job; False when it is unknown or already finished."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.finished:
+                return False
+            self._deadlines[job_id].cancel()
+            if self._futures[job_id].cancel():
+                job.state = CANCELLED
+                job.finished_at = time.time()
+                job.message = "Cancelled before it started."
+            else:
+                job.message = "Cancelling..."
+            return True
+
+    def result(self, job_id: str, timeout: float | None = None) -> Any:
+        """Wait for a job and return its result; raises its error if it failed."""
+        with self._lock:
+            future = self._futures.get(job_id)
+        if future is None:
+            raise ValueError(f"Unknown job: {job_id}")
+        try:
+            return future.result(timeout=timeout)
+        except CancelledError:
+            raise DeadlineExceeded("Job was cancelled.") from None
+
+    def forget(self, job_id: str) -> None:
+        """Drop a finished job; running jobs are cancelled first."""
+        self.cancel(job_id)
+        with self._lock:
+            self._jobs.pop(job_id, None)
+            self._futures.pop(job_id, None)
+            self._deadlines.pop(job_id, None)
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            counts = {state: 0 for state in (QUEUED, RUNNING, SUCCEEDED, FAILED, CANCELLED)}
+            for job in self._jobs.values():
+                counts[job.state] += 1
+        return counts
+
+    def shutdown(self, cancel_running: bool = True) -> None:
+        if cancel_running:
+            with self._lock:
+                job_ids = list(self._jobs)
+            for job_id in job_ids:
+                self.cancel(job_id)
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self, job_id: str, function: Callable[[JobContext], Any], context: JobContext) -> Any:
+        with self._lock:
+            job = self._jobs[job_id]
+            job.state = RUNNING
+            job.started_at = time.time()
+        try:
+            result = function(context)
+        except BaseException as exc:
+            with self._lock:
+                job.state = CANCELLED if context.cancelled else FAILED
+                job.error = "" if context.cancelled else str(exc) or type(exc).__name__
+                job.message = "Cancelled." if context.cancelled else job.message
+                job.finished_at = time.time()
+            raise
+        with self._lock:
+            job.state = SUCCEEDED
+            job.progress = 1.0
+            job.result = result
+            job.finished_at = time.time()
+        return result
+
+    def _update(self, job_id: str, **changes: Any) -> None:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            for name, value in changes.items():
+                setattr(job, name, value)
+
+    def _prune(self) -> None:
+        finished = sorted(
+            (job for job in self._jobs.values() if job.finished), key=lambda job: job.finished_at
+        )
+        for job in finished[: max(0, len(finished) - self.max_finished)]:
+            self._jobs.pop(job.id, None)
+            self._futures.pop(job.id, None)
+            self._deadlines.pop(job.id, None)
@@ -0,0 +1,314 @@
+"""Bulk validation CLI for script directories and catalog snapshots.
+
+Usage:
+    python -m modules.lint PATH [PATH ...] [--format jsonl|sarif] [--workers N] [--output FILE]
+    python -m modules.lint --catalog tree.json [--root CHECKOUT]
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+from collections.abc import Iterator
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from dataclasses import dataclass
+from pathlib import Path
+from typing import IO, Any
+
+from modules.community_search import CommunityProject, build_project_catalog
+from modules.validation import validate_scripts
+from modules.validation_rules import Finding, default_rule_registry
+
+DEFAULT_BATCH_SIZE = 32
+SARIF_SCHEMA = "https://json.schemastore.org/sarif-2.1.0.json"
+_SARIF_LEVELS = {"error": "error", "warning": "warning", "info": "note"}
+_SEVERITY_RANK = {"info": 0, "warning": 1, "error": 2}
+
+
+@dataclass(slots=True)
+class LintUnit:
+    """One detection/remediation pair to validate; paths are relative to `root`."""
+
+    project: str
+    root: str
+    detection_path: str = ""
+    remediation_path: str = ""
+    detection_content: str | None = None
+    remediation_content: str | None = None
+
+
+@dataclass(slots=True)
+class LintResult:
+    project: str
+    detection_path: str
+    remediation_path: str
+    findings: list[Finding]
+    error: str = ""
+
+
+def units_from_directory(root: str | Path) -> list[LintUnit]:
+    """Walk a checkout and pair scripts per top-level folder like the community catalog."""
+    root_path = Path(root)
+    items = []
+    for directory, dirnames, filenames in os.walk(root_path):
+        dirnames[:] = [name for name in dirnames if not name.startswith(".")]
+        for filename in filenames:
+            relative = Path(directory, filename).relative_to(root_path).as_posix()
+            items.append({"path": relative, "type": "blob"})
+    return _pair(build_project_catalog(items), str(root_path), {})
+
+
+def units_from_catalog(snapshot: str | Path, root: str | Path | None = None) -> list[LintUnit]:
+    """Load a GitHub tree snapshot (`{"tree": [...]}` or a list of items).
+
+    Items may carry the script text under `content`; otherwise it is read from `root`,
+    which defaults to the snapshot's directory.
+    """
+    snapshot_path = Path(snapshot)
+    data = json.loads(snapshot_path.read_text(encoding="utf-8"))
+    items = data.get("tree", []) if isinstance(data, dict) else data
+    if not isinstance(items, list):
+        raise ValueError("Catalog snapshot must be a list of tree items or contain a 'tree' list.")
+    contents = {item["path"]: item["content"] for item in items if isinstance(item.get("content"), str)}
+    base = str(root) if root is not None else str(snapshot_path.parent)
+    return _pair(build_project_catalog(items), base, contents)
+
+
+def _pair(projects: list[CommunityProject], root: str, contents: dict[str, str]) -> list[LintUnit]:
+    units: list[LintUnit] = []
+    for project in projects:
+        remediations = list(project.remediation_files)
+        detections = [path for path in project.detection_files if path not in remediations]
+        for detection in detections or [""]:
+            remediation = _matching_remediation(detection, remediations)
+            if remediation:
+                remediations.remove(remediation)
+            if detection or remediation:
+                units.append(_unit(project.name, root, detection, remediation, contents))
+        # Remediation files left over once every detection file has its pair.
+        for remediation in remediations:
+            units.append(_unit(project.name, root, "", remediation, contents))
+    return units
+
+
+def _matching_remediation(detection: str, remediations: list[str]) -> str:
+    """Prefer a remediation file in the same directory as the detection file."""
+    if not remediations:
+        return ""
+    directory = detection.rsplit("/", 1)[0] if detection else ""
+    for remediation in remediations:
+        if remediation.rsplit("/", 1)[0] == directory:
+            return remediation
+    return remediations[0]
+
+
+def _unit(project: str, root: str, detection: str, remediation: str, contents: dict[str, str]) -> LintUnit:
+    return LintUnit(
+        project=project,
+        root=root,
+        detection_path=detection,
+        remediation_path=remediation,
+        detection_content=contents.get(detection),
+        remediation_content=contents.get(remediation),
+    )
+
+
+def lint_batch(units: list[LintUnit]) -> list[LintResult]:
+    """Validate a batch of units; runs inside worker processes."""
+    return [_lint_unit(unit) for unit in units]
+
+
+def _lint_unit(unit: LintUnit) -> LintResult:
+    try:
+        detection = _read(unit.root, unit.detection_path, unit.detection_content)
+        remediation = _read(unit.root, unit.remediation_path, unit.remediation_content)
+    except OSError as exc:
+        return LintResult(unit.project, unit.detection_path, unit.remediation_path, [], error=str(exc))
+
+    if not unit.detection_path:
+        findings = [Finding("DET000", "error", "Project has no detection script.", "detection")]
+        if remediation.strip():
+            findings += default_rule_registry.scan(remediation, "remediation")
+    else:
+        findings = validate_scripts(detection, remediation).findings
+    return LintResult(unit.project, unit.detection_path, unit.remediation_path, findings)
+
+
+def _read(root: str, path: str, content: str | None) -> str:
+    if not path:
+        return ""
+    if content is not None:
+        return content
+    # PowerShell scripts are often saved as UTF-8 with BOM or UTF-16 by Windows editors.
+    raw = Path(root, path).read_bytes()
+    if raw.startswith((b"\xff\xfe", b"\xfe\xff")):
+        return raw.decode("utf-16")
+    return raw.decode("utf-8-sig", errors="replace")
+
+
+def run_lint(units: list[LintUnit], workers: int | None = None, batch_size: int = DEFAULT_BATCH_SIZE) -> Iterator[LintResult]:
+    """Validate units across a process pool, yielding results as batches finish."""
+    batches = [units[index : index + batch_size] for index in range(0, len(units), batch_size)]
+    if workers == 1 or len(batches) <= 1:
+        for batch in batches:
+            yield from lint_batch(batch)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending: set[Future] = {executor.submit(lint_batch, batch) for batch in batches}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield from future.result()
+
+
+class JsonLinesWriter:
+    """One JSON object per unit, written as soon as it is validated."""
+
+    def __init__(self, stream: IO[str]):
+        self.stream = stream
+
+    def write(self, result: LintResult) -> None:
+        record = {
+            "project": result.project,
+            "detection_path": result.detection_path,
+            "remediation_path": result.remediation_path,
+            "findings": [
+                {
+                    "rule_id": finding.rule_id,
+                    "severity": finding.severity,
+                    "message": finding.message,
+                    "target": finding.target,
+                    "line": finding.line,
+                    "column": finding.column,
+                    "match": finding.match,
+                }
+                for finding in result.findings
+            ],
+            "error": result.error,
+        }
+        self.stream.write(json.dumps(record, ensure_ascii=True) + "\n")
+        self.stream.flush()
+
+    def close(self) -> None:
+        pass
+
+
+class SarifWriter:
+    """SARIF 2.1.0 log streamed result by result; the document is closed in `close()`."""
+
+    def __init__(self, stream: IO[str]):
+        self.stream = stream
+        self._first = True
+        driver = {
+            "name": "remediation-creator-lint",
+            "rules": [
+                {
+                    "id": rule.rule_id,
+                    "shortDescription": {"text": rule.message.replace("{match}", "").rstrip(": ")},
+                    "defaultConfiguration": {"level": _SARIF_LEVELS[rule.severity]},
+                }
+                for rule in default_rule_registry.rules
+            ],
+        }
+        header = json.dumps({"tool": {"driver": driver}})[:-1]
+        stream.write(f'{{"$schema": "{SARIF_SCHEMA}", "version": "2.1.0", "runs": [{header}, "results": [\n')
+
+    def write(self, result: LintResult) -> None:
+        for item in _sarif_results(result):
+            self.stream.write(("" if self._first else ",\n") + json.dumps(item))
+            self._first = False
+        self.stream.flush()
+
+    def close(self) -> None:
+        self.stream.write("\n]}]}\n")
+        self.stream.flush()
+
+
+def _sarif_results(result: LintResult) -> Iterator[dict[str, Any]]:
+    if result.error:
+        yield {
+            "ruleId": "IO001",
+            "level": "error",
+            "message": {"text": f"Could not read scripts: {result.error}"},
+            "locations": [_sarif_location(result.detection_path or result.remediation_path)],
+        }
+    for finding in result.findings:
+        path = result.detection_path if finding.target == "detection" else result.remediation_path
+        yield {
+            "ruleId": finding.rule_id,
+            "level": _SARIF_LEVELS[finding.severity],
+            "message": {"text": finding.message},
+            "locations": [_sarif_location(path or result.project, finding.line, finding.column)],
+        }
+
+
+def _sarif_location(uri: str, line: int = 0, column: int = 0) -> dict[str, Any]:
+    physical: dict[str, Any] = {"artifactLocation": {"uri": uri}}
+    if line:
+        physical["region"] = {"startLine": line, "startColumn": column}
+    return {"physicalLocation": physical}
+
+
+def _silence_stdout() -> None:
+    """Point stdout at devnull so the interpreter's final flush does not hit the closed pipe again."""
+    try:
+        fd = sys.stdout.fileno()
+    except (AttributeError, OSError, ValueError):
+        return
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, fd)
+    os.close(devnull)
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m modules.lint", description="Validate remediation scripts in bulk.")
+    parser.add_argument("paths", nargs="*", help="Directories laid out like the community repository.")
+    parser.add_argument("--catalog", help="GitHub tree snapshot (JSON) to validate instead of walking directories.")
+    parser.add_argument("--root", help="Checkout holding the files listed in --catalog.")
+    parser.add_argument("--format", choices=("jsonl", "sarif"), default="jsonl")
+    parser.add_argument("--output", help="Write the report to this file instead of stdout.")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count).")
+    parser.add_argument("--fail-on", choices=("error", "warning", "info", "never"), default="error")
+    args = parser.parse_args(argv)
+
+    if not args.paths and not args.catalog:
+        parser.error("Give at least one directory or --catalog.")
+
+    units: list[LintUnit] = []
+    if args.catalog:
+        units += units_from_catalog(args.catalog, args.root)
+    for path in args.paths:
+        if not Path(path).is_dir():
+            parser.error(f"Not a directory: {path}")
+        units += units_from_directory(path)
+
+    stream = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    worst = -1
+    try:
+        writer = SarifWriter(stream) if args.format == "sarif" else JsonLinesWriter(stream)
+        for result in run_lint(units, workers=args.workers):
+            writer.write(result)
+            if result.error:
+                worst = max(worst, _SEVERITY_RANK["error"])
+            for finding in result.findings:
+                worst = max(worst, _SEVERITY_RANK[finding.severity])
+        writer.close()
+    except BrokenPipeError:
+        # The reader went away (e.g. `| head`); stop without a traceback.
+        _silence_stdout()
+        return 1
+    finally:
+        if stream is not sys.stdout:
+            stream.close()
+
+    print(f"Validated {len(units)} script pairs.", file=sys.stderr)
+    if args.fail_on == "never":
+        return 0
+    return 1 if worst >= _SEVERITY_RANK[args.fail_on] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,135 @@
+"""Linear-time PowerShell comment and string masking for static analysis."""
+
+from __future__ import annotations
+
+import re
+from collections.abc import Iterator
+
+# A single-quoted string; nothing inside it is expanded.
+_SINGLE_QUOTED = re.compile(r"'(?:[^']|'')*(?:'|\Z)")
+_DOUBLE_QUOTED_STOP = re.compile(r'[`"$]')
+# Only the constructs that hide code: comments, strings and backtick escapes.
+_SPAN = re.compile(
+    r"""
+      `(?:\r?\n|.)
+    | <\#.*?(?:\#>|\Z)
+    | \#[^\r\n]*
+    | @"[ \t]*\r?\n.*?(?:\r?\n"@|\Z)
+    | @'[ \t]*\r?\n.*?(?:\r?\n'@|\Z)
+    | '(?:[^']|'')*(?:'|\Z)
+    | "
+    """,
+    re.VERBOSE | re.DOTALL,
+)
+_NOT_NEWLINE = re.compile(r"[^\r\n]")
+_EXPANDABLE_STOP = re.compile(r"[`$]")
+
+
+def iter_spans(script: str, position: int = 0) -> Iterator[tuple[int, int, bool]]:
+    """Yield `(start, end, is_text)` for comments and strings (`is_text`) and backtick escapes.
+
+    Unrelated code is skipped by the regex engine, so this stays fast on long scripts.
+    `position` must be the start of a line with no state carried over from earlier lines
+    (not inside a comment, string or line continuation).
+    """
+    while True:
+        match = _SPAN.search(script, position)
+        if match is None:
+            return
+        start = match.start()
+        if script[start] == '"':
+            end = _double_quoted_end(script, start)
+        else:
+            end = match.end()
+        yield start, end, script[start] != "`"
+        position = end
+
+
+def code_view(script: str) -> str:
+    """Return `script` with comments and strings blanked out (see `blank`), keeping offsets and line breaks."""
+    parts: list[str] = []
+    position = 0
+    for start, end, is_text in iter_spans(script):
+        if not is_text:
+            continue
+        parts.append(script[position:start])
+        parts.append(blank(script[start:end]))
+        position = end
+    parts.append(script[position:])
+    return "".join(parts)
+
+
+def blank(text: str) -> str:
+    """Blank a comment or string with spaces, keeping line breaks.
+
+    The bodies of `$( ... )` subexpressions in double-quoted strings and here-strings
+    run as code, so they stay visible (with their own comments and strings blanked).
+    """
+    if not text.startswith(('"', '@"')):
+        return _NOT_NEWLINE.sub(" ", text)
+    parts: list[str] = []
+    position = 0
+    for body_start, body_end in _subexpressions(text):
+        parts.append(_NOT_NEWLINE.sub(" ", text[position:body_start]))
+        parts.append(code_view(text[body_start:body_end]))
+        position = body_end
+    parts.append(_NOT_NEWLINE.sub(" ", text[position:]))
+    return "".join(parts)
+
+
+def _double_quoted_end(script: str, start: int) -> int:
+    """End offset of the double-quoted string at `start`, honouring escapes and `$( )`."""
+    position = start + 1
+    length = len(script)
+    while position < length:
+        stop = _DOUBLE_QUOTED_STOP.search(script, position)
+        if stop is None:
+            return length
+        char = stop.group()
+        position = stop.end()
+        if char == "`":
+            position += 1
+        elif char == '"':
+            if script.startswith('"', position):
+                position += 1
+                continue
+            return position
+        elif script.startswith("(", position):
+            position = _subexpression_end(script, position + 1)
+    return length
+
+
+def _subexpressions(text: str) -> Iterator[tuple[int, int]]:
+    """Offsets of the top-level `$( ... )` bodies in an expandable string or here-string."""
+    position = 1 if text.startswith('"') else 2
+    while True:
+        stop = _EXPANDABLE_STOP.search(text, position)
+        if stop is None:
+            return
+        position = stop.end()
+        if stop.group() == "`":
+            position += 1
+        elif text.startswith("(", position):
+            end = _subexpression_end(text, position + 1)
+            yield position + 1, end - 1 if text[end - 1] == ")" else end
+            position = end
+
+
+def _subexpression_end(script: str, position: int) -> int:
+    """End offset of a `$( ... )` body starting after its opening parenthesis."""
+    depth = 1
+    length = len(script)
+    while position < length and depth:
+        char = script[position]
+        if char == '"':
+            position = _double_quoted_end(script, position)
+            continue
+        if char == "'":
+            position = _SINGLE_QUOTED.match(script, position).end()
+            continue
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        position += 1
+    return position
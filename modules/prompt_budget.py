@@ -0,0 +1,237 @@
+"""Token budgeting and context compaction for generation prompts."""
+
+from __future__ import annotations
+
+import logging
+import math
+import re
+from collections.abc import Callable
+from dataclasses import dataclass, field
+
+from modules.powershell_lexer import code_view
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INPUT_TOKEN_BUDGET = 6000
+DEFAULT_EXTRA_REQUIREMENTS_TOKENS = 800
+DEFAULT_CONTEXT_WINDOW = 128_000
+MIN_OUTPUT_TOKENS = 256
+
+# Longest prefix wins; values are total context window sizes in tokens.
+MODEL_CONTEXT_WINDOWS: dict[str, int] = {
+    "gpt-5": 400_000,
+    "gpt-4.1": 1_000_000,
+    "gpt-4o": 128_000,
+    "gpt-4-turbo": 128_000,
+    "gpt-4-32k": 32_768,
+    "gpt-4": 8_192,
+    "gpt-35-turbo-16k": 16_384,
+    "gpt-35-turbo": 16_384,
+    "gpt-3.5-turbo": 16_384,
+    "o1": 200_000,
+    "o3": 200_000,
+    "o4": 200_000,
+}
+
+_TOKEN_PIECES = re.compile(r"[A-Za-z]+|\d+|[^\sA-Za-z\d]")
+_LINE_COMMENT = re.compile(r"^\s*#(?!requires\b).*$", re.IGNORECASE)
+_BLOCK_COMMENT = re.compile(r"<#.*?#>", re.DOTALL)
+_OUTPUT_NOISE = re.compile(r"^\s*(Write-(Host|Verbose|Debug|Information|Progress)|Out-Host)\b", re.IGNORECASE)
+_FUNCTION_START = re.compile(r"^(\s*)function\s+([\w-]+)[^{]*\{\s*$", re.IGNORECASE)
+
+
+@dataclass(slots=True)
+class BudgetResult:
+    """A prompt fitted to the budget, with token accounting."""
+
+    prompt: str
+    max_tokens: int
+    original_tokens: int
+    final_tokens: int
+    steps: list[str] = field(default_factory=list)
+
+    @property
+    def tokens_saved(self) -> int:
+        return max(0, self.original_tokens - self.final_tokens)
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimate BPE token count locally.
+
+    Words count as one token per ~6 characters, digits per ~3, and every punctuation mark
+    as one token, which tracks OpenAI tokenizers closely for PowerShell and English text.
+    """
+    total = 0
+    for piece in _TOKEN_PIECES.findall(text):
+        if piece.isalpha():
+            total += math.ceil(len(piece) / 6)
+        elif piece.isdigit():
+            total += math.ceil(len(piece) / 3)
+        else:
+            total += 1
+    return total
+
+
+def context_window(model_name: str) -> int:
+    lower_model = model_name.lower()
+    matches = [prefix for prefix in MODEL_CONTEXT_WINDOWS if lower_model.startswith(prefix)]
+    if not matches:
+        return DEFAULT_CONTEXT_WINDOW
+    return MODEL_CONTEXT_WINDOWS[max(matches, key=len)]
+
+
+def strip_comments(script: str) -> str:
+    without_blocks = _BLOCK_COMMENT.sub("", script)
+    lines = [line for line in without_blocks.splitlines() if not _LINE_COMMENT.match(line)]
+    return "\n".join(line.rstrip() for line in lines if line.strip())
+
+
+def drop_output_noise(script: str) -> str:
+    return "\n".join(line for line in script.splitlines() if not _OUTPUT_NOISE.match(line))
+
+
+def summarize_functions(script: str) -> str:
+    """Replace helper function bodies with a one-line summary, keeping their signatures.
+
+    Braces are counted on `code_view(script)`, so braces in strings, here-strings and
+    comments do not end (or extend) a function body.
+    """
+    lines = script.splitlines()
+    code = code_view(script).splitlines()
+    output: list[str] = []
+    index = 0
+    while index < len(lines):
+        match = _FUNCTION_START.match(code[index])
+        if not match:
+            output.append(lines[index])
+            index += 1
+            continue
+
+        depth = 0
+        end = index
+        for end in range(index, len(lines)):
+            depth += code[end].count("{") - code[end].count("}")
+            if depth <= 0:
+                break
+        body = lines[index + 1 : end]
+        params = [line for line in body if line.strip().lower().startswith("param")]
+        output.append(lines[index])
+        output.extend(params[:1])
+        output.append(f"{match.group(1)}    # ... {len(body)} lines omitted")
+        output.append(f"{match.group(1)}}}")
+        index = end + 1
+    return "\n".join(output)
+
+
+def truncate_middle(text: str, max_tokens: int) -> str:
+    """Keep the head and tail of `text` so it fits roughly within `max_tokens`.
+
+    Whole lines are kept where possible; text with too few lines for that (one long
+    paragraph, say) is cut by characters instead.
+    """
+    total = estimate_tokens(text)
+    if total <= max_tokens:
+        return text
+    lines = text.splitlines()
+    head: list[str] = []
+    tail: list[str] = []
+    used = 0
+    for front, back in zip(lines, reversed(lines)):
+        cost = estimate_tokens(front) + estimate_tokens(back) + 2
+        if used + cost > max_tokens or len(head) + len(tail) + 2 > len(lines):
+            break
+        head.append(front)
+        tail.insert(0, back)
+        used += cost
+    if not head:
+        return _truncate_characters(text, max_tokens, total)
+    omitted = len(lines) - len(head) - len(tail)
+    return "\n".join(head + [f"# ... {omitted} lines omitted"] + tail)
+
+
+def _truncate_characters(text: str, max_tokens: int, total: int) -> str:
+    keep = int(len(text) * max_tokens / total)
+    while True:
+        # The marker costs a few tokens of its own, so shrink until the result fits.
+        keep = max(0, keep - 16)
+        head, tail = text[: keep // 2], text[len(text) - keep // 2 :]
+        result = f"{head} ... [{len(text) - len(head) - len(tail)} characters omitted] ... {tail}"
+        if estimate_tokens(result) <= max_tokens or not keep:
+            return result.strip()
+
+
+_COMPACTION_STEPS: tuple[tuple[str, Callable[[str], str]], ...] = (
+    ("strip comments", strip_comments),
+    ("drop Write-Host output", drop_output_noise),
+    ("summarize helper functions", summarize_functions),
+)
+
+
+def fit_prompt(
+    build: Callable[[str, str], str],
+    context: str,
+    extra_requirements: str,
+    system: str,
+    model_name: str,
+    max_tokens: int,
+    input_budget: int = DEFAULT_INPUT_TOKEN_BUDGET,
+    extra_requirements_budget: int = DEFAULT_EXTRA_REQUIREMENTS_TOKENS,
+) -> BudgetResult:
+    """Build a prompt via `build(context, extra_requirements)` that fits the token budget.
+
+    The context (the detection script for remediation prompts) is compacted step by step
+    until system + user prompt fit `input_budget`. `max_tokens` is then lowered if input
+    plus output would exceed the model's context window.
+    """
+    steps: list[str] = []
+    original_prompt = build(context, extra_requirements)
+    system_tokens = estimate_tokens(system)
+    original_tokens = system_tokens + estimate_tokens(original_prompt)
+
+    extra_tokens = estimate_tokens(extra_requirements)
+    if extra_tokens > extra_requirements_budget:
+        extra_requirements = truncate_middle(extra_requirements, extra_requirements_budget)
+        steps.append("truncate extra requirements")
+        logger.warning(
+            "Extra requirements cut from ~%d to ~%d tokens to fit the prompt budget.",
+            extra_tokens,
+            estimate_tokens(extra_requirements),
+        )
+
+    prompt = build(context, extra_requirements)
+    total = system_tokens + estimate_tokens(prompt)
+    for name, step in _COMPACTION_STEPS:
+        if total <= input_budget or not context:
+            break
+        compacted = step(context)
+        if compacted == context:
+            continue
+        context = compacted
+        steps.append(name)
+        prompt = build(context, extra_requirements)
+        total = system_tokens + estimate_tokens(prompt)
+
+    if total > input_budget and context:
+        overflow = total - input_budget
+        context = truncate_middle(context, max(estimate_tokens(context) - overflow, 200))
+        steps.append("truncate context")
+        prompt = build(context, extra_requirements)
+        total = system_tokens + estimate_tokens(prompt)
+
+    window = context_window(model_name)
+    available = window - total
+    if available < MIN_OUTPUT_TOKENS:
+        raise ValueError(
+            f"Prompt needs ~{total} tokens and leaves no room for output in the {window}-token context window."
+        )
+    if max_tokens > available:
+        max_tokens = available
+        steps.append("lower max tokens")
+
+    return BudgetResult(
+        prompt=prompt,
+        max_tokens=max_tokens,
+        original_tokens=original_tokens,
+        final_tokens=total,
+        steps=steps,
+    )
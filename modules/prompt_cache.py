@@ -0,0 +1,63 @@
+"""Provider prompt-prefix cache accounting."""
+
+from __future__ import annotations
+
+import threading
+from typing import Any
+
+
+class PromptCacheStats:
+    """Aggregate cached-input-token counts and latency across LLM calls.
+
+    Providers report cached prompt tokens in the usage block (`cached_tokens`). A call is a
+    cache hit when any input tokens were served from the provider's prefix cache. The
+    latency saving is estimated as the difference between the average miss and hit
+    latency, multiplied by the number of hits.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.calls = 0
+            self.hits = 0
+            self.input_tokens = 0
+            self.cached_tokens = 0
+            self.hit_latency_total = 0.0
+            self.miss_latency_total = 0.0
+
+    def record(self, input_tokens: int, cached_tokens: int, latency_seconds: float) -> None:
+        with self._lock:
+            self.calls += 1
+            self.input_tokens += input_tokens
+            self.cached_tokens += cached_tokens
+            if cached_tokens > 0:
+                self.hits += 1
+                self.hit_latency_total += latency_seconds
+            else:
+                self.miss_latency_total += latency_seconds
+
+    def report(self) -> dict[str, Any]:
+        """Return hit rate, cached-token share and estimated latency saved."""
+        with self._lock:
+            misses = self.calls - self.hits
+            avg_hit = self.hit_latency_total / self.hits if self.hits else 0.0
+            avg_miss = self.miss_latency_total / misses if misses else 0.0
+            saved = max(0.0, avg_miss - avg_hit) * self.hits if self.hits and misses else 0.0
+            return {
+                "calls": self.calls,
+                "cache_hits": self.hits,
+                "hit_rate": round(self.hits / self.calls, 4) if self.calls else 0.0,
+                "input_tokens": self.input_tokens,
+                "cached_tokens": self.cached_tokens,
+                "cached_token_share": round(self.cached_tokens / self.input_tokens, 4) if self.input_tokens else 0.0,
+                "avg_hit_latency_ms": round(avg_hit * 1000, 1),
+                "avg_miss_latency_ms": round(avg_miss * 1000, 1),
+                "estimated_latency_saved_ms": round(saved * 1000, 1),
+            }
+
+
+# Process-wide accumulator used when a Utility is not given its own instance.
+default_prompt_cache_stats = PromptCacheStats()
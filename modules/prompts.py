@@ -22,6 +22,28 @@ Rules:
 """.strip()
 
 
+# Static user-prompt prefixes. They must stay byte-identical between calls and come before
+# any request-specific text so providers can reuse the cached prompt prefix.
+DETECTION_REQUEST_PREFIX = """
+Create a Microsoft Intune Endpoint Analytics detection script for Windows devices.
+
+Output constraints:
+- Output must be valid PowerShell only
+- No markdown, no explanation text
+- Include clear status output
+""".strip()
+
+
+REMEDIATION_REQUEST_PREFIX = """
+Create a Microsoft Intune Endpoint Analytics remediation script for Windows devices.
+
+Output constraints:
+- Output must be valid PowerShell only
+- No markdown, no explanation text
+- Include robust error handling and status output
+""".strip()
+
+
 SCENARIO_TEMPLATES = [
     {
         "name": "BitLocker Compliance",
@@ -0,0 +1,355 @@
+"""Incremental sync of published script run states from Graph into SQLite."""
+
+from __future__ import annotations
+
+import json
+import sqlite3
+import time
+from collections.abc import Callable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+from urllib.parse import quote
+
+from modules.deadline import Deadline, DeadlineExceeded, request_timeout
+from modules.graph_auth import GraphAuth, auth_headers, graph_session
+
+if TYPE_CHECKING:
+    import requests
+
+DEFAULT_RUN_STATE_PATH = ".cache/run_states.sqlite"
+DEFAULT_SYNC_CONCURRENCY = 4
+DEFAULT_PAGE_SIZE = 1000
+DEFAULT_PAGE_TIMEOUT_SECONDS = 60
+MAX_PAGE_ATTEMPTS = 5
+_STATE_SELECT = (
+    "id,detectionState,remediationState,lastStateUpdateDateTime,lastSyncDateTime,"
+    "preRemediationDetectionScriptError,remediationScriptError,postRemediationDetectionScriptError"
+)
+_SUMMARY_FIELDS = (
+    "noIssueDetectedDeviceCount",
+    "issueDetectedDeviceCount",
+    "detectionScriptErrorDeviceCount",
+    "detectionScriptPendingDeviceCount",
+    "issueRemediatedDeviceCount",
+    "remediationSkippedDeviceCount",
+    "issueReoccurredDeviceCount",
+    "remediationScriptErrorDeviceCount",
+    "lastScriptRunDateTime",
+)
+
+
+@dataclass(slots=True)
+class SyncResult:
+    """Outcome of syncing one script."""
+
+    script_id: str
+    rows: int = 0
+    pages: int = 0
+    incremental: bool = False
+    seconds: float = 0.0
+    error: str = ""
+
+    @property
+    def ok(self) -> bool:
+        return not self.error
+
+
+class RunStateStore:
+    """Device run states and run summaries per script, persisted in SQLite.
+
+    Rows are upserted page by page; a state only overwrites a stored one when its
+    `lastStateUpdateDateTime` is not older, so replayed pages are harmless. Graph varies
+    the number of fractional digits, so timestamps are parsed and stored in one fixed-width
+    UTC form (see `normalize_timestamp`) before they are compared.
+    """
+
+    def __init__(self, path: str | Path = DEFAULT_RUN_STATE_PATH):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS run_states (
+                    script_id TEXT NOT NULL,
+                    device_id TEXT NOT NULL,
+                    device_name TEXT NOT NULL,
+                    detection_state TEXT NOT NULL,
+                    remediation_state TEXT NOT NULL,
+                    last_state_update TEXT NOT NULL,
+                    last_sync TEXT NOT NULL,
+                    error TEXT NOT NULL,
+                    PRIMARY KEY (script_id, device_id)
+                ) WITHOUT ROWID;
+                CREATE TABLE IF NOT EXISTS run_summaries (
+                    script_id TEXT PRIMARY KEY,
+                    summary TEXT NOT NULL,
+                    fetched REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS sync_state (
+                    script_id TEXT PRIMARY KEY,
+                    watermark TEXT NOT NULL,
+                    synced REAL NOT NULL
+                );
+                """
+            )
+
+    def write_states(self, script_id: str, items: list[dict[str, Any]]) -> str:
+        """Upsert one page of `deviceRunStates`; return the newest `lastStateUpdateDateTime` in it (normalized)."""
+        rows = [_state_row(script_id, item) for item in items]
+        with self._connect() as conn:
+            conn.executemany(
+                """
+                INSERT INTO run_states VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (script_id, device_id) DO UPDATE SET
+                    device_name = CASE WHEN excluded.device_name != '' THEN excluded.device_name ELSE device_name END,
+                    detection_state = excluded.detection_state,
+                    remediation_state = excluded.remediation_state,
+                    last_state_update = excluded.last_state_update,
+                    last_sync = excluded.last_sync,
+                    error = excluded.error
+                WHERE excluded.last_state_update >= run_states.last_state_update
+                """,
+                rows,
+            )
+        return max((row[5] for row in rows), default="")
+
+    def write_summary(self, script_id: str, summary: dict[str, Any]) -> None:
+        record = {name: summary.get(name) for name in _SUMMARY_FIELDS}
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO run_summaries VALUES (?, ?, ?)",
+                (script_id, json.dumps(record), time.time()),
+            )
+
+    def watermark(self, script_id: str) -> str:
+        with self._connect() as conn:
+            row = conn.execute("SELECT watermark FROM sync_state WHERE script_id = ?", (script_id,)).fetchone()
+        return row[0] if row else ""
+
+    def set_watermark(self, script_id: str, watermark: str) -> None:
+        """Advance the watermark of `script_id`; an older `watermark` leaves it unchanged."""
+        watermark = normalize_timestamp(watermark)
+        with self._connect() as conn:
+            row = conn.execute("SELECT watermark FROM sync_state WHERE script_id = ?", (script_id,)).fetchone()
+            if row is not None:
+                # Stored by an older version, possibly with a different number of digits.
+                watermark = max(watermark, normalize_timestamp(row[0]))
+            conn.execute("INSERT OR REPLACE INTO sync_state VALUES (?, ?, ?)", (script_id, watermark, time.time()))
+
+    def summary(self, script_id: str) -> dict[str, Any]:
+        """Graph's run summary plus device counts per detection/remediation state from the store."""
+        with self._connect() as conn:
+            row = conn.execute("SELECT summary FROM run_summaries WHERE script_id = ?", (script_id,)).fetchone()
+            detection = conn.execute(
+                "SELECT detection_state, count(*) FROM run_states WHERE script_id = ? GROUP BY 1",
+                (script_id,),
+            ).fetchall()
+            remediation = conn.execute(
+                "SELECT remediation_state, count(*) FROM run_states WHERE script_id = ? GROUP BY 1",
+                (script_id,),
+            ).fetchall()
+        return {
+            "graph": json.loads(row[0]) if row else {},
+            "devices": sum(count for _, count in detection),
+            "detection_states": dict(detection),
+            "remediation_states": dict(remediation),
+        }
+
+    def states(
+        self,
+        script_id: str,
+        detection_state: str | None = None,
+        limit: int = 100,
+        offset: int = 0,
+    ) -> list[dict[str, str]]:
+        """One page of stored device states, most recently updated first."""
+        query = "SELECT * FROM run_states WHERE script_id = ?"
+        params: list[Any] = [script_id]
+        if detection_state:
+            query += " AND detection_state = ?"
+            params.append(detection_state)
+        query += " ORDER BY last_state_update DESC LIMIT ? OFFSET ?"
+        params += [limit, offset]
+        with self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            return [dict(row) for row in conn.execute(query, params)]
+
+    def clear(self, script_id: str | None = None) -> None:
+        with self._connect() as conn:
+            for table in ("run_states", "run_summaries", "sync_state"):
+                if script_id is None:
+                    conn.execute(f"DELETE FROM {table}")
+                else:
+                    conn.execute(f"DELETE FROM {table} WHERE script_id = ?", (script_id,))
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+
+class RunStateSync:
+    """Page `deviceRunStates` and `runSummary` for many scripts into a `RunStateStore`.
+
+    Scripts sync concurrently; within a script, pages are followed through
+    `@odata.nextLink` and written as they arrive, so memory holds at most one page per
+    worker. After the first sync, only states updated since the stored watermark are
+    requested. If Graph rejects that filter, the full list is paged instead and unchanged
+    rows are left alone by the store.
+    """
+
+    def __init__(
+        self,
+        auth: GraphAuth,
+        store: RunStateStore,
+        base_url: str,
+        endpoint: str = "deviceManagement/deviceHealthScripts",
+        concurrency: int = DEFAULT_SYNC_CONCURRENCY,
+        page_size: int = DEFAULT_PAGE_SIZE,
+        session: requests.Session | None = None,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        if concurrency < 1:
+            raise ValueError("Sync concurrency must be at least 1.")
+        self.auth = auth
+        self.store = store
+        self.root = base_url.rstrip("/") + "/" + endpoint.strip("/")
+        self.concurrency = concurrency
+        self.page_size = page_size
+        self.session = session or graph_session()
+        self._sleep = sleep
+
+    def sync(self, script_ids: list[str], full: bool = False, deadline: Deadline | None = None) -> list[SyncResult]:
+        """Sync every script; `full` ignores the watermarks and re-reads all states."""
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="run-state-sync") as executor:
+            return list(executor.map(lambda script_id: self._sync_script(script_id, full, deadline), script_ids))
+
+    def _sync_script(self, script_id: str, full: bool, deadline: Deadline | None) -> SyncResult:
+        import requests
+
+        result = SyncResult(script_id)
+        started = time.perf_counter()
+        try:
+            summary = self._get(f"{self.root}/{script_id}/runSummary", deadline)
+            self.store.write_summary(script_id, summary)
+
+            watermark = "" if full else self.store.watermark(script_id)
+            result.incremental = bool(watermark)
+            newest = self._page_states(script_id, watermark, result, deadline)
+            if newest:
+                self.store.set_watermark(script_id, newest)
+        except (requests.RequestException, RuntimeError, DeadlineExceeded, ValueError) as exc:
+            result.error = str(exc)
+        result.seconds = round(time.perf_counter() - started, 3)
+        return result
+
+    def _page_states(self, script_id: str, watermark: str, result: SyncResult, deadline: Deadline | None) -> str:
+        url: str | None = self._states_url(script_id, watermark)
+        newest = ""
+        while url:
+            try:
+                page = self._get(url, deadline)
+            except _FilterRejected:
+                # Filtering on lastStateUpdateDateTime is not supported here; re-read everything.
+                result.incremental = False
+                url = self._states_url(script_id, "")
+                continue
+            items = page.get("value", [])
+            newest = max(newest, self.store.write_states(script_id, items))
+            result.rows += len(items)
+            result.pages += 1
+            url = page.get("@odata.nextLink")
+        return newest
+
+    def _states_url(self, script_id: str, watermark: str) -> str:
+        url = (
+            f"{self.root}/{script_id}/deviceRunStates?$select={_STATE_SELECT}"
+            f"&$expand=managedDevice($select=id,deviceName)&$top={self.page_size}"
+        )
+        if watermark:
+            url += "&$filter=" + quote(f"lastStateUpdateDateTime ge {watermark}")
+        return url
+
+    def _get(self, url: str, deadline: Deadline | None) -> dict[str, Any]:
+        for attempt in range(1, MAX_PAGE_ATTEMPTS + 1):
+            response = self.session.get(
+                url,
+                headers=auth_headers(self.auth),
+                timeout=request_timeout(deadline, DEFAULT_PAGE_TIMEOUT_SECONDS, "Graph run state sync"),
+            )
+            if response.status_code == 400 and "$filter=" in url:
+                raise _FilterRejected(response.text[:500])
+            if response.status_code in {429, 500, 502, 503, 504} and attempt < MAX_PAGE_ATTEMPTS:
+                delay = _retry_after(response) or min(2.0**attempt, 30.0)
+                remaining = None if deadline is None else deadline.remaining()
+                if remaining is not None and delay >= remaining:
+                    raise DeadlineExceeded("Deadline exceeded while waiting to retry a run state page.")
+                self._sleep(delay)
+                continue
+            if response.status_code >= 400:
+                raise RuntimeError(f"Graph run state sync failed ({response.status_code}): {response.text[:500]}")
+            return response.json()
+        raise RuntimeError("Graph run state sync gave up after repeated throttling.")
+
+
+class _FilterRejected(Exception):
+    pass
+
+
+def normalize_timestamp(value: str) -> str:
+    """An ISO 8601 timestamp as UTC with exactly six fractional digits, so strings sort by time.
+
+    Values that do not parse are returned unchanged.
+    """
+    if not value:
+        return ""
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        return value
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    try:
+        parsed = parsed.astimezone(timezone.utc)
+    except OverflowError:
+        return value
+    # `%Y` does not zero-pad years before 1000 on every platform; Graph uses year 1 for "never".
+    return f"{parsed.year:04d}-" + parsed.strftime("%m-%dT%H:%M:%S.%fZ")
+
+
+def _state_row(script_id: str, item: dict[str, Any]) -> tuple[str, ...]:
+    device = item.get("managedDevice") or {}
+    # State IDs have the form "<script id>:<device id>".
+    device_id = str(device.get("id") or str(item.get("id", "")).rsplit(":", 1)[-1])
+    errors = [
+        item.get("preRemediationDetectionScriptError"),
+        item.get("remediationScriptError"),
+        item.get("postRemediationDetectionScriptError"),
+    ]
+    return (
+        script_id,
+        device_id,
+        str(device.get("deviceName") or ""),
+        str(item.get("detectionState") or "unknown"),
+        str(item.get("remediationState") or "unknown"),
+        normalize_timestamp(str(item.get("lastStateUpdateDateTime") or "")),
+        str(item.get("lastSyncDateTime") or ""),
+        "\n".join(str(error) for error in errors if error)[:2000],
+    )
+
+
+def _retry_after(response: Any) -> float | None:
+    value = response.headers.get("Retry-After")
+    try:
+        return max(0.0, float(value)) if value else None
+    except ValueError:
+        return None
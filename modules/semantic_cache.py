@@ -0,0 +1,307 @@
+"""Semantic near-duplicate cache for generated script artifacts."""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import math
+import re
+import sqlite3
+import threading
+import time
+from array import array
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass
+from operator import mul
+from pathlib import Path
+from typing import Any, Protocol
+
+from modules.utility import ScriptArtifact
+
+DEFAULT_CACHE_PATH = ".cache/semantic_cache.sqlite"
+DEFAULT_SIMILARITY_THRESHOLD = 0.95
+DEFAULT_MAX_ENTRIES = 2000
+
+# Common Intune/Windows aliases so paraphrases land near each other with the offline embedder.
+_ALIASES: dict[str, str] = {
+    "w32time": "windows time service",
+    "ntp": "windows time service",
+    "bitlocker": "bitlocker drive encryption",
+    "defender": "microsoft defender antivirus",
+    "wu": "windows update",
+    "wuauserv": "windows update service",
+    "gpo": "group policy",
+    "admins": "local administrators",
+    "admin": "local administrators",
+    "c:": "system drive",
+    "temp": "temporary files",
+}
+_STOPWORDS = {
+    "a", "an", "and", "the", "is", "are", "if", "it", "its", "of", "on", "or", "to", "by",
+    "for", "in", "be", "with", "that", "this", "check", "detect", "whether", "make", "sure",
+}
+_TOKEN_PATTERN = re.compile(r"[a-z0-9:]+")
+# Words that flip what a script must check. Requests only match when these agree, however
+# similar the rest is: "BitLocker enabled" and "BitLocker disabled" embed close together.
+_CONDITION_TERMS: dict[str, str] = {
+    **dict.fromkeys(
+        ("enabled", "enable", "on", "active", "running", "started", "start", "installed", "present",
+         "exists", "exist", "allowed", "allow", "true", "compliant", "set", "configured", "above", "more"),
+        "+",
+    ),
+    **dict.fromkeys(
+        ("disabled", "disable", "off", "inactive", "stopped", "stop", "uninstalled", "missing", "absent",
+         "removed", "blocked", "block", "denied", "deny", "false", "noncompliant", "unset", "below", "less"),
+        "-",
+    ),
+    **dict.fromkeys(("not", "no", "never", "without", "none", "cannot", "isn", "aren", "doesn", "don", "won"), "!"),
+}
+
+
+class Embedder(Protocol):
+    """Turns texts into fixed-size vectors; `identity` changes when vectors are not comparable."""
+
+    identity: str
+
+    def embed(self, texts: list[str]) -> list[list[float]]: ...
+
+
+class HashingEmbedder:
+    """Offline embedder using hashed word and character n-gram features."""
+
+    def __init__(self, dimensions: int = 512):
+        self.dimensions = dimensions
+        self.identity = f"hashing-v1-{dimensions}"
+
+    def embed(self, texts: list[str]) -> list[list[float]]:
+        return [self._embed_one(text) for text in texts]
+
+    def _embed_one(self, text: str) -> list[float]:
+        vector = [0.0] * self.dimensions
+        words = _expand_aliases(_TOKEN_PATTERN.findall(text.lower()))
+        for word in words:
+            self._add(vector, "w:" + word, 1.0)
+            padded = f"#{word}#"
+            for index in range(len(padded) - 2):
+                self._add(vector, "c:" + padded[index : index + 3], 0.3)
+        for first, second in zip(words, words[1:]):
+            self._add(vector, f"b:{first} {second}", 0.5)
+        return _normalize(vector)
+
+    def _add(self, vector: list[float], feature: str, weight: float) -> None:
+        digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+        bucket = int.from_bytes(digest[:4], "little") % self.dimensions
+        sign = 1.0 if digest[4] & 1 else -1.0
+        vector[bucket] += sign * weight
+
+
+class OpenAIEmbedder:
+    """Embedder backed by an OpenAI/Azure OpenAI embeddings deployment."""
+
+    def __init__(self, client: Any, model_name: str = "text-embedding-3-small"):
+        self.client = client
+        self.model_name = model_name
+        self.identity = f"openai-{model_name}"
+
+    def embed(self, texts: list[str]) -> list[list[float]]:
+        response = self.client.embeddings.create(model=self.model_name, input=texts)
+        return [_normalize(list(item.embedding)) for item in response.data]
+
+
+@dataclass(slots=True)
+class SemanticCacheHit:
+    """A cached artifact whose request is similar to the current one.
+
+    `exact` is False for a near-duplicate: the cached scripts were generated for other
+    wording, so callers should show `cached_description` rather than substitute silently.
+    """
+
+    artifact: ScriptArtifact
+    similarity: float
+    cached_description: str
+    exact: bool = False
+
+
+class SemanticCache:
+    """Local vector index over previously generated artifacts, persisted in SQLite.
+
+    A cached request matches when its similarity reaches `threshold` and it agrees with
+    the new one on condition words (enabled/disabled, running/stopped, negations) and
+    numbers; see `condition_terms`.
+    """
+
+    def __init__(
+        self,
+        path: str | Path = DEFAULT_CACHE_PATH,
+        embedder: Embedder | None = None,
+        threshold: float = DEFAULT_SIMILARITY_THRESHOLD,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+    ):
+        self.path = Path(path)
+        self.embedder = embedder or HashingEmbedder()
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._index: list[tuple[str, str, frozenset[str], array]] | None = None
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS semantic_cache (
+                    key TEXT PRIMARY KEY,
+                    embedder TEXT NOT NULL,
+                    mode TEXT NOT NULL,
+                    request_text TEXT NOT NULL,
+                    vector BLOB NOT NULL,
+                    artifact TEXT NOT NULL,
+                    created REAL NOT NULL
+                )
+                """
+            )
+
+    def lookup(self, description: str, extra_requirements: str, mode: str) -> SemanticCacheHit | None:
+        """Return the most similar cached artifact above the threshold, if any."""
+        request_text = normalize_request(description, extra_requirements)
+        if not request_text:
+            return None
+        query = self.embedder.embed([request_text])[0]
+        terms = condition_terms(request_text)
+
+        best_key = ""
+        best_score = -1.0
+        for key, entry_mode, entry_terms, vector in self._load_index():
+            if entry_mode != mode or entry_terms != terms:
+                continue
+            score = sum(map(mul, query, vector))
+            if score > best_score:
+                best_key, best_score = key, score
+
+        if not best_key or best_score < self.threshold:
+            return None
+
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT request_text, artifact FROM semantic_cache WHERE key = ?",
+                (best_key,),
+            ).fetchone()
+        if row is None:
+            return None
+        return SemanticCacheHit(
+            artifact=ScriptArtifact(**json.loads(row[1])),
+            similarity=round(best_score, 4),
+            cached_description=row[0],
+            exact=row[0] == request_text,
+        )
+
+    def store(self, artifact: ScriptArtifact, extra_requirements: str = "") -> None:
+        """Index an artifact under its normalized request text."""
+        request_text = normalize_request(artifact.description, extra_requirements)
+        if not request_text or not artifact.detection_script:
+            return
+        vector = array("f", self.embedder.embed([request_text])[0])
+        key = hashlib.sha256(
+            f"{self.embedder.identity}\n{artifact.mode}\n{request_text}".encode("utf-8")
+        ).hexdigest()
+        record = {
+            "description": artifact.description,
+            "mode": artifact.mode,
+            "detection_script": artifact.detection_script,
+            "remediation_script": artifact.remediation_script,
+            "created_at": artifact.created_at,
+            "fingerprint": artifact.fingerprint,
+            "score": artifact.score,
+        }
+
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO semantic_cache VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    key,
+                    self.embedder.identity,
+                    artifact.mode,
+                    request_text,
+                    vector.tobytes(),
+                    json.dumps(record),
+                    time.time(),
+                ),
+            )
+            conn.execute(
+                """
+                DELETE FROM semantic_cache WHERE key IN (
+                    SELECT key FROM semantic_cache ORDER BY created DESC LIMIT -1 OFFSET ?
+                )
+                """,
+                (self.max_entries,),
+            )
+        with self._lock:
+            self._index = None
+
+    def clear(self) -> None:
+        with self._connect() as conn:
+            conn.execute("DELETE FROM semantic_cache")
+        with self._lock:
+            self._index = None
+
+    def _load_index(self) -> list[tuple[str, str, frozenset[str], array]]:
+        with self._lock:
+            if self._index is None:
+                with self._connect() as conn:
+                    rows = conn.execute(
+                        "SELECT key, mode, request_text, vector FROM semantic_cache WHERE embedder = ?",
+                        (self.embedder.identity,),
+                    ).fetchall()
+                index = []
+                for key, mode, request_text, blob in rows:
+                    vector = array("f")
+                    vector.frombytes(blob)
+                    index.append((key, mode, condition_terms(request_text), vector))
+                self._index = index
+            return self._index
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+
+def normalize_request(description: str, extra_requirements: str = "") -> str:
+    """Lower-case and collapse whitespace so trivial edits map to the same text."""
+    parts = [" ".join(description.lower().split()), " ".join(extra_requirements.lower().split())]
+    return "\n".join(part for part in parts if part)
+
+
+def condition_terms(request_text: str) -> frozenset[str]:
+    """Polarity words (as `+`, `-` or `!`) and numbers; requests only match when these are equal."""
+    terms = set()
+    for word in _TOKEN_PATTERN.findall(request_text.lower()):
+        if word.isdigit():
+            terms.add(word)
+        elif word in _CONDITION_TERMS:
+            terms.add(_CONDITION_TERMS[word])
+    return frozenset(terms)
+
+
+def _expand_aliases(words: list[str]) -> list[str]:
+    expanded: list[str] = []
+    for word in words:
+        if word in _STOPWORDS:
+            continue
+        alias = _ALIASES.get(word)
+        if alias:
+            expanded.extend(alias.split())
+        else:
+            expanded.append(word)
+    return expanded
+
+
+def _normalize(vector: list[float]) -> list[float]:
+    norm = math.sqrt(sum(value * value for value in vector))
+    if norm == 0:
+        return vector
+    return [value / norm for value in vector]
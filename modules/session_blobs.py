@@ -0,0 +1,211 @@
+"""Compressed, content-addressed storage for large session-state text."""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from pathlib import Path
+
+DEFAULT_MEMORY_LIMIT_BYTES = 64 * 1024 * 1024
+DEFAULT_SESSION_LIMIT_BYTES = 512 * 1024
+DEFAULT_SPILL_DIR = ".cache/session_blobs"
+DEFAULT_SPILL_MAX_AGE_SECONDS = 7 * 24 * 3600
+DEFAULT_COMPRESSION_LEVEL = 6
+
+
+class BlobStore:
+    """Text blobs shared by every session, zlib-compressed and keyed by their SHA-256.
+
+    Identical text (the same community README opened by many users) is kept once.
+    Compressed blobs live in memory up to `memory_limit_bytes`; beyond that the least
+    recently used ones are spilled to `spill_dir` and read back on demand. Spilled files
+    older than `spill_max_age_seconds` are removed when the store is created.
+    """
+
+    def __init__(
+        self,
+        memory_limit_bytes: int = DEFAULT_MEMORY_LIMIT_BYTES,
+        spill_dir: str | Path = DEFAULT_SPILL_DIR,
+        compression_level: int = DEFAULT_COMPRESSION_LEVEL,
+        spill_max_age_seconds: float = DEFAULT_SPILL_MAX_AGE_SECONDS,
+    ):
+        self.memory_limit_bytes = memory_limit_bytes
+        self.spill_dir = Path(spill_dir)
+        self.compression_level = compression_level
+        self._lock = threading.Lock()
+        self._memory: OrderedDict[str, bytes] = OrderedDict()
+        self._memory_bytes = 0
+        # Evicted blobs until their spill file is written, so readers never miss them.
+        self._pending: dict[str, bytes] = {}
+        self._counters = {"puts": 0, "deduplicated": 0, "raw_bytes": 0, "spilled": 0, "disk_reads": 0}
+        self._prune_spilled(spill_max_age_seconds)
+
+    def put(self, text: str) -> str:
+        """Store `text` and return its key."""
+        raw = text.encode("utf-8")
+        key = hashlib.sha256(raw).hexdigest()
+        with self._lock:
+            self._counters["puts"] += 1
+            if self._stored(key):
+                self._counters["deduplicated"] += 1
+                return key
+        data = zlib.compress(raw, self.compression_level)
+        with self._lock:
+            # Another thread may have stored the same text while this one compressed it.
+            if self._stored(key):
+                self._counters["deduplicated"] += 1
+                return key
+            self._counters["raw_bytes"] += len(raw)
+            evicted = self._remember(key, data)
+        self._write(evicted)
+        return key
+
+    def get(self, key: str) -> str:
+        """Text for `key`; raises KeyError when it was never stored or has been pruned."""
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+            else:
+                data = self._pending.get(key)
+        if data is None:
+            path = self._path(key)
+            try:
+                data = path.read_bytes()
+            except FileNotFoundError:
+                raise KeyError(key) from None
+            os.utime(path)
+            with self._lock:
+                self._counters["disk_reads"] += 1
+                evicted = self._remember(key, data)
+            self._write(evicted)
+        return zlib.decompress(data).decode("utf-8")
+
+    def size(self, key: str) -> int:
+        """Compressed size of `key` in memory or on disk; 0 when it is not stored."""
+        with self._lock:
+            data = self._memory.get(key) or self._pending.get(key)
+        if data is not None:
+            return len(data)
+        try:
+            return self._path(key).stat().st_size
+        except FileNotFoundError:
+            return 0
+
+    def spill(self, keys: list[str]) -> None:
+        """Move blobs from memory to disk, e.g. when a session is over its own limit."""
+        with self._lock:
+            evicted = [(key, self._memory.pop(key)) for key in keys if key in self._memory]
+            self._memory_bytes -= sum(len(data) for _, data in evicted)
+            self._pending.update(evicted)
+        self._write(evicted)
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {**self._counters, "blobs_in_memory": len(self._memory), "memory_bytes": self._memory_bytes}
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+        for path in self.spill_dir.glob("*/*.z"):
+            path.unlink(missing_ok=True)
+
+    def _stored(self, key: str) -> bool:
+        """Whether `key` is in memory, being spilled or on disk; call with the lock held."""
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return True
+        return key in self._pending or self._path(key).exists()
+
+    def _remember(self, key: str, data: bytes) -> list[tuple[str, bytes]]:
+        """Add to the in-memory LRU and return what it pushed out; call with the lock held."""
+        if key not in self._memory:
+            self._memory_bytes += len(data)
+        self._memory[key] = data
+        self._memory.move_to_end(key)
+        evicted = []
+        while self._memory_bytes > self.memory_limit_bytes and len(self._memory) > 1:
+            old_key, old_data = self._memory.popitem(last=False)
+            self._memory_bytes -= len(old_data)
+            evicted.append((old_key, old_data))
+        self._pending.update(evicted)
+        return evicted
+
+    def _write(self, blobs: list[tuple[str, bytes]]) -> None:
+        for key, data in blobs:
+            path = self._path(key)
+            if not path.exists():
+                path.parent.mkdir(parents=True, exist_ok=True)
+                temporary = path.with_name(f"{path.name}.{threading.get_ident()}.tmp")
+                temporary.write_bytes(data)
+                temporary.replace(path)
+                with self._lock:
+                    self._counters["spilled"] += 1
+            with self._lock:
+                self._pending.pop(key, None)
+
+    def _path(self, key: str) -> Path:
+        return self.spill_dir / key[:2] / f"{key}.z"
+
+    def _prune_spilled(self, max_age_seconds: float) -> None:
+        cutoff = time.time() - max_age_seconds
+        for path in self.spill_dir.glob("*/*.z"):
+            try:
+                if path.stat().st_mtime < cutoff:
+                    path.unlink()
+            except OSError:
+                continue
+
+
+class SessionBlobs:
+    """One session's handle on a shared `BlobStore`, with its own memory limit.
+
+    Session state keeps only the keys returned by `put()`. When the compressed blobs this
+    session touched exceed `limit_bytes`, its least recently used ones are spilled to disk.
+    Blobs count at their compressed size even when the shared store has already spilled
+    them, so the limit holds however full the store is.
+    """
+
+    def __init__(self, store: BlobStore, limit_bytes: int = DEFAULT_SESSION_LIMIT_BYTES):
+        self.store = store
+        self.limit_bytes = limit_bytes
+        self._recent: OrderedDict[str, int] = OrderedDict()
+        self._bytes = 0
+
+    def put(self, text: str) -> str:
+        key = self.store.put(text)
+        self._touch(key)
+        return key
+
+    def get(self, key: str, default: str = "") -> str:
+        """Text for `key`, or `default` for an empty or unknown key."""
+        if not key:
+            return default
+        try:
+            text = self.store.get(key)
+        except KeyError:
+            return default
+        self._touch(key)
+        return text
+
+    @property
+    def memory_bytes(self) -> int:
+        return self._bytes
+
+    def _touch(self, key: str) -> None:
+        self._bytes -= self._recent.pop(key, 0)
+        size = self.store.size(key)
+        self._recent[key] = size
+        self._bytes += size
+        spilled = []
+        while self._bytes > self.limit_bytes and len(self._recent) > 1:
+            old_key, old_size = self._recent.popitem(last=False)
+            self._bytes -= old_size
+            spilled.append(old_key)
+        if spilled:
+            self.store.spill(spilled)
@@ -0,0 +1,368 @@
+"""Pluggable cache backends shared by threads, sessions and, on disk or SQLite, replicas."""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sqlite3
+import struct
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from pathlib import Path
+from typing import IO, Any
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+CACHE_BACKENDS = ("memory", "disk", "sqlite")
+DEFAULT_CACHE_BACKEND = "memory"
+DEFAULT_DISK_CACHE_DIR = ".cache/shared"
+DEFAULT_SQLITE_CACHE_PATH = ".cache/shared_cache.sqlite"
+DEFAULT_MEMORY_CACHE_BYTES = 64 * 1024 * 1024
+DEFAULT_FILL_WAIT_SECONDS = 30.0
+_LOCK_FILE_MAX_AGE_SECONDS = 24 * 3600
+_EXPIRES = struct.Struct("<d")
+
+
+def cache_key(*parts: Any) -> str:
+    """Stable key from JSON-serialisable parts, e.g. `cache_key("catalog", owner, repo, ref)`."""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, separators=(",", ":")).encode("utf-8")).hexdigest()
+
+
+class CacheBackend:
+    """Bytes under string keys, each with its own TTL; subclasses store them.
+
+    `get_or_fill()` computes a missing value once: concurrent callers for the same key
+    wait for the first one instead of all calling upstream. Backends with a `lock_dir`
+    also serialise fills across processes with file locks, so replicas sharing the
+    directory or database fetch each value once between them. A caller that waited
+    longer than `wait` seconds computes the value itself.
+    """
+
+    name = ""
+
+    def __init__(self, lock_dir: str | Path | None = None):
+        self.lock_dir = Path(lock_dir) if lock_dir is not None else None
+        self._fill_guard = threading.Lock()
+        # Per-key fill locks with the number of threads using them, dropped when unused.
+        self._fill_locks: dict[str, list[Any]] = {}
+        self._counter_lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "sets": 0, "fills": 0, "filled_by_others": 0}
+
+    def get(self, key: str) -> bytes | None:
+        value = self._get(key, time.time())
+        self._count("hits" if value is not None else "misses")
+        return value
+
+    def set(self, key: str, value: bytes, ttl_seconds: float) -> None:
+        self._set(key, value, time.time() + ttl_seconds)
+        self._count("sets")
+
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        raise NotImplementedError
+
+    def get_json(self, key: str) -> Any:
+        """Decoded value, or None when missing or expired."""
+        data = self.get(key)
+        return None if data is None else json.loads(zlib.decompress(data))
+
+    def set_json(self, key: str, value: Any, ttl_seconds: float) -> None:
+        self.set(key, zlib.compress(json.dumps(value).encode("utf-8")), ttl_seconds)
+
+    def get_or_fill(
+        self,
+        key: str,
+        compute: Callable[[], Any],
+        ttl_seconds: float,
+        wait: float = DEFAULT_FILL_WAIT_SECONDS,
+    ) -> Any:
+        """JSON value for `key`, computed by `compute()` and stored when missing.
+
+        Exceptions from `compute` propagate and nothing is stored, so failures are not
+        cached; neither is a None result.
+        """
+        value = self.get_json(key)
+        if value is not None:
+            return value
+        with self._fill_lock(key, wait):
+            data = self._get(key, time.time())
+            if data is not None:
+                self._count("filled_by_others")
+                return json.loads(zlib.decompress(data))
+            value = compute()
+            self._count("fills")
+            if value is not None:
+                self.set_json(key, value, ttl_seconds)
+            return value
+
+    def stats(self) -> dict[str, int]:
+        with self._counter_lock:
+            return dict(self._counters)
+
+    def _get(self, key: str, now: float) -> bytes | None:
+        raise NotImplementedError
+
+    def _set(self, key: str, value: bytes, expires: float) -> None:
+        raise NotImplementedError
+
+    def _count(self, name: str) -> None:
+        with self._counter_lock:
+            self._counters[name] += 1
+
+    @contextmanager
+    def _fill_lock(self, key: str, wait: float) -> Iterator[None]:
+        with self._fill_guard:
+            entry = self._fill_locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        started = time.monotonic()
+        locked = entry[0].acquire(timeout=max(0.0, wait))
+        try:
+            if self.lock_dir is None:
+                yield
+                return
+            remaining = max(0.0, wait - (time.monotonic() - started))
+            digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+            with _file_lock(self.lock_dir / f"{digest}.lock", remaining):
+                yield
+        finally:
+            if locked:
+                entry[0].release()
+            with self._fill_guard:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._fill_locks[key]
+
+    def _prune_lock_files(self) -> None:
+        """Remove lock files unused for a day; they are touched whenever a fill takes them."""
+        if self.lock_dir is None:
+            return
+        cutoff = time.time() - _LOCK_FILE_MAX_AGE_SECONDS
+        for path in self.lock_dir.glob("*.lock"):
+            try:
+                if path.stat().st_mtime < cutoff:
+                    path.unlink()
+            except OSError:
+                continue
+
+
+class MemoryCache(CacheBackend):
+    """Per-process LRU of up to `max_bytes`; nothing is shared between replicas."""
+
+    name = "memory"
+
+    def __init__(self, max_bytes: int = DEFAULT_MEMORY_CACHE_BYTES):
+        super().__init__()
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[str, tuple[float, bytes]] = OrderedDict()
+        self._bytes = 0
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._bytes -= len(entry[1])
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {**super().stats(), "entries": len(self._entries), "bytes": self._bytes}
+
+    def _get(self, key: str, now: float) -> bytes | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= now:
+                del self._entries[key]
+                self._bytes -= len(entry[1])
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def _set(self, key: str, value: bytes, expires: float) -> None:
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old[1])
+            self._entries[key] = (expires, value)
+            self._bytes += len(value)
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+
+
+class DiskCache(CacheBackend):
+    """One file per key under `directory`, written atomically; expired files are pruned on start.
+
+    Replicas on one host, or on a shared volume with working `flock`, can share it.
+    """
+
+    name = "disk"
+
+    def __init__(self, directory: str | Path = DEFAULT_DISK_CACHE_DIR):
+        self.directory = Path(directory)
+        super().__init__(lock_dir=self.directory / ".locks")
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._prune()
+        self._prune_lock_files()
+
+    def delete(self, key: str) -> None:
+        self._path(key).unlink(missing_ok=True)
+
+    def clear(self) -> None:
+        for path in self.directory.glob("*/*.c"):
+            path.unlink(missing_ok=True)
+
+    def _get(self, key: str, now: float) -> bytes | None:
+        path = self._path(key)
+        try:
+            data = path.read_bytes()
+        except FileNotFoundError:
+            return None
+        (expires,) = _EXPIRES.unpack_from(data)
+        if expires <= now:
+            path.unlink(missing_ok=True)
+            return None
+        return data[_EXPIRES.size :]
+
+    def _set(self, key: str, value: bytes, expires: float) -> None:
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temporary = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        temporary.write_bytes(_EXPIRES.pack(expires) + value)
+        temporary.replace(path)
+
+    def _path(self, key: str) -> Path:
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        return self.directory / digest[:2] / f"{digest}.c"
+
+    def _prune(self) -> None:
+        now = time.time()
+        for path in self.directory.glob("*/*.c"):
+            try:
+                with path.open("rb") as handle:
+                    (expires,) = _EXPIRES.unpack(handle.read(_EXPIRES.size))
+                if expires <= now:
+                    path.unlink()
+            except (OSError, struct.error):
+                continue
+
+
+class SqliteCache(CacheBackend):
+    """Entries in one SQLite database in WAL mode, for replicas on one host or volume.
+
+    SQLite locking is unreliable on network file systems such as NFS or SMB; use a
+    local volume shared by the replicas' containers.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str | Path = DEFAULT_SQLITE_CACHE_PATH):
+        self.path = Path(path)
+        super().__init__(lock_dir=self.path.with_name(self.path.name + ".locks"))
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires)")
+            conn.execute("DELETE FROM cache WHERE expires <= ?", (time.time(),))
+        self._prune_lock_files()
+
+    def delete(self, key: str) -> None:
+        with self._connect() as conn:
+            conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def clear(self) -> None:
+        with self._connect() as conn:
+            conn.execute("DELETE FROM cache")
+
+    def _get(self, key: str, now: float) -> bytes | None:
+        with self._connect() as conn:
+            row = conn.execute("SELECT value FROM cache WHERE key = ? AND expires > ?", (key, now)).fetchone()
+        return bytes(row[0]) if row else None
+
+    def _set(self, key: str, value: bytes, expires: float) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires) VALUES (?, ?, ?)",
+                (key, sqlite3.Binary(value), expires),
+            )
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+
+def create_cache(backend: str = DEFAULT_CACHE_BACKEND, path: str = "", memory_bytes: int = DEFAULT_MEMORY_CACHE_BYTES) -> CacheBackend:
+    """Backend by name; `path` is the directory (disk) or database file (sqlite)."""
+    backend = backend.lower().strip()
+    if backend == "memory":
+        return MemoryCache(memory_bytes)
+    if backend == "disk":
+        return DiskCache(path or DEFAULT_DISK_CACHE_DIR)
+    if backend == "sqlite":
+        return SqliteCache(path or DEFAULT_SQLITE_CACHE_PATH)
+    raise ValueError(f"Unknown cache backend '{backend}'. Use one of: {', '.join(CACHE_BACKENDS)}.")
+
+
+@contextmanager
+def _file_lock(path: Path, wait: float) -> Iterator[bool]:
+    """Hold an exclusive lock on `path` for up to `wait` seconds of trying; yields whether it got it."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("a+b") as handle:
+        os.utime(path)
+        deadline = time.monotonic() + wait
+        while True:
+            try:
+                _lock(handle)
+                locked = True
+                break
+            except OSError:
+                if time.monotonic() >= deadline:
+                    locked = False
+                    break
+                time.sleep(0.05)
+        try:
+            yield locked
+        finally:
+            if locked:
+                _unlock(handle)
+
+
+def _lock(handle: IO[bytes]) -> None:
+    if fcntl is not None:
+        fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    else:
+        handle.seek(0)
+        msvcrt.locking(handle.fileno(), msvcrt.LK_NBLCK, 1)
+
+
+def _unlock(handle: IO[bytes]) -> None:
+    if fcntl is not None:
+        fcntl.flock(handle, fcntl.LOCK_UN)
+    else:
+        handle.seek(0)
+        msvcrt.locking(handle.fileno(), msvcrt.LK_UNLCK, 1)
@@ -0,0 +1,179 @@
+"""Local stand-ins for OpenAI, Microsoft Graph and GitHub, for load-testing the headless API.
+
+Usage:
+    python -m modules.stand_ins [--port PORT] [--llm-latency SECONDS] [--projects N]
+
+Then point the API at it, e.g. with `OPENAI_BASE_URL=http://127.0.0.1:PORT/v1`,
+`GRAPH_BASE_URL=http://127.0.0.1:PORT/beta/` and `GITHUB_API_BASE=http://127.0.0.1:PORT`.
+Responses are canned; nothing is stored.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+from urllib.parse import urlsplit
+
+DEFAULT_STAND_IN_PORT = 8765
+DEFAULT_PROJECTS = 200
+CANNED_SCRIPT = """try {
+    $value = Get-ItemProperty -Path 'HKLM:\\SOFTWARE\\Contoso' -Name 'Enabled' -ErrorAction Stop
+    if ($value.Enabled -eq 1) { Write-Output 'Compliant'; exit 0 }
+    Write-Output 'Not compliant'; exit 1
+} catch {
+    Write-Output "Check failed: $_"; exit 1
+}"""
+
+_RUN_STATES = [
+    {
+        "id": f"script:device-{index}",
+        "detectionState": state,
+        "remediationState": "success" if state == "fail" else "skipped",
+        "lastStateUpdateDateTime": "2026-01-01T00:00:00.5Z",
+        "managedDevice": {"id": f"device-{index}", "deviceName": f"PC-{index:03d}"},
+    }
+    for index, state in enumerate(("success", "fail"))
+]
+
+
+class StandInServer(ThreadingHTTPServer):
+    """Answers the few upstream calls the API makes, after `llm_latency` seconds for LLM calls."""
+
+    daemon_threads = True
+    request_queue_size = 256
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, llm_latency: float = 0.0, projects: int = DEFAULT_PROJECTS):
+        super().__init__((host, port), _StandInHandler)
+        self.llm_latency = llm_latency
+        self.tree = [
+            {"path": f"Project {index:04d} - Setting {index}/{name}", "type": "blob"}
+            for index in range(projects)
+            for name in ("Detect.ps1", "Remediate.ps1", "README.md")
+        ]
+        self._lock = threading.Lock()
+        self.counts = {"llm": 0, "graph_batch": 0, "graph_list": 0, "graph_run_states": 0, "github": 0}
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, name: str) -> None:
+        with self._lock:
+            self.counts[name] += 1
+
+
+class _StandInHandler(BaseHTTPRequestHandler):
+    server: StandInServer
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format: str, *args: Any) -> None:
+        return
+
+    def do_GET(self) -> None:
+        path = urlsplit(self.path).path
+        if "/git/trees/" in path:
+            self.server.count("github")
+            return self._send(200, {"sha": "stand-in", "tree": self.server.tree, "truncated": False})
+        if "/contents/" in path:
+            self.server.count("github")
+            return self._send(200, CANNED_SCRIPT.encode("utf-8"), "text/plain")
+        if path.endswith("/runSummary"):
+            self.server.count("graph_run_states")
+            return self._send(200, {"issueDetectedDeviceCount": 1, "noIssueDetectedDeviceCount": 1})
+        if path.endswith("/deviceRunStates"):
+            self.server.count("graph_run_states")
+            return self._send(200, {"value": _RUN_STATES})
+        if path.rstrip("/").endswith("deviceHealthScripts"):
+            self.server.count("graph_list")
+            return self._send(200, {"value": []})
+        self._send(404, {"error": {"message": f"Stand-in has no route for {path}"}})
+
+    def do_POST(self) -> None:
+        path = urlsplit(self.path).path
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", "0"))) or b"{}")
+        if path.endswith("/chat/completions") or path.endswith("/responses"):
+            self.server.count("llm")
+            time.sleep(self.server.llm_latency)
+            return self._send(200, _llm_response(path, body))
+        if path.endswith("/$batch"):
+            self.server.count("graph_batch")
+            return self._send(200, {"responses": [_batch_response(item) for item in body.get("requests", [])]})
+        self._send(404, {"error": {"message": f"Stand-in has no route for {path}"}})
+
+    def _send(self, status: int, body: dict[str, Any] | bytes, content_type: str = "application/json") -> None:
+        data = body if isinstance(body, bytes) else json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def _llm_response(path: str, body: dict[str, Any]) -> dict[str, Any]:
+    usage = {"input_tokens": 400, "output_tokens": 120, "total_tokens": 520}
+    if path.endswith("/responses"):
+        return {
+            "id": f"resp_{uuid.uuid4().hex}",
+            "object": "response",
+            "created_at": int(time.time()),
+            "model": body.get("model", ""),
+            "status": "completed",
+            "output": [
+                {
+                    "id": f"msg_{uuid.uuid4().hex}",
+                    "type": "message",
+                    "role": "assistant",
+                    "status": "completed",
+                    "content": [{"type": "output_text", "text": CANNED_SCRIPT, "annotations": []}],
+                }
+            ],
+            "usage": usage,
+        }
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", ""),
+        "choices": [
+            {"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": CANNED_SCRIPT}}
+        ],
+        "usage": {"prompt_tokens": 400, "completion_tokens": 120, "total_tokens": 520},
+    }
+
+
+def _batch_response(item: dict[str, Any]) -> dict[str, Any]:
+    if item.get("method") == "POST":
+        created = {"id": str(uuid.uuid4()), "lastModifiedDateTime": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())}
+        return {"id": item.get("id"), "status": 201, "body": {**(item.get("body") or {}), **created}}
+    if item.get("method") == "PATCH":
+        return {"id": item.get("id"), "status": 204, "body": None}
+    return {"id": item.get("id"), "status": 404, "body": {"error": {"message": "Stand-in stores nothing."}}}
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m modules.stand_ins", description="Serve upstream stand-ins.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_STAND_IN_PORT)
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="Seconds each LLM call takes.")
+    parser.add_argument("--projects", type=int, default=DEFAULT_PROJECTS, help="Projects in the fake catalog.")
+    args = parser.parse_args(argv)
+    server = StandInServer(args.host, args.port, args.llm_latency, args.projects)
+    print(f"Stand-ins on {server.url}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,152 @@
+"""Opt-in import-time profiling for cold start and lazily loaded dependencies."""
+
+from __future__ import annotations
+
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any
+
+PROFILE_ENV_VAR = "STARTUP_PROFILE"
+
+
+@dataclass(slots=True)
+class ImportRecord:
+    """One module import; `self_ms` excludes the modules it imported in turn."""
+
+    module: str
+    self_ms: float
+    cumulative_ms: float
+    phase: str
+
+
+class _TimedLoader:
+    """Delegating loader that times `exec_module`, the part of an import that runs code."""
+
+    def __init__(self, loader: Any, profiler: ImportProfiler):
+        self._loader = loader
+        self._profiler = profiler
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._loader, name)
+
+    def create_module(self, spec: Any) -> Any:
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module: Any) -> None:
+        stack = self._profiler._stack()
+        stack.append(0.0)
+        started = time.perf_counter()
+        try:
+            self._loader.exec_module(module)
+        finally:
+            cumulative = (time.perf_counter() - started) * 1000
+            children = stack.pop()
+            if stack:
+                stack[-1] += cumulative
+            self._profiler._record(module.__name__, cumulative - children, cumulative)
+
+
+class ImportProfiler:
+    """Meta path hook recording how long each newly imported module takes to load.
+
+    Imports before `mark_first_paint()` count as the `startup` phase; later ones, such as
+    the OpenAI SDK on the first generation, as `runtime`. Loaded modules are unaffected.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._records: list[ImportRecord] = []
+        self.phase = "startup"
+        self.enabled_at = time.perf_counter()
+        self.first_paint_ms = 0.0
+
+    def find_spec(self, fullname: str, path: Any = None, target: Any = None) -> Any:
+        if getattr(self._local, "finding", False):
+            return None
+        self._local.finding = True
+        try:
+            for finder in sys.meta_path:
+                if finder is self or not hasattr(finder, "find_spec"):
+                    continue
+                spec = finder.find_spec(fullname, path, target)
+                if spec is not None:
+                    break
+            else:
+                return None
+        finally:
+            self._local.finding = False
+        if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+            spec.loader = _TimedLoader(spec.loader, self)
+        return spec
+
+    def mark_first_paint(self) -> None:
+        """Close the startup phase once the first page has been rendered."""
+        with self._lock:
+            if self.phase == "startup":
+                self.phase = "runtime"
+                self.first_paint_ms = (time.perf_counter() - self.enabled_at) * 1000
+
+    def records(self, phase: str | None = None) -> list[ImportRecord]:
+        with self._lock:
+            return [record for record in self._records if phase is None or record.phase == phase]
+
+    def report(self, limit: int = 25) -> list[dict[str, Any]]:
+        """Costliest top-level packages per phase, summing the own time of their modules."""
+        totals: dict[tuple[str, str], list[float]] = {}
+        for record in self.records():
+            total = totals.setdefault((record.phase, record.module.split(".", 1)[0]), [0.0, 0])
+            total[0] += record.self_ms
+            total[1] += 1
+        rows = [
+            {"phase": phase, "package": package, "import_ms": round(import_ms, 1), "modules": int(count)}
+            for (phase, package), (import_ms, count) in totals.items()
+        ]
+        return sorted(rows, key=lambda row: row["import_ms"], reverse=True)[:limit]
+
+    def summary(self) -> dict[str, float]:
+        startup = self.records("startup")
+        runtime = self.records("runtime")
+        return {
+            "startup_import_ms": round(sum(record.self_ms for record in startup), 1),
+            "startup_modules": len(startup),
+            "first_paint_ms": round(self.first_paint_ms, 1),
+            "runtime_import_ms": round(sum(record.self_ms for record in runtime), 1),
+            "runtime_modules": len(runtime),
+        }
+
+    def format_report(self, limit: int = 25) -> str:
+        lines = [" ".join(f"{name}={value}" for name, value in self.summary().items())]
+        lines += [
+            f"{row['phase']:8} {row['import_ms']:9.1f} ms {row['modules']:5} modules  {row['package']}"
+            for row in self.report(limit)
+        ]
+        return "\n".join(lines)
+
+    def _stack(self) -> list[float]:
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _record(self, module: str, self_ms: float, cumulative_ms: float) -> None:
+        with self._lock:
+            self._records.append(ImportRecord(module, round(self_ms, 3), round(cumulative_ms, 3), self.phase))
+
+
+_profiler: ImportProfiler | None = None
+
+
+def enable_import_profiling() -> ImportProfiler:
+    """Install the process-wide profiler once; later calls return the same one."""
+    global _profiler
+    if _profiler is None:
+        _profiler = ImportProfiler()
+        sys.meta_path.insert(0, _profiler)
+    return _profiler
+
+
+def active_profiler() -> ImportProfiler | None:
+    return _profiler
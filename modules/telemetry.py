@@ -0,0 +1,222 @@
+"""In-process telemetry for LLM calls with JSON and Prometheus export."""
+
+from __future__ import annotations
+
+import json
+import logging
+import threading
+import time
+from collections import deque
+from dataclasses import asdict, dataclass, field
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS_SECONDS = (0.5, 1.0, 2.0, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+DEFAULT_RECENT_CALLS = 500
+_METRIC_PREFIX = "remediation_creator_llm"
+
+
+@dataclass(slots=True)
+class CallRecord:
+    """One LLM request attempt as seen by the service facade."""
+
+    provider: str
+    model: str
+    api_path: str
+    latency_seconds: float
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cached_tokens: int = 0
+    fallback_attempts: int = 0
+    error: str = ""
+    timestamp: float = field(default_factory=time.time)
+
+    @property
+    def outcome(self) -> str:
+        return "error" if self.error else "ok"
+
+
+@dataclass(slots=True)
+class _Aggregate:
+    calls: int = 0
+    errors: int = 0
+    fallback_attempts: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cached_tokens: int = 0
+    latency_total: float = 0.0
+    latency_max: float = 0.0
+    bucket_counts: list[int] = field(default_factory=lambda: [0] * len(LATENCY_BUCKETS_SECONDS))
+
+
+class TelemetryRecorder:
+    """Thread-safe aggregation of `CallRecord`s keyed by provider, model, API path and outcome."""
+
+    def __init__(self, recent_calls: int = DEFAULT_RECENT_CALLS):
+        self._lock = threading.Lock()
+        self._recent: deque[CallRecord] = deque(maxlen=recent_calls)
+        self._aggregates: dict[tuple[str, str, str, str], _Aggregate] = {}
+        self._prompt_budget = {"prompts": 0, "compacted": 0, "tokens_before": 0, "tokens_after": 0}
+
+    def record(self, record: CallRecord) -> None:
+        if record.error:
+            logger.warning(
+                "LLM call failed (%s %s via %s, %.2fs): %s",
+                record.provider,
+                record.model,
+                record.api_path,
+                record.latency_seconds,
+                record.error,
+            )
+        key = (record.provider, record.model, record.api_path, record.outcome)
+        with self._lock:
+            self._recent.append(record)
+            aggregate = self._aggregates.setdefault(key, _Aggregate())
+            aggregate.calls += 1
+            aggregate.errors += 1 if record.error else 0
+            aggregate.fallback_attempts += record.fallback_attempts
+            aggregate.input_tokens += record.input_tokens
+            aggregate.output_tokens += record.output_tokens
+            aggregate.cached_tokens += record.cached_tokens
+            aggregate.latency_total += record.latency_seconds
+            aggregate.latency_max = max(aggregate.latency_max, record.latency_seconds)
+            for index, bound in enumerate(LATENCY_BUCKETS_SECONDS):
+                if record.latency_seconds <= bound:
+                    aggregate.bucket_counts[index] += 1
+
+    def record_prompt_budget(self, original_tokens: int, final_tokens: int) -> None:
+        """Track estimated prompt tokens before and after budget compaction."""
+        with self._lock:
+            self._prompt_budget["prompts"] += 1
+            self._prompt_budget["compacted"] += 1 if final_tokens < original_tokens else 0
+            self._prompt_budget["tokens_before"] += original_tokens
+            self._prompt_budget["tokens_after"] += final_tokens
+
+    def reset(self) -> None:
+        with self._lock:
+            self._recent.clear()
+            self._aggregates.clear()
+            for key in self._prompt_budget:
+                self._prompt_budget[key] = 0
+
+    def recent(self, limit: int = 50) -> list[CallRecord]:
+        with self._lock:
+            return list(self._recent)[-limit:]
+
+    def summary(self) -> list[dict[str, Any]]:
+        """Return one row per provider/model/API path/outcome."""
+        with self._lock:
+            items = sorted(self._aggregates.items())
+            rows = []
+            for (provider, model, api_path, outcome), aggregate in items:
+                rows.append(
+                    {
+                        "provider": provider,
+                        "model": model,
+                        "api_path": api_path,
+                        "outcome": outcome,
+                        "calls": aggregate.calls,
+                        "fallback_attempts": aggregate.fallback_attempts,
+                        "input_tokens": aggregate.input_tokens,
+                        "output_tokens": aggregate.output_tokens,
+                        "cached_tokens": aggregate.cached_tokens,
+                        "avg_latency_ms": round(aggregate.latency_total / aggregate.calls * 1000, 1),
+                        "max_latency_ms": round(aggregate.latency_max * 1000, 1),
+                    }
+                )
+            return rows
+
+    def totals(self) -> dict[str, Any]:
+        rows = self.summary()
+        with self._lock:
+            budget = dict(self._prompt_budget)
+        calls = sum(row["calls"] for row in rows)
+        latency = sum(row["avg_latency_ms"] * row["calls"] for row in rows)
+        return {
+            "calls": calls,
+            "errors": sum(row["calls"] for row in rows if row["outcome"] == "error"),
+            "fallback_attempts": sum(row["fallback_attempts"] for row in rows),
+            "input_tokens": sum(row["input_tokens"] for row in rows),
+            "output_tokens": sum(row["output_tokens"] for row in rows),
+            "cached_tokens": sum(row["cached_tokens"] for row in rows),
+            "avg_latency_ms": round(latency / calls, 1) if calls else 0.0,
+            "prompts_compacted": budget["compacted"],
+            "prompt_tokens_saved": budget["tokens_before"] - budget["tokens_after"],
+        }
+
+    def to_json(self, recent: int = 50) -> str:
+        return json.dumps(
+            {
+                "totals": self.totals(),
+                "by_target": self.summary(),
+                "recent_calls": [asdict(record) for record in self.recent(recent)],
+            },
+            indent=2,
+        )
+
+    def to_prometheus(self) -> str:
+        """Render aggregates in the Prometheus text exposition format."""
+        with self._lock:
+            items = sorted(self._aggregates.items())
+            lines = [
+                f"# HELP {_METRIC_PREFIX}_calls_total LLM call attempts.",
+                f"# TYPE {_METRIC_PREFIX}_calls_total counter",
+            ]
+            for key, aggregate in items:
+                lines.append(f"{_METRIC_PREFIX}_calls_total{{{_labels(key)}}} {aggregate.calls}")
+
+            lines += [
+                f"# HELP {_METRIC_PREFIX}_fallback_attempts_total Parameter or API-path fallbacks before the final attempt.",
+                f"# TYPE {_METRIC_PREFIX}_fallback_attempts_total counter",
+            ]
+            for key, aggregate in items:
+                lines.append(f"{_METRIC_PREFIX}_fallback_attempts_total{{{_labels(key)}}} {aggregate.fallback_attempts}")
+
+            lines += [
+                f"# HELP {_METRIC_PREFIX}_tokens_total Tokens reported by the provider.",
+                f"# TYPE {_METRIC_PREFIX}_tokens_total counter",
+            ]
+            for key, aggregate in items:
+                for kind, value in (
+                    ("input", aggregate.input_tokens),
+                    ("output", aggregate.output_tokens),
+                    ("cached_input", aggregate.cached_tokens),
+                ):
+                    lines.append(f'{_METRIC_PREFIX}_tokens_total{{{_labels(key)},kind="{kind}"}} {value}')
+
+            lines += [
+                f"# HELP {_METRIC_PREFIX}_latency_seconds LLM call latency.",
+                f"# TYPE {_METRIC_PREFIX}_latency_seconds histogram",
+            ]
+            for key, aggregate in items:
+                labels = _labels(key)
+                for bound, count in zip(LATENCY_BUCKETS_SECONDS, aggregate.bucket_counts):
+                    lines.append(f'{_METRIC_PREFIX}_latency_seconds_bucket{{{labels},le="{bound}"}} {count}')
+                lines.append(f'{_METRIC_PREFIX}_latency_seconds_bucket{{{labels},le="+Inf"}} {aggregate.calls}')
+                lines.append(f"{_METRIC_PREFIX}_latency_seconds_sum{{{labels}}} {aggregate.latency_total:.6f}")
+                lines.append(f"{_METRIC_PREFIX}_latency_seconds_count{{{labels}}} {aggregate.calls}")
+
+            lines += [
+                f"# HELP {_METRIC_PREFIX}_prompt_tokens_estimated_total Estimated prompt tokens before/after budgeting.",
+                f"# TYPE {_METRIC_PREFIX}_prompt_tokens_estimated_total counter",
+                f'{_METRIC_PREFIX}_prompt_tokens_estimated_total{{stage="original"}} {self._prompt_budget["tokens_before"]}',
+                f'{_METRIC_PREFIX}_prompt_tokens_estimated_total{{stage="final"}} {self._prompt_budget["tokens_after"]}',
+                f"# HELP {_METRIC_PREFIX}_prompts_compacted_total Prompts shortened to fit the token budget.",
+                f"# TYPE {_METRIC_PREFIX}_prompts_compacted_total counter",
+                f"{_METRIC_PREFIX}_prompts_compacted_total {self._prompt_budget['compacted']}",
+            ]
+        return "\n".join(lines) + "\n"
+
+
+def _labels(key: tuple[str, str, str, str]) -> str:
+    names = ("provider", "model", "api_path", "outcome")
+    return ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, key))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# Process-wide recorder used when a Utility is not given its own instance.
+default_telemetry = TelemetryRecorder()
@@ -5,31 +5,40 @@ from __future__ import annotations
 import base64
 import hashlib
 import json
-import re
-from dataclasses import dataclass
+import time
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
 from datetime import datetime, timezone
 from typing import Any
 
-import requests
-from openai import AzureOpenAI, OpenAI
-
-from modules.prompts import DETECTION_SCRIPT_PROMPT, REMEDIATION_SCRIPT_PROMPT
+from modules.client_registry import ClientRegistry, default_client_registry
+from modules.deadline import Deadline, DeadlineExceeded, request_timeout
+from modules.deployment_pool import Deployment, DeploymentPool
+from modules.graph_auth import GraphAuth, GraphTokenProvider, auth_headers
+from modules.graph_batch import DEFAULT_BATCH_CONCURRENCY, GraphBatchPublisher, PublishResult
+from modules.graph_inventory import GraphInventory, upsert
+from modules.hedging import RequestHedger
+from modules.prompt_budget import DEFAULT_INPUT_TOKEN_BUDGET, BudgetResult, fit_prompt
+from modules.prompt_cache import PromptCacheStats, default_prompt_cache_stats
+from modules.prompts import (
+    DETECTION_REQUEST_PREFIX,
+    DETECTION_SCRIPT_PROMPT,
+    REMEDIATION_REQUEST_PREFIX,
+    REMEDIATION_SCRIPT_PROMPT,
+)
+from modules.run_states import DEFAULT_SYNC_CONCURRENCY, RunStateStore, RunStateSync, SyncResult
+from modules.shared_cache import CacheBackend, cache_key
+from modules.telemetry import CallRecord, TelemetryRecorder, default_telemetry
+from modules.validation import ValidationReport, validate_scripts
+from modules.validation_rules import RuleRegistry, ValidationSession, default_rule_registry
 
 GRAPH_BASE_URL = "https://graph.microsoft.com/beta/"
 DEFAULT_TIMEOUT_SECONDS = 45
-
-_DETECTION_MUTATION_MARKERS = (
-    r"\bSet-",
-    r"\bNew-",
-    r"\bRemove-",
-    r"\bRename-",
-    r"\bStart-",
-    r"\bStop-",
-    r"\bRestart-",
-    r"\bInvoke-",
-    r"\breg\s+add\b",
-    r"\bsc\s+config\b",
-)
+MAX_CANDIDATES = 5
+DEFAULT_GENERATION_DEADLINE_SECONDS = 180
+# LLM responses are cached only when a TTL is configured; otherwise every generate call asks the model.
+DEFAULT_RESPONSE_CACHE_TTL_SECONDS = 0
 
 
 @dataclass(slots=True)
@@ -42,23 +51,62 @@ class ScriptArtifact:
     remediation_script: str
     created_at: str
     fingerprint: str
+    score: float = 0.0
+    alternates: list[ScriptArtifact] = field(default_factory=list)
 
 
 @dataclass(slots=True)
-class ValidationReport:
-    """Validation output for generated scripts."""
+class CallUsage:
+    """Token usage reported by the provider for one LLM call."""
 
-    errors: list[str]
-    warnings: list[str]
-    infos: list[str]
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cached_tokens: int = 0
 
     @property
-    def is_valid(self) -> bool:
-        return not self.errors
-
-
-class Utility:
-    """Backend service facade for AI generation and Graph upload."""
+    def total_tokens(self) -> int:
+        return self.input_tokens + self.output_tokens
+
+
+def build_upload_payload(
+    script_name: str,
+    description: str,
+    scope: str,
+    detection_script: str,
+    remediation_script: str = "",
+    run_as_32_bit: bool = True,
+    enforce_signature_check: bool = False,
+    publisher: str = "Remediation Creator Next",
+) -> dict[str, Any]:
+    """Build a Graph-ready upload payload for device health scripts; needs no LLM or Graph client."""
+    clean_name = script_name.strip()
+    if not clean_name:
+        raise ValueError("Script name is required.")
+    if not detection_script.strip():
+        raise ValueError("Detection script is required for upload.")
+
+    normalized_scope = "system" if scope.lower().startswith("system") else "user"
+
+    payload = {
+        "displayName": clean_name,
+        "description": description.strip(),
+        "publisher": publisher,
+        "runAs32Bit": run_as_32_bit,
+        "runAsAccount": normalized_scope,
+        "enforceSignatureCheck": enforce_signature_check,
+        "detectionScriptContent": _b64(detection_script),
+        "remediationScriptContent": _b64(remediation_script) if remediation_script.strip() else "",
+        "roleScopeTagIds": ["0"],
+    }
+    return payload
+
+
+def _b64(script: str) -> str:
+    return base64.b64encode(script.encode("utf-8")).decode("utf-8")
+
+
+class BaseUtility:
+    """Provider-independent logic shared by the sync and async service facades."""
 
     def __init__(
         self,
@@ -68,10 +116,39 @@ class Utility:
         api_key: str = "",
         azure_openai_endpoint: str = "",
         azure_openai_api_version: str = "2024-10-21",
+        deployment_pool: DeploymentPool | None = None,
+        hedger: RequestHedger | None = None,
+        prompt_cache_stats: PromptCacheStats | None = None,
+        telemetry: TelemetryRecorder | None = None,
+        input_token_budget: int = DEFAULT_INPUT_TOKEN_BUDGET,
+        validation_rules: RuleRegistry | None = None,
+        graph_token_provider: GraphTokenProvider | None = None,
+        client_registry: ClientRegistry | None = None,
+        cache: CacheBackend | None = None,
+        response_cache_ttl: float = DEFAULT_RESPONSE_CACHE_TTL_SECONDS,
     ):
         self.provider = provider.lower().strip()
         self.model_name = model_name.strip()
         self.graph_auth_header = graph_auth_header or {}
+        self.graph_token_provider = graph_token_provider
+        self.client_registry = client_registry or default_client_registry
+        self.deployment_pool = deployment_pool
+        self.hedger = hedger
+        self.prompt_cache_stats = prompt_cache_stats or default_prompt_cache_stats
+        self.telemetry = telemetry or default_telemetry
+        self.input_token_budget = input_token_budget
+        self.validation_rules = validation_rules or default_rule_registry
+        # Validation reports and, while `response_cache_ttl` > 0, LLM responses are shared through it.
+        self.cache = cache
+        self.response_cache_ttl = response_cache_ttl
+
+        if deployment_pool is not None:
+            # The pool owns the clients; the primary deployment stands in for single-client callers.
+            primary = deployment_pool.deployments[0]
+            self.provider = primary.provider
+            self.model_name = self.model_name or primary.model_name
+            self._client = primary.client
+            return
 
         if not self.model_name:
             raise ValueError("Model/deployment name is required.")
@@ -79,104 +156,35 @@ class Utility:
         if self.provider == "openai":
             if not api_key.strip():
                 raise ValueError("OPENAI_API_KEY is required for OpenAI provider.")
-            self.client = OpenAI(api_key=api_key)
         elif self.provider == "azure":
             if not api_key.strip():
                 raise ValueError("AZURE_OPENAI_KEY is required for Azure provider.")
             if not azure_openai_endpoint.strip():
                 raise ValueError("AZURE_OPENAI_ENDPOINT is required for Azure provider.")
-            self.client = AzureOpenAI(
-                api_key=api_key,
-                api_version=azure_openai_api_version,
-                azure_endpoint=azure_openai_endpoint,
-            )
         else:
             raise ValueError("Unsupported provider. Use 'azure' or 'openai'.")
 
-    def generate(
-        self,
-        description: str,
-        include_remediation: bool,
-        temperature: float = 0.2,
-        max_tokens: int = 1600,
-        extra_requirements: str = "",
-    ) -> ScriptArtifact:
-        """Generate detection and optionally remediation scripts."""
-        if not description.strip():
-            raise ValueError("Description cannot be empty.")
+        # Built on first use, so validation and payload building never load the OpenAI SDK.
+        self._client: Any = None
+        self._client_settings = (api_key, azure_openai_endpoint, azure_openai_api_version)
 
-        detection_prompt = self._build_detection_prompt(description, extra_requirements)
-        detection_script = self._invoke_gpt_call(
-            user=detection_prompt,
-            system=DETECTION_SCRIPT_PROMPT,
-            temperature=temperature,
-            max_tokens=max_tokens,
-        )
-
-        remediation_script = ""
-        mode = "Detection only"
-        if include_remediation:
-            remediation_prompt = self._build_remediation_prompt(
-                description=description,
-                detection_script=detection_script,
-                extra_requirements=extra_requirements,
-            )
-            remediation_script = self._invoke_gpt_call(
-                user=remediation_prompt,
-                system=REMEDIATION_SCRIPT_PROMPT,
-                temperature=temperature,
-                max_tokens=max_tokens,
-            )
-            mode = "Detection and Remediation"
-
-        return ScriptArtifact(
-            description=description.strip(),
-            mode=mode,
-            detection_script=detection_script.strip(),
-            remediation_script=remediation_script.strip(),
-            created_at=datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%SZ"),
-            fingerprint=self._fingerprint(detection_script, remediation_script),
-        )
-
-    def validate_scripts(self, detection_script: str, remediation_script: str = "") -> ValidationReport:
-        """Run lightweight static validation checks for generated scripts."""
-        errors: list[str] = []
-        warnings: list[str] = []
-        infos: list[str] = []
-
-        detection = detection_script.strip()
-        remediation = remediation_script.strip()
-
-        if not detection:
-            errors.append("Detection script is empty.")
-            return ValidationReport(errors=errors, warnings=warnings, infos=infos)
-
-        detection_exits = self._extract_exit_codes(detection)
-        if 0 not in detection_exits or 1 not in detection_exits:
-            warnings.append(
-                "Detection script should include both exit 0 and exit 1 paths for Intune compliance logic."
-            )
-
-        risky_commands = self._find_detection_mutations(detection)
-        if risky_commands:
-            warnings.append(
-                "Detection script appears to mutate the system. Check these commands: "
-                + ", ".join(sorted(risky_commands))
-            )
-
-        if "Write-Host" not in detection:
-            infos.append("Detection script has no Write-Host output. Consider adding operator-friendly status text.")
+    @property
+    def client(self) -> Any:
+        if self._client is None:
+            self._client = self._create_client(*self._client_settings)
+        return self._client
 
-        if remediation:
-            remediation_exits = self._extract_exit_codes(remediation)
-            if 0 not in remediation_exits:
-                warnings.append("Remediation script should include exit 0 on successful remediation.")
-            if "try" not in remediation.lower() or "catch" not in remediation.lower():
-                infos.append("Remediation script has no explicit try/catch block.")
-            if "Write-Host" not in remediation:
-                infos.append("Remediation script has no Write-Host output.")
+    def _create_client(self, api_key: str, azure_openai_endpoint: str, azure_openai_api_version: str) -> Any:
+        raise NotImplementedError
 
-        return ValidationReport(errors=errors, warnings=warnings, infos=infos)
+    def validate_scripts(
+        self,
+        detection_script: str,
+        remediation_script: str = "",
+        session: ValidationSession | None = None,
+    ) -> ValidationReport:
+        """Validate scripts with this instance's rules; see `modules.validation.validate_scripts`."""
+        return validate_scripts(detection_script, remediation_script, self.validation_rules, session, self.cache)
 
     def build_upload_payload(
         self,
@@ -190,40 +198,35 @@ class Utility:
         publisher: str = "Remediation Creator Next",
     ) -> dict[str, Any]:
         """Build a Graph-ready upload payload for device health scripts."""
-        clean_name = script_name.strip()
-        if not clean_name:
-            raise ValueError("Script name is required.")
-        if not detection_script.strip():
-            raise ValueError("Detection script is required for upload.")
-
-        normalized_scope = "system" if scope.lower().startswith("system") else "user"
-
-        payload = {
-            "displayName": clean_name,
-            "description": description.strip(),
-            "publisher": publisher,
-            "runAs32Bit": run_as_32_bit,
-            "runAsAccount": normalized_scope,
-            "enforceSignatureCheck": enforce_signature_check,
-            "detectionScriptContent": self._b64(detection_script),
-            "remediationScriptContent": self._b64(remediation_script) if remediation_script.strip() else "",
-            "roleScopeTagIds": ["0"],
-        }
-        return payload
-
-    def upload_payload(self, payload: dict[str, Any], endpoint: str = "deviceManagement/deviceHealthScripts") -> dict[str, Any]:
-        """Upload a prepared payload to Microsoft Graph."""
+        return build_upload_payload(
+            script_name,
+            description,
+            scope,
+            detection_script,
+            remediation_script,
+            run_as_32_bit,
+            enforce_signature_check,
+            publisher,
+        )
+
+    @staticmethod
+    def pretty_json(data: dict[str, Any]) -> str:
+        return json.dumps(data, indent=2, ensure_ascii=True)
+
+    @property
+    def graph_auth(self) -> GraphAuth:
+        """The token provider when one is set, so each request gets a fresh token."""
+        return self.graph_token_provider or self.graph_auth_header
+
+    def _require_graph_auth(self) -> None:
+        if self.graph_token_provider is not None:
+            return
         if not self.graph_auth_header or "Authorization" not in self.graph_auth_header:
             raise ValueError("Graph authentication header is missing. Authenticate first.")
 
-        uri = GRAPH_BASE_URL + endpoint
-        response = requests.post(
-            uri,
-            headers=self.graph_auth_header,
-            json=payload,
-            timeout=DEFAULT_TIMEOUT_SECONDS,
-        )
-
+    @staticmethod
+    def _graph_result(response: Any) -> dict[str, Any]:
+        """Convert a Graph HTTP response (requests or httpx) into a result dict."""
         if response.status_code >= 400:
             raise RuntimeError(
                 f"Graph upload failed ({response.status_code}): {response.text[:500]}"
@@ -236,67 +239,277 @@ class Utility:
                 return {"status": "ok", "raw": response.text}
         return {"status": "ok"}
 
+    def _build_artifact(
+        self,
+        description: str,
+        detection_script: str,
+        remediation_script: str,
+        include_remediation: bool,
+    ) -> ScriptArtifact:
+        return ScriptArtifact(
+            description=description.strip(),
+            mode="Detection and Remediation" if include_remediation else "Detection only",
+            detection_script=detection_script.strip(),
+            remediation_script=remediation_script.strip(),
+            created_at=datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%SZ"),
+            fingerprint=self._fingerprint(detection_script, remediation_script),
+        )
+
+    def _score_artifact(self, artifact: ScriptArtifact) -> float:
+        """Rank a candidate by validation outcome; higher is better."""
+        report = self.validate_scripts(artifact.detection_script, artifact.remediation_script)
+        score = 100.0 - 50.0 * len(report.errors) - 10.0 * len(report.warnings) - 1.0 * len(report.infos)
+
+        flagged = {finding.rule_id for finding in report.findings}
+        score += 5.0 * len({"DET001", "DET002"} - flagged)
+        if artifact.remediation_script:
+            score += 0.0 if "REM001" in flagged else 5.0
+        mutations = {finding.match.lower() for finding in report.findings if finding.rule_id == "DET003"}
+        score -= 5.0 * len(mutations)
+        return score
+
+    def _select_best(self, outcomes: list[ScriptArtifact | BaseException]) -> ScriptArtifact:
+        """Score successful candidates and return the best one with the rest as alternates."""
+        artifacts = [item for item in outcomes if isinstance(item, ScriptArtifact)]
+        if not artifacts:
+            raise next(item for item in outcomes if isinstance(item, BaseException))
+
+        for artifact in artifacts:
+            artifact.score = self._score_artifact(artifact)
+        # Stable sort keeps the earliest candidate first among equal scores.
+        ranked = sorted(artifacts, key=lambda item: item.score, reverse=True)
+        best = ranked[0]
+        best.alternates = [item for item in ranked[1:] if item.fingerprint != best.fingerprint]
+        return best
+
+    @property
+    def caches_responses(self) -> bool:
+        return self.cache is not None and self.response_cache_ttl > 0
+
+    def _response_cache_key(self, user: str, system: str, temperature: float, max_tokens: int, variant: int) -> str:
+        return cache_key("llm", self.provider, self.model_name, system, user, temperature, max_tokens, variant)
+
     @staticmethod
-    def pretty_json(data: dict[str, Any]) -> str:
-        return json.dumps(data, indent=2, ensure_ascii=True)
+    def _candidate_count(candidates: int) -> int:
+        return max(1, min(int(candidates), MAX_CANDIDATES))
+
+    def _fit_detection_prompt(self, description: str, extra_requirements: str, max_tokens: int) -> BudgetResult:
+        return self._fit(
+            build=lambda _context, extra: self._build_detection_prompt(description, extra),
+            context="",
+            extra_requirements=extra_requirements,
+            system=DETECTION_SCRIPT_PROMPT,
+            max_tokens=max_tokens,
+        )
 
-    def _invoke_gpt_call(
+    def _fit_remediation_prompt(
         self,
-        user: str,
+        description: str,
+        detection_script: str,
+        extra_requirements: str,
+        max_tokens: int,
+    ) -> BudgetResult:
+        return self._fit(
+            build=lambda context, extra: self._build_remediation_prompt(description, context, extra),
+            context=detection_script,
+            extra_requirements=extra_requirements,
+            system=REMEDIATION_SCRIPT_PROMPT,
+            max_tokens=max_tokens,
+        )
+
+    def _fit(
+        self,
+        build: Any,
+        context: str,
+        extra_requirements: str,
         system: str,
-        temperature: float,
         max_tokens: int,
-    ) -> str:
-        messages = [
+    ) -> BudgetResult:
+        budget = fit_prompt(
+            build=build,
+            context=context,
+            extra_requirements=extra_requirements,
+            system=system,
+            model_name=self.model_name,
+            max_tokens=max_tokens,
+            input_budget=self.input_token_budget,
+        )
+        self.telemetry.record_prompt_budget(budget.original_tokens, budget.final_tokens)
+        return budget
+
+    @staticmethod
+    def _build_messages(user: str, system: str) -> list[dict[str, str]]:
+        return [
             {"role": "system", "content": system},
             {"role": "user", "content": user},
         ]
 
-        # GPT-5 style chat models are often exposed through the Responses API.
-        if self._prefer_responses_api():
-            try:
-                return self._invoke_with_responses(
-                    messages=messages,
-                    temperature=temperature,
-                    max_tokens=max_tokens,
-                )
-            except Exception:
-                # Fall back to chat completions for compatibility with classic deployments.
-                pass
+    def _prefer_responses_api(self, model_name: str = "") -> bool:
+        lower_model = (model_name or self.model_name).lower()
+        return lower_model.startswith("gpt-5")
 
-        return self._invoke_with_chat_completions(
-            messages=messages,
-            temperature=temperature,
-            max_tokens=max_tokens,
-        )
+    def _hedge_exclusions(self, used: set[str]) -> frozenset[str]:
+        """Deployments a hedge attempt should avoid: the ones the primary already uses."""
+        if self.deployment_pool is None or len(used) >= len(self.deployment_pool.deployments):
+            return frozenset()
+        return frozenset(used)
 
-    def _prefer_responses_api(self) -> bool:
-        lower_model = self.model_name.lower()
-        return lower_model.startswith("gpt-5")
+    @staticmethod
+    def _client_for_deadline(client: Any, deadline: Deadline | None) -> Any:
+        """Client whose request timeout is the remaining deadline budget."""
+        if deadline is None:
+            return client
+        timeout = deadline.timeout(action="LLM call")
+        if timeout is None:
+            return client
+        return client.with_options(timeout=timeout)
+
+    @staticmethod
+    def _estimate_call_tokens(messages: list[dict[str, str]], max_tokens: int) -> int:
+        # Rough 4-characters-per-token estimate, plus the reserved completion budget.
+        return sum(len(message["content"]) for message in messages) // 4 + max_tokens
 
-    def _invoke_with_responses(
+    def _relax_params(self, params: dict[str, Any], exc: Exception) -> dict[str, Any] | None:
+        """Return adjusted request parameters for a rejected call, or None if nothing can be relaxed."""
+        relaxed = dict(params)
+        if self._is_max_tokens_unsupported_error(exc) and "max_tokens" in relaxed:
+            relaxed["max_completion_tokens"] = relaxed.pop("max_tokens")
+        if self._is_temperature_default_only_error(exc):
+            relaxed.pop("temperature", None)
+        return relaxed if relaxed != params else None
+
+    # Request handling shared by the sync and async call loops, which differ only in awaiting `_send_request`.
+
+    @staticmethod
+    def _request_params(api_path: str, temperature: float, max_tokens: int) -> dict[str, Any]:
+        tokens_param = "max_output_tokens" if api_path == "responses" else "max_tokens"
+        return {"temperature": temperature, tokens_param: max_tokens}
+
+    def _send_request(
         self,
+        client: Any,
+        api_path: str,
+        model_name: str,
         messages: list[dict[str, str]],
-        temperature: float,
-        max_tokens: int,
-    ) -> str:
+        params: dict[str, Any],
+        deadline: Deadline | None,
+    ) -> Any:
+        """Issue one call; returns the response, or an awaitable of it for async clients."""
+        timed_client = self._client_for_deadline(client, deadline)
+        if api_path == "responses":
+            return timed_client.responses.create(model=model_name, input=messages, **params)
+        return timed_client.chat.completions.create(model=model_name, messages=messages, **params)
+
+    def _retry_params(
+        self,
+        exc: Exception,
+        params: dict[str, Any],
+        started: float,
+        provider: str,
+        model_name: str,
+        api_path: str,
+        fallback_attempts: int,
+        deadline: Deadline | None,
+    ) -> dict[str, Any]:
+        """Parameters to retry a rejected call with; records the failure and raises when there are none."""
+        if deadline is not None and deadline.expired:
+            self._record_failure(exc, time.perf_counter() - started, provider, model_name, api_path, fallback_attempts)
+            raise DeadlineExceeded("Deadline exceeded during LLM call.") from exc
+        relaxed = self._relax_params(params, exc)
+        if relaxed is None:
+            self._record_failure(exc, time.perf_counter() - started, provider, model_name, api_path, fallback_attempts)
+            raise exc
+        return relaxed
+
+    def _finish_call(
+        self,
+        response: Any,
+        started: float,
+        provider: str,
+        model_name: str,
+        api_path: str,
+        fallback_attempts: int,
+    ) -> tuple[str, CallUsage]:
+        """Text and token usage of a completed call, recorded in telemetry either way."""
+        latency = time.perf_counter() - started
         try:
-            response = self.client.responses.create(
-                model=self.model_name,
-                input=messages,
-                temperature=temperature,
-                max_output_tokens=max_tokens,
-            )
-        except Exception as exc:
-            if self._is_temperature_default_only_error(exc):
-                response = self.client.responses.create(
-                    model=self.model_name,
-                    input=messages,
-                    max_output_tokens=max_tokens,
-                )
+            if api_path == "responses":
+                text = self._text_from_responses(response)
             else:
-                raise
+                text = self._text_from_chat_completion(response)
+        except Exception as exc:
+            self._record_failure(exc, latency, provider, model_name, api_path, fallback_attempts)
+            raise
+        return text, self._record_call(response, latency, provider, model_name, api_path, fallback_attempts)
+
+    def _record_call(
+        self,
+        response: Any,
+        latency_seconds: float,
+        provider: str,
+        model_name: str,
+        api_path: str,
+        fallback_attempts: int,
+    ) -> CallUsage:
+        usage = self._usage_from_response(response)
+        self.prompt_cache_stats.record(usage.input_tokens, usage.cached_tokens, latency_seconds)
+        self.telemetry.record(
+            CallRecord(
+                provider=provider or self.provider,
+                model=model_name,
+                api_path=api_path,
+                latency_seconds=latency_seconds,
+                input_tokens=usage.input_tokens,
+                output_tokens=usage.output_tokens,
+                cached_tokens=usage.cached_tokens,
+                fallback_attempts=fallback_attempts,
+            )
+        )
+        return usage
+
+    def _record_failure(
+        self,
+        exc: BaseException,
+        latency_seconds: float,
+        provider: str,
+        model_name: str,
+        api_path: str,
+        fallback_attempts: int,
+    ) -> None:
+        self.telemetry.record(
+            CallRecord(
+                provider=provider or self.provider,
+                model=model_name,
+                api_path=api_path,
+                latency_seconds=latency_seconds,
+                fallback_attempts=fallback_attempts,
+                error=f"{type(exc).__name__}: {str(exc)[:300]}",
+            )
+        )
+
+    @staticmethod
+    def _usage_from_response(response: Any) -> CallUsage:
+        """Read token usage from a Responses or chat completions result."""
+        usage = getattr(response, "usage", None)
+        if usage is None:
+            return CallUsage()
+
+        input_tokens = getattr(usage, "input_tokens", None)
+        if input_tokens is not None:
+            details = getattr(usage, "input_tokens_details", None)
+            output_tokens = getattr(usage, "output_tokens", 0)
+        else:
+            input_tokens = getattr(usage, "prompt_tokens", 0)
+            details = getattr(usage, "prompt_tokens_details", None)
+            output_tokens = getattr(usage, "completion_tokens", 0)
+        cached_tokens = getattr(details, "cached_tokens", 0) if details is not None else 0
+        return CallUsage(
+            input_tokens=int(input_tokens or 0),
+            output_tokens=int(output_tokens or 0),
+            cached_tokens=int(cached_tokens or 0),
+        )
 
+    def _text_from_responses(self, response: Any) -> str:
         output_text = getattr(response, "output_text", None)
         if isinstance(output_text, str) and output_text.strip():
             return output_text.strip()
@@ -306,63 +519,8 @@ class Utility:
             return extracted
         raise RuntimeError("Responses API returned no text output.")
 
-    def _invoke_with_chat_completions(
-        self,
-        messages: list[dict[str, str]],
-        temperature: float,
-        max_tokens: int,
-    ) -> str:
-        try:
-            response = self.client.chat.completions.create(
-                model=self.model_name,
-                temperature=temperature,
-                max_tokens=max_tokens,
-                messages=messages,
-            )
-        except Exception as exc:
-            message = str(exc)
-            if "max_tokens" in message and "max_completion_tokens" in message and self._is_temperature_default_only_error(exc):
-                response = self.client.chat.completions.create(
-                    model=self.model_name,
-                    max_completion_tokens=max_tokens,
-                    messages=messages,
-                )
-            elif "max_tokens" in message and "max_completion_tokens" in message:
-                try:
-                    response = self.client.chat.completions.create(
-                        model=self.model_name,
-                        temperature=temperature,
-                        max_completion_tokens=max_tokens,
-                        messages=messages,
-                    )
-                except Exception as exc2:
-                    if self._is_temperature_default_only_error(exc2):
-                        response = self.client.chat.completions.create(
-                            model=self.model_name,
-                            max_completion_tokens=max_tokens,
-                            messages=messages,
-                        )
-                    else:
-                        raise
-            elif self._is_temperature_default_only_error(exc):
-                try:
-                    response = self.client.chat.completions.create(
-                        model=self.model_name,
-                        max_tokens=max_tokens,
-                        messages=messages,
-                    )
-                except Exception as exc2:
-                    if "max_tokens" in str(exc2) and "max_completion_tokens" in str(exc2):
-                        response = self.client.chat.completions.create(
-                            model=self.model_name,
-                            max_completion_tokens=max_tokens,
-                            messages=messages,
-                        )
-                    else:
-                        raise
-            else:
-                raise
-
+    @staticmethod
+    def _text_from_chat_completion(response: Any) -> str:
         content = response.choices[0].message.content
         if isinstance(content, str) and content.strip():
             return content.strip()
@@ -407,49 +565,26 @@ class Utility:
             )
         )
 
+    @staticmethod
+    def _is_max_tokens_unsupported_error(exc: Exception) -> bool:
+        message = str(exc)
+        return "max_tokens" in message and "max_completion_tokens" in message
+
     @staticmethod
     def _build_detection_prompt(description: str, extra_requirements: str) -> str:
-        prompt = (
-            "Create a Microsoft Intune Endpoint Analytics detection script for Windows devices.\n\n"
-            f"Description:\n{description.strip()}\n\n"
-            "Output constraints:\n"
-            "- Output must be valid PowerShell only\n"
-            "- No markdown, no explanation text\n"
-            "- Include clear status output\n"
-        )
+        prompt = DETECTION_REQUEST_PREFIX + f"\n\nDescription:\n{description.strip()}\n"
         if extra_requirements.strip():
             prompt += f"\nAdditional requirements:\n{extra_requirements.strip()}\n"
         return prompt
 
     @staticmethod
     def _build_remediation_prompt(description: str, detection_script: str, extra_requirements: str) -> str:
-        prompt = (
-            "Create a Microsoft Intune Endpoint Analytics remediation script for Windows devices.\n\n"
-            f"Description:\n{description.strip()}\n\n"
-            "Detection script context:\n"
-            f"{detection_script.strip()}\n\n"
-            "Output constraints:\n"
-            "- Output must be valid PowerShell only\n"
-            "- No markdown, no explanation text\n"
-            "- Include robust error handling and status output\n"
-        )
+        prompt = REMEDIATION_REQUEST_PREFIX + f"\n\nDescription:\n{description.strip()}\n"
         if extra_requirements.strip():
             prompt += f"\nAdditional requirements:\n{extra_requirements.strip()}\n"
+        prompt += f"\nDetection script context:\n{detection_script.strip()}\n"
         return prompt
 
-    @staticmethod
-    def _extract_exit_codes(script: str) -> set[int]:
-        codes = re.findall(r"\bexit\s+([0-9]+)\b", script, flags=re.IGNORECASE)
-        return {int(code) for code in codes}
-
-    @staticmethod
-    def _find_detection_mutations(script: str) -> set[str]:
-        found = set()
-        for marker in _DETECTION_MUTATION_MARKERS:
-            if re.search(marker, script, flags=re.IGNORECASE):
-                found.add(marker.replace("\\b", ""))
-        return found
-
     @staticmethod
     def _fingerprint(detection_script: str, remediation_script: str) -> str:
         digest = hashlib.sha256(
@@ -457,6 +592,338 @@ class Utility:
         ).hexdigest()
         return digest[:12]
 
-    @staticmethod
-    def _b64(script: str) -> str:
-        return base64.b64encode(script.encode("utf-8")).decode("utf-8")
+
+class Utility(BaseUtility):
+    """Backend service facade for AI generation and Graph upload."""
+
+    def _create_client(self, api_key: str, azure_openai_endpoint: str, azure_openai_api_version: str) -> Any:
+        # Shared across instances, reruns and sessions so connections stay warm.
+        if self.provider == "openai":
+            return self.client_registry.get("openai", api_key)
+        return self.client_registry.get("azure", api_key, azure_openai_endpoint, azure_openai_api_version)
+
+    def generate(
+        self,
+        description: str,
+        include_remediation: bool,
+        temperature: float = 0.2,
+        max_tokens: int = 1600,
+        extra_requirements: str = "",
+        candidates: int = 1,
+        deadline: Deadline | None = None,
+        on_stage: Callable[[str, str], None] | None = None,
+    ) -> ScriptArtifact:
+        """Generate detection and optionally remediation scripts.
+
+        With `candidates > 1` the full generation runs that many times concurrently and
+        the candidate with the best validation score is returned; the others are kept
+        in `ScriptArtifact.alternates`.
+
+        All LLM calls, retries and fallbacks share `deadline` (by default
+        `DEFAULT_GENERATION_DEADLINE_SECONDS`); `DeadlineExceeded` is raised when it runs out.
+
+        `on_stage("detection" | "remediation", script)` is called as each candidate
+        finishes a script, from the candidate's own thread, so callers can stream them.
+        """
+        if not description.strip():
+            raise ValueError("Description cannot be empty.")
+        if deadline is None:
+            deadline = Deadline.after(DEFAULT_GENERATION_DEADLINE_SECONDS)
+
+        count = self._candidate_count(candidates)
+        if count == 1:
+            return self._generate_candidate(
+                description, include_remediation, temperature, max_tokens, extra_requirements, deadline, on_stage
+            )
+
+        executor = ThreadPoolExecutor(max_workers=count)
+        try:
+            futures = [
+                executor.submit(
+                    self._generate_candidate,
+                    description,
+                    include_remediation,
+                    temperature,
+                    max_tokens,
+                    extra_requirements,
+                    deadline,
+                    on_stage,
+                    variant,
+                )
+                for variant in range(count)
+            ]
+            done, _ = wait(futures, timeout=deadline.remaining())
+        finally:
+            # Unfinished candidates stop on their own once the shared deadline runs out.
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        outcomes: list[ScriptArtifact | BaseException] = []
+        for future in futures:
+            if future in done:
+                error = future.exception()
+                outcomes.append(future.result() if error is None else error)
+        if len(done) < len(futures):
+            # Listed after real failures so those are reported in preference to the timeout.
+            outcomes.append(DeadlineExceeded("Deadline exceeded while generating."))
+        return self._select_best(outcomes)
+
+    def _generate_candidate(
+        self,
+        description: str,
+        include_remediation: bool,
+        temperature: float,
+        max_tokens: int,
+        extra_requirements: str,
+        deadline: Deadline | None = None,
+        on_stage: Callable[[str, str], None] | None = None,
+        variant: int = 0,
+    ) -> ScriptArtifact:
+        detection_budget = self._fit_detection_prompt(description, extra_requirements, max_tokens)
+        detection_script = self._invoke_gpt_call(
+            user=detection_budget.prompt,
+            system=DETECTION_SCRIPT_PROMPT,
+            temperature=temperature,
+            max_tokens=detection_budget.max_tokens,
+            deadline=deadline,
+            variant=variant,
+        )
+        if on_stage is not None:
+            on_stage("detection", detection_script)
+
+        remediation_script = ""
+        if include_remediation:
+            remediation_budget = self._fit_remediation_prompt(
+                description, detection_script, extra_requirements, max_tokens
+            )
+            remediation_script = self._invoke_gpt_call(
+                user=remediation_budget.prompt,
+                system=REMEDIATION_SCRIPT_PROMPT,
+                temperature=temperature,
+                max_tokens=remediation_budget.max_tokens,
+                deadline=deadline,
+                variant=variant,
+            )
+            if on_stage is not None:
+                on_stage("remediation", remediation_script)
+
+        return self._build_artifact(description, detection_script, remediation_script, include_remediation)
+
+    def upload_payload(
+        self,
+        payload: dict[str, Any],
+        endpoint: str = "deviceManagement/deviceHealthScripts",
+        deadline: Deadline | None = None,
+    ) -> dict[str, Any]:
+        """Upload a prepared payload to Microsoft Graph."""
+        self._require_graph_auth()
+
+        import requests
+
+        uri = GRAPH_BASE_URL + endpoint
+        response = requests.post(
+            uri,
+            headers=auth_headers(self.graph_auth),
+            json=payload,
+            timeout=request_timeout(deadline, DEFAULT_TIMEOUT_SECONDS, "Graph upload"),
+        )
+        return self._graph_result(response)
+
+    def publish_payloads(
+        self,
+        payloads: list[dict[str, Any]],
+        endpoint: str = "deviceManagement/deviceHealthScripts",
+        concurrency: int = DEFAULT_BATCH_CONCURRENCY,
+        deadline: Deadline | None = None,
+        base_url: str = GRAPH_BASE_URL,
+    ) -> list[PublishResult]:
+        """Upload many payloads through Graph `$batch`; one result per payload, in order."""
+        self._require_graph_auth()
+        publisher = GraphBatchPublisher(self.graph_auth, base_url, endpoint, concurrency=concurrency)
+        return publisher.publish(payloads, deadline)
+
+    def upsert_payloads(
+        self,
+        payloads: list[dict[str, Any]],
+        inventory: GraphInventory | None = None,
+        concurrency: int = DEFAULT_BATCH_CONCURRENCY,
+        deadline: Deadline | None = None,
+    ) -> list[PublishResult]:
+        """Create, update or skip each payload against the scripts already in the tenant.
+
+        Reuse one `GraphInventory` across calls so the remote index is not rebuilt each time.
+        """
+        self._require_graph_auth()
+        inventory = inventory or GraphInventory(GRAPH_BASE_URL)
+        publisher = GraphBatchPublisher(
+            self.graph_auth,
+            inventory.base_url,
+            inventory.endpoint,
+            concurrency=concurrency,
+            session=inventory.session,
+        )
+        return upsert(payloads, inventory, publisher, self.graph_auth, deadline)
+
+    def sync_run_states(
+        self,
+        script_ids: list[str],
+        store: RunStateStore | None = None,
+        full: bool = False,
+        concurrency: int = DEFAULT_SYNC_CONCURRENCY,
+        deadline: Deadline | None = None,
+        base_url: str = GRAPH_BASE_URL,
+    ) -> list[SyncResult]:
+        """Pull device run states and run summaries of published scripts into `store`."""
+        self._require_graph_auth()
+        sync = RunStateSync(self.graph_auth, store or RunStateStore(), base_url, concurrency=concurrency)
+        return sync.sync(script_ids, full=full, deadline=deadline)
+
+    def _invoke_gpt_call(
+        self,
+        user: str,
+        system: str,
+        temperature: float,
+        max_tokens: int,
+        deadline: Deadline | None = None,
+        variant: int = 0,
+    ) -> str:
+        """One LLM call, answered from the shared cache when the same prompt was sent recently.
+
+        `variant` keeps the concurrent candidates of one generation apart, so a cached
+        request still yields as many distinct candidates as the first one did.
+        """
+        if not self.caches_responses:
+            return self._invoke_uncached(user, system, temperature, max_tokens, deadline)
+        key = self._response_cache_key(user, system, temperature, max_tokens, variant)
+        remaining = deadline.remaining() if deadline is not None else None
+        return self.cache.get_or_fill(
+            key,
+            lambda: self._invoke_uncached(user, system, temperature, max_tokens, deadline),
+            self.response_cache_ttl,
+            wait=remaining if remaining is not None else DEFAULT_GENERATION_DEADLINE_SECONDS,
+        )
+
+    def _invoke_uncached(
+        self,
+        user: str,
+        system: str,
+        temperature: float,
+        max_tokens: int,
+        deadline: Deadline | None,
+    ) -> str:
+        messages = self._build_messages(user, system)
+        used: set[str] = set()
+
+        if self.hedger is not None:
+            return self.hedger.call(
+                primary=lambda: self._invoke_routed(messages, temperature, max_tokens, used, deadline),
+                hedge=lambda: self._invoke_routed(
+                    messages, temperature, max_tokens, used, deadline, exclude=self._hedge_exclusions(used)
+                ),
+                deadline=deadline,
+            )
+        return self._invoke_routed(messages, temperature, max_tokens, used, deadline)
+
+    def _invoke_routed(
+        self,
+        messages: list[dict[str, str]],
+        temperature: float,
+        max_tokens: int,
+        used: set[str],
+        deadline: Deadline | None,
+        exclude: frozenset[str] = frozenset(),
+    ) -> str:
+        if self.deployment_pool is None:
+            text, _usage = self._invoke_model(
+                client=self.client,
+                model_name=self.model_name,
+                provider=self.provider,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                deadline=deadline,
+            )
+            return text
+
+        def run(deployment: Deployment) -> tuple[str, CallUsage]:
+            used.add(deployment.name)
+            return self._invoke_model(
+                client=deployment.client,
+                model_name=deployment.model_name,
+                provider=deployment.provider,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                deadline=deadline,
+            )
+
+        text, _usage = self.deployment_pool.call(
+            run,
+            estimated_tokens=self._estimate_call_tokens(messages, max_tokens),
+            exclude=exclude,
+            deadline=deadline,
+            tokens_used=lambda result: result[1].total_tokens,
+        )
+        return text
+
+    def _invoke_model(
+        self,
+        client: Any,
+        model_name: str,
+        provider: str,
+        messages: list[dict[str, str]],
+        temperature: float,
+        max_tokens: int,
+        deadline: Deadline | None = None,
+    ) -> tuple[str, CallUsage]:
+        fallback_attempts = 0
+        # GPT-5 style chat models are often exposed through the Responses API.
+        if self._prefer_responses_api(model_name):
+            try:
+                return self._invoke_api(
+                    "responses", client, model_name, provider, messages, temperature, max_tokens, 0, deadline
+                )
+            except DeadlineExceeded:
+                raise
+            except Exception:
+                # Fall back to chat completions for compatibility with classic deployments.
+                # The failed attempt is already recorded in telemetry.
+                fallback_attempts = 1
+
+        return self._invoke_api(
+            "chat.completions",
+            client,
+            model_name,
+            provider,
+            messages,
+            temperature,
+            max_tokens,
+            fallback_attempts,
+            deadline,
+        )
+
+    def _invoke_api(
+        self,
+        api_path: str,
+        client: Any,
+        model_name: str,
+        provider: str,
+        messages: list[dict[str, str]],
+        temperature: float,
+        max_tokens: int,
+        fallback_attempts: int = 0,
+        deadline: Deadline | None = None,
+    ) -> tuple[str, CallUsage]:
+        params = self._request_params(api_path, temperature, max_tokens)
+        started = time.perf_counter()
+        while True:
+            try:
+                response = self._send_request(client, api_path, model_name, messages, params, deadline)
+                break
+            except DeadlineExceeded:
+                raise
+            except Exception as exc:
+                params = self._retry_params(
+                    exc, params, started, provider, model_name, api_path, fallback_attempts, deadline
+                )
+                fallback_attempts += 1
+        return self._finish_call(response, started, provider, model_name, api_path, fallback_attempts)
@@ -0,0 +1,75 @@
+"""Credential-free static validation of detection/remediation script pairs."""
+
+from __future__ import annotations
+
+from dataclasses import asdict, dataclass, field
+
+from modules.shared_cache import CacheBackend, cache_key
+from modules.validation_rules import Finding, RuleRegistry, ValidationSession, default_rule_registry
+
+VALIDATION_CACHE_TTL_SECONDS = 7 * 24 * 3600
+
+
+@dataclass(slots=True)
+class ValidationReport:
+    """Validation output for generated scripts."""
+
+    errors: list[str]
+    warnings: list[str]
+    infos: list[str]
+    findings: list[Finding] = field(default_factory=list)
+
+    @property
+    def is_valid(self) -> bool:
+        return not self.errors
+
+    @classmethod
+    def from_findings(cls, findings: list[Finding]) -> ValidationReport:
+        by_severity: dict[str, list[str]] = {"error": [], "warning": [], "info": []}
+        for finding in findings:
+            by_severity[finding.severity].append(finding.describe())
+        return cls(
+            errors=by_severity["error"],
+            warnings=by_severity["warning"],
+            infos=by_severity["info"],
+            findings=findings,
+        )
+
+
+def validate_scripts(
+    detection_script: str,
+    remediation_script: str = "",
+    rules: RuleRegistry | None = None,
+    session: ValidationSession | None = None,
+    cache: CacheBackend | None = None,
+) -> ValidationReport:
+    """Run the validation rules over both scripts, one pass per script.
+
+    Pass the same `session` for successive versions of scripts being edited to
+    re-scan only the lines that changed since the previous call. Without a session,
+    reports are looked up in `cache` by script content and rule set.
+    """
+    rules = rules or default_rule_registry
+    if cache is not None and session is None:
+        key = cache_key("validation", rules.fingerprint, detection_script, remediation_script)
+        findings = cache.get_or_fill(
+            key,
+            lambda: [asdict(finding) for finding in validate_scripts(detection_script, remediation_script, rules).findings],
+            VALIDATION_CACHE_TTL_SECONDS,
+        )
+        return ValidationReport.from_findings([Finding(**finding) for finding in findings])
+
+    if not detection_script.strip():
+        finding = Finding("DET000", "error", "Detection script is empty.", "detection")
+        return ValidationReport.from_findings([finding])
+
+    if session is not None and session.registry is rules:
+        findings = session.detection.validate(detection_script)
+        if remediation_script.strip():
+            findings += session.remediation.validate(remediation_script)
+        return ValidationReport.from_findings(findings)
+
+    findings = rules.scan(detection_script, "detection")
+    if remediation_script.strip():
+        findings += rules.scan(remediation_script, "remediation")
+    return ValidationReport.from_findings(findings)
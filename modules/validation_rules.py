@@ -0,0 +1,540 @@
+"""Compiled single-pass rule engine for static script validation."""
+
+from __future__ import annotations
+
+import hashlib
+import re
+import threading
+from bisect import bisect_right
+from collections import OrderedDict
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass
+from difflib import SequenceMatcher
+
+from modules.powershell_lexer import blank, code_view, iter_spans
+
+SEVERITIES = ("error", "warning", "info")
+TARGETS = ("detection", "remediation")
+SCOPES = ("code", "text")
+MEMO_SIZE = 256
+# Larger changed regions are re-scanned as one block instead of being diffed line by line.
+MAX_DIFF_LINES = 400
+
+
+@dataclass(slots=True, frozen=True)
+class Rule:
+    """One validation rule.
+
+    `forbid` rules report every match of `pattern`; `require` rules report once when the
+    script has no match at all, or no match for one of the extra `all_of` patterns.
+    `message` may reference the matched text as `{match}`.
+    `code` rules see the script with comments and strings blanked out; `text` rules see
+    it verbatim.
+    Patterns are matched case-insensitively unless `flags` says otherwise and must not
+    use named groups or backreferences, because they are combined into one scanner.
+    """
+
+    rule_id: str
+    severity: str
+    message: str
+    pattern: str
+    targets: tuple[str, ...] = TARGETS
+    mode: str = "forbid"
+    flags: int = re.IGNORECASE
+    scope: str = "code"
+    all_of: tuple[str, ...] = ()
+
+
+@dataclass(slots=True, frozen=True)
+class Finding:
+    """A rule hit in one script; `line` and `column` are 1-based, 0 for whole-script findings."""
+
+    rule_id: str
+    severity: str
+    message: str
+    target: str
+    line: int = 0
+    column: int = 0
+    match: str = ""
+
+    def describe(self) -> str:
+        if not self.line:
+            return self.message
+        return f"{self.message} (line {self.line}, column {self.column})"
+
+
+DEFAULT_RULES: tuple[Rule, ...] = (
+    Rule(
+        rule_id="DET001",
+        severity="warning",
+        message="Detection script should include an exit 0 path for Intune compliance logic.",
+        pattern=r"\bexit\s+0\b",
+        targets=("detection",),
+        mode="require",
+    ),
+    Rule(
+        rule_id="DET002",
+        severity="warning",
+        message="Detection script should include an exit 1 path for Intune compliance logic.",
+        pattern=r"\bexit\s+1\b",
+        targets=("detection",),
+        mode="require",
+    ),
+    Rule(
+        rule_id="DET003",
+        severity="warning",
+        message="Detection script appears to mutate the system: {match}",
+        pattern=r"\b(?:Set|New|Remove|Rename|Start|Stop|Restart|Invoke)-\w+|\breg\s+add\b|\bsc\s+config\b",
+        targets=("detection",),
+    ),
+    Rule(
+        rule_id="DET004",
+        severity="info",
+        message="Detection script has no Write-Host output. Consider adding operator-friendly status text.",
+        pattern=r"\bWrite-Host\b",
+        targets=("detection",),
+        mode="require",
+    ),
+    Rule(
+        rule_id="REM001",
+        severity="warning",
+        message="Remediation script should include exit 0 on successful remediation.",
+        pattern=r"\bexit\s+0\b",
+        targets=("remediation",),
+        mode="require",
+    ),
+    Rule(
+        rule_id="REM002",
+        severity="info",
+        message="Remediation script has no explicit try/catch block.",
+        pattern=r"\btry\b",
+        targets=("remediation",),
+        mode="require",
+        all_of=(r"\bcatch\b",),
+    ),
+    Rule(
+        rule_id="REM003",
+        severity="info",
+        message="Remediation script has no Write-Host output.",
+        pattern=r"\bWrite-Host\b",
+        targets=("remediation",),
+        mode="require",
+    ),
+)
+
+
+class _Scanner:
+    """All rules for one target compiled into a single alternation."""
+
+    def __init__(self, rules: list[Rule]):
+        self.rules = rules
+        # One entry per pattern: `(rule, part)`, where part 0 is `pattern` and 1.. are `all_of`.
+        self.parts = [(rule, part) for rule in rules for part in range(len(rule.all_of) + 1)]
+        patterns = [_pattern(rule, part) for rule, part in self.parts]
+        self.singles = [re.compile(pattern, rule.flags) for (rule, _part), pattern in zip(self.parts, patterns)]
+        self.combined = re.compile(
+            "|".join(
+                f"(?P<r{index}>{_scoped(pattern, rule.flags)})"
+                for index, ((rule, _part), pattern) in enumerate(zip(self.parts, patterns))
+            )
+        )
+
+    def hits(self, view: str) -> Iterator[tuple[Rule, int, int, int]]:
+        """Yield `(rule, part, start, end)` for every rule match in `view`."""
+        if not self.parts:
+            return
+        # Where each pattern may match again, so a pattern never reports a match inside its own last one.
+        resume = [0] * len(self.parts)
+        hit = self.combined.search(view)
+        while hit is not None:
+            position = hit.start()
+            first = int(hit.lastgroup[1:])
+            # The alternation only reports the first pattern that matches here; check the rest.
+            for index in range(first, len(self.parts)):
+                if position < resume[index]:
+                    continue
+                match = hit if index == first else self.singles[index].match(view, position)
+                if match is None:
+                    continue
+                resume[index] = max(match.end(), position + 1)
+                yield *self.parts[index], position, match.end()
+            # Resume one character on so a long match cannot hide another rule's match inside it.
+            hit = self.combined.search(view, position + 1)
+
+    def scan(self, view: str, script: str, target: str) -> list[Finding]:
+        """Match rules against `view`, an offset-preserving rendering of `script`."""
+        findings: list[Finding] = []
+        seen: set[tuple[str, int]] = set()
+        line_starts: list[int] | None = None
+
+        for rule, part, position, end in self.hits(view):
+            seen.add((rule.rule_id, part))
+            if rule.mode != "forbid":
+                continue
+            if line_starts is None:
+                line_starts = _line_starts(script)
+            line = bisect_right(line_starts, position)
+            text = script[position:end]
+            findings.append(
+                _finding(rule, target, text, line, position - line_starts[line - 1] + 1)
+            )
+        return findings + _missing(self.rules, seen, target)
+
+
+class RuleRegistry:
+    """Pluggable rule set; rules are compiled once per target and rescanned in one pass."""
+
+    def __init__(self, rules: Iterable[Rule] = DEFAULT_RULES):
+        self._lock = threading.Lock()
+        self._rules: dict[str, Rule] = {}
+        self._scanners: dict[tuple[str, str], _Scanner] = {}
+        self._memo: OrderedDict[tuple[str, bytes], list[Finding]] = OrderedDict()
+        self._fingerprint = ""
+        self.version = 0
+        for rule in rules:
+            self.register(rule)
+
+    @property
+    def rules(self) -> list[Rule]:
+        with self._lock:
+            return list(self._rules.values())
+
+    @property
+    def fingerprint(self) -> str:
+        """Hash of the rule definitions; equal in every process that registered the same rules."""
+        with self._lock:
+            if not self._fingerprint:
+                rules = sorted(self._rules.values(), key=lambda rule: rule.rule_id)
+                self._fingerprint = hashlib.sha256(repr(rules).encode("utf-8")).hexdigest()
+            return self._fingerprint
+
+    def register(self, rule: Rule, replace: bool = False) -> None:
+        """Add a rule; raises ValueError for invalid rules or duplicate IDs unless `replace`."""
+        if rule.severity not in SEVERITIES:
+            raise ValueError(f"Rule {rule.rule_id}: severity must be one of {', '.join(SEVERITIES)}.")
+        if rule.mode not in {"forbid", "require"}:
+            raise ValueError(f"Rule {rule.rule_id}: mode must be 'forbid' or 'require'.")
+        if not rule.targets or any(target not in TARGETS for target in rule.targets):
+            raise ValueError(f"Rule {rule.rule_id}: targets must be within {', '.join(TARGETS)}.")
+        if rule.scope not in SCOPES:
+            raise ValueError(f"Rule {rule.rule_id}: scope must be 'code' or 'text'.")
+        if rule.all_of and rule.mode != "require":
+            raise ValueError(f"Rule {rule.rule_id}: all_of is only supported by require rules.")
+        for pattern in (rule.pattern, *rule.all_of):
+            try:
+                compiled = re.compile(pattern, rule.flags)
+            except re.error as exc:
+                raise ValueError(f"Rule {rule.rule_id}: invalid pattern: {exc}") from exc
+            if compiled.groupindex:
+                raise ValueError(f"Rule {rule.rule_id}: patterns must not use named groups.")
+            if compiled.match(""):
+                raise ValueError(f"Rule {rule.rule_id}: pattern must not match the empty string.")
+
+        with self._lock:
+            if rule.rule_id in self._rules and not replace:
+                raise ValueError(f"Rule {rule.rule_id} is already registered.")
+            self._rules[rule.rule_id] = rule
+            self._invalidate()
+
+    def unregister(self, rule_id: str) -> None:
+        with self._lock:
+            self._rules.pop(rule_id, None)
+            self._invalidate()
+
+    def scan(self, script: str, target: str) -> list[Finding]:
+        """Run every rule for `target` over `script`, one pass per scope.
+
+        Results are memoized by script content.
+        """
+        if target not in TARGETS:
+            raise ValueError(f"Unknown validation target: {target}")
+        key = (target, hashlib.blake2b(script.encode("utf-8"), digest_size=16).digest())
+        with self._lock:
+            cached = self._memo.get(key)
+            if cached is not None:
+                self._memo.move_to_end(key)
+                return list(cached)
+
+        findings: list[Finding] = []
+        text_scanner = self._scanner(target, "text")
+        if text_scanner.rules:
+            findings += text_scanner.scan(script, script, target)
+        code_scanner = self._scanner(target, "code")
+        if code_scanner.rules:
+            findings += code_scanner.scan(code_view(script), script, target)
+
+        with self._lock:
+            self._memo[key] = findings
+            while len(self._memo) > MEMO_SIZE:
+                self._memo.popitem(last=False)
+        return list(findings)
+
+    def rules_for(self, target: str) -> list[Rule]:
+        return [rule for rule in self.rules if target in rule.targets]
+
+    def _scanner(self, target: str, scope: str) -> _Scanner:
+        with self._lock:
+            scanner = self._scanners.get((target, scope))
+            if scanner is None:
+                scanner = _Scanner(
+                    [rule for rule in self._rules.values() if target in rule.targets and rule.scope == scope]
+                )
+                self._scanners[(target, scope)] = scanner
+            return scanner
+
+    def _invalidate(self) -> None:
+        self._scanners.clear()
+        self._memo.clear()
+        self._fingerprint = ""
+        self.version += 1
+
+
+class IncrementalValidator:
+    """Validate successive versions of one script, re-scanning only changed lines.
+
+    Each version is diffed line by line against the previous one. Lexing restarts at the
+    nearest earlier line where the lexer carries no state (so an edit that opens a
+    here-string or block comment is handled) and stops once it is back in step with
+    unchanged lines. Only the re-lexed lines are scanned again; findings for the other
+    lines are reused with shifted line numbers.
+    """
+
+    def __init__(self, registry: RuleRegistry, target: str):
+        if target not in TARGETS:
+            raise ValueError(f"Unknown validation target: {target}")
+        self.registry = registry
+        self.target = target
+        self.rescanned_lines = 0
+        self._version = -1
+        self._lines: list[str] = []
+        # `_clean[i]` is True when line i starts with fresh lexer state; one extra entry for EOF.
+        self._clean: list[bool] = [True]
+        self._masked: list[str] = []
+        self._hits: list[list[tuple[Rule, int, int, str]]] = []
+
+    def validate(self, script: str) -> list[Finding]:
+        if self._version != self.registry.version:
+            self._version = self.registry.version
+            self._lines, self._clean, self._masked, self._hits = [], [True], [], []
+
+        lines = _split_lines(script)
+        clean: list[bool] = []
+        masked: list[str] = []
+        hits: list[list[tuple[Rule, int, int, str]]] = []
+        reused: list[bool] = []
+        dirty: list[tuple[int, int, bool]] = []
+
+        for tag, i1, i2, j1, j2 in _line_opcodes(self._lines, lines):
+            if tag == "equal":
+                clean += self._clean[i1:i2]
+                masked += self._masked[i1:i2]
+                hits += self._hits[i1:i2]
+                reused += [True] * (i2 - i1)
+                continue
+            # The state entering the edit is the old state entering line i1.
+            dirty.append((j1, j2, self._clean[i1]))
+            clean += [False] * (j2 - j1)
+            masked += [""] * (j2 - j1)
+            hits += [[] for _ in range(j2 - j1)]
+            reused += [False] * (j2 - j1)
+        clean.append(self._clean[-1] if not dirty or dirty[-1][1] < len(lines) else False)
+        reused.append(True)
+
+        offsets = [0]
+        for line in lines:
+            offsets.append(offsets[-1] + len(line))
+
+        self.rescanned_lines = 0
+        synced = -1  # Line where the previous re-lex got back in step with the old version.
+        for first, last, entering_clean in dirty:
+            if first < synced or (first == synced and first == last):
+                if last <= synced:
+                    continue
+                start = synced
+            else:
+                start = first
+                if first != synced:
+                    old_flag = clean[first]
+                    clean[first] = entering_clean
+                    if first == last and entering_clean and old_flag:
+                        # A pure deletion between two clean lines changes nothing else.
+                        continue
+            while start > 0 and not clean[start]:
+                start -= 1
+            synced = self._relex(script, lines, offsets, start, max(last, start + 1), clean, masked, hits, reused)
+
+        self._lines, self._clean, self._masked, self._hits = lines, clean, masked, hits
+        return self._findings()
+
+    def _relex(
+        self,
+        script: str,
+        lines: list[str],
+        offsets: list[int],
+        start: int,
+        minimum_stop: int,
+        clean: list[bool],
+        masked: list[str],
+        hits: list[list[tuple[Rule, int, int, str]]],
+        reused: list[bool],
+    ) -> int:
+        """Re-lex and re-scan from line `start` until back in step; returns the stop line."""
+        stop = -1
+        blanked: list[tuple[int, int]] = []
+        line = start + 1  # Next line start to classify.
+        end_of_file = len(lines)
+
+        def advance(limit: int) -> int:
+            """Mark line starts up to `limit` as clean; returns the stop line once back in step."""
+            nonlocal line
+            while line <= end_of_file and offsets[line] <= limit:
+                was_clean, clean[line] = clean[line], True
+                if line >= minimum_stop and reused[line] and was_clean:
+                    return line
+                line += 1
+            return -1
+
+        for span_start, span_end, is_text in iter_spans(script, offsets[start]):
+            stop = advance(span_start)
+            if stop >= 0:
+                break
+            # Line starts inside a comment, string or after a line continuation carry state.
+            while line <= end_of_file and offsets[line] <= span_end:
+                clean[line] = False
+                line += 1
+            if is_text:
+                blanked.append((span_start, span_end))
+        else:
+            stop = advance(len(script))
+        if stop < 0:
+            stop = end_of_file
+
+        region_start, region_end = offsets[start], offsets[stop]
+        raw = script[region_start:region_end]
+        parts: list[str] = []
+        position = region_start
+        for span_start, span_end in blanked:
+            parts.append(script[position:span_start])
+            parts.append(blank(script[span_start:span_end]))
+            position = span_end
+        parts.append(script[position:region_end])
+        code = "".join(parts)
+        masked[start:stop] = _split_lines(code) if code else []
+        if len(masked) != len(lines):
+            raise RuntimeError("Incremental validation lost track of line boundaries.")
+
+        region_offsets = [offset - region_start for offset in offsets[start : stop + 1]]
+        for index in range(start, stop):
+            hits[index] = []
+        for scope, view in (("text", raw), ("code", code)):
+            for rule, part, position, end in self.registry._scanner(self.target, scope).hits(view):
+                line = start + bisect_right(region_offsets, position) - 1
+                hits[line].append((rule, part, position - region_offsets[line - start], raw[position:end]))
+        self.rescanned_lines += stop - start
+        return stop
+
+    def _findings(self) -> list[Finding]:
+        findings: list[Finding] = []
+        seen: set[tuple[str, int]] = set()
+        for number, line_hits in enumerate(self._hits, start=1):
+            for rule, part, column, text in line_hits:
+                seen.add((rule.rule_id, part))
+                if rule.mode == "forbid":
+                    findings.append(_finding(rule, self.target, text, number, column + 1))
+        return findings + _missing(self.registry.rules_for(self.target), seen, self.target)
+
+
+class ValidationSession:
+    """Incremental validators for the detection and remediation script being edited."""
+
+    def __init__(self, registry: RuleRegistry):
+        self.registry = registry
+        self.detection = IncrementalValidator(registry, "detection")
+        self.remediation = IncrementalValidator(registry, "remediation")
+
+    @property
+    def rescanned_lines(self) -> int:
+        return self.detection.rescanned_lines + self.remediation.rescanned_lines
+
+
+def _line_opcodes(old: list[str], new: list[str]) -> list[tuple[str, int, int, int, int]]:
+    """Diff opcodes like `SequenceMatcher.get_opcodes`, trimming the common prefix and suffix first."""
+    prefix = 0
+    limit = min(len(old), len(new))
+    while prefix < limit and old[prefix] == new[prefix]:
+        prefix += 1
+    suffix = 0
+    while suffix < limit - prefix and old[-1 - suffix] == new[-1 - suffix]:
+        suffix += 1
+    old_end, new_end = len(old) - suffix, len(new) - suffix
+
+    opcodes = [("equal", 0, prefix, 0, prefix)] if prefix else []
+    if old_end - prefix <= MAX_DIFF_LINES and new_end - prefix <= MAX_DIFF_LINES:
+        matcher = SequenceMatcher(None, old[prefix:old_end], new[prefix:new_end], autojunk=False)
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            opcodes.append((tag, i1 + prefix, i2 + prefix, j1 + prefix, j2 + prefix))
+    elif old_end > prefix or new_end > prefix:
+        opcodes.append(("replace", prefix, old_end, prefix, new_end))
+    if suffix:
+        opcodes.append(("equal", old_end, len(old), new_end, len(new)))
+    return opcodes
+
+
+def _finding(rule: Rule, target: str, text: str, line: int, column: int) -> Finding:
+    return Finding(
+        rule_id=rule.rule_id,
+        severity=rule.severity,
+        message=rule.message.replace("{match}", text),
+        target=target,
+        line=line,
+        column=column,
+        match=text,
+    )
+
+
+def _missing(rules: list[Rule], seen: set[tuple[str, int]], target: str) -> list[Finding]:
+    return [
+        Finding(rule.rule_id, rule.severity, rule.message, target)
+        for rule in rules
+        if rule.mode == "require" and any((rule.rule_id, part) not in seen for part in range(len(rule.all_of) + 1))
+    ]
+
+
+def _split_lines(text: str) -> list[str]:
+    """Split after each `\\n`, keeping line endings, so masked lines line up with script lines."""
+    lines = text.split("\n")
+    result = [line + "\n" for line in lines[:-1]]
+    if lines[-1]:
+        result.append(lines[-1])
+    return result
+
+
+def _pattern(rule: Rule, part: int) -> str:
+    return rule.pattern if part == 0 else rule.all_of[part - 1]
+
+
+def _scoped(pattern: str, rule_flags: int) -> str:
+    """Wrap a pattern so its flags apply only to its own alternative."""
+    flags = ""
+    if rule_flags & re.IGNORECASE:
+        flags += "i"
+    if rule_flags & re.MULTILINE:
+        flags += "m"
+    if rule_flags & re.DOTALL:
+        flags += "s"
+    if rule_flags & re.VERBOSE:
+        flags += "x"
+    return f"(?{flags}:{pattern})" if flags else f"(?:{pattern})"
+
+
+def _line_starts(script: str) -> list[int]:
+    starts = [0]
+    index = script.find("\n")
+    while index != -1:
+        starts.append(index + 1)
+        index = script.find("\n", index + 1)
+    return starts
+
+
+# Process-wide registry used when a Utility is not given its own rule set.
+default_rule_registry = RuleRegistry()
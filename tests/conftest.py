@@ -0,0 +1,96 @@
+"""Shared fakes: an OpenAI-style client and a Utility wired to it, no network needed."""
+
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from collections.abc import Callable
+from types import SimpleNamespace
+from typing import Any
+
+import pytest
+
+from modules.prompt_cache import PromptCacheStats
+from modules.telemetry import TelemetryRecorder
+from modules.async_utility import AsyncUtility
+from modules.utility import BaseUtility, Utility
+
+SCRIPT = "try { Write-Output 'Compliant'; exit 0 } catch { Write-Output $_; exit 1 }"
+
+
+class FakeClient:
+    """Answers `chat.completions.create` with `reply(call_number, kwargs)`, counting calls.
+
+    `reply` may return text or raise; `latency` seconds are slept first.
+    """
+
+    def __init__(self, reply: Callable[[int, dict[str, Any]], str] | None = None, latency: float = 0.0):
+        self.reply = reply or (lambda _number, _kwargs: SCRIPT)
+        self.latency = latency
+        self.calls = 0
+        self.timeouts: list[float | None] = []
+        self.closed = False
+        self._lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def with_options(self, timeout: float | None = None) -> FakeClient:
+        self.timeouts.append(timeout)
+        return self
+
+    def close(self) -> None:
+        self.closed = True
+
+    def _create(self, **kwargs: Any) -> Any:
+        number = self._count()
+        if self.latency:
+            time.sleep(self.latency)
+        return self._respond(number, kwargs)
+
+    def _count(self) -> int:
+        with self._lock:
+            self.calls += 1
+            return self.calls
+
+    def _respond(self, number: int, kwargs: dict[str, Any]) -> Any:
+        text = self.reply(number, kwargs)
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=text))],
+            usage=SimpleNamespace(prompt_tokens=300, completion_tokens=200, total_tokens=500),
+        )
+
+
+class AsyncFakeClient(FakeClient):
+    """`FakeClient` for `AsyncUtility`: `create` is a coroutine and `close` is awaited.
+
+    `latency` is awaited, so other tasks on the loop keep running meanwhile.
+    """
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._acreate))
+
+    async def close(self) -> None:
+        self.closed = True
+
+    async def _acreate(self, **kwargs: Any) -> Any:
+        number = self._count()
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._respond(number, kwargs)
+
+
+@pytest.fixture
+def make_utility() -> Callable[..., Utility]:
+    """`Utility` (or `cls=AsyncUtility`) on a fake client, with its own telemetry and prompt stats."""
+
+    def build(client: Any = None, cls: type[BaseUtility] = Utility, **kwargs: Any) -> Any:
+        kwargs.setdefault("telemetry", TelemetryRecorder())
+        kwargs.setdefault("prompt_cache_stats", PromptCacheStats())
+        if "deployment_pool" in kwargs:
+            return cls(model_name="", **kwargs)
+        utility = cls(model_name="gpt-4o", provider="openai", api_key="test", **kwargs)
+        utility._client = client or (AsyncFakeClient() if cls is AsyncUtility else FakeClient())
+        return utility
+
+    return build
@@ -0,0 +1,72 @@
+from __future__ import annotations
+
+import json
+import socket
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import pytest
+
+from modules import api_server
+from modules.api_server import ApiServer, ApiService, ServerConfig
+
+
+@pytest.fixture
+def server(monkeypatch):
+    monkeypatch.setattr(api_server, "MAX_PENDING_REJECTIONS", 2)
+    service = ApiService(ServerConfig())
+    release = threading.Event()
+    health = service.health
+
+    def slow_health():
+        release.wait(5)
+        return health()
+
+    monkeypatch.setattr(service, "health", slow_health)
+    instance = ApiServer(service, port=0, workers=1, max_queue=0)
+    thread = threading.Thread(target=instance.serve_forever, daemon=True)
+    thread.start()
+    yield instance, release
+    release.set()
+    instance.shutdown()
+    instance.server_close()
+
+
+def _get(instance: ApiServer, path: str) -> tuple[int, dict]:
+    url = f"http://127.0.0.1:{instance.server_address[1]}{path}"
+    try:
+        with urllib.request.urlopen(url, timeout=5) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as exc:
+        return exc.code, json.loads(exc.read())
+
+
+def test_over_limit_connections_are_refused_then_dropped(server):
+    instance, release = server
+    busy = threading.Thread(target=_get, args=(instance, "/healthz"))
+    busy.start()
+    while instance.stats()["active"] < 1:
+        time.sleep(0.01)
+
+    status, body = _get(instance, "/metrics")
+    assert status == 503 and "busy" in body["error"]
+
+    # Idle clients keep their refusals lingering, so only two can be pending at once.
+    idle = [socket.create_connection(instance.server_address, timeout=5) for _ in range(10)]
+    while instance.stats()["rejected"] + instance.stats()["dropped"] < 11:
+        time.sleep(0.01)
+    stats = instance.stats()
+    assert stats["dropped"] >= 6
+    assert stats["accepted"] == 1
+    for connection in idle:
+        connection.close()
+
+    release.set()
+    busy.join(5)
+    while instance.stats()["active"]:
+        time.sleep(0.01)
+    status, body = _get(instance, "/metrics")
+    assert status == 200
+    assert body["pool"]["dropped"] == stats["dropped"]
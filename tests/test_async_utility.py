@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+
+from modules.async_utility import AsyncUtility
+from modules.deployment_pool import Deployment, DeploymentPool
+from tests.conftest import SCRIPT, AsyncFakeClient, FakeClient
+
+
+def _picky_reply(number, kwargs):
+    """Rejects `max_tokens` and a non-default temperature, the way newer models do."""
+    if "max_tokens" in kwargs:
+        raise ValueError("Unsupported parameter: 'max_tokens'. Use 'max_completion_tokens' instead.")
+    if "temperature" in kwargs:
+        raise ValueError("Unsupported value: 'temperature' does not support 0.2. Only the default (1) is supported.")
+    return SCRIPT
+
+
+@pytest.mark.parametrize("async_path", [False, True])
+def test_sync_and_async_relax_rejected_parameters_the_same_way(make_utility, async_path):
+    if async_path:
+        client = AsyncFakeClient(_picky_reply)
+        utility = make_utility(client, cls=AsyncUtility)
+        artifact = asyncio.run(utility.generate("Check BitLocker", include_remediation=False))
+    else:
+        client = FakeClient(_picky_reply)
+        utility = make_utility(client)
+        artifact = utility.generate("Check BitLocker", include_remediation=False)
+    assert artifact.detection_script == SCRIPT
+    assert client.calls == 3
+    totals = utility.telemetry.totals()
+    assert (totals["calls"], totals["errors"], totals["fallback_attempts"]) == (1, 0, 2)
+
+
+@pytest.mark.parametrize("async_path", [False, True])
+def test_unrelaxable_errors_are_raised_and_recorded(make_utility, async_path):
+    def reply(_number, _kwargs):
+        raise PermissionError("401 Unauthorized")
+
+    if async_path:
+        utility = make_utility(AsyncFakeClient(reply), cls=AsyncUtility)
+        with pytest.raises(PermissionError):
+            asyncio.run(utility.generate("Check BitLocker", include_remediation=False))
+    else:
+        utility = make_utility(FakeClient(reply))
+        with pytest.raises(PermissionError):
+            utility.generate("Check BitLocker", include_remediation=False)
+    assert utility.telemetry.totals()["errors"] == 1
+
+
+def test_aclose_closes_the_client_it_created(make_utility):
+    client = AsyncFakeClient()
+    utility = make_utility(client, cls=AsyncUtility)
+
+    async def run():
+        async with utility:
+            await utility.generate("Check BitLocker", include_remediation=False)
+
+    asyncio.run(run())
+    assert client.closed
+
+
+def test_aclose_leaves_shared_pool_clients_open(make_utility):
+    own = AsyncFakeClient()
+    shared = AsyncFakeClient()
+    pool = DeploymentPool(
+        [
+            Deployment("own", own, "gpt-4o", provider="openai", owns_client=True),
+            Deployment("shared", shared, "gpt-4o", provider="openai"),
+        ]
+    )
+    utility = make_utility(cls=AsyncUtility, deployment_pool=pool)
+    asyncio.run(utility.aclose())
+    assert own.closed
+    assert not shared.closed
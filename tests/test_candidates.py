@@ -0,0 +1,85 @@
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+
+from modules.async_utility import AsyncUtility
+from modules.utility import ScriptArtifact
+from tests.conftest import SCRIPT
+
+NO_EXIT_CODES = "Write-Output 'Compliant'"
+MUTATES = SCRIPT + "\nRemove-Item C:\\Temp\\x"
+
+
+class Boom(RuntimeError):
+    pass
+
+
+def _stub_candidates(utility, outcomes: list[str | BaseException], async_path: bool) -> None:
+    """Replace `_generate_candidate` so variant `n` returns or raises `outcomes[n]`."""
+
+    def outcome(variant: int) -> ScriptArtifact:
+        value = outcomes[variant]
+        if isinstance(value, BaseException):
+            raise value
+        return utility._build_artifact("Check BitLocker", value, "", False)
+
+    if async_path:
+
+        async def generate_candidate(*args, variant: int = 0, **_kwargs):
+            return outcome(args[6] if len(args) > 6 else variant)
+
+    else:
+
+        def generate_candidate(*args, variant: int = 0, **_kwargs):
+            return outcome(args[7] if len(args) > 7 else variant)
+
+    utility._generate_candidate = generate_candidate
+
+
+def _generate(utility, async_path: bool, candidates: int) -> ScriptArtifact:
+    work = utility.generate("Check BitLocker", include_remediation=False, candidates=candidates)
+    return asyncio.run(work) if async_path else work
+
+
+@pytest.mark.parametrize("async_path", [False, True])
+def test_candidate_with_fewest_findings_wins(make_utility, async_path):
+    utility = make_utility(cls=AsyncUtility) if async_path else make_utility()
+    _stub_candidates(utility, [NO_EXIT_CODES, Boom("429 Too Many Requests"), MUTATES, SCRIPT], async_path)
+
+    best = _generate(utility, async_path, candidates=4)
+
+    assert best.detection_script == SCRIPT
+    assert [alternate.detection_script for alternate in best.alternates] == [MUTATES, NO_EXIT_CODES]
+    assert best.score > best.alternates[0].score > best.alternates[1].score
+
+
+def test_scores_penalise_findings_and_mutations(make_utility):
+    utility = make_utility()
+
+    def score(script: str) -> float:
+        return utility._score_artifact(utility._build_artifact("Check BitLocker", script, "", False))
+
+    assert score(SCRIPT) > score(MUTATES) > score(NO_EXIT_CODES)
+
+
+def test_equal_scores_keep_the_earliest_candidate_and_drop_duplicates(make_utility):
+    utility = make_utility()
+    first = utility._build_artifact("Check BitLocker", SCRIPT, "", False)
+    duplicate = utility._build_artifact("Check BitLocker", SCRIPT, "", False)
+    other = utility._build_artifact("Check BitLocker", SCRIPT.replace("Compliant", "OK"), "", False)
+
+    best = utility._select_best([first, duplicate, other])
+
+    assert best is first
+    assert best.alternates == [other]
+
+
+@pytest.mark.parametrize("async_path", [False, True])
+def test_all_failed_candidates_raise_the_first_candidate_error(make_utility, async_path):
+    utility = make_utility(cls=AsyncUtility) if async_path else make_utility()
+    _stub_candidates(utility, [Boom("quota exceeded"), ValueError("bad request"), Boom("401")], async_path)
+
+    with pytest.raises(Boom, match="quota exceeded"):
+        _generate(utility, async_path, candidates=3)
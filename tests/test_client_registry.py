@@ -0,0 +1,65 @@
+from __future__ import annotations
+
+import threading
+
+import pytest
+
+from modules.client_registry import ClientRegistry
+
+ENDPOINT = "https://east.openai.azure.com"
+
+
+@pytest.fixture
+def registry():
+    registry = ClientRegistry()
+    yield registry
+    registry.clear()
+
+
+def test_same_settings_share_one_client(registry):
+    first = registry.get("azure", "key-1", ENDPOINT + "/", "2024-10-21")
+    assert registry.get("azure", "key-1", ENDPOINT, "2024-10-21") is first
+    assert registry.get("openai", "key-1") is registry.get("openai", "key-1")
+    assert registry.stats() == {"created": 2, "reused": 2, "clients": 2}
+
+
+@pytest.mark.parametrize(
+    "changed",
+    [
+        {"api_key": "key-2"},
+        {"endpoint": "https://west.openai.azure.com"},
+        {"api_version": "2025-01-01-preview"},
+        {"max_retries": 0},
+    ],
+)
+def test_different_keys_or_endpoints_get_their_own_client(registry, changed):
+    settings = {"api_key": "key-1", "endpoint": ENDPOINT, "api_version": "2024-10-21"}
+    first = registry.get("azure", **settings)
+    assert registry.get("azure", **{**settings, **changed}) is not first
+    assert registry.stats() == {"created": 2, "reused": 0, "clients": 2}
+
+
+def test_concurrent_first_use_creates_one_client(registry):
+    clients = []
+    threads = [threading.Thread(target=lambda: clients.append(registry.get("openai", "key-1"))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len({id(client) for client in clients}) == 1
+    assert registry.stats() == {"created": 1, "reused": 7, "clients": 1}
+
+
+def test_clear_closes_clients_and_later_calls_create_new_ones(registry):
+    first = registry.get("openai", "key-1", max_retries=1)
+    assert first.max_retries == 1
+    registry.clear()
+    assert first.is_closed()
+    assert registry.get("openai", "key-1", max_retries=1) is not first
+    assert registry.stats() == {"created": 2, "reused": 0, "clients": 1}
+
+
+def test_unknown_provider_is_rejected(registry):
+    with pytest.raises(ValueError, match="Unsupported provider"):
+        registry.get("anthropic", "key-1")
+    assert registry.stats()["clients"] == 0
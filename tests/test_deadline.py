@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+import time
+
+import pytest
+
+from modules.deadline import Deadline, DeadlineExceeded, request_timeout
+from tests.conftest import SCRIPT, FakeClient
+
+
+class Boom(RuntimeError):
+    pass
+
+
+def test_deadline_budget_shrinks_and_cancel_expires_it():
+    now = [100.0]
+    deadline = Deadline(10, clock=lambda: now[0])
+    now[0] += 4
+    assert deadline.remaining() == pytest.approx(6)
+    assert deadline.timeout(cap=2) == 2
+    assert request_timeout(deadline, 45) == pytest.approx(6)
+    deadline.cancel()
+    assert deadline.expired
+    with pytest.raises(DeadlineExceeded, match="cancelled"):
+        deadline.check("upload")
+
+
+def test_unbounded_deadline_keeps_defaults():
+    assert Deadline.never().remaining() is None
+    assert request_timeout(Deadline.never(), 45) == 45
+    assert request_timeout(None, 45) == 45
+
+
+def test_llm_call_timeout_is_the_remaining_budget(make_utility):
+    client = FakeClient()
+    utility = make_utility(client)
+    utility.generate("Check that BitLocker is enabled", include_remediation=False, deadline=Deadline.after(30))
+    assert client.timeouts and 0 < client.timeouts[0] <= 30
+
+
+def test_expired_deadline_stops_before_calling(make_utility):
+    client = FakeClient()
+    utility = make_utility(client)
+    deadline = Deadline.after(30)
+    deadline.cancel()
+    with pytest.raises(DeadlineExceeded):
+        utility.generate("Check that BitLocker is enabled", include_remediation=False, deadline=deadline)
+    assert client.calls == 0
+
+
+@pytest.mark.parametrize("candidates", [1, 3])
+def test_candidate_failures_are_not_reported_as_timeouts(make_utility, candidates):
+    def reply(_number, _kwargs):
+        raise Boom("401 Unauthorized")
+
+    utility = make_utility(FakeClient(reply))
+    with pytest.raises(Boom):
+        utility.generate("Check that BitLocker is enabled", include_remediation=False, candidates=candidates)
+
+
+def test_unfinished_candidates_raise_deadline_exceeded(make_utility):
+    utility = make_utility(FakeClient(latency=1.0))
+    started = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        utility.generate(
+            "Check that BitLocker is enabled",
+            include_remediation=False,
+            candidates=3,
+            deadline=Deadline.after(0.2),
+        )
+    assert time.monotonic() - started < 0.9
+
+
+def test_real_failure_wins_over_timeout_of_other_candidates(make_utility):
+    def reply(number, _kwargs):
+        if number == 1:
+            raise Boom("quota exceeded")
+        time.sleep(1.0)
+        return SCRIPT
+
+    utility = make_utility(FakeClient(reply))
+    with pytest.raises(Boom):
+        utility.generate(
+            "Check that BitLocker is enabled",
+            include_remediation=False,
+            candidates=2,
+            deadline=Deadline.after(0.3),
+        )
+
+
+def test_one_successful_candidate_is_enough(make_utility):
+    def reply(number, _kwargs):
+        if number == 1:
+            raise Boom("429 Too Many Requests")
+        return SCRIPT
+
+    utility = make_utility(FakeClient(reply))
+    artifact = utility.generate("Check that BitLocker is enabled", include_remediation=False, candidates=3)
+    assert artifact.detection_script == SCRIPT
@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from modules.async_utility import AsyncUtility
+from modules.deadline import Deadline, DeadlineExceeded
+from modules.deployment_pool import Deployment, DeploymentPool, DeploymentUnavailableError
+from tests.conftest import AsyncFakeClient, FakeClient
+
+
+class Throttled(RuntimeError):
+    status_code = 429
+
+    def __init__(self, retry_after: str = "20"):
+        super().__init__("429 Too Many Requests")
+        self.response = SimpleNamespace(headers={"retry-after": retry_after})
+
+
+class BadRequest(RuntimeError):
+    status_code = 400
+
+
+@pytest.fixture
+def now():
+    return [1000.0]
+
+
+def _pool(now, **limits) -> DeploymentPool:
+    deployments = [
+        Deployment("primary", FakeClient(), "gpt-4o", "openai", **limits),
+        Deployment("secondary", FakeClient(), "gpt-4o", "openai", priority=1),
+    ]
+    return DeploymentPool(deployments, max_wait_seconds=0, clock=lambda: now[0])
+
+
+def _rows(pool: DeploymentPool) -> dict[str, dict]:
+    return {row["name"]: row for row in pool.snapshot()}
+
+
+def test_throttled_deployment_fails_over_and_cools_down(now):
+    pool = _pool(now)
+    served = []
+
+    def invoke(deployment):
+        served.append(deployment.name)
+        if deployment.name == "primary":
+            raise Throttled()
+        return "ok"
+
+    assert pool.call(invoke) == "ok"
+    assert served == ["primary", "secondary"]
+    rows = _rows(pool)
+    assert not rows["primary"]["healthy"] and rows["primary"]["cooldown_remaining_s"] == 20
+    # While primary cools down the lower-priority tier serves directly.
+    assert pool.call(invoke) == "ok"
+    assert served[-1] == "secondary"
+    now[0] += 21
+    assert pool.select().name == "primary"
+
+
+def test_non_retryable_errors_do_not_fail_over(now):
+    pool = _pool(now)
+
+    def invoke(deployment):
+        raise BadRequest("400 bad request")
+
+    with pytest.raises(BadRequest):
+        pool.call(invoke)
+    assert all(row["healthy"] and row["in_flight"] == 0 for row in pool.snapshot())
+
+
+def test_every_deployment_failing_raises_unavailable(now):
+    pool = _pool(now)
+    with pytest.raises(DeploymentUnavailableError, match="429"):
+        pool.call(lambda deployment: (_ for _ in ()).throw(Throttled()))
+
+
+def test_cooldown_wait_beyond_the_deadline_raises(now):
+    pool = DeploymentPool([Deployment("only", FakeClient(), "gpt-4o")], clock=lambda: now[0])
+    with pytest.raises(DeploymentUnavailableError):
+        pool.call(lambda deployment: (_ for _ in ()).throw(Throttled()))
+    # The next call would wait 20 s for the cooldown, but only 5 s are left.
+    with pytest.raises(DeadlineExceeded, match="cooldown"):
+        pool.call(lambda deployment: "ok", deadline=Deadline(5, clock=lambda: now[0]))
+
+
+def test_tpm_window_counts_reported_tokens_and_falls_back_to_estimate(now):
+    pool = _pool(now, tpm_limit=1000)
+    pool.call(lambda deployment: ("ok", 700), estimated_tokens=100, tokens_used=lambda result: result[1])
+    assert _rows(pool)["primary"]["tpm"] == 700
+    # 700 used + 400 estimated exceeds the limit, so the next call goes to the other tier.
+    assert pool.select(estimated_tokens=400).name == "secondary"
+    pool.call(
+        lambda deployment: ("ok", 0),
+        estimated_tokens=50,
+        exclude=frozenset({"secondary"}),
+        tokens_used=lambda result: result[1],
+    )
+    assert _rows(pool)["primary"]["tpm"] == 750
+    now[0] += 61
+    assert _rows(pool)["primary"]["tpm"] == 0
+
+
+@pytest.mark.parametrize("async_path", [False, True])
+def test_utility_records_provider_usage_in_the_pool(make_utility, now, async_path):
+    client = AsyncFakeClient() if async_path else FakeClient()
+    pool = DeploymentPool([Deployment("primary", client, "gpt-4o", "openai")], clock=lambda: now[0])
+    if async_path:
+        utility = make_utility(cls=AsyncUtility, deployment_pool=pool)
+        asyncio.run(utility._invoke_gpt_call("Check the firewall", "system", 0.2, 1600))
+    else:
+        utility = make_utility(deployment_pool=pool)
+        utility._invoke_gpt_call("Check the firewall", "system", 0.2, 1600)
+    # The fake reports 300 prompt + 200 completion tokens, not the 1600-token estimate.
+    assert _rows(pool)["primary"]["tpm"] == 500
@@ -0,0 +1,125 @@
+from __future__ import annotations
+
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from modules.graph_auth import GraphTokenProvider
+
+
+class FakeCredential:
+    """Issues `token-1`, `token-2`, ... valid for `lifetime` seconds on the shared fake clock."""
+
+    def __init__(self, clock: list[float], lifetime: float = 3600.0):
+        self.clock = clock
+        self.lifetime = lifetime
+        self.calls = 0
+        self.fail: Exception | None = None
+        self.release = threading.Event()
+        self.release.set()
+        self._lock = threading.Lock()
+
+    def get_token(self, scope: str) -> SimpleNamespace:
+        assert scope == "https://graph.microsoft.com/.default"
+        with self._lock:
+            self.calls += 1
+            calls = self.calls
+        self.release.wait(5)
+        if self.fail is not None:
+            raise self.fail
+        return SimpleNamespace(token=f"token-{calls}", expires_on=self.clock[0] + self.lifetime)
+
+
+@pytest.fixture
+def clock():
+    return [1000.0]
+
+
+@pytest.fixture
+def credential(clock):
+    return FakeCredential(clock)
+
+
+@pytest.fixture
+def provider(credential, clock):
+    return GraphTokenProvider(
+        credential, "https://graph.microsoft.com/.default", refresh_margin_seconds=300, clock=lambda: clock[0]
+    )
+
+
+def _join_background(provider: GraphTokenProvider) -> None:
+    if provider._background is not None:
+        provider._background.join(5)
+
+
+def test_cached_token_is_reused_until_the_refresh_margin(provider, credential, clock):
+    assert provider.token() == "token-1"
+    clock[0] += 3000
+    assert provider.token() == "token-1"
+    assert provider.auth_header()["Authorization"] == "Bearer token-1"
+    assert credential.calls == 1
+    assert provider.connected
+
+
+def test_token_inside_the_margin_is_served_while_refreshing_in_background(provider, credential, clock):
+    provider.token()
+    clock[0] += 3400
+    assert provider.token() == "token-1"
+    _join_background(provider)
+    assert credential.calls == 2
+    assert provider.token() == "token-2"
+    assert provider.expires_on == clock[0] + 3600
+
+
+def test_expired_or_invalidated_tokens_are_refreshed_in_the_foreground(provider, credential, clock):
+    provider.token()
+    clock[0] += 3600
+    assert not provider.connected
+    assert provider.token() == "token-2"
+
+    provider.invalidate("token-1")
+    assert provider.token() == "token-2"
+    provider.invalidate("token-2")
+    assert provider.token() == "token-3"
+
+
+def test_concurrent_callers_share_one_refresh(provider, credential):
+    credential.release.clear()
+    tokens: list[str] = []
+    threads = [threading.Thread(target=lambda: tokens.append(provider.token())) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    deadline = time.monotonic() + 5
+    while credential.calls == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    time.sleep(0.05)
+    credential.release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert credential.calls == 1
+    assert tokens == ["token-1"] * 8
+
+
+def test_refresh_failures(provider, credential, clock):
+    credential.fail = RuntimeError("sign-in required")
+    with pytest.raises(RuntimeError, match="sign-in required"):
+        provider.token()
+
+    credential.fail = None
+    provider.token()
+    clock[0] += 3400
+    credential.fail = RuntimeError("network down")
+    # A failed background refresh keeps the still-valid token and records the error.
+    assert provider.token() == "token-2"
+    _join_background(provider)
+    assert provider.last_error == "network down"
+    assert provider.token() == "token-2"
+
+    _join_background(provider)
+    clock[0] += 300
+    credential.fail = None
+    assert provider.token().startswith("token-")
+    assert provider.last_error == ""
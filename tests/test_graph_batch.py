@@ -0,0 +1,120 @@
+from __future__ import annotations
+
+import threading
+from collections.abc import Callable
+from types import SimpleNamespace
+from typing import Any
+
+from modules.deadline import Deadline
+from modules.graph_batch import GraphBatchPublisher
+
+Reply = Callable[[dict[str, Any]], dict[str, Any]]
+
+
+def _created(request: dict[str, Any]) -> dict[str, Any]:
+    return {"id": request["id"], "status": 201, "body": {"displayName": request["body"]["displayName"]}}
+
+
+class FakeSession:
+    """Answers `$batch` posts item by item with `reply`, or whole batches with `batch_status`."""
+
+    def __init__(self, reply: Reply = _created, batch_status: list[int] | None = None):
+        self.reply = reply
+        self.batch_status = list(batch_status or [])
+        self.batches: list[list[str]] = []
+        self._lock = threading.Lock()
+
+    def post(self, url: str, headers: dict[str, str], json: dict[str, Any], timeout: float) -> Any:
+        assert url == "https://graph.test/beta/$batch"
+        with self._lock:
+            self.batches.append([request["id"] for request in json["requests"]])
+            status = self.batch_status.pop(0) if self.batch_status else 200
+        if status != 200:
+            return SimpleNamespace(status_code=status, text="busy", headers={"Retry-After": "3"}, json=dict)
+        responses = [self.reply(request) for request in json["requests"]]
+        return SimpleNamespace(status_code=200, text="", headers={}, json=lambda: {"responses": responses})
+
+
+def _publisher(session: FakeSession, sleeps: list[float], **kwargs: Any) -> GraphBatchPublisher:
+    return GraphBatchPublisher(
+        {"Authorization": "Bearer t"}, "https://graph.test/beta/", session=session, sleep=sleeps.append, **kwargs
+    )
+
+
+def _payloads(count: int) -> list[dict[str, Any]]:
+    return [{"displayName": f"Script {index}"} for index in range(count)]
+
+
+def test_payloads_are_sent_twenty_per_batch_and_returned_in_order():
+    session = FakeSession()
+    results = _publisher(session, []).publish(_payloads(45))
+
+    assert sorted(len(batch) for batch in session.batches) == [5, 20, 20]
+    assert sorted(int(index) for batch in session.batches for index in batch) == list(range(45))
+    assert [result.index for result in results] == list(range(45))
+    assert all(result.ok and result.attempts == 1 and result.action == "created" for result in results)
+    assert results[44].body == {"displayName": "Script 44"}
+
+
+def test_item_failures_map_to_their_own_payloads():
+    def reply(request: dict[str, Any]) -> dict[str, Any]:
+        if request["id"] == "1":
+            return {"id": "1", "status": 400, "body": {"error": {"message": "Bad displayName"}}}
+        return _created(request)
+
+    session = FakeSession(reply)
+    results = _publisher(session, []).publish(_payloads(3))
+
+    assert [result.ok for result in results] == [True, False, True]
+    assert results[1].status_code == 400
+    assert results[1].error == "Graph request failed (400): Bad displayName"
+    assert results[1].attempts == 1
+    assert len(session.batches) == 1
+
+
+def test_throttled_items_are_retried_after_the_largest_retry_after():
+    throttled: set[str] = set()
+
+    def reply(request: dict[str, Any]) -> dict[str, Any]:
+        if request["id"] in {"0", "2"} and request["id"] not in throttled:
+            throttled.add(request["id"])
+            return {"id": request["id"], "status": 429, "headers": {"Retry-After": str(4 + int(request["id"]))}}
+        return _created(request)
+
+    session = FakeSession(reply)
+    sleeps: list[float] = []
+    results = _publisher(session, sleeps).publish(_payloads(3))
+
+    assert session.batches == [["0", "1", "2"], ["0", "2"]]
+    assert sleeps == [6.0]
+    assert [result.attempts for result in results] == [2, 1, 2]
+    assert all(result.ok for result in results)
+
+
+def test_failed_batches_back_off_until_max_attempts():
+    session = FakeSession(batch_status=[429, 503, 503, 503])
+    sleeps: list[float] = []
+    results = _publisher(session, sleeps, max_attempts=3).publish(_payloads(2))
+
+    assert len(session.batches) == 3
+    assert sleeps == [3.0, 3.0]
+    assert [(result.status_code, result.attempts) for result in results] == [(503, 3), (503, 3)]
+    assert results[0].error == "Graph batch failed (503): busy"
+
+
+def test_retries_stop_at_the_deadline():
+    now = [0.0]
+    deadline = Deadline(10, clock=lambda: now[0])
+    session = FakeSession(lambda request: {"id": request["id"], "status": 429, "headers": {"Retry-After": "30"}})
+    sleeps: list[float] = []
+    results = _publisher(session, sleeps).publish(_payloads(2), deadline)
+
+    assert len(session.batches) == 1
+    assert sleeps == []
+    assert results[0].error.startswith("Deadline exceeded while waiting to retry. Last error: Graph request failed (429)")
+
+    now[0] = 11.0
+    session = FakeSession()
+    results = _publisher(session, sleeps).publish(_payloads(2), deadline)
+    assert session.batches == []
+    assert [result.error for result in results] == ["Deadline exceeded before the item was published."] * 2
@@ -0,0 +1,71 @@
+from __future__ import annotations
+
+from types import SimpleNamespace
+from typing import Any
+
+from modules.graph_batch import BatchOperation, PublishResult
+from modules.graph_inventory import GraphInventory, upsert
+
+
+class FakeGraph:
+    """A tenant's script collection behind both the listing session and the `$batch` publisher."""
+
+    def __init__(self):
+        self.scripts: dict[str, dict[str, Any]] = {}
+        self.reads = 0
+        self.writes: list[str] = []
+        self._clock = 0
+
+    def get(self, url: str, **_kwargs: Any) -> Any:
+        value = [
+            {"id": script_id, "displayName": body["displayName"], "lastModifiedDateTime": body["lastModifiedDateTime"]}
+            for script_id, body in self.scripts.items()
+        ]
+        return SimpleNamespace(status_code=200, text="", json=lambda: {"value": value})
+
+    def execute(self, operations: list[BatchOperation], deadline: Any = None) -> list[PublishResult]:
+        results = []
+        for index, operation in enumerate(operations):
+            script_id = operation.url.rsplit("/", 1)[-1]
+            if operation.method == "GET":
+                self.reads += 1
+                results.append(PublishResult(index, operation.display_name, 200, dict(self.scripts[script_id])))
+                continue
+            self.writes.append(operation.method)
+            self._clock += 1
+            stamp = f"2026-01-01T00:00:{self._clock:02d}Z"
+            if operation.method == "POST":
+                script_id = f"id-{len(self.scripts)}"
+                self.scripts[script_id] = {**operation.body, "id": script_id, "lastModifiedDateTime": stamp}
+                results.append(PublishResult(index, operation.display_name, 201, dict(self.scripts[script_id])))
+            else:
+                self.scripts[script_id].update(operation.body, lastModifiedDateTime=stamp)
+                results.append(PublishResult(index, operation.display_name, 204))
+            results[-1].action = operation.action
+        return results
+
+
+def _payload(name: str, content: str) -> dict[str, Any]:
+    return {"displayName": name, "detectionScriptContent": content}
+
+
+def test_upsert_dedupes_names_and_skips_unchanged_without_rereading():
+    graph = FakeGraph()
+    inventory = GraphInventory("https://graph.test/beta/", session=graph, max_age_seconds=0)
+
+    first = upsert([_payload("A", "v1"), _payload("a ", "v2"), _payload("B", "v1")], inventory, graph, {})
+    assert [result.action for result in first] == ["duplicate", "created", "created"]
+    assert not first[0].ok
+    assert graph.writes == ["POST", "POST"]
+    assert graph.scripts["id-0"]["detectionScriptContent"] == "v2"
+
+    second = upsert([_payload("A", "v3"), _payload("B", "v1")], inventory, graph, {})
+    assert [result.action for result in second] == ["updated", "unchanged"]
+    # Created scripts kept their fingerprints through the POST response timestamp.
+    assert graph.reads == 0
+
+    third = upsert([_payload("A", "v3"), _payload("B", "v1")], inventory, graph, {})
+    assert [result.action for result in third] == ["unchanged", "unchanged"]
+    # The PATCH answered 204, so the listed timestamp was adopted instead of a re-read.
+    assert graph.reads == 0
+    assert graph.writes == ["POST", "POST", "PATCH"]
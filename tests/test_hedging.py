@@ -0,0 +1,139 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from modules.async_utility import AsyncUtility
+from modules.deadline import Deadline, DeadlineExceeded
+from modules.deployment_pool import Deployment, DeploymentPool
+from modules.hedging import RequestHedger
+from tests.conftest import SCRIPT, AsyncFakeClient, FakeClient
+
+
+def _hedger(delay: float = 0.05) -> RequestHedger:
+    return RequestHedger(initial_delay_seconds=delay, min_delay_seconds=delay, max_delay_seconds=delay)
+
+
+def _slow(result: str, seconds: float):
+    def run():
+        time.sleep(seconds)
+        return result
+
+    return run
+
+
+def _fail(message: str):
+    def run():
+        raise RuntimeError(message)
+
+    return run
+
+
+def test_fast_primary_does_not_fire_a_hedge():
+    hedger = _hedger()
+    assert hedger.call(lambda: "primary", _fail("hedge should not run")) == "primary"
+    assert hedger.stats()["hedges_fired"] == 0
+
+
+def test_slow_primary_loses_to_the_hedge():
+    hedger = _hedger()
+    assert hedger.call(_slow("primary", 1.0), lambda: "hedge") == "hedge"
+    stats = hedger.stats()
+    assert (stats["hedges_fired"], stats["hedge_wins"]) == (1, 1)
+
+
+def test_failed_hedge_falls_back_to_the_primary():
+    hedger = _hedger()
+    assert hedger.call(_slow("primary", 0.2), _fail("hedge broke")) == "primary"
+    assert hedger.stats()["primary_wins_after_hedge"] == 1
+
+
+def test_both_attempts_failing_raises_the_first_error():
+    hedger = _hedger()
+
+    def primary():
+        time.sleep(0.1)
+        raise RuntimeError("primary broke")
+
+    with pytest.raises(RuntimeError, match="hedge broke"):
+        hedger.call(primary, _fail("hedge broke"))
+
+
+def test_deadline_stops_waiting_for_both_attempts():
+    hedger = _hedger()
+    started = time.perf_counter()
+    with pytest.raises(DeadlineExceeded):
+        hedger.call(_slow("primary", 1.0), _slow("hedge", 1.0), deadline=Deadline(0.2))
+    assert time.perf_counter() - started < 0.5
+
+
+def test_delay_follows_the_latency_percentile():
+    hedger = RequestHedger(percentile=90, min_samples=10, min_delay_seconds=0.0)
+    for latency in range(1, 11):
+        hedger._finish((latency / 100, None))
+    assert hedger.delay() == pytest.approx(0.09)
+
+
+def test_async_hedge_wins_and_the_primary_is_cancelled():
+    hedger = _hedger()
+    cancelled = threading.Event()
+
+    async def primary():
+        try:
+            await asyncio.sleep(1.0)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+        return "primary"
+
+    async def hedge():
+        return "hedge"
+
+    async def run():
+        result = await hedger.acall(primary, hedge)
+        await asyncio.sleep(0)
+        return result
+
+    assert asyncio.run(run()) == "hedge"
+    assert cancelled.is_set()
+
+
+@pytest.mark.parametrize("async_path", [False, True])
+def test_hedge_goes_to_another_deployment(make_utility, async_path):
+    fake = AsyncFakeClient if async_path else FakeClient
+    slow, fast = fake(latency=1.0), fake()
+    pool = DeploymentPool(
+        [
+            Deployment("slow", slow, "gpt-4o", "openai"),
+            Deployment("fast", fast, "gpt-4o", "openai", priority=1),
+        ]
+    )
+    if async_path:
+        utility = make_utility(cls=AsyncUtility, deployment_pool=pool, hedger=_hedger())
+        text = asyncio.run(utility._invoke_gpt_call("Check the firewall", "system", 0.2, 400))
+    else:
+        utility = make_utility(deployment_pool=pool, hedger=_hedger())
+        text = utility._invoke_gpt_call("Check the firewall", "system", 0.2, 400)
+    assert text == SCRIPT
+    assert (slow.calls, fast.calls) == (1, 1)
+    assert utility.hedger.stats()["hedge_wins"] == 1
+
+
+def test_primaries_do_not_queue_behind_the_hedge_pool():
+    hedger = RequestHedger(initial_delay_seconds=0.3, min_delay_seconds=0.3, max_workers=1)
+    results: list[str] = []
+    threads = [
+        threading.Thread(target=lambda: results.append(hedger.call(_slow("primary", 0.2), lambda: "hedge")))
+        for _ in range(6)
+    ]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == ["primary"] * 6
+    assert hedger.stats()["hedges_fired"] == 0
+    assert time.perf_counter() - started < 0.6
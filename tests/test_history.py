@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+import sqlite3
+
+import pytest
+
+from modules.history import HistoryStore, fts_query
+
+
+@pytest.fixture
+def store(tmp_path):
+    return HistoryStore(tmp_path / "history.sqlite")
+
+
+def _descriptions(store: HistoryStore, query: str) -> list[str]:
+    return [item.description for item in store.page(query)]
+
+
+def test_search_matches_word_prefixes_in_descriptions_and_scripts(store):
+    store.save("Check BitLocker status", "Get-BitLockerVolume; exit 0", "", "detection")
+    store.save("Firewall profile", "Get-NetFirewallProfile # bitlocker unrelated", "", "detection")
+    store.save("Time service", "Get-Service w32time", "Start-Service w32time", "both")
+
+    # Description matches rank above script-body matches.
+    assert _descriptions(store, "bitlock") == ["Check BitLocker status", "Firewall profile"]
+    assert _descriptions(store, "start-service w32") == ["Time service"]
+    assert store.count("w32time") == 1
+    assert store.count("") == 3
+    assert fts_query('a "quoted" term') == '"a"* "quoted"* "term"*'
+
+
+def test_saving_the_same_scripts_again_reindexes_the_description(store):
+    store.save("Old wording", "Get-Service w32time", "", "detection")
+    store.save("New wording", "Get-Service w32time", "", "detection")
+    assert store.count() == 1
+    assert _descriptions(store, "old") == []
+    assert _descriptions(store, "new") == ["New wording"]
+
+
+def test_script_edits_and_deletes_keep_the_index_in_step(store):
+    item = store.save("Printer spooler", "Get-Service Spooler", "", "detection")
+    with sqlite3.connect(store.path) as conn:
+        conn.execute("UPDATE history SET detection_script = 'Get-Printer' WHERE id = ?", (item.id,))
+    assert _descriptions(store, "spooler") == ["Printer spooler"]
+    assert _descriptions(store, "get-printer") == ["Printer spooler"]
+    assert store.count("Get-Service") == 0
+
+    store.delete(item.id)
+    assert store.count("printer") == 0
+    with sqlite3.connect(store.path) as conn:
+        # Raises if the index no longer matches the table.
+        conn.execute("INSERT INTO history_fts (history_fts) VALUES ('integrity-check')")
+
+
+def test_opening_an_older_database_replaces_the_update_trigger(tmp_path):
+    path = tmp_path / "history.sqlite"
+    HistoryStore(path)
+    with sqlite3.connect(path) as conn:
+        conn.executescript(
+            """
+            DROP TRIGGER history_au;
+            CREATE TRIGGER history_au AFTER UPDATE OF description ON history BEGIN SELECT 1; END;
+            """
+        )
+    HistoryStore(path)
+    with sqlite3.connect(path) as conn:
+        sql = conn.execute("SELECT sql FROM sqlite_master WHERE name = 'history_au'").fetchone()[0]
+    assert "remediation_script ON history" in sql
+
+
+def test_owners_only_see_their_own_snapshots(store):
+    alice = store.save("BitLocker check", "Get-BitLockerVolume", "", "detection", owner="user:alice")
+    bob = store.save("BitLocker check", "Get-BitLockerVolume", "", "detection", owner="user:bob")
+    store.save("Shared spooler", "Get-Service Spooler", "", "detection")
+
+    assert alice.id != bob.id
+    assert [item.id for item in store.page(owner="user:alice")] == [alice.id]
+    assert [item.id for item in store.page("bitlocker", owner="user:bob")] == [bob.id]
+    assert store.count("bitlocker", owner="user:alice") == 1
+    assert store.count(owner="user:carol") == 0
+    assert _descriptions(store, "") == ["Shared spooler"]
+    assert store.get(alice.id, owner="user:bob") is None
+    assert store.get(alice.id, owner="user:alice").detection_script == "Get-BitLockerVolume"
+
+    store.delete(alice.id, owner="user:bob")
+    assert store.count(owner="user:alice") == 1
+    store.clear(owner="user:alice")
+    assert store.count(owner="user:alice") == 0
+    assert store.count(owner="user:bob") == 1
+
+
+def test_rows_from_before_owners_stay_in_the_shared_history(tmp_path):
+    path = tmp_path / "history.sqlite"
+    with sqlite3.connect(path) as conn:
+        conn.execute(
+            """
+            CREATE TABLE history (
+                rowid INTEGER PRIMARY KEY, id TEXT NOT NULL UNIQUE, created_at TEXT NOT NULL,
+                mode TEXT NOT NULL, description TEXT NOT NULL, detection_script TEXT NOT NULL,
+                remediation_script TEXT NOT NULL, saved REAL NOT NULL
+            )
+            """
+        )
+        conn.execute("INSERT INTO history VALUES (1, 'old', 'then', 'detection', 'Legacy', 'x', '', 0)")
+    store = HistoryStore(path)
+    assert [item.id for item in store.page()] == ["old"]
+    assert store.count(owner="session:abc") == 0
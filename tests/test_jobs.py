@@ -0,0 +1,125 @@
+from __future__ import annotations
+
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+from modules.deadline import DeadlineExceeded
+from modules.jobs import CANCELLED, FAILED, RUNNING, SUCCEEDED, JobQueue
+from modules.stand_ins import StandInServer
+
+APP = Path(__file__).resolve().parents[1] / "app.py"
+
+
+@pytest.fixture
+def queue():
+    queue = JobQueue(max_workers=2)
+    yield queue
+    queue.shutdown()
+
+
+def _wait_for(predicate, timeout=5.0):
+    limit = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < limit, "condition not reached"
+        time.sleep(0.01)
+
+
+def test_submit_returns_before_the_job_finishes(queue):
+    release = threading.Event()
+    started = time.perf_counter()
+    job_id = queue.submit(lambda context: release.wait(5) and "done", "generate", owner="a")
+    assert time.perf_counter() - started < 0.05
+    _wait_for(lambda: queue.get(job_id).state == RUNNING)
+    release.set()
+    assert queue.result(job_id, timeout=5) == "done"
+    job = queue.get(job_id)
+    assert job.state == SUCCEEDED and job.progress == 1.0
+
+
+def test_progress_failure_and_owner_filter(queue):
+    def work(context):
+        context.progress(0.5, "halfway")
+        raise RuntimeError("Graph upload failed (403)")
+
+    job_id = queue.submit(work, "publish", owner="a")
+    queue.submit(lambda context: 1, "generate", owner="b")
+    with pytest.raises(RuntimeError):
+        queue.result(job_id, timeout=5)
+    job = queue.get(job_id)
+    assert (job.state, job.message, job.error) == (FAILED, "halfway", "Graph upload failed (403)")
+    assert [job.id for job in queue.jobs("a")] == [job_id]
+
+
+def test_several_jobs_of_one_owner_run_concurrently(queue):
+    barrier = threading.Barrier(2, timeout=5)
+    ids = [queue.submit(lambda context: barrier.wait(), "generate", owner="a") for _ in range(2)]
+    for job_id in ids:
+        queue.result(job_id, timeout=5)
+
+
+def test_cancel_running_and_queued_jobs(queue):
+    def cooperative(context):
+        while True:
+            context.check("generation")
+            time.sleep(0.01)
+
+    running = [queue.submit(cooperative, "generate") for _ in range(2)]
+    queued = queue.submit(cooperative, "generate")
+    _wait_for(lambda: all(queue.get(job_id).state == RUNNING for job_id in running))
+    assert queue.cancel(queued)
+    assert queue.get(queued).state == CANCELLED
+    for job_id in running:
+        assert queue.cancel(job_id)
+        with pytest.raises(DeadlineExceeded):
+            queue.result(job_id, timeout=5)
+        assert queue.get(job_id).state == CANCELLED
+    assert not queue.cancel(running[0])
+
+
+def test_finished_jobs_are_pruned_oldest_first():
+    queue = JobQueue(max_workers=1, max_finished=2)
+    ids = []
+    for index in range(4):
+        ids.append(queue.submit(lambda context, index=index: index, "generate"))
+        queue.result(ids[-1], timeout=5)
+    queue.submit(lambda context: None, "generate")
+    assert queue.get(ids[0]) is None
+    assert queue.get(ids[3]) is not None
+    queue.shutdown()
+
+
+def test_generate_click_returns_while_the_llm_is_still_answering(tmp_path, monkeypatch):
+    streamlit_testing = pytest.importorskip("streamlit.testing.v1")
+    stand_in = StandInServer(llm_latency=2.0)
+    threading.Thread(target=stand_in.serve_forever, daemon=True).start()
+    monkeypatch.setenv("OPENAI_BASE_URL", f"{stand_in.url}/v1")
+    try:
+        app = streamlit_testing.AppTest.from_file(str(APP), default_timeout=60)
+        app.secrets["OPENAI_API_KEY"] = "test"
+        app.secrets["OPENAI_MODEL"] = "gpt-4o"
+        app.secrets["HISTORY_PATH"] = str(tmp_path / "history.sqlite")
+        app.secrets["SEMANTIC_CACHE_PATH"] = str(tmp_path / "semantic.sqlite")
+        app.session_state["llm_provider"] = "OpenAI"
+        app.session_state["use_semantic_cache"] = False
+        app.run()
+        app.text_area[0].set_value("Detect that the Windows Time service is stopped").run()
+
+        started = time.perf_counter()
+        next(button for button in app.button if button.label == "Generate scripts").click().run()
+        elapsed = time.perf_counter() - started
+        assert not app.exception
+        assert elapsed < 1.5, f"UI run blocked for {elapsed:.2f}s behind a 2s LLM call"
+        assert app.session_state["pending_jobs"]
+        assert not app.session_state["detection_script"]
+
+        _wait_for(lambda: stand_in.counts["llm"] >= 2, timeout=15)
+        time.sleep(2.5)
+        app.run()
+        assert not app.exception
+        assert "Compliant" in app.session_state["detection_script"]
+    finally:
+        stand_in.shutdown()
+        stand_in.server_close()
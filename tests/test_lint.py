@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+import io
+import json
+import sys
+
+import pytest
+
+from modules.lint import SARIF_SCHEMA, main
+from tests.conftest import SCRIPT
+
+CLEAN_REMEDIATION = "try { Set-Service w32time -StartupType Automatic; exit 0 } catch { exit 1 }"
+
+
+@pytest.fixture
+def scripts(tmp_path):
+    """Two projects laid out like the community repository: one clean, one missing exit codes."""
+    clean = tmp_path / "Time service"
+    clean.mkdir()
+    (clean / "Detect.ps1").write_text(SCRIPT, encoding="utf-8")
+    (clean / "Remediate.ps1").write_text(CLEAN_REMEDIATION, encoding="utf-8")
+    broken = tmp_path / "Printer"
+    broken.mkdir()
+    (broken / "Remediate.ps1").write_text(CLEAN_REMEDIATION, encoding="utf-8")
+    return tmp_path
+
+
+def _run(capsys, *argv: str) -> tuple[int, str]:
+    code = main([*argv, "--workers", "1"])
+    return code, capsys.readouterr().out
+
+
+def test_jsonl_report_has_one_record_per_script_pair(scripts, capsys):
+    code, out = _run(capsys, str(scripts))
+    records = {record["project"]: record for record in map(json.loads, out.splitlines())}
+
+    assert code == 1
+    assert set(records) == {"Time service", "Printer"}
+    assert records["Time service"]["detection_path"] == "Time service/Detect.ps1"
+    assert records["Time service"]["remediation_path"] == "Time service/Remediate.ps1"
+    assert records["Time service"]["error"] == ""
+    assert all(finding["severity"] != "error" for finding in records["Time service"]["findings"])
+    missing = records["Printer"]["findings"][0]
+    assert set(missing) == {"rule_id", "severity", "message", "target", "line", "column", "match"}
+    assert (missing["rule_id"], missing["severity"]) == ("DET000", "error")
+
+
+def test_sarif_report_is_one_valid_document(scripts, tmp_path, capsys):
+    output = tmp_path / "report.sarif"
+    code, out = _run(capsys, str(scripts), "--format", "sarif", "--output", str(output))
+    log = json.loads(output.read_text(encoding="utf-8"))
+
+    assert code == 1
+    assert out == ""
+    assert log["$schema"] == SARIF_SCHEMA
+    assert log["version"] == "2.1.0"
+    (run,) = log["runs"]
+    rule_ids = {rule["id"] for rule in run["tool"]["driver"]["rules"]}
+    assert {"DET001", "DET003"} <= rule_ids
+    results = {result["ruleId"]: result for result in run["results"]}
+    assert results["DET000"]["level"] == "error"
+    assert results["DET000"]["locations"][0]["physicalLocation"]["artifactLocation"]["uri"] == "Printer"
+    assert {result["level"] for result in run["results"]} <= {"error", "warning", "note"}
+
+
+def test_exit_code_follows_fail_on(scripts, capsys):
+    clean = scripts / "Time service"
+    assert _run(capsys, str(clean.parent), "--fail-on", "never")[0] == 0
+    (scripts / "Printer" / "Remediate.ps1").unlink()
+    (scripts / "Printer").rmdir()
+    assert _run(capsys, str(scripts))[0] == 0
+    assert _run(capsys, str(scripts), "--fail-on", "info")[0] == 1
+
+
+def test_closed_stdout_exits_quietly(scripts, monkeypatch, capsys):
+    class ClosedPipe(io.StringIO):
+        def write(self, _text: str) -> int:
+            raise BrokenPipeError(32, "Broken pipe")
+
+    monkeypatch.setattr(sys, "stdout", ClosedPipe())
+    assert main([str(scripts), "--workers", "1"]) == 1
+    assert capsys.readouterr().err == ""
@@ -0,0 +1,75 @@
+from __future__ import annotations
+
+import random
+
+import pytest
+
+from modules.powershell_lexer import code_view
+from modules.validation_rules import IncrementalValidator, RuleRegistry
+
+VIEW_CASES = [
+    'Write-Output "$(Remove-Item C:\\x -Recurse)"',
+    'Write-Output "a $("nested $(Invoke-Expression $c)") b"',
+    "Write-Output 'no $(Remove-Item x)'",
+    '$s = @"\nline $(Stop-Service w32time)\n"@\nexit 0',
+    'Write-Output "`$(Remove-Item x)"',
+    'Write-Output "$(Get-Item x # Set-Item y\n)" # Set-Item z',
+]
+
+PIECES = [
+    'Write-Host "hi"\n', "exit 0\n", "exit 1\n", "Set-ItemProperty -Path x\n", "# Set-Foo comment\n",
+    "<# block\n", "Stop-Service w32time\n", "#>\n", '$x = @"\n', "Remove-Item x\n", '"@\n',
+    "$y = @'\n", "'@\n", '$s = "multi\n', 'line Start-Process"\n', "'quoted Set-X\n", "x'\n",
+    "try { Invoke-Foo } catch { }\n", "Get-Service `\n", "  -Name x\n", "\n", "reg add HKLM\n",
+    'Write-Host "$(Restart-Computer)"\n', 'Write-Host "$(Get-Date) $(\'Set-X\')"\n',
+]
+
+
+def _key(findings):
+    return sorted((f.rule_id, f.line, f.column, f.match) for f in findings)
+
+
+@pytest.mark.parametrize("script", VIEW_CASES)
+def test_code_view_keeps_offsets_and_line_breaks(script):
+    view = code_view(script)
+    assert len(view) == len(script)
+    assert [i for i, c in enumerate(view) if c == "\n"] == [i for i, c in enumerate(script) if c == "\n"]
+
+
+def test_code_view_blanks_comments_and_strings():
+    script = "Get-Item 'a' # note\n<# block #>\nexit 0"
+    assert code_view(script) == "Get-Item     " + " " * 6 + "\n" + " " * 11 + "\nexit 0"
+
+
+def test_subexpressions_in_expandable_strings_stay_visible():
+    assert "Remove-Item C:\\x -Recurse" in code_view(VIEW_CASES[0])
+    assert "Invoke-Expression $c" in code_view(VIEW_CASES[1])
+    assert "Stop-Service w32time" in code_view(VIEW_CASES[3])
+    assert "Remove-Item" not in code_view(VIEW_CASES[2])
+    assert "Remove-Item" not in code_view(VIEW_CASES[4])
+    assert "Set-Item" not in code_view(VIEW_CASES[5])
+
+
+def test_mutation_inside_subexpression_is_flagged():
+    findings = RuleRegistry().scan('Write-Host "$(Remove-Item C:\\x)"\nexit 0\nexit 1', "detection")
+    assert [(f.rule_id, f.match) for f in findings] == [("DET003", "Remove-Item")]
+
+
+def test_incremental_validation_matches_full_scan():
+    registry = RuleRegistry()
+    rng = random.Random(7)
+    for _ in range(300):
+        validator = IncrementalValidator(registry, "detection")
+        lines = "".join(rng.choice(PIECES) for _ in range(rng.randint(0, 15))).split("\n")
+        for _ in range(8):
+            script = "\n".join(lines)
+            assert _key(validator.validate(script)) == _key(registry.scan(script, "detection")), script
+            index = rng.randint(0, len(lines))
+            roll = rng.random()
+            if roll < 0.4:
+                lines.insert(index, rng.choice(PIECES).rstrip("\n"))
+            elif lines and roll < 0.7:
+                del lines[min(index, len(lines) - 1)]
+            elif lines:
+                lines[min(index, len(lines) - 1)] = rng.choice(PIECES).rstrip("\n")
+
@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+import logging
+
+from modules.prompt_budget import (
+    DEFAULT_EXTRA_REQUIREMENTS_TOKENS,
+    estimate_tokens,
+    fit_prompt,
+    summarize_functions,
+    truncate_middle,
+)
+
+
+def _build(context: str, extra: str) -> str:
+    return f"Detection script:\n{context}\n\nExtra requirements:\n{extra}"
+
+
+def test_single_line_is_cut_by_characters_not_dropped():
+    paragraph = "Only report devices where the registry value is missing or set to zero. " * 200
+    result = truncate_middle(paragraph, 100)
+    assert estimate_tokens(result) <= 100
+    assert result.startswith("Only report devices") and result.endswith("set to zero.")
+    assert "characters omitted" in result
+
+
+def test_multi_line_text_keeps_whole_head_and_tail_lines():
+    text = "\n".join(f"Get-Item C:\\path\\{index}" for index in range(200))
+    result = truncate_middle(text, 100).splitlines()
+    assert result[0] == "Get-Item C:\\path\\0" and result[-1] == "Get-Item C:\\path\\199"
+    assert any("lines omitted" in line for line in result)
+
+
+def test_braces_in_strings_and_comments_do_not_end_a_function_early():
+    script = "\n".join(
+        [
+            "function Get-State {",
+            "    param($Name)",
+            '    $open = "{"',
+            "    # closing } in a comment",
+            "    $text = @'",
+            "}",
+            "'@",
+            "    return $open",
+            "}",
+            "Get-State -Name x",
+            "exit 0",
+        ]
+    )
+    assert summarize_functions(script).splitlines() == [
+        "function Get-State {",
+        "    param($Name)",
+        "    # ... 7 lines omitted",
+        "}",
+        "Get-State -Name x",
+        "exit 0",
+    ]
+
+
+def test_fit_prompt_stays_within_budget_and_reports_truncation(caplog):
+    helper = "\n".join(["function Helper-{0} {{", "    Write-Host 'x{0}'", "    Get-Item C:\\{0}", "}}"])
+    context = "\n".join(helper.format(index) for index in range(400)) + "\nexit 0"
+    extra = "Keep the existing registry layout and never restart services. " * 150
+    with caplog.at_level(logging.WARNING, logger="modules.prompt_budget"):
+        budget = fit_prompt(_build, context, extra, "system", "gpt-4o", 1600, input_budget=3000)
+    assert budget.final_tokens <= 3000
+    assert estimate_tokens(budget.prompt) + estimate_tokens("system") == budget.final_tokens
+    assert "truncate extra requirements" in budget.steps
+    assert "Keep the existing registry layout" in budget.prompt
+    assert any("Extra requirements cut" in record.message for record in caplog.records)
+    assert estimate_tokens(budget.prompt.split("Extra requirements:\n", 1)[1]) <= DEFAULT_EXTRA_REQUIREMENTS_TOKENS
@@ -0,0 +1,59 @@
+from __future__ import annotations
+
+from types import SimpleNamespace
+
+import pytest
+
+from modules.prompt_cache import PromptCacheStats
+from modules.utility import BaseUtility, CallUsage
+
+RESPONSES_USAGE = SimpleNamespace(
+    input_tokens=2000, output_tokens=300, input_tokens_details=SimpleNamespace(cached_tokens=1536)
+)
+CHAT_USAGE = SimpleNamespace(
+    prompt_tokens=1200, completion_tokens=250, prompt_tokens_details=SimpleNamespace(cached_tokens=1024)
+)
+
+
+@pytest.mark.parametrize(
+    "usage, expected",
+    [
+        (RESPONSES_USAGE, CallUsage(2000, 300, 1536)),
+        (CHAT_USAGE, CallUsage(1200, 250, 1024)),
+        (SimpleNamespace(prompt_tokens=90, completion_tokens=10), CallUsage(90, 10, 0)),
+        (SimpleNamespace(input_tokens=80, output_tokens=5, input_tokens_details=None), CallUsage(80, 5, 0)),
+        (None, CallUsage()),
+    ],
+)
+def test_usage_is_read_from_responses_and_chat_shapes(usage, expected):
+    assert BaseUtility._usage_from_response(SimpleNamespace(usage=usage)) == expected
+
+
+def test_recorded_calls_feed_cache_stats_and_telemetry(make_utility):
+    utility = make_utility()
+    utility._record_call(SimpleNamespace(usage=RESPONSES_USAGE), 0.5, "", "gpt-4o", "responses", 0)
+    utility._record_call(SimpleNamespace(usage=CHAT_USAGE), 0.7, "", "gpt-4o", "chat", 0)
+    uncached = SimpleNamespace(usage=SimpleNamespace(prompt_tokens=800, completion_tokens=1))
+    utility._record_call(uncached, 1.5, "", "gpt-4o", "chat", 0)
+
+    report = utility.prompt_cache_stats.report()
+    assert (report["calls"], report["cache_hits"], report["hit_rate"]) == (3, 2, 0.6667)
+    assert (report["input_tokens"], report["cached_tokens"]) == (4000, 2560)
+    assert report["cached_token_share"] == 0.64
+    assert utility.telemetry.totals()["cached_tokens"] == 2560
+
+
+def test_latency_saved_is_estimated_from_hit_and_miss_averages():
+    stats = PromptCacheStats()
+    stats.record(1000, 512, 0.4)
+    stats.record(1000, 512, 0.6)
+    stats.record(1000, 0, 1.5)
+
+    report = stats.report()
+    assert (report["avg_hit_latency_ms"], report["avg_miss_latency_ms"]) == (500.0, 1500.0)
+    assert report["estimated_latency_saved_ms"] == 2000.0
+
+    stats.reset()
+    stats.record(1000, 512, 0.4)
+    # With no misses to compare against, no saving is claimed.
+    assert stats.report()["estimated_latency_saved_ms"] == 0.0
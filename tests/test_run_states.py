@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+import threading
+from pathlib import Path
+from types import SimpleNamespace
+from urllib.parse import unquote
+
+import pytest
+
+from modules import utility
+from modules.run_states import RunStateStore, RunStateSync, normalize_timestamp
+from modules.stand_ins import StandInServer
+
+APP = Path(__file__).resolve().parents[1] / "app.py"
+
+
+class FakeGraph:
+    def __init__(self, pages: list[list[dict]]):
+        self.pages = pages
+        self.urls: list[str] = []
+
+    def get(self, url: str, **_kwargs):
+        self.urls.append(unquote(url))
+        if url.endswith("/runSummary"):
+            body = {"issueDetectedDeviceCount": 0}
+        else:
+            page = len([seen for seen in self.urls if "/deviceRunStates" in seen]) - 1
+            body = {"value": self.pages[page] if page < len(self.pages) else []}
+            if page + 1 < len(self.pages):
+                body["@odata.nextLink"] = url + "&page"
+        return SimpleNamespace(status_code=200, text="", headers={}, json=lambda: body)
+
+
+def _state(device: str, updated: str, state: str = "success") -> dict:
+    return {"id": f"s1:{device}", "detectionState": state, "lastStateUpdateDateTime": updated}
+
+
+def test_timestamps_compare_by_time_not_digits():
+    assert normalize_timestamp("2026-01-01T00:00:00.1Z") > normalize_timestamp("2026-01-01T00:00:00Z")
+    assert normalize_timestamp("2026-01-01T01:00:00+01:00") == "2026-01-01T00:00:00.000000Z"
+    assert normalize_timestamp("") == ""
+    assert normalize_timestamp("0001-01-01T00:00:00Z") == "0001-01-01T00:00:00.000000Z"
+    assert normalize_timestamp("0001-01-01T00:00:00Z") < normalize_timestamp("2026-01-01T00:00:00Z")
+
+
+def test_watermark_is_the_newest_state_across_pages(tmp_path):
+    store = RunStateStore(tmp_path / "states.sqlite")
+    graph = FakeGraph(
+        [
+            [_state("a", "2026-01-01T00:00:00.25Z"), _state("b", "2026-01-01T00:00:00Z")],
+            [_state("c", "2026-01-01T00:00:00.1234567Z")],
+        ]
+    )
+    result = RunStateSync({"Authorization": "Bearer x"}, store, "https://graph.test/beta/", session=graph).sync(["s1"])
+    assert result[0].ok and result[0].rows == 3
+    # "…00Z" sorts after "…00.25Z" as text; parsed, .25 s is the newest.
+    assert store.watermark("s1") == "2026-01-01T00:00:00.250000Z"
+
+    store.set_watermark("s1", "2026-01-01T00:00:00Z")
+    assert store.watermark("s1") == "2026-01-01T00:00:00.250000Z"
+
+    # An older replay of device a does not overwrite the stored state.
+    store.write_states("s1", [_state("a", "2026-01-01T00:00:00.2Z", "fail")])
+    assert store.summary("s1")["detection_states"] == {"success": 3}
+
+    graph.pages, graph.urls = [[]], []
+    RunStateSync({"Authorization": "Bearer x"}, store, "https://graph.test/beta/", session=graph).sync(["s1"])
+    assert "lastStateUpdateDateTime ge 2026-01-01T00:00:00.250000Z" in graph.urls[-1]
+
+
+def test_panel_syncs_with_graph_only(tmp_path, monkeypatch):
+    streamlit_testing = pytest.importorskip("streamlit.testing.v1")
+    stand_in = StandInServer()
+    threading.Thread(target=stand_in.serve_forever, daemon=True).start()
+    monkeypatch.setattr(utility, "GRAPH_BASE_URL", f"{stand_in.url}/beta/")
+    try:
+        app = streamlit_testing.AppTest.from_file(str(APP), default_timeout=60)
+        app.secrets["HISTORY_PATH"] = str(tmp_path / "history.sqlite")
+        app.secrets["SEMANTIC_CACHE_PATH"] = str(tmp_path / "semantic.sqlite")
+        app.secrets["RUN_STATE_PATH"] = str(tmp_path / "run_states.sqlite")
+        app.session_state["graph_auth_header"] = {"Authorization": "Bearer test"}
+        app.run()
+        next(box for box in app.text_input if box.label == "Script ID").set_value("script").run()
+        next(button for button in app.button if button.label == "Sync run states").click().run()
+        assert not app.exception
+        assert not app.error, [error.value for error in app.error]
+        assert any("2 device states synced" in message.value for message in app.success)
+        assert stand_in.counts["graph_run_states"] == 2
+    finally:
+        stand_in.shutdown()
+        stand_in.server_close()
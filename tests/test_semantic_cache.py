@@ -0,0 +1,64 @@
+from __future__ import annotations
+
+import pytest
+
+from modules.semantic_cache import SemanticCache, condition_terms
+from modules.utility import ScriptArtifact
+
+MODE = "Detection only"
+
+
+def _artifact(description: str) -> ScriptArtifact:
+    return ScriptArtifact(
+        description=description,
+        mode=MODE,
+        detection_script=f"# {description}\nexit 0",
+        remediation_script="",
+        created_at="2026-01-01 00:00:00Z",
+        fingerprint=description,
+    )
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return SemanticCache(tmp_path / "semantic.sqlite")
+
+
+def test_exact_request_is_an_exact_hit(cache):
+    cache.store(_artifact("Detect that BitLocker is enabled on the system drive"))
+    hit = cache.lookup("detect that  BitLocker is enabled on the system drive", "", MODE)
+    assert hit is not None and hit.exact
+
+
+def test_paraphrase_is_reported_as_near_duplicate(cache):
+    cache.store(_artifact("Detect that BitLocker is enabled on the system drive"))
+    hit = cache.lookup("Check whether BitLocker is enabled on C:", "", MODE)
+    assert hit is not None
+    assert not hit.exact
+    assert hit.cached_description == "detect that bitlocker is enabled on the system drive"
+
+
+@pytest.mark.parametrize(
+    "cached, description",
+    [
+        ("BitLocker enabled", "BitLocker disabled"),
+        ("check w32time running", "Windows Time Service"),
+        ("Ensure the Print Spooler service is disabled", "Ensure the Print Spooler service is enabled"),
+        ("Detect that the Windows Time service is running", "Detect that the Windows Time service is not running"),
+        ("Detect local admins with more than 2 members", "Detect local administrators with more than 3 members"),
+    ],
+)
+def test_opposite_conditions_never_match(cache, cached, description):
+    cache.store(_artifact(cached))
+    assert cache.lookup(description, "", MODE) is None
+
+
+def test_other_mode_never_matches(cache):
+    cache.store(_artifact("Detect that BitLocker is enabled"))
+    assert cache.lookup("Detect that BitLocker is enabled", "", "Detection and Remediation") is None
+
+
+def test_condition_terms_fold_synonyms_and_keep_numbers():
+    assert condition_terms("service is running") == condition_terms("service started")
+    assert condition_terms("service is not running") == frozenset({"!", "+"})
+    assert condition_terms("older than 30 days") == frozenset({"30"})
@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+import random
+import threading
+import tracemalloc
+
+import pytest
+
+from modules.session_blobs import BlobStore, SessionBlobs
+
+
+def _text(seed: int, size: int = 6000) -> str:
+    rng = random.Random(seed)
+    words = ["Get-Service", "w32time", "-ErrorAction", "Stop", "Write-Output", "exit", "1", "$status", "BitLocker"]
+    return " ".join(rng.choice(words) for _ in range(size // 8))
+
+
+@pytest.fixture
+def store(tmp_path):
+    return BlobStore(memory_limit_bytes=64 * 1024, spill_dir=tmp_path / "blobs")
+
+
+def test_identical_text_is_stored_once(store):
+    keys = {store.put(_text(1)) for _ in range(5)}
+    assert len(keys) == 1
+    stats = store.stats()
+    assert (stats["puts"], stats["deduplicated"], stats["blobs_in_memory"]) == (5, 4, 1)
+    assert stats["memory_bytes"] < len(_text(1)) / 3
+
+
+def test_concurrent_puts_of_the_same_text_store_it_once(store):
+    text = _text(2)
+    barrier = threading.Barrier(8)
+
+    def put():
+        barrier.wait()
+        store.put(text)
+
+    threads = [threading.Thread(target=put) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stats = store.stats()
+    assert stats["deduplicated"] == 7
+    assert stats["raw_bytes"] == len(text.encode("utf-8"))
+
+
+def test_least_recently_used_blobs_spill_and_read_back(tmp_path):
+    store = BlobStore(memory_limit_bytes=4000, spill_dir=tmp_path / "blobs")
+    texts = [_text(seed) for seed in range(10)]
+    keys = [store.put(text) for text in texts]
+    stats = store.stats()
+    assert stats["spilled"] > 0
+    assert stats["memory_bytes"] <= 4000 or stats["blobs_in_memory"] == 1
+    assert [store.get(key) for key in keys] == texts
+    assert store.stats()["disk_reads"] > 0
+    # A spilled blob counts as stored, so putting it again deduplicates.
+    assert store.put(texts[0]) == keys[0]
+    assert store.stats()["raw_bytes"] == sum(len(text.encode("utf-8")) for text in texts)
+
+
+def test_unknown_key_raises_and_session_falls_back(store):
+    with pytest.raises(KeyError):
+        store.get("0" * 64)
+    assert SessionBlobs(store).get("0" * 64, default="none") == "none"
+    assert SessionBlobs(store).get("") == ""
+
+
+def test_session_limit_counts_compressed_size_and_spills_lru(store):
+    session = SessionBlobs(store, limit_bytes=3000)
+    keys = [session.put(_text(seed)) for seed in range(6)]
+    assert 0 < session.memory_bytes <= 3000
+    sizes = [store.size(key) for key in keys]
+    assert all(sizes)
+    # Most recent blobs stay counted; the oldest were handed to the store to spill.
+    assert session.memory_bytes == sum(sizes[-len(session._recent) :])
+    assert list(session._recent) == keys[-len(session._recent) :]
+
+
+def test_session_limit_holds_for_blobs_the_store_already_spilled(tmp_path):
+    # A store so small that every blob read back from disk is evicted again at once.
+    store = BlobStore(memory_limit_bytes=1, spill_dir=tmp_path / "blobs")
+    keys = [store.put(_text(seed)) for seed in range(6)]
+    store.put(_text(99))
+    session = SessionBlobs(store, limit_bytes=3000)
+    for key in keys:
+        session.get(key)
+    assert session.memory_bytes > 0
+    assert session.memory_bytes <= 3000
+    assert session.memory_bytes == sum(store.size(key) for key in session._recent)
+
+
+def test_500_sessions_hold_less_memory_with_blob_keys(tmp_path):
+    sessions = 500
+    readmes = [_text(1000 + index, 8000) for index in range(20)]
+    scripts = [(_text(index, 6000), _text(index + 5000, 5000)) for index in range(sessions)]
+
+    def plain_state():
+        return [
+            {
+                "alternates": [{"detection_script": "".join(detection), "remediation_script": "".join(remediation)}],
+                "readme": "".join(readmes[index % 20]),
+                "history": [("".join(detection), "".join(remediation)) for _ in range(4)],
+            }
+            for index, (detection, remediation) in enumerate(scripts)
+        ]
+
+    def blob_state(store):
+        states = []
+        for index, (detection, remediation) in enumerate(scripts):
+            blobs = SessionBlobs(store)
+            states.append(
+                {
+                    "alternates": [{"detection_key": blobs.put(detection), "remediation_key": blobs.put(remediation)}],
+                    "readme_key": blobs.put(readmes[index % 20]),
+                    "history": [(blobs.put(detection), blobs.put(remediation)) for _ in range(4)],
+                    "blobs": blobs,
+                }
+            )
+        return states
+
+    def measure(build):
+        tracemalloc.start()
+        try:
+            kept = build()
+            current, _ = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        del kept
+        return current
+
+    plain = measure(plain_state)
+    store = BlobStore(memory_limit_bytes=1024 * 1024, spill_dir=tmp_path / "blobs")
+    blob = measure(lambda: blob_state(store))
+    assert store.stats()["memory_bytes"] <= 1024 * 1024
+    assert blob < plain / 5, f"{sessions} sessions: {plain / 1e6:.1f} MB plain vs {blob / 1e6:.1f} MB with blobs"
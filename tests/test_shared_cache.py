@@ -0,0 +1,154 @@
+from __future__ import annotations
+
+import asyncio
+import multiprocessing
+import threading
+import time
+
+import pytest
+
+from modules.async_utility import AsyncUtility
+from modules.shared_cache import MemoryCache, create_cache
+from tests.conftest import AsyncFakeClient, FakeClient
+
+
+@pytest.fixture(params=["memory", "disk", "sqlite"])
+def cache(request, tmp_path):
+    path = {"memory": "", "disk": str(tmp_path / "shared"), "sqlite": str(tmp_path / "shared.sqlite")}
+    return create_cache(request.param, path[request.param])
+
+
+def test_roundtrip_and_expiry(cache):
+    cache.set_json("k", {"a": [1, 2]}, ttl_seconds=60)
+    assert cache.get_json("k") == {"a": [1, 2]}
+    cache.set_json("gone", "x", ttl_seconds=-1)
+    assert cache.get_json("gone") is None
+    assert cache.stats()["hits"] == 1
+
+
+def test_get_or_fill_computes_once_under_concurrency(cache):
+    calls = []
+    barrier = threading.Barrier(16)
+    results = []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.2)
+        return {"value": 42}
+
+    def worker():
+        barrier.wait()
+        results.append(cache.get_or_fill("catalog", compute, ttl_seconds=60))
+
+    threads = [threading.Thread(target=worker) for _ in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert results == [{"value": 42}] * 16
+    assert cache.stats()["fills"] == 1
+
+
+def test_unrelated_keys_fill_in_parallel(cache):
+    started = time.monotonic()
+    threads = [
+        threading.Thread(target=cache.get_or_fill, args=(f"key-{index}", lambda: time.sleep(0.3) or 1, 60))
+        for index in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert time.monotonic() - started < 1.0
+
+
+def test_failures_and_none_are_not_cached(cache):
+    def fail():
+        raise RuntimeError("GitHub 502")
+
+    with pytest.raises(RuntimeError):
+        cache.get_or_fill("k", fail, ttl_seconds=60)
+    assert cache.get_or_fill("k", lambda: None, ttl_seconds=60) is None
+    assert cache.get_or_fill("k", lambda: "ok", ttl_seconds=60) == "ok"
+
+
+def _fill_from_process(backend: str, path: str, counter: str) -> None:
+    def compute():
+        with open(counter, "a", encoding="utf-8") as handle:
+            handle.write("x")
+        time.sleep(0.3)
+        return "filled"
+
+    assert create_cache(backend, path).get_or_fill("shared-key", compute, ttl_seconds=60) == "filled"
+
+
+@pytest.mark.parametrize("backend", ["disk", "sqlite"])
+def test_replicas_sharing_a_path_fill_once(backend, tmp_path):
+    if "fork" not in multiprocessing.get_all_start_methods():
+        pytest.skip("needs fork")
+    path = str(tmp_path / ("shared" if backend == "disk" else "shared.sqlite"))
+    counter = tmp_path / "computed"
+    create_cache(backend, path)
+    context = multiprocessing.get_context("fork")
+    processes = [context.Process(target=_fill_from_process, args=(backend, path, str(counter))) for _ in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(10)
+    assert [process.exitcode for process in processes] == [0, 0, 0, 0]
+    assert counter.read_text() == "x"
+
+
+def test_memory_cache_evicts_least_recently_used():
+    cache = MemoryCache(max_bytes=100)
+    cache.set("a", b"x" * 40, 60)
+    cache.set("b", b"x" * 40, 60)
+    assert cache.get("a") is not None
+    cache.set("c", b"x" * 40, 60)
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.stats()["bytes"] == 80
+
+
+def test_llm_responses_are_not_cached_by_default(make_utility):
+    client = FakeClient()
+    utility = make_utility(client, cache=MemoryCache())
+    for _ in range(2):
+        utility.generate("Check that BitLocker is enabled", include_remediation=False)
+    assert client.calls == 2
+
+
+def test_llm_responses_are_replayed_when_a_ttl_is_set(make_utility):
+    client = FakeClient()
+    utility = make_utility(client, cache=MemoryCache(), response_cache_ttl=60)
+    for _ in range(2):
+        utility.generate("Check that BitLocker is enabled", include_remediation=False)
+    assert client.calls == 1
+
+
+def test_sync_and_async_share_cached_responses(make_utility):
+    cache = MemoryCache()
+    sync_client = FakeClient()
+    make_utility(sync_client, cache=cache, response_cache_ttl=60).generate(
+        "Check that BitLocker is enabled", include_remediation=True
+    )
+    async_client = AsyncFakeClient()
+    utility = make_utility(async_client, cls=AsyncUtility, cache=cache, response_cache_ttl=60)
+    artifact = asyncio.run(utility.generate("Check that BitLocker is enabled", include_remediation=True))
+    assert sync_client.calls == 2
+    assert async_client.calls == 0
+    assert artifact.remediation_script
+
+
+def test_async_responses_are_cached_per_candidate(make_utility):
+    client = AsyncFakeClient(reply=lambda number, _kwargs: f"Write-Output {number}; exit 0")
+    utility = make_utility(client, cls=AsyncUtility, cache=MemoryCache(), response_cache_ttl=60)
+    first = asyncio.run(utility.generate("Check BitLocker", include_remediation=False, candidates=3))
+    second = asyncio.run(utility.generate("Check BitLocker", include_remediation=False, candidates=3))
+    assert client.calls == 3
+    assert len(first.alternates) == 2
+    assert {second.detection_script, *(item.detection_script for item in second.alternates)} == {
+        first.detection_script,
+        *(item.detection_script for item in first.alternates),
+    }
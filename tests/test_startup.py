@@ -0,0 +1,30 @@
+from __future__ import annotations
+
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+SERVICE_MODULES = [
+    "modules.api_server",
+    "modules.async_utility",
+    "modules.community_search",
+    "modules.graph_auth",
+    "modules.graph_batch",
+    "modules.graph_inventory",
+    "modules.run_states",
+    "modules.utility",
+    "modules.validation",
+]
+HEAVY_PACKAGES = ["azure.identity", "httpx", "openai", "requests"]
+
+
+def test_service_modules_load_heavy_packages_only_on_first_use():
+    code = (
+        "import importlib, sys\n"
+        f"for name in {SERVICE_MODULES!r}:\n"
+        "    importlib.import_module(name)\n"
+        f"print(','.join(name for name in {HEAVY_PACKAGES!r} if name in sys.modules))\n"
+    )
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == ""
@@ -0,0 +1,89 @@
+from __future__ import annotations
+
+import re
+
+from modules.telemetry import CallRecord, TelemetryRecorder
+
+PREFIX = "remediation_creator_llm"
+# One sample line of the text exposition format: name{labels} value
+_SAMPLE = re.compile(r'^[a-z_]+(\{([a-z_]+="(?:[^"\\]|\\.)*",?)*\})? -?[0-9.e+]+$')
+
+
+def _recorder() -> TelemetryRecorder:
+    telemetry = TelemetryRecorder()
+    telemetry.record(CallRecord("openai", "gpt-4o", "chat", 0.4, 100, 20, cached_tokens=64))
+    telemetry.record(CallRecord("openai", "gpt-4o", "chat", 3.0, 50, 10, fallback_attempts=1))
+    telemetry.record(CallRecord("azure", 'dep "east"', "responses", 150.0, error="timeout"))
+    telemetry.record_prompt_budget(1000, 600)
+    telemetry.record_prompt_budget(200, 200)
+    return telemetry
+
+
+def _samples(text: str) -> dict[str, float]:
+    return {line.rsplit(" ", 1)[0]: float(line.rsplit(" ", 1)[1]) for line in text.splitlines() if line[0] != "#"}
+
+
+def test_prometheus_text_is_well_formed():
+    text = _recorder().to_prometheus()
+    assert text.endswith("\n")
+    for line in text.splitlines():
+        if line.startswith("# HELP ") or line.startswith("# TYPE "):
+            continue
+        assert _SAMPLE.match(line), line
+    types = re.findall(r"^# TYPE (\S+) (\S+)$", text, re.MULTILINE)
+    assert dict(types) == {
+        f"{PREFIX}_calls_total": "counter",
+        f"{PREFIX}_fallback_attempts_total": "counter",
+        f"{PREFIX}_tokens_total": "counter",
+        f"{PREFIX}_latency_seconds": "histogram",
+        f"{PREFIX}_prompt_tokens_estimated_total": "counter",
+        f"{PREFIX}_prompts_compacted_total": "counter",
+    }
+    assert 'model="dep \\"east\\""' in text
+
+
+def test_prometheus_values_and_histogram_buckets():
+    samples = _samples(_recorder().to_prometheus())
+    ok = 'provider="openai",model="gpt-4o",api_path="chat",outcome="ok"'
+    failed = 'provider="azure",model="dep \\"east\\"",api_path="responses",outcome="error"'
+
+    assert samples[f"{PREFIX}_calls_total{{{ok}}}"] == 2
+    assert samples[f"{PREFIX}_calls_total{{{failed}}}"] == 1
+    assert samples[f"{PREFIX}_fallback_attempts_total{{{ok}}}"] == 1
+    assert samples[f'{PREFIX}_tokens_total{{{ok},kind="input"}}'] == 150
+    assert samples[f'{PREFIX}_tokens_total{{{ok},kind="cached_input"}}'] == 64
+    assert samples[f'{PREFIX}_latency_seconds_bucket{{{ok},le="0.5"}}'] == 1
+    assert samples[f'{PREFIX}_latency_seconds_bucket{{{ok},le="5.0"}}'] == 2
+    assert samples[f'{PREFIX}_latency_seconds_bucket{{{failed},le="120.0"}}'] == 0
+    assert samples[f'{PREFIX}_latency_seconds_bucket{{{failed},le="+Inf"}}'] == 1
+    assert samples[f"{PREFIX}_latency_seconds_sum{{{ok}}}"] == 3.4
+    assert samples[f"{PREFIX}_latency_seconds_count{{{ok}}}"] == 2
+    assert samples[f'{PREFIX}_prompt_tokens_estimated_total{{stage="original"}}'] == 1200
+    assert samples[f'{PREFIX}_prompt_tokens_estimated_total{{stage="final"}}'] == 800
+    assert samples[f"{PREFIX}_prompts_compacted_total"] == 1
+
+
+def test_totals_add_up_across_targets():
+    telemetry = _recorder()
+    assert telemetry.totals() == {
+        "calls": 3,
+        "errors": 1,
+        "fallback_attempts": 1,
+        "input_tokens": 150,
+        "output_tokens": 30,
+        "cached_tokens": 64,
+        "avg_latency_ms": round((400 + 3000 + 150000) / 3, 1),
+        "prompts_compacted": 1,
+        "prompt_tokens_saved": 400,
+    }
+    telemetry.reset()
+    assert telemetry.totals()["calls"] == 0
+    assert _samples(telemetry.to_prometheus())[f"{PREFIX}_prompts_compacted_total"] == 0
+
+
+def test_generation_records_one_call_per_script(make_utility):
+    utility = make_utility()
+    utility.generate("Check that BitLocker is enabled", include_remediation=True)
+    totals = utility.telemetry.totals()
+    assert (totals["calls"], totals["errors"], totals["input_tokens"], totals["output_tokens"]) == (2, 0, 600, 400)
+    assert [row["provider"] for row in utility.telemetry.summary()] == ["openai"]
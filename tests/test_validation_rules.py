@@ -0,0 +1,112 @@
+from __future__ import annotations
+
+import pytest
+
+from modules.validation_rules import IncrementalValidator, Rule, RuleRegistry
+
+
+@pytest.mark.parametrize(
+    "script, reported",
+    [
+        ("catch { Write-Host x }\nexit 0", True),
+        ("try { Write-Host x } finally { }\nexit 0", True),
+        ("# try\ncatch { Write-Host x }\nexit 0", True),
+        ("try {\n  Write-Host x\n}\ncatch {\n  exit 1\n}\nexit 0", False),
+    ],
+)
+def test_rem002_requires_try_and_catch(script, reported):
+    registry = RuleRegistry()
+    full = [f.rule_id for f in registry.scan(script, "remediation")]
+    incremental = [f.rule_id for f in IncrementalValidator(registry, "remediation").validate(script)]
+    assert ("REM002" in full) is reported
+    assert full == incremental
+
+
+def test_all_of_is_rejected_on_forbid_rules():
+    with pytest.raises(ValueError, match="all_of"):
+        RuleRegistry([]).register(Rule("ORG001", "error", "x", r"\bfoo\b", all_of=(r"\bbar\b",)))
+
+
+def test_a_rule_reports_each_match_once_without_overlaps():
+    registry = RuleRegistry([Rule("X1", "warning", "Number {match}", r"\d+"), Rule("X2", "info", "Host", r"Host\b")])
+    script = 'Write-Host 12345 67\nWrite-Host "$(Get-Item 89)"'
+    findings = registry.scan(script, "detection")
+    assert [(f.rule_id, f.match, f.line) for f in findings] == [
+        ("X2", "Host", 1),
+        ("X1", "12345", 1),
+        ("X1", "67", 1),
+        ("X2", "Host", 2),
+        ("X1", "89", 2),
+    ]
+    assert [f.match for f in IncrementalValidator(registry, "detection").validate(script)] == [
+        f.match for f in findings
+    ]
+
+
+def test_other_rules_still_match_inside_a_long_match():
+    registry = RuleRegistry(
+        [Rule("X1", "warning", "Call", r"Invoke-\w+ -Command \w+"), Rule("X2", "warning", "Cmd", r"-Command")]
+    )
+    findings = registry.scan("Invoke-Thing -Command x; Invoke-Thing -Command y", "detection")
+    assert [f.rule_id for f in findings] == ["X1", "X2", "X1", "X2"]
+
+
+BASE = [
+    "try {",
+    "    Get-Service w32time",
+    "    Set-ItemProperty -Path HKLM:\\x -Name y",
+    "} catch { exit 1 }",
+    "exit 0",
+]
+
+EDITS = [
+    ("insert", 1, "Stop-Service w32time"),
+    ("replace", 2, "    # Set-ItemProperty is a comment now"),
+    ("delete", 1, None),
+    # Multi-line constructs opened and closed by single-line edits.
+    ("insert", 1, "<#"),
+    ("insert", 4, "#>"),
+    ("delete", 4, None),
+    ("insert", 4, "Remove-Item C:\\Temp -Recurse #>"),
+    ("delete", 1, None),
+    ("insert", 2, '$text = @"'),
+    ("insert", 4, '"@'),
+    ("replace", 3, "line $(Restart-Computer) inside"),
+    ("delete", 4, None),
+    ("insert", 5, '"@'),
+    ("insert", 1, "$s = 'open"),
+    ("insert", 3, "close' ; exit 1"),
+    ("replace", 1, "$s = 'done'"),
+    ("insert", 0, "Get-Service `"),
+    ("insert", 1, "  -Name w32time"),
+    ("delete", 0, None),
+]
+
+
+@pytest.mark.parametrize("target", ["detection", "remediation"])
+def test_incremental_edits_match_a_full_scan(target):
+    registry = RuleRegistry()
+    validator = IncrementalValidator(registry, target)
+    lines = list(BASE)
+    for action, index, text in [("start", 0, None), *EDITS]:
+        if action == "insert":
+            lines.insert(index, text)
+        elif action == "delete":
+            del lines[index]
+        elif action == "replace":
+            lines[index] = text
+        script = "\n".join(lines)
+        key = [(f.rule_id, f.line, f.column, f.match) for f in registry.scan(script, target)]
+        assert [(f.rule_id, f.line, f.column, f.match) for f in validator.validate(script)] == key, (action, script)
+
+
+def test_a_local_edit_rescans_only_nearby_lines():
+    registry = RuleRegistry()
+    validator = IncrementalValidator(registry, "detection")
+    lines = [f"Get-Service svc{index}" for index in range(200)] + ["exit 0", "exit 1"]
+    validator.validate("\n".join(lines))
+    before = validator.rescanned_lines
+    lines[100] = "Remove-Item C:\\Temp"
+    findings = validator.validate("\n".join(lines))
+    assert validator.rescanned_lines - before <= 2
+    assert [(f.rule_id, f.line) for f in findings if f.rule_id == "DET003"] == [("DET003", 101)]